@@ -0,0 +1,66 @@
+"""Add daily_closes table materialized from prices
+
+Revision ID: 20251215_1000
+Revises: 20251209_1400
+Create Date: 2025-12-15 10:00:00
+
+The prices table mixes intraday quotes, previous-close markers and official
+history closes, so every chart/history read had to group by day and pick a
+source. daily_closes keeps exactly one row per (asset_id, date): the official
+close (source 'yfinance_history') when present, otherwise the latest quote of
+the day. It is maintained on every price write (app.crud.prices) and can be
+rebuilt with app.crud.prices.rebuild_daily_closes().
+
+Performance Impact:
+- History/chart reads become a primary-key range scan per asset
+- No per-row grouping or source de-duplication in Python
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20251215_1000'
+down_revision: Union[str, None] = '20251209_1400'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create daily_closes and backfill it from existing prices"""
+    op.create_table(
+        'daily_closes',
+        sa.Column('asset_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('close', sa.NUMERIC(precision=20, scale=8), nullable=False),
+        sa.Column('source', sa.String(), nullable=False),
+        sa.Column('asof', sa.DateTime(), nullable=False),
+        sa.Column('volume', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('asset_id', 'date'),
+        sa.ForeignKeyConstraint(['asset_id'], ['portfolio.assets.id'], ondelete='CASCADE'),
+        schema='portfolio'
+    )
+
+    # One-off backfill: preferred price of every (asset, day)
+    op.execute("""
+        INSERT INTO portfolio.daily_closes (asset_id, date, close, source, asof, volume)
+        SELECT DISTINCT ON (asset_id, asof::date)
+            asset_id,
+            asof::date,
+            price,
+            COALESCE(source, 'yfinance'),
+            asof,
+            volume
+        FROM portfolio.prices
+        ORDER BY asset_id, asof::date, (source = 'yfinance_history') DESC NULLS LAST, asof DESC
+    """)
+
+    print("✓ Created and backfilled portfolio.daily_closes")
+
+
+def downgrade() -> None:
+    """Drop daily_closes"""
+    op.drop_table('daily_closes', schema='portfolio')
@@ -0,0 +1,69 @@
+"""Unique (asset_id, asof) index on prices for bulk upserts
+
+Revision ID: 20251216_0900
+Revises: 20251215_1000
+Create Date: 2025-12-16 09:00:00
+
+Bulk price ingestion (crud.prices.bulk_upsert_prices) writes whole chunks with
+INSERT ... ON CONFLICT (asset_id, asof) DO UPDATE, which needs a unique index
+on those columns. create_price() already treated (asset_id, asof) as the key,
+so any duplicates are leftovers from concurrent writes and are removed first
+(keeping the most recent row).
+
+Databases created from db/init already have the equivalent unique index
+idx_prices_asset_asof; the new index is only created when it is missing.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20251216_0900'
+down_revision: Union[str, None] = '20251215_1000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Deduplicate prices and add the unique (asset_id, asof) index"""
+    conn = op.get_bind()
+    has_init_index = conn.execute(sa.text("""
+        SELECT 1 FROM pg_indexes
+        WHERE schemaname = 'portfolio' AND indexname = 'idx_prices_asset_asof'
+    """)).first() is not None
+
+    if has_init_index:
+        print("✓ Unique index idx_prices_asset_asof already present, skipping")
+        return
+
+    op.execute("""
+        DELETE FROM portfolio.prices a
+        USING portfolio.prices b
+        WHERE a.asset_id = b.asset_id
+          AND a.asof = b.asof
+          AND a.id < b.id
+    """)
+
+    op.create_index(
+        'uq_prices_asset_asof',
+        'prices',
+        ['asset_id', 'asof'],
+        unique=True,
+        schema='portfolio',
+        if_not_exists=True
+    )
+
+    print("✓ Created unique index: uq_prices_asset_asof")
+
+
+def downgrade() -> None:
+    """Remove the unique index"""
+    op.drop_index(
+        'uq_prices_asset_asof',
+        table_name='prices',
+        schema='portfolio',
+        if_exists=True
+    )
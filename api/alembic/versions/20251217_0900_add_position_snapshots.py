@@ -0,0 +1,103 @@
+"""Add persisted position snapshots and checkpoints
+
+Revision ID: 20251217_0900
+Revises: 20251216_0900
+Create Date: 2025-12-17 09:00:00
+
+Positions used to be computed by reloading and replaying every transaction of
+a portfolio on each cache miss. position_snapshots keeps the folded state per
+(portfolio, asset); position_checkpoints keeps the state after each
+transaction so back-dated edits/deletes only replay from the affected date.
+Both are maintained by app.crud.positions on every transaction flush.
+
+portfolios.positions_synced_at stays NULL for existing portfolios; their
+snapshots are built by one full replay on the first positions read.
+
+Performance Impact:
+- Position reads are one query per portfolio, independent of history length
+- Appending a transaction folds only that transaction
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20251217_0900'
+down_revision: Union[str, None] = '20251216_0900'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _state_columns():
+    return [
+        sa.Column('quantity', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_cost', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('shares_for_cost', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('realized_pnl', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_buy_cost', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_buy_shares', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_sell_proceeds', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_sell_shares', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_dividends', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('total_fees', sa.NUMERIC(), nullable=False, server_default='0'),
+        sa.Column('position_currency', sa.String(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    """Create position_snapshots / position_checkpoints and the sync marker"""
+    op.create_table(
+        'position_snapshots',
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('asset_id', sa.Integer(), nullable=False),
+        *_state_columns(),
+        sa.Column('last_tx_id', sa.Integer(), nullable=True),
+        sa.Column('last_tx_date', sa.Date(), nullable=True),
+        sa.Column('last_tx_created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('portfolio_id', 'asset_id'),
+        sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.portfolios.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['asset_id'], ['portfolio.assets.id'], ondelete='CASCADE'),
+        schema='portfolio'
+    )
+    print("✓ Created portfolio.position_snapshots")
+
+    op.create_table(
+        'position_checkpoints',
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('portfolio_id', sa.Integer(), nullable=False),
+        sa.Column('asset_id', sa.Integer(), nullable=False),
+        sa.Column('tx_date', sa.Date(), nullable=False),
+        sa.Column('tx_created_at', sa.DateTime(), nullable=True),
+        *_state_columns(),
+        sa.PrimaryKeyConstraint('transaction_id'),
+        sa.ForeignKeyConstraint(['transaction_id'], ['portfolio.transactions.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['portfolio_id'], ['portfolio.portfolios.id'], ondelete='CASCADE'),
+        schema='portfolio'
+    )
+    op.create_index(
+        'idx_position_checkpoints_lookup',
+        'position_checkpoints',
+        ['portfolio_id', 'asset_id', 'tx_date'],
+        schema='portfolio',
+        if_not_exists=True
+    )
+    print("✓ Created portfolio.position_checkpoints")
+
+    op.add_column(
+        'portfolios',
+        sa.Column('positions_synced_at', sa.DateTime(), nullable=True),
+        schema='portfolio'
+    )
+    print("✓ Added portfolios.positions_synced_at (existing portfolios rebuild on first read)")
+
+
+def downgrade() -> None:
+    """Drop position snapshot tables and the sync marker"""
+    op.drop_column('portfolios', 'positions_synced_at', schema='portfolio')
+    op.drop_index('idx_position_checkpoints_lookup', table_name='position_checkpoints', schema='portfolio', if_exists=True)
+    op.drop_table('position_checkpoints', schema='portfolio')
+    op.drop_table('position_snapshots', schema='portfolio')
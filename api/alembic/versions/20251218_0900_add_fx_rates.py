@@ -0,0 +1,49 @@
+"""Add daily FX rate series
+
+Revision ID: 20251218_0900
+Revises: 20251217_0900
+Create Date: 2025-12-18 09:00:00
+
+Historical exchange rates were downloaded from Yahoo Finance on every lookup
+(a 7-day window per call) and never stored, so the history chart converted
+every day at today's spot rate. fx_rates keeps one close per currency pair
+and day; app.services.fx_history backfills it incrementally with USD legs and
+serves as-of lookups from sorted in-memory arrays.
+
+Performance Impact:
+- Historical rate lookups no longer hit Yahoo Finance once a pair is stored
+- History charts convert each day at its own rate without per-day requests
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '20251218_0900'
+down_revision: Union[str, None] = '20251217_0900'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create portfolio.fx_rates"""
+    op.create_table(
+        'fx_rates',
+        sa.Column('base_currency', sa.String(), nullable=False),
+        sa.Column('quote_currency', sa.String(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('rate', sa.NUMERIC(precision=20, scale=10), nullable=False),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('base_currency', 'quote_currency', 'date'),
+        schema='portfolio'
+    )
+    print("✓ Created portfolio.fx_rates (backfilled on first use)")
+
+
+def downgrade() -> None:
+    """Drop portfolio.fx_rates"""
+    op.drop_table('fx_rates', schema='portfolio')
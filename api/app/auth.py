@@ -10,10 +10,11 @@ from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.db import get_db
+from app.db import get_async_db, get_db
 from app.models import User
 from app.schemas import TokenData
 from app.errors import (
@@ -89,19 +90,38 @@ async def get_current_user(
     db: Session = Depends(get_db)
 ) -> User:
     """Get current authenticated user from JWT token"""
+    token_data = _decode_token(token)
+    user = db.query(User).filter(User.id == token_data.user_id).first()
+    return _check_user(user, token_data)
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Get current authenticated user from JWT token (async session, for the hot read endpoints)"""
+    from app.crud.aio import users as crud_users
+    
+    token_data = _decode_token(token)
+    user = await crud_users.get_user_by_id(db, token_data.user_id)
+    return _check_user(user, token_data)
+
+
+def _decode_token(token: str) -> TokenData:
+    """Validate a JWT and extract its claims"""
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id: int = payload.get("user_id")
         email: str = payload.get("email")
-        is_admin: bool = payload.get("is_admin", False)
         if user_id is None or email is None:
             raise InvalidTokenError("Could not validate credentials")
-        token_data = TokenData(user_id=user_id, email=email)
+        return TokenData(user_id=user_id, email=email)
     except JWTError:
         raise InvalidTokenError("Could not validate credentials")
-    
-    user = db.query(User).filter(User.id == token_data.user_id).first()
-    
+
+
+def _check_user(user: Optional[User], token_data: TokenData) -> User:
+    """Reject missing and inactive users"""
     if user is None:
         raise UserNotFoundError(user_id=token_data.user_id)
     
@@ -129,6 +149,15 @@ async def get_current_verified_user(
     return current_user
 
 
+async def get_current_verified_user_async(
+    current_user: User = Depends(get_current_user_async)
+) -> User:
+    """Get current verified user (async session)"""
+    if not current_user.is_verified:
+        raise EmailNotVerifiedError()
+    return current_user
+
+
 async def get_current_superuser(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -174,3 +203,28 @@ async def verify_portfolio_access(
         raise UnauthorizedPortfolioAccessError(portfolio_id)
     
     return portfolio
+
+
+async def verify_portfolio_access_async(
+    portfolio_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Async-session variant of verify_portfolio_access for the hot read endpoints
+    
+    Usage in routers:
+        @router.get("/{portfolio_id}/positions")
+        async def endpoint(portfolio = Depends(verify_portfolio_access_async)):
+            return portfolio
+    """
+    from app.crud.aio import portfolios as crud
+    
+    portfolio = await crud.get_portfolio(db, portfolio_id)
+    if not portfolio:
+        raise PortfolioNotFoundError(portfolio_id)
+    
+    if portfolio.user_id != current_user.id:
+        raise UnauthorizedPortfolioAccessError(portfolio_id)
+    
+    return portfolio
@@ -16,6 +16,7 @@ celery_app = Celery(
         "app.tasks.cache_tasks",
         "app.tasks.dashboard_tasks",
         "app.tasks.report_tasks",
+        "app.tasks.price_tasks",
     ]
 )
 
@@ -52,6 +52,33 @@ class Settings(BaseSettings):
     
     # Price caching
     PRICE_CACHE_TTL_SECONDS: int = 300
+    PRICE_BATCH_FETCH_SIZE: int = 50  # Max symbols per batched quote request
+
+    # Scheduled price refresh (held symbols whose exchange is open)
+    PRICE_REFRESH_ROUND_SIZE: int = 100  # Symbols resolved together by one get_multiple_prices() round
+    PRICE_REFRESH_CONCURRENCY: int = 4  # Rounds in flight at once
+    PRICE_REFRESH_MAX_SYMBOLS: int = 2000  # Symbols per run, the least recently priced first
+    PRICE_REFRESH_BUDGET_SECONDS: float = 600.0  # No new round starts after this long (the job runs every 15 min)
+
+    # Price tick stream (ATH, alerts, positions cache and daily change notifications follow fetched prices)
+    PRICE_TICK_STREAM_MAXLEN: int = 100000  # Ticks kept in the stream (approximate trim)
+    PRICE_TICK_BATCH_SIZE: int = 500  # Ticks read and applied together by a consumer group
+    PRICE_TICK_POLL_SECONDS: int = 5  # How often the scheduler drains the consumer groups
+    PRICE_TICK_CLAIM_IDLE_SECONDS: int = 60  # Unacknowledged ticks are retried after this long
+    PRICE_TICK_MAX_DELIVERIES: int = 5  # Ticks failing this many times are dropped
+    PRICE_FEED_HEARTBEAT_SECONDS: int = 15  # Idle live price connections get a heartbeat this often
+    MARKET_DATA_REFRESH_SECONDS: int = 240  # Sentiment and index refresh interval (entries are fresh for 300s)
+    MARKET_DATA_MAX_STALE_SECONDS: int = 21600  # Last known market data is served this long when upstream fails
+    
+    # Upstream market data (Yahoo Finance HTTP API, shared by every quote consumer)
+    YAHOO_BASE_URL: str = "https://query1.finance.yahoo.com"
+    UPSTREAM_MAX_CONCURRENCY: int = 8  # Max in-flight upstream requests per event loop
+    UPSTREAM_RATE_PER_SECOND: float = 20.0  # Token bucket refill rate, shared by the whole process
+    UPSTREAM_RATE_BURST: int = 20  # Token bucket capacity
+    UPSTREAM_TIMEOUT_SECONDS: float = 10.0  # Default per-request timeout
+    
+    # Streaming dashboard batch
+    DASHBOARD_WIDGET_DEADLINE_SECONDS: float = 15.0  # A widget still computing after this is reported pending
     
     # Transaction validation
     VALIDATE_SELL_QUANTITY: bool = True  # Check if selling more shares than owned
@@ -67,6 +94,11 @@ class Settings(BaseSettings):
     REDIS_MAX_CONNECTIONS: int = 50
     REDIS_SOCKET_TIMEOUT: int = 5
     REDIS_SOCKET_CONNECT_TIMEOUT: int = 5
+    CACHE_LOCAL_MAX_ENTRIES: int = 4096  # In-process cache tier in front of Redis (0 disables it)
+    CACHE_LOCAL_TTL_SECONDS: int = 30  # Longest a value is served from the process without asking Redis
+    CACHE_CODEC: str = "msgpack"  # "msgpack", or "json" to write entries workers without the codec can read
+    CACHE_COMPRESSION: str = "zstd"  # "zstd" (zlib when zstandard is not installed), "zlib" or "none"
+    CACHE_COMPRESSION_MIN_BYTES: int = 1024  # Cache entries at least this large are compressed
     
     # Celery Configuration
     CELERY_BROKER_URL: str = ""  # Will be constructed from Redis settings if not provided
@@ -196,6 +228,16 @@ class Settings(BaseSettings):
                 "PRICE_CACHE_TTL_SECONDS cannot be negative. "
                 f"Current: {self.PRICE_CACHE_TTL_SECONDS}"
             )
+        if self.PRICE_BATCH_FETCH_SIZE < 1:
+            errors.append(
+                "PRICE_BATCH_FETCH_SIZE must be at least 1. "
+                f"Current: {self.PRICE_BATCH_FETCH_SIZE}"
+            )
+        if self.UPSTREAM_MAX_CONCURRENCY < 1 or self.UPSTREAM_RATE_PER_SECOND <= 0 or self.UPSTREAM_RATE_BURST < 1:
+            errors.append(
+                "UPSTREAM_MAX_CONCURRENCY and UPSTREAM_RATE_BURST must be at least 1 "
+                "and UPSTREAM_RATE_PER_SECOND must be positive"
+            )
         
         # 9. Validate CORS origins
         if not self.CORS_ORIGINS:
@@ -222,6 +264,11 @@ class Settings(BaseSettings):
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
     
+    @property
+    def async_database_url(self) -> str:
+        """Database URL for the asyncpg driver (async read endpoints)"""
+        return self.database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    
     @property
     def redis_url(self) -> str:
         """Construct Redis URL for Celery"""
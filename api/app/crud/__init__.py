@@ -1 +1,5 @@
 """CRUD package"""
+# Registers the after_flush listener that keeps position snapshots in sync with transactions
+from app.crud import positions  # noqa: F401
+# Registers the session listeners that keep the price alert index in sync with watchlist alerts
+from app.crud import watchlist  # noqa: F401
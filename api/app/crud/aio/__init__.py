@@ -0,0 +1,6 @@
+"""
+Async CRUD variants for the AsyncSession path (app.db.get_async_db)
+
+Only the lookups request dependencies make directly live here; service code
+runs the sync crud modules through app.db.run_db instead.
+"""
@@ -0,0 +1,24 @@
+"""
+Async CRUD reads for portfolios
+"""
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Portfolio
+
+
+async def get_portfolio(db: AsyncSession, portfolio_id: int) -> Optional[Portfolio]:
+    """Get portfolio by ID (direct from database)"""
+    return await db.get(Portfolio, portfolio_id)
+
+
+async def get_portfolios_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> List[Portfolio]:
+    """Get portfolios for a specific user"""
+    result = await db.scalars(
+        select(Portfolio)
+        .where(Portfolio.user_id == user_id)
+        .offset(skip)
+        .limit(limit)
+    )
+    return list(result)
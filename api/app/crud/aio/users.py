@@ -0,0 +1,12 @@
+"""
+Async CRUD reads for users
+"""
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import User
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Get user by ID"""
+    return await db.get(User, user_id)
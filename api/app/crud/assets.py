@@ -1,10 +1,11 @@
 """
 CRUD operations for assets
 """
-from typing import List, Optional
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import case, or_, update
 
 from app.models import Asset
 from app.schemas import AssetCreate
@@ -130,6 +131,34 @@ def delete_asset(db: Session, asset_id: int) -> bool:
     return True
 
 
+def raise_all_time_highs(db: Session, highs: Dict[int, Tuple[Decimal, datetime]]) -> int:
+    """
+    Raise the all-time high of every asset a new price beats, with one UPDATE
+
+    Assets without an ATH take the price; the others only when it is higher.
+    Not committed.
+
+    Args:
+        db: Database session
+        highs: Asset ID -> (highest new price, when it was reached)
+
+    Returns:
+        Number of assets whose ATH was raised
+    """
+    if not highs:
+        return 0
+    price = case({asset_id: high for asset_id, (high, _) in highs.items()}, value=Asset.id)
+    reached = case({asset_id: asof for asset_id, (_, asof) in highs.items()}, value=Asset.id)
+    result = db.execute(
+        update(Asset)
+        .where(Asset.id.in_(list(highs)))
+        .where(or_(Asset.ath_price.is_(None), Asset.ath_price < price))
+        .values(ath_price=price, ath_date=reached, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
 def enrich_asset_metadata(db: Session, asset_id: int) -> Optional[Asset]:
     """Enrich asset with metadata from yfinance"""
     import yfinance as yf
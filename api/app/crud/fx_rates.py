@@ -0,0 +1,86 @@
+"""
+CRUD operations for historical FX rates
+"""
+from typing import Dict, Iterable, List, Tuple
+from datetime import date
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+
+from app.crud.prices import BULK_UPSERT_CHUNK_SIZE, upsert_insert
+from app.models import FxRate
+
+
+def get_fx_series(
+    db: Session,
+    base_currency: str,
+    quote_currencies: Iterable[str]
+) -> Dict[str, List[Tuple[date, Decimal]]]:
+    """
+    Get the stored daily rates of many pairs sharing a base currency in one query
+
+    Args:
+        db: Database session
+        base_currency: Base currency of every pair (e.g. 'USD')
+        quote_currencies: Quote currencies to load
+
+    Returns:
+        Dict of quote_currency -> (date, rate) tuples in ascending date order.
+        Every requested currency has a key, possibly empty.
+    """
+    quote_currencies = list(dict.fromkeys(quote_currencies))
+    series: Dict[str, List[Tuple[date, Decimal]]] = {currency: [] for currency in quote_currencies}
+    if not quote_currencies:
+        return series
+
+    stmt = (
+        select(FxRate.quote_currency, FxRate.date, FxRate.rate)
+        .where(FxRate.base_currency == base_currency, FxRate.quote_currency.in_(quote_currencies))
+        .order_by(FxRate.quote_currency, FxRate.date)
+    )
+    for row in db.execute(stmt):
+        series[row.quote_currency].append((row.date, Decimal(str(row.rate))))
+    return series
+
+
+def upsert_fx_rates(
+    db: Session,
+    rates: Iterable[dict],
+    chunk_size: int = BULK_UPSERT_CHUNK_SIZE
+) -> int:
+    """
+    Insert or update many daily rates with one INSERT ... ON CONFLICT per chunk
+
+    Flushes without committing; the caller owns the transaction.
+
+    Args:
+        db: Database session
+        rates: Dicts with base_currency, quote_currency, date, rate, source
+        chunk_size: Rows per statement
+
+    Returns:
+        Number of rows written
+    """
+    # Last write wins for duplicate keys
+    rows = {
+        (r["base_currency"], r["quote_currency"], r["date"]): {
+            "base_currency": r["base_currency"],
+            "quote_currency": r["quote_currency"],
+            "date": r["date"],
+            "rate": r["rate"],
+            "source": r.get("source") or "yfinance",
+        }
+        for r in rates
+    }
+    rows = list(rows.values())
+
+    for start in range(0, len(rows), chunk_size):
+        stmt = upsert_insert(db)(FxRate.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FxRate.base_currency, FxRate.quote_currency, FxRate.date],
+            set_={"rate": stmt.excluded.rate, "source": stmt.excluded.source},
+        )
+        db.execute(stmt, rows[start:start + chunk_size])
+
+    db.flush()
+    return len(rows)
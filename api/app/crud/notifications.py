@@ -8,6 +8,12 @@ from sqlalchemy import desc
 from app.models import Notification, NotificationType
 
 
+def _invalidate_dashboard(user_id: int) -> None:
+    """Drop the cached notifications widget of a user"""
+    from app.services.cache import invalidate_dashboard_widgets
+    invalidate_dashboard_widgets(f"u{user_id}", "notifications")
+
+
 def create_notification(
     db: Session,
     user_id: int,
@@ -27,6 +33,7 @@ def create_notification(
     db.add(notification)
     db.commit()
     db.refresh(notification)
+    _invalidate_dashboard(user_id)
     return notification
 
 
@@ -69,6 +76,7 @@ def mark_as_read(db: Session, notification_id: int) -> Optional[Notification]:
         notification.is_read = True
         db.commit()
         db.refresh(notification)
+        _invalidate_dashboard(notification.user_id)
     return notification
 
 
@@ -79,6 +87,7 @@ def mark_all_as_read(db: Session, user_id: int) -> int:
         Notification.is_read == False
     ).update({"is_read": True})
     db.commit()
+    _invalidate_dashboard(user_id)
     return count
 
 
@@ -88,6 +97,7 @@ def delete_notification(db: Session, notification_id: int) -> bool:
     if notification:
         db.delete(notification)
         db.commit()
+        _invalidate_dashboard(notification.user_id)
         return True
     return False
 
@@ -0,0 +1,375 @@
+"""
+CRUD operations for persisted position snapshots
+
+Snapshots are kept in sync with transactions by an after_flush listener, so
+every writer (crud.transactions, conversions, watchlist convert-to-buy, CSV
+import) updates them in the same database transaction as the change itself:
+
+- Appended transactions (later in fold order than the snapshot's last
+  applied transaction) are folded into the stored state one by one
+- Back-dated inserts, edits and deletes replay only the transactions dated
+  on/after the affected date, starting from the last checkpoint before it
+
+Portfolios with positions_synced_at NULL (created before snapshots existed)
+are skipped by the listener and rebuilt on first read.
+"""
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, inspect, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import Asset, Portfolio, PositionCheckpoint, PositionSnapshot, Transaction
+from app.services.position_state import PositionState, fold_key
+
+logger = logging.getLogger(__name__)
+
+# Transaction attributes that change the folded state (notes edits do not)
+FOLD_ATTRIBUTES = ("asset_id", "tx_date", "type", "quantity", "price", "fees", "currency", "meta_data")
+
+_TX_COLUMNS = (
+    Transaction.id,
+    Transaction.asset_id,
+    Transaction.tx_date,
+    Transaction.created_at,
+    Transaction.type,
+    Transaction.quantity,
+    Transaction.price,
+    Transaction.fees,
+    Transaction.currency,
+    Transaction.meta_data.label("meta_data"),
+)
+
+
+def get_position_snapshots(db: Session, portfolio_id: int) -> List[PositionSnapshot]:
+    """Get all position snapshots of a portfolio with their assets (one query)"""
+    return (
+        db.query(PositionSnapshot)
+        .options(joinedload(PositionSnapshot.asset))
+        .filter(PositionSnapshot.portfolio_id == portfolio_id)
+        .order_by(PositionSnapshot.asset_id)
+        # Snapshots are written with Core statements; never serve stale identity-map rows
+        .populate_existing()
+        .all()
+    )
+
+
+def get_position_snapshot(db: Session, portfolio_id: int, asset_id: int) -> Optional[PositionSnapshot]:
+    """Get the position snapshot of one asset in a portfolio"""
+    return (
+        db.query(PositionSnapshot)
+        .filter(
+            PositionSnapshot.portfolio_id == portfolio_id,
+            PositionSnapshot.asset_id == asset_id
+        )
+        .populate_existing()
+        .first()
+    )
+
+
+def get_held_assets(db: Session) -> List[Asset]:
+    """Assets with a positive quantity in at least one portfolio (one query)"""
+    held = select(PositionSnapshot.asset_id).where(PositionSnapshot.quantity > 0)
+    return db.query(Asset).filter(Asset.id.in_(held)).order_by(Asset.id).all()
+
+
+def get_holding_portfolios(db: Session, asset_ids: List[int]) -> List[int]:
+    """IDs of the portfolios with a positive quantity of any of the assets (one query)"""
+    if not asset_ids:
+        return []
+    return list(db.execute(
+        select(PositionSnapshot.portfolio_id)
+        .where(PositionSnapshot.asset_id.in_(asset_ids), PositionSnapshot.quantity > 0)
+        .distinct()
+        .order_by(PositionSnapshot.portfolio_id)
+    ).scalars())
+
+
+def rebuild_portfolio_positions(db: Session, portfolio_id: int) -> int:
+    """
+    Rebuild all snapshots and checkpoints of a portfolio with one full replay
+
+    Marks the portfolio as synced and commits.
+
+    Returns:
+        Number of position snapshots written
+    """
+    conn = db.connection()
+    conn.execute(delete(PositionCheckpoint.__table__).where(PositionCheckpoint.portfolio_id == portfolio_id))
+    conn.execute(delete(PositionSnapshot.__table__).where(PositionSnapshot.portfolio_id == portfolio_id))
+
+    rows = conn.execute(
+        select(*_TX_COLUMNS)
+        .where(Transaction.portfolio_id == portfolio_id)
+        .order_by(Transaction.asset_id, Transaction.tx_date, Transaction.created_at, Transaction.id)
+    ).all()
+
+    by_asset: Dict[int, List[Any]] = {}
+    for row in rows:
+        by_asset.setdefault(row.asset_id, []).append(row)
+
+    checkpoints: List[Dict[str, Any]] = []
+    for asset_id, txs in by_asset.items():
+        txs.sort(key=lambda tx: fold_key(tx.tx_date, tx.created_at, tx.id))
+        state = PositionState()
+        checkpoints.extend(_fold(state, portfolio_id, asset_id, txs))
+        _write_snapshot(conn, portfolio_id, asset_id, state, txs[-1])
+
+    if checkpoints:
+        conn.execute(insert(PositionCheckpoint.__table__), checkpoints)
+
+    db.query(Portfolio).filter(Portfolio.id == portfolio_id).update(
+        {Portfolio.positions_synced_at: datetime.utcnow()},
+        synchronize_session="evaluate"
+    )
+    db.commit()
+
+    logger.info(
+        f"Rebuilt {len(by_asset)} position snapshots for portfolio {portfolio_id} "
+        f"from {len(rows)} transactions"
+    )
+    return len(by_asset)
+
+
+def _fold(state: PositionState, portfolio_id: int, asset_id: int, txs: List[Any]) -> List[Dict[str, Any]]:
+    """Apply transactions to state in place and return one checkpoint row per transaction"""
+    checkpoints = []
+    for tx in txs:
+        state.apply(tx)
+        checkpoints.append({
+            "transaction_id": tx.id,
+            "portfolio_id": portfolio_id,
+            "asset_id": asset_id,
+            "tx_date": tx.tx_date,
+            "tx_created_at": tx.created_at,
+            **state.as_dict(),
+        })
+    return checkpoints
+
+
+def _write_snapshot(conn: Connection, portfolio_id: int, asset_id: int, state: PositionState, last_tx: Any) -> None:
+    """Replace the snapshot of (portfolio, asset) with state as of last_tx"""
+    conn.execute(
+        delete(PositionSnapshot.__table__).where(
+            PositionSnapshot.portfolio_id == portfolio_id,
+            PositionSnapshot.asset_id == asset_id
+        )
+    )
+    conn.execute(
+        insert(PositionSnapshot.__table__).values(
+            portfolio_id=portfolio_id,
+            asset_id=asset_id,
+            last_tx_id=last_tx.id,
+            last_tx_date=last_tx.tx_date,
+            last_tx_created_at=last_tx.created_at,
+            updated_at=datetime.utcnow(),
+            **state.as_dict()
+        )
+    )
+
+
+def _append(conn: Connection, portfolio_id: int, asset_id: int, snapshot: Any, txs: List[Any]) -> None:
+    """Fold transactions that come after the snapshot's last applied transaction"""
+    state = PositionState.from_row(snapshot) if snapshot is not None else PositionState()
+    checkpoints = _fold(state, portfolio_id, asset_id, txs)
+    conn.execute(insert(PositionCheckpoint.__table__), checkpoints)
+    _write_snapshot(conn, portfolio_id, asset_id, state, txs[-1])
+
+
+def _replay(conn: Connection, portfolio_id: int, asset_id: int, from_date: date) -> None:
+    """Recompute checkpoints and snapshot of (portfolio, asset) from from_date on"""
+    start = conn.execute(
+        select(PositionCheckpoint.__table__)
+        .where(
+            PositionCheckpoint.portfolio_id == portfolio_id,
+            PositionCheckpoint.asset_id == asset_id,
+            PositionCheckpoint.tx_date < from_date
+        )
+        .order_by(
+            PositionCheckpoint.tx_date.desc(),
+            PositionCheckpoint.tx_created_at.desc().nulls_last(),
+            PositionCheckpoint.transaction_id.desc()
+        )
+        .limit(1)
+    ).first()
+
+    txs = conn.execute(
+        select(*_TX_COLUMNS)
+        .where(
+            Transaction.portfolio_id == portfolio_id,
+            Transaction.asset_id == asset_id,
+            Transaction.tx_date >= from_date
+        )
+        .order_by(Transaction.tx_date, Transaction.created_at, Transaction.id)
+    ).all()
+    txs = sorted(txs, key=lambda tx: fold_key(tx.tx_date, tx.created_at, tx.id))
+
+    conn.execute(
+        delete(PositionCheckpoint.__table__).where(
+            PositionCheckpoint.portfolio_id == portfolio_id,
+            PositionCheckpoint.asset_id == asset_id,
+            PositionCheckpoint.tx_date >= from_date
+        )
+    )
+    if txs:
+        # Transactions moved here from another asset still have their old checkpoint
+        conn.execute(
+            delete(PositionCheckpoint.__table__).where(
+                PositionCheckpoint.transaction_id.in_([tx.id for tx in txs])
+            )
+        )
+
+    if start is None and not txs:
+        conn.execute(
+            delete(PositionSnapshot.__table__).where(
+                PositionSnapshot.portfolio_id == portfolio_id,
+                PositionSnapshot.asset_id == asset_id
+            )
+        )
+        return
+
+    state = PositionState.from_row(start) if start is not None else PositionState()
+    if txs:
+        conn.execute(insert(PositionCheckpoint.__table__), _fold(state, portfolio_id, asset_id, txs))
+        last_tx = txs[-1]
+    else:
+        last_tx = _CheckpointKey(start.transaction_id, start.tx_date, start.tx_created_at)
+    _write_snapshot(conn, portfolio_id, asset_id, state, last_tx)
+
+
+class _CheckpointKey:
+    """Fold key of a checkpoint, shaped like a transaction row"""
+
+    __slots__ = ("id", "tx_date", "created_at")
+
+    def __init__(self, tx_id: int, tx_date: date, created_at: Optional[datetime]):
+        self.id = tx_id
+        self.tx_date = tx_date
+        self.created_at = created_at
+
+
+class _PendingChange:
+    """Transactions appended and earliest replay date of one (portfolio, asset) in a flush"""
+
+    __slots__ = ("appended", "replay_from")
+
+    def __init__(self):
+        self.appended: List[Transaction] = []
+        self.replay_from: Optional[date] = None
+
+    def replay(self, from_date: date) -> None:
+        if self.replay_from is None or from_date < self.replay_from:
+            self.replay_from = from_date
+
+
+def _loaded(tx: Transaction, attribute: str) -> Any:
+    """Value of an attribute before the flush without triggering a load (None if unknown)"""
+    state = inspect(tx)
+    history = state.attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.dict.get(attribute)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_position_snapshots(session: Session, flush_context: Any) -> None:
+    """Fold flushed transaction changes into position snapshots (same DB transaction)"""
+    new = [obj for obj in session.new if isinstance(obj, Transaction)]
+    dirty = [
+        obj for obj in session.dirty
+        if isinstance(obj, Transaction)
+        and any(inspect(obj).attrs[attr].history.has_changes() for attr in FOLD_ATTRIBUTES)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Transaction)]
+    if not (new or dirty or deleted):
+        return
+
+    conn = session.connection()
+    changes: Dict[Tuple[int, int], _PendingChange] = {}
+    unattributed = set()
+
+    def change(portfolio_id: int, asset_id: int) -> _PendingChange:
+        return changes.setdefault((portfolio_id, asset_id), _PendingChange())
+
+    for tx in new:
+        change(tx.portfolio_id, tx.asset_id).appended.append(tx)
+
+    if dirty:
+        # Checkpoints remember where each transaction was folded before the edit
+        previous = {
+            row.transaction_id: row
+            for row in conn.execute(
+                select(
+                    PositionCheckpoint.transaction_id,
+                    PositionCheckpoint.asset_id,
+                    PositionCheckpoint.tx_date
+                ).where(PositionCheckpoint.transaction_id.in_([tx.id for tx in dirty]))
+            )
+        }
+        for tx in dirty:
+            old = previous.get(tx.id)
+            old_asset_id = old.asset_id if old else _loaded(tx, "asset_id")
+            old_date = old.tx_date if old else _loaded(tx, "tx_date")
+            if old_asset_id is None or old_date is None:
+                unattributed.add(tx.portfolio_id)
+                continue
+            change(tx.portfolio_id, tx.asset_id).replay(min(old_date, tx.tx_date))
+            if old_asset_id != tx.asset_id:
+                change(tx.portfolio_id, old_asset_id).replay(old_date)
+
+    for tx in deleted:
+        portfolio_id = _loaded(tx, "portfolio_id")
+        asset_id = _loaded(tx, "asset_id")
+        tx_date = _loaded(tx, "tx_date")
+        if asset_id is None or tx_date is None:
+            unattributed.add(portfolio_id)
+            continue
+        change(portfolio_id, asset_id).replay(tx_date)
+
+    portfolio_ids = {portfolio_id for portfolio_id, _ in changes} | unattributed
+    synced = set(conn.execute(
+        select(Portfolio.id).where(
+            Portfolio.id.in_(portfolio_ids),
+            Portfolio.positions_synced_at.isnot(None)
+        )
+    ).scalars())
+    # Portfolios being deleted take their snapshots with them
+    synced -= {obj.id for obj in session.deleted if isinstance(obj, Portfolio)}
+
+    unattributed &= synced
+    if unattributed:
+        # Cannot tell which positions changed: rebuild these portfolios on next read
+        conn.execute(
+            update(Portfolio.__table__)
+            .where(Portfolio.id.in_(unattributed))
+            .values(positions_synced_at=None)
+        )
+        synced -= unattributed
+
+    for (portfolio_id, asset_id), pending in changes.items():
+        if portfolio_id not in synced:
+            continue
+
+        appended = sorted(pending.appended, key=lambda tx: fold_key(tx.tx_date, tx.created_at, tx.id))
+        if pending.replay_from is None:
+            snapshot = conn.execute(
+                select(PositionSnapshot.__table__).where(
+                    PositionSnapshot.portfolio_id == portfolio_id,
+                    PositionSnapshot.asset_id == asset_id
+                )
+            ).first()
+            first_key = fold_key(appended[0].tx_date, appended[0].created_at, appended[0].id)
+            if snapshot is None or first_key > fold_key(
+                snapshot.last_tx_date, snapshot.last_tx_created_at, snapshot.last_tx_id
+            ):
+                _append(conn, portfolio_id, asset_id, snapshot, appended)
+                continue
+        if appended:
+            # Back-dated insert (or insert next to an edit/delete)
+            pending.replay(appended[0].tx_date)
+
+        _replay(conn, portfolio_id, asset_id, pending.replay_from)
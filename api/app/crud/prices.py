@@ -1,14 +1,28 @@
 """
 CRUD operations for prices
 """
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import Row, and_, case, func, not_, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
 
-from app.models import Price, Asset
+from app.models import Price, Asset, DailyClose
 from app.schemas import PriceCreate
 
+# Source tag of official daily closes; preferred over intraday quotes of the same day
+OFFICIAL_CLOSE_SOURCE = "yfinance_history"
+
+# Rows per INSERT ... ON CONFLICT statement in bulk upserts (5-6 bind params per row)
+BULK_UPSERT_CHUNK_SIZE = 1000
+
+
+def upsert_insert(db: Session):
+    """Dialect-specific INSERT construct (supports ON CONFLICT on PostgreSQL and SQLite)"""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
+
 
 def get_latest_price(db: Session, asset_id: int) -> Optional[Price]:
     """Get most recent price for an asset"""
@@ -20,6 +34,63 @@ def get_latest_price(db: Session, asset_id: int) -> Optional[Price]:
     )
 
 
+def get_latest_prices(db: Session, asset_ids: Iterable[int]) -> Dict[int, Price]:
+    """Most recent price of each asset, in one query"""
+    asset_ids = list(set(asset_ids))
+    if not asset_ids:
+        return {}
+    ranked = (
+        select(
+            Price.id,
+            func.row_number().over(
+                partition_by=Price.asset_id, order_by=(Price.asof.desc(), Price.id.desc())
+            ).label("rank"),
+        )
+        .where(Price.asset_id.in_(asset_ids))
+        .subquery()
+    )
+    rows = db.query(Price).join(ranked, Price.id == ranked.c.id).filter(ranked.c.rank == 1).all()
+    return {price.asset_id: price for price in rows}
+
+
+def get_recent_prices(
+    db: Session,
+    asset_ids: Iterable[int],
+    date_from: datetime,
+    date_to: Optional[datetime] = None,
+    limit: int = 100
+) -> Dict[int, List[Price]]:
+    """
+    get_prices() for many assets in one query: per asset, its prices since
+    date_from (until date_to), newest first, at most limit of them
+    """
+    asset_ids = list(set(asset_ids))
+    if not asset_ids:
+        return {}
+    conditions = [Price.asset_id.in_(asset_ids), Price.asof >= date_from]
+    if date_to:
+        conditions.append(Price.asof <= date_to)
+    ranked = (
+        select(
+            Price.id,
+            func.row_number().over(partition_by=Price.asset_id, order_by=Price.asof.desc()).label("rank"),
+        )
+        .where(*conditions)
+        .subquery()
+    )
+    rows = (
+        db.query(Price)
+        .join(ranked, Price.id == ranked.c.id)
+        .filter(ranked.c.rank <= limit)
+        .order_by(Price.asset_id, Price.asof.desc())
+        .all()
+    )
+    prices: Dict[int, List[Price]] = {}
+    for price in rows:
+        prices.setdefault(price.asset_id, []).append(price)
+    return prices
+
+
 def get_prices(
     db: Session,
     asset_id: int,
@@ -38,6 +109,169 @@ def get_prices(
     return q.order_by(Price.asof.desc()).limit(limit).all()
 
 
+def get_daily_closes(
+    db: Session,
+    asset_ids: Iterable[int],
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> Dict[int, List[Row]]:
+    """
+    Get one closing price per calendar day for many assets in a single query
+    
+    Reads the materialized daily_closes table: for each (asset, day) the
+    official close (source 'yfinance_history') wins, otherwise the latest price
+    of the day.
+    
+    Args:
+        db: Database session
+        asset_ids: Assets to load
+        date_from: Inclusive lower bound on asof
+        date_to: Inclusive upper bound on asof
+    
+    Returns:
+        Dict of asset_id -> rows (asset_id, asof, price, volume, source) in
+        ascending date order. Every requested asset has a key, possibly empty.
+    """
+    asset_ids = list(dict.fromkeys(asset_ids))
+    closes: Dict[int, List[Row]] = {asset_id: [] for asset_id in asset_ids}
+    if not asset_ids:
+        return closes
+    
+    stmt = select(
+        DailyClose.asset_id,
+        DailyClose.asof,
+        DailyClose.close.label("price"),
+        DailyClose.volume,
+        DailyClose.source,
+    ).where(DailyClose.asset_id.in_(asset_ids))
+    
+    # Range on the (asset_id, date) key first, exact asof bounds on the edges
+    if date_from:
+        stmt = stmt.where(DailyClose.date >= date_from.date(), DailyClose.asof >= date_from)
+    if date_to:
+        stmt = stmt.where(DailyClose.date <= date_to.date(), DailyClose.asof <= date_to)
+    
+    for row in db.execute(stmt.order_by(DailyClose.asset_id, DailyClose.date)):
+        closes[row.asset_id].append(row)
+    return closes
+
+
+def _preferred(candidate: dict, current: dict) -> bool:
+    """Whether candidate should replace current as the close of the same day"""
+    candidate_official = candidate["source"] == OFFICIAL_CLOSE_SOURCE
+    current_official = current["source"] == OFFICIAL_CLOSE_SOURCE
+    if candidate_official != current_official:
+        return candidate_official
+    return candidate["asof"] >= current["asof"]
+
+
+def upsert_daily_closes(db: Session, prices: Iterable[Tuple[int, datetime, object, Optional[int], Optional[str]]]) -> None:
+    """
+    Fold newly written prices into daily_closes (does not commit)
+    
+    Args:
+        db: Database session
+        prices: (asset_id, asof, price, volume, source) tuples
+    
+    Keeps the existing row when it is preferred over the new price: an official
+    close is never replaced by an intraday quote, otherwise the later asof wins.
+    """
+    # Reduce to one candidate per key first - a single INSERT may not hit a row twice
+    candidates: Dict[Tuple[int, date], dict] = {}
+    for asset_id, asof, price, volume, source in prices:
+        row = {
+            "asset_id": asset_id,
+            "date": asof.date(),
+            "close": price,
+            "source": source or "yfinance",
+            "asof": asof,
+            "volume": volume,
+        }
+        key = (asset_id, row["date"])
+        if key not in candidates or _preferred(row, candidates[key]):
+            candidates[key] = row
+    
+    if not candidates:
+        return
+    
+    # executemany form: compiled once, batched by the driver ("insertmanyvalues")
+    stmt = upsert_insert(db)(DailyClose.__table__)
+    new_official = stmt.excluded.source == OFFICIAL_CLOSE_SOURCE
+    old_official = DailyClose.source == OFFICIAL_CLOSE_SOURCE
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyClose.asset_id, DailyClose.date],
+        set_={
+            "close": stmt.excluded.close,
+            "source": stmt.excluded.source,
+            "asof": stmt.excluded.asof,
+            "volume": stmt.excluded.volume,
+        },
+        where=or_(
+            and_(new_official, not_(old_official)),
+            and_(or_(new_official, not_(old_official)), stmt.excluded.asof >= DailyClose.asof),
+        ),
+    )
+    db.execute(stmt, list(candidates.values()))
+
+
+def rebuild_daily_closes(db: Session, asset_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute daily_closes from the raw prices table (one-off backfill / repair)
+    
+    Runs as one INSERT ... SELECT: a ROW_NUMBER() window picks the preferred
+    price of every (asset, day), and existing rows are overwritten.
+    
+    Args:
+        db: Database session
+        asset_ids: Restrict to these assets (default: all)
+    
+    Returns:
+        Number of daily close rows written
+    """
+    day_rank = func.row_number().over(
+        partition_by=(Price.asset_id, func.date(Price.asof)),
+        order_by=(
+            case((Price.source == OFFICIAL_CLOSE_SOURCE, 0), else_=1),
+            Price.asof.desc(),
+        ),
+    )
+    ranked = select(
+        Price.asset_id,
+        Price.asof,
+        Price.price,
+        Price.volume,
+        func.coalesce(Price.source, "yfinance").label("source"),
+        day_rank.label("day_rank"),
+    )
+    if asset_ids is not None:
+        ranked = ranked.where(Price.asset_id.in_(list(asset_ids)))
+    ranked = ranked.subquery()
+    
+    stmt = upsert_insert(db)(DailyClose).from_select(
+        ["asset_id", "date", "close", "source", "asof", "volume"],
+        select(
+            ranked.c.asset_id,
+            func.date(ranked.c.asof),
+            ranked.c.price,
+            ranked.c.source,
+            ranked.c.asof,
+            ranked.c.volume,
+        ).where(ranked.c.day_rank == 1),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyClose.asset_id, DailyClose.date],
+        set_={
+            "close": stmt.excluded.close,
+            "source": stmt.excluded.source,
+            "asof": stmt.excluded.asof,
+            "volume": stmt.excluded.volume,
+        },
+    )
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+
 def create_price(db: Session, price: PriceCreate) -> Price:
     """Create or update price record"""
     # Check if price already exists for this asset and timestamp
@@ -57,6 +291,7 @@ def create_price(db: Session, price: PriceCreate) -> Price:
         existing.price = price.price
         existing.volume = price.volume
         existing.source = price.source
+        upsert_daily_closes(db, [(price.asset_id, price.asof, price.price, price.volume, price.source)])
         db.commit()
         db.refresh(existing)
         return existing
@@ -70,15 +305,78 @@ def create_price(db: Session, price: PriceCreate) -> Price:
         source=price.source
     )
     db.add(db_price)
+    upsert_daily_closes(db, [(price.asset_id, price.asof, price.price, price.volume, price.source)])
     db.commit()
     db.refresh(db_price)
     return db_price
 
 
+def bulk_upsert_prices(
+    db: Session,
+    prices: Iterable[dict],
+    chunk_size: int = BULK_UPSERT_CHUNK_SIZE
+) -> Dict[str, int]:
+    """
+    Insert or update many prices with one INSERT ... ON CONFLICT per chunk
+    
+    Relies on the unique (asset_id, asof) index. daily_closes is maintained in
+    the same transaction and everything is committed once at the end.
+    
+    Args:
+        db: Database session
+        prices: Dicts with asset_id, asof, price, volume, source
+        chunk_size: Rows per statement
+    
+    Returns:
+        Dict with 'inserted' and 'updated' row counts
+    """
+    # Last write wins for duplicate keys, like repeated create_price() calls
+    rows = {
+        (p["asset_id"], p["asof"]): {
+            "asset_id": p["asset_id"],
+            "asof": p["asof"],
+            "price": p["price"],
+            "volume": p.get("volume"),
+            "source": p.get("source") or "yfinance",
+        }
+        for p in prices
+    }
+    rows = list(rows.values())
+    
+    inserted = 0
+    updated = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        
+        # Count keys that already exist so callers can tell new rows from refreshes
+        existing = db.execute(
+            select(func.count()).select_from(Price).where(
+                tuple_(Price.asset_id, Price.asof).in_([(r["asset_id"], r["asof"]) for r in chunk])
+            )
+        ).scalar()
+        
+        stmt = upsert_insert(db)(Price.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Price.asset_id, Price.asof],
+            set_={
+                "price": stmt.excluded.price,
+                "volume": stmt.excluded.volume,
+                "source": stmt.excluded.source,
+            },
+        )
+        db.execute(stmt, chunk)
+        upsert_daily_closes(
+            db, ((r["asset_id"], r["asof"], r["price"], r["volume"], r["source"]) for r in chunk)
+        )
+        
+        updated += existing
+        inserted += len(chunk) - existing
+    
+    db.commit()
+    return {"inserted": inserted, "updated": updated}
+
+
 def bulk_create_prices(db: Session, prices: List[PriceCreate]) -> int:
-    """Bulk insert prices"""
-    count = 0
-    for price in prices:
-        create_price(db, price)
-        count += 1
-    return count
+    """Bulk insert prices (set-based upsert), returns number of rows written"""
+    counts = bulk_upsert_prices(db, (price.model_dump() for price in prices))
+    return counts["inserted"] + counts["updated"]
@@ -1,14 +1,53 @@
 """
 CRUD operations for watchlist
 """
-from typing import List, Optional
+from typing import Any, List, Optional
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
+from sqlalchemy import and_, event, select
 
-from app.models import Watchlist, WatchlistTag
+from app.models import Asset, Watchlist, WatchlistTag
 from app.schemas import WatchlistItemCreate, WatchlistItemUpdate, WatchlistTagCreate, WatchlistTagUpdate
 
 
+# Session.info key of the alert changes flushed but not committed yet
+_PENDING_ALERTS = "pending_price_alerts"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_alert_changes(session: Session, flush_context: Any) -> None:
+    """Remember flushed alert changes, indexed once their transaction commits"""
+    pending = None
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Watchlist):
+            pending = session.info.setdefault(_PENDING_ALERTS, {})
+            target = obj.alert_target_price if obj.alert_enabled else None
+            pending[obj.id] = (obj.id, obj.asset_id, target)
+    for obj in session.deleted:
+        if isinstance(obj, Watchlist):
+            pending = session.info.setdefault(_PENDING_ALERTS, {})
+            pending[obj.id] = (obj.id, obj.asset_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _index_alert_changes(session: Session) -> None:
+    """Update the price alert index with the committed alert changes"""
+    pending = session.info.pop(_PENDING_ALERTS, None)
+    if pending:
+        from app.services.price_alerts import apply_alert_changes
+        apply_alert_changes(list(pending.values()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_alert_changes(session: Session) -> None:
+    session.info.pop(_PENDING_ALERTS, None)
+
+
+def _invalidate_dashboard(user_id: int) -> None:
+    """Drop the cached watchlist widget of a user"""
+    from app.services.cache import invalidate_dashboard_widgets
+    invalidate_dashboard_widgets(f"u{user_id}", "watchlist")
+
+
 def get_watchlist_item(db: Session, item_id: int) -> Optional[Watchlist]:
     """Get watchlist item by ID"""
     return db.query(Watchlist).options(
@@ -53,6 +92,16 @@ def get_watchlist_items_by_user(
     return query.offset(skip).limit(limit).all()
 
 
+def get_alert_assets(db: Session) -> List[Asset]:
+    """Assets with at least one enabled price alert (one query)"""
+    alerted = (
+        select(Watchlist.asset_id)
+        .where(Watchlist.alert_enabled == True)  # noqa: E712
+        .where(Watchlist.alert_target_price.isnot(None))
+    )
+    return db.query(Asset).filter(Asset.id.in_(alerted)).order_by(Asset.id).all()
+
+
 def get_watchlist_item_by_user_and_asset(
     db: Session, 
     user_id: int, 
@@ -84,6 +133,7 @@ def create_watchlist_item(
     
     # Load the asset relationship
     db.refresh(db_item, attribute_names=['asset'])
+    _invalidate_dashboard(user_id)
     return db_item
 
 
@@ -107,6 +157,7 @@ def update_watchlist_item(
     db.commit()
     db.refresh(db_item)
     db.refresh(db_item, attribute_names=['asset'])
+    _invalidate_dashboard(db_item.user_id)
     return db_item
 
 
@@ -118,6 +169,7 @@ def delete_watchlist_item(db: Session, item_id: int) -> bool:
     
     db.delete(db_item)
     db.commit()
+    _invalidate_dashboard(db_item.user_id)
     return True
 
 
@@ -125,6 +177,7 @@ def delete_all_watchlist_items_by_user(db: Session, user_id: int) -> int:
     """Delete all watchlist items for a user. Returns count deleted."""
     count = db.query(Watchlist).filter(Watchlist.user_id == user_id).delete()
     db.commit()
+    _invalidate_dashboard(user_id)
     return count
 
 
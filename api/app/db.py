@@ -1,12 +1,25 @@
 """
 Database connection and session management
+
+Two engines share the same database:
+- engine / SessionLocal (psycopg2): Celery tasks, APScheduler jobs and
+  endpoints that have not moved to the async path
+- async_engine / AsyncSessionLocal (asyncpg): hot read endpoints, so a slow
+  query no longer stalls every other request on the uvicorn worker
 """
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncGenerator, Callable, TypeVar
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_session, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
 from app.config import settings
 
+T = TypeVar("T")
+
 # Create engine
 engine = create_engine(
     settings.database_url,
@@ -18,6 +31,17 @@ engine = create_engine(
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the event loop (same pool sizing, separate connections)
+async_engine = create_async_engine(
+    settings.async_database_url,
+    pool_pre_ping=True,
+    pool_size=10,
+    max_overflow=20,
+)
+
+# Objects stay usable after commit: lazy refreshes would need a greenlet
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -38,7 +62,46 @@ def get_db() -> Session:
         db.close()
 
 
-from contextlib import contextmanager
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for getting an async database session
+    
+    Usage:
+        @app.get("/example")
+        async def example(db: AsyncSession = Depends(get_async_db)):
+            ...
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def run_db(db: Session, fn: Callable[..., T], /, *args, **kwargs) -> T:
+    """
+    Run synchronous ORM code against a session without blocking the event loop
+    
+    When db is the sync_session of an AsyncSession (see get_async_db), fn runs
+    through AsyncSession.run_sync, so every query inside it awaits the asyncpg
+    driver. Calls are serialized per session, since concurrent tasks of one
+    request share it. Plain sessions (Celery, scheduler, sync endpoints) run
+    fn inline, exactly as before.
+    
+    Args:
+        db: Session the services hold (self.db)
+        fn: Sync callable doing ORM work; it must not touch the session after returning
+        
+    Returns:
+        Whatever fn returns
+    """
+    proxy = async_session(db)
+    if proxy is None:
+        return fn(*args, **kwargs)
+    
+    lock = db.info.get("run_db_lock")
+    if lock is None:
+        lock = db.info["run_db_lock"] = asyncio.Lock()
+    async with lock:
+        return await proxy.run_sync(lambda _session: fn(*args, **kwargs))
+
 
 @contextmanager
 def get_db_context():
@@ -59,3 +122,19 @@ def get_db_context():
         raise
     finally:
         db.close()
+
+
+@asynccontextmanager
+async def get_async_db_context() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Context manager for an async session outside of request dependencies
+    
+    For work that outlives the request's own sessions, like the body of a
+    streaming response.
+    
+    Usage:
+        async with get_async_db_context() as db:
+            ...
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -6,9 +6,10 @@ and improve testability.
 """
 from typing import Annotated
 from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db import get_db
+from app.db import get_async_db, get_db
 from app.services.insights import InsightsService
 from app.services.metrics import MetricsService
 from app.services.pricing import PricingService
@@ -27,6 +28,11 @@ def get_metrics_service(db: Session = Depends(get_db)) -> MetricsService:
     return MetricsService(db)
 
 
+def get_async_metrics_service(db: AsyncSession = Depends(get_async_db)) -> MetricsService:
+    """Create MetricsService whose queries run over the async driver (see app.db.run_db)"""
+    return MetricsService(db.sync_session)
+
+
 def get_pricing_service(db: Session = Depends(get_db)) -> PricingService:
     """Create PricingService instance with database session"""
     return PricingService(db)
@@ -45,6 +51,7 @@ def get_currency_service(db: Session = Depends(get_db)) -> CurrencyService:
 # Type aliases for dependency injection
 InsightsServiceDep = Annotated[InsightsService, Depends(get_insights_service)]
 MetricsServiceDep = Annotated[MetricsService, Depends(get_metrics_service)]
+AsyncMetricsServiceDep = Annotated[MetricsService, Depends(get_async_metrics_service)]
 PricingServiceDep = Annotated[PricingService, Depends(get_pricing_service)]
 NotificationServiceDep = Annotated[NotificationService, Depends(get_notification_service)]
 CurrencyServiceDep = Annotated[CurrencyService, Depends(get_currency_service)]
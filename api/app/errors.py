@@ -211,6 +211,16 @@ class PriceRefreshTaskError(PortfoliumException):
         )
 
 
+class DailyClosesBackfillError(PortfoliumException):
+    """Raised when the daily closes backfill fails"""
+    
+    def __init__(self, reason: str):
+        super().__init__(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Daily closes backfill failed: {reason}"
+        )
+
+
 class CannotSellMoreThanOwnedError(PortfoliumException):
     """Raised when trying to sell more shares than owned"""
     
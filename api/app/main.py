@@ -6,7 +6,7 @@ from logging.handlers import RotatingFileHandler
 import os
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from scalar_fastapi import get_scalar_api_reference
 
@@ -15,6 +15,7 @@ from app.db import engine, Base, SessionLocal
 from app.routers import assets, portfolios, transactions, prices, health, admin, settings as settings_router, logs, auth, watchlist, notifications, insights, version, dashboard_layouts, market, batch, tasks, goals, public
 from app.tasks.scheduler import start_scheduler, stop_scheduler
 from app.services.admin import ensure_admin_user, ensure_email_config
+from app.services.cache import FRESH, STALE, freshness_scope
 from app.version import __version__, get_version_info
 
 
@@ -182,10 +183,24 @@ async def lifespan(app: FastAPI):
     if not skip_migrations:
         stop_scheduler()
     
+    # Let background cache refreshes finish while Redis is still open
+    from app.services.cache_refresh import shutdown_refresh_loop
+    shutdown_refresh_loop()
+    
     # Close Redis connection
     from app.redis_client import close_redis_connection
+    from app.services.cache import stop_invalidation_listener
+    from app.services.single_flight import stop_single_flight_listener
+    stop_invalidation_listener()
+    stop_single_flight_listener()
     close_redis_connection()
     logger.info("Redis connection closed")
+
+    # Close pooled upstream market data connections
+    from app.services.quote_provider import close_quote_provider, shutdown_background_loop
+    await close_quote_provider()
+    shutdown_background_loop()
+    logger.info("Upstream market data clients closed")
     sys.stdout.flush()
 
 
@@ -203,9 +218,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache-Freshness"],
 )
 
 
+@app.middleware("http")
+async def cache_freshness_header(request: Request, call_next):
+    """
+    Tell the UI when a response was built from stale cache entries
+    
+    X-Cache-Freshness is "stale" when any stale-while-revalidate entry read
+    for the request was past its TTL (a background refresh is updating it),
+    "fresh" otherwise. Responses that read no such entry do not carry it.
+    """
+    with freshness_scope() as states:
+        response = await call_next(request)
+    if states:
+        response.headers["X-Cache-Freshness"] = STALE if STALE in states else FRESH
+    return response
+
+
 # Include routers
 app.include_router(health.router, tags=["health"])
 app.include_router(version.router, tags=["version"])
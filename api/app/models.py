@@ -23,6 +23,10 @@ from app.models import (
     Portfolio,
     Transaction,
     Price,
+    DailyClose,
+    FxRate,
+    PositionSnapshot,
+    PositionCheckpoint,
     Watchlist,
     Notification,
     DashboardLayout,
@@ -41,6 +45,10 @@ __all__ = [
     "Portfolio",
     "Transaction",
     "Price",
+    "DailyClose",
+    "FxRate",
+    "PositionSnapshot",
+    "PositionCheckpoint",
     "Watchlist",
     "Notification",
     "DashboardLayout",
@@ -5,7 +5,9 @@ from app.models.enums import AssetClass, TransactionType, NotificationType
 from app.models.user import User
 from app.models.asset import Asset, AssetMetadataOverride
 from app.models.portfolio import Portfolio, Transaction
-from app.models.price import Price
+from app.models.price import Price, DailyClose
+from app.models.fx import FxRate
+from app.models.position import PositionSnapshot, PositionCheckpoint
 from app.models.watchlist import Watchlist, WatchlistTag, watchlist_item_tags
 from app.models.notification import Notification
 from app.models.dashboard import DashboardLayout
@@ -23,6 +25,10 @@ __all__ = [
     "Portfolio",
     "Transaction",
     "Price",
+    "DailyClose",
+    "FxRate",
+    "PositionSnapshot",
+    "PositionCheckpoint",
     "Watchlist",
     "WatchlistTag",
     "watchlist_item_tags",
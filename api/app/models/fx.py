@@ -0,0 +1,26 @@
+"""
+FX rate model for historical exchange rate series
+"""
+from datetime import datetime
+from sqlalchemy import Column, Date, DateTime, Numeric, String
+
+from app.db import Base
+
+
+class FxRate(Base):
+    """
+    Daily closing exchange rate of one currency pair
+
+    1 base_currency = rate quote_currency on that date. Filled incrementally
+    by app.services.fx_history, which stores one leg per currency against USD
+    and triangulates cross rates.
+    """
+    __tablename__ = "fx_rates"
+    __table_args__ = {"schema": "portfolio"}
+    
+    base_currency = Column(String, primary_key=True)
+    quote_currency = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    rate = Column(Numeric(20, 10), nullable=False)
+    source = Column(String, default="yfinance")
+    created_at = Column(DateTime, default=datetime.utcnow)
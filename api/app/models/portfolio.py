@@ -30,6 +30,8 @@ class Portfolio(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # NULL until position snapshots have been built (new portfolios start empty, hence synced)
+    positions_synced_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="portfolios")
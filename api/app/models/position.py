@@ -0,0 +1,80 @@
+"""
+Persisted position state per portfolio and asset
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Numeric
+from sqlalchemy.orm import relationship
+
+from app.db import Base
+
+
+class PositionSnapshot(Base):
+    """
+    Current position state of one asset in one portfolio
+
+    Result of folding every transaction of the (portfolio, asset) pair in
+    (tx_date, created_at, id) order. Maintained by app.crud.positions on every
+    transaction flush: appends fold only the new transaction, back-dated
+    edits/deletes replay from the latest PositionCheckpoint before the
+    affected date. State amounts are unscaled NUMERIC so the stored state
+    matches an in-memory Decimal replay digit for digit.
+    """
+    __tablename__ = "position_snapshots"
+    __table_args__ = {"schema": "portfolio"}
+
+    portfolio_id = Column(Integer, ForeignKey("portfolio.portfolios.id", ondelete="CASCADE"), primary_key=True)
+    asset_id = Column(Integer, ForeignKey("portfolio.assets.id", ondelete="CASCADE"), primary_key=True)
+
+    # Position state (see app.services.position_state.PositionState)
+    quantity = Column(Numeric, nullable=False, default=0)
+    total_cost = Column(Numeric, nullable=False, default=0)
+    shares_for_cost = Column(Numeric, nullable=False, default=0)
+    realized_pnl = Column(Numeric, nullable=False, default=0)
+    total_buy_cost = Column(Numeric, nullable=False, default=0)
+    total_buy_shares = Column(Numeric, nullable=False, default=0)
+    total_sell_proceeds = Column(Numeric, nullable=False, default=0)
+    total_sell_shares = Column(Numeric, nullable=False, default=0)
+    total_dividends = Column(Numeric, nullable=False, default=0)
+    total_fees = Column(Numeric, nullable=False, default=0)
+    position_currency = Column(String)
+
+    # Last applied transaction (fold order key)
+    last_tx_id = Column(Integer)
+    last_tx_date = Column(Date)
+    last_tx_created_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    asset = relationship("Asset")
+
+
+class PositionCheckpoint(Base):
+    """
+    Position state right after one transaction
+
+    Replay starting points for back-dated edits and deletes: the state before
+    date D is the checkpoint of the last transaction dated before D.
+    """
+    __tablename__ = "position_checkpoints"
+    __table_args__ = (
+        Index("idx_position_checkpoints_lookup", "portfolio_id", "asset_id", "tx_date"),
+        {"schema": "portfolio"},
+    )
+
+    transaction_id = Column(Integer, ForeignKey("portfolio.transactions.id", ondelete="CASCADE"), primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolio.portfolios.id", ondelete="CASCADE"), nullable=False)
+    asset_id = Column(Integer, nullable=False)
+    tx_date = Column(Date, nullable=False)
+    tx_created_at = Column(DateTime)
+
+    quantity = Column(Numeric, nullable=False, default=0)
+    total_cost = Column(Numeric, nullable=False, default=0)
+    shares_for_cost = Column(Numeric, nullable=False, default=0)
+    realized_pnl = Column(Numeric, nullable=False, default=0)
+    total_buy_cost = Column(Numeric, nullable=False, default=0)
+    total_buy_shares = Column(Numeric, nullable=False, default=0)
+    total_sell_proceeds = Column(Numeric, nullable=False, default=0)
+    total_sell_shares = Column(Numeric, nullable=False, default=0)
+    total_dividends = Column(Numeric, nullable=False, default=0)
+    total_fees = Column(Numeric, nullable=False, default=0)
+    position_currency = Column(String)
@@ -2,7 +2,7 @@
 Price model for asset price caching
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, Numeric, BigInteger, String
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, Index, Numeric, BigInteger, String
 from sqlalchemy.orm import relationship
 
 from app.db import Base
@@ -11,7 +11,11 @@ from app.db import Base
 class Price(Base):
     """Asset price cache"""
     __tablename__ = "prices"
-    __table_args__ = {"schema": "portfolio"}
+    __table_args__ = (
+        # One row per asset and timestamp; target of bulk INSERT ... ON CONFLICT upserts
+        Index("uq_prices_asset_asof", "asset_id", "asof", unique=True),
+        {"schema": "portfolio"},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     asset_id = Column(Integer, ForeignKey("portfolio.assets.id", ondelete="CASCADE"), nullable=False)
@@ -23,3 +27,22 @@ class Price(Base):
     
     # Relationships
     asset = relationship("Asset", back_populates="prices")
+
+
+class DailyClose(Base):
+    """
+    One closing price per asset and calendar day, materialized from prices
+    
+    Maintained by crud.prices on every price write: an official close
+    (source 'yfinance_history') wins over intraday quotes, otherwise the latest
+    quote of the day wins. Rebuild with crud.prices.rebuild_daily_closes().
+    """
+    __tablename__ = "daily_closes"
+    __table_args__ = {"schema": "portfolio"}
+    
+    asset_id = Column(Integer, ForeignKey("portfolio.assets.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    close = Column(Numeric(20, 8), nullable=False)
+    source = Column(String, nullable=False)
+    asof = Column(DateTime, nullable=False)  # Timestamp of the price row the close came from
+    volume = Column(BigInteger)
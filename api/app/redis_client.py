@@ -22,28 +22,33 @@ class RedisManager:
     def __init__(self):
         self._pool: Optional[ConnectionPool] = None
         self._client: Optional[redis.Redis] = None
+        self._binary_pool: Optional[ConnectionPool] = None
+        self._binary_client: Optional[redis.Redis] = None
         self._healthy = False
         self._initialize_connection()
     
+    @staticmethod
+    def _create_pool(decode_responses: bool) -> ConnectionPool:
+        """Connection pool to the configured Redis"""
+        password_part = f":{settings.REDIS_PASSWORD}@" if settings.REDIS_PASSWORD else ""
+        redis_url = (
+            f"redis://{password_part}{settings.REDIS_HOST}:{settings.REDIS_PORT}/"
+            f"{settings.REDIS_DB}"
+        )
+        return ConnectionPool.from_url(
+            redis_url,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            decode_responses=decode_responses,
+            health_check_interval=30,  # Health check every 30 seconds
+        )
+    
     def _initialize_connection(self) -> None:
         """Initialize Redis connection pool"""
         try:
-            # Build connection URL
-            password_part = f":{settings.REDIS_PASSWORD}@" if settings.REDIS_PASSWORD else ""
-            redis_url = (
-                f"redis://{password_part}{settings.REDIS_HOST}:{settings.REDIS_PORT}/"
-                f"{settings.REDIS_DB}"
-            )
-            
-            # Create connection pool
-            self._pool = ConnectionPool.from_url(
-                redis_url,
-                max_connections=settings.REDIS_MAX_CONNECTIONS,
-                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
-                socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
-                decode_responses=True,  # Automatically decode bytes to strings
-                health_check_interval=30,  # Health check every 30 seconds
-            )
+            # Create connection pool, decoding bytes to strings
+            self._pool = self._create_pool(decode_responses=True)
             
             # Create client
             self._client = redis.Redis(connection_pool=self._pool)
@@ -96,6 +101,18 @@ class RedisManager:
             return None
         return self._client
     
+    def get_binary_client(self) -> Optional[redis.Redis]:
+        """
+        Get a Redis client returning raw bytes (binary cache payloads).
+        Returns None if Redis is unavailable (graceful degradation).
+        """
+        if not self.is_healthy:
+            return None
+        if self._binary_client is None:
+            self._binary_pool = self._create_pool(decode_responses=False)
+            self._binary_client = redis.Redis(connection_pool=self._binary_pool)
+        return self._binary_client
+    
     @contextmanager
     def pipeline(self, transaction: bool = True):
         """
@@ -123,6 +140,8 @@ class RedisManager:
     
     def close(self) -> None:
         """Close Redis connection pool"""
+        if self._binary_pool:
+            self._binary_pool.disconnect()
         if self._pool:
             self._pool.disconnect()
             logger.info("Redis connection pool closed")
@@ -183,6 +202,15 @@ def get_redis() -> Optional[redis.Redis]:
     return manager.get_client()
 
 
+def get_redis_binary() -> Optional[redis.Redis]:
+    """
+    Redis client for binary payloads (bytes in, bytes out).
+    Returns None if Redis is unavailable (graceful degradation).
+    """
+    manager = get_redis_manager()
+    return manager.get_binary_client()
+
+
 def close_redis_connection():
     """Close Redis connection (called on application shutdown)"""
     global _redis_manager
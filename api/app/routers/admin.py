@@ -20,6 +20,7 @@ from app.errors import (
     CannotDeleteSuperAdminError,
     CannotGetPortfolioReportError, 
     CannotRevokeSuperAdminError, 
+    DailyClosesBackfillError,
     EmailAlreadyRegisteredError,
     EmailSendingError,
     EmailSystemDisabledError,
@@ -243,6 +244,28 @@ def trigger_refresh_prices(
         raise PriceRefreshTaskError(reason=str(e))
 
 
+@router.post("/trigger/backfill-daily-closes")
+def trigger_backfill_daily_closes(
+    asset_id: Optional[int] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Rebuild the materialized daily closes from the raw prices table
+    
+    Daily closes are maintained on every price write; use this one-off
+    backfill after bulk imports or to repair drift.
+    """
+    from app.tasks.price_tasks import backfill_daily_closes
+    
+    result = backfill_daily_closes(asset_id=asset_id)
+    if result["errors"]:
+        raise DailyClosesBackfillError(reason="; ".join(result["errors"]))
+    return {
+        "success": True,
+        "message": f"Daily closes rebuilt ({result['rows']} rows)"
+    }
+
+
 @router.get("/logo-cache/stats")
 def get_logo_cache_stats(
     db: Session = Depends(get_db),
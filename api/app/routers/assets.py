@@ -16,7 +16,7 @@ from app.crud import assets as crud
 from app.auth import get_current_user
 from app.models import User
 from app.dependencies import MetricsServiceDep
-from app.services.cache import CacheService
+from app.services.cache import CacheService, user_tag
 from app.errors import ( 
     AssetAlreadyExistsError,
     AssetNotFoundError,
@@ -265,8 +265,7 @@ def set_metadata_overrides(
         )
         
         # Invalidate cache for held and sold assets since effective metadata changed
-        cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-        cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+        cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
         
         # Get the asset with effective metadata
         asset = crud.get_asset(db, asset_id)
@@ -417,7 +416,7 @@ async def get_held_assets(
     results.sort(key=lambda x: x["symbol"])
     
     # Cache for 1 hour (invalidated on transaction changes)
-    cache_service.set(cache_key, json.dumps(results), ttl=3600)
+    cache_service.set(cache_key, json.dumps(results), ttl=3600, tags=[user_tag(current_user.id, "assets")])
     
     return results
 
@@ -533,7 +532,7 @@ async def get_sold_assets(
     results.sort(key=lambda x: x["symbol"])
     
     # Cache for 1 hour (invalidated on transaction changes)
-    cache_service.set(cache_key, json.dumps(results), ttl=3600)
+    cache_service.set(cache_key, json.dumps(results), ttl=3600, tags=[user_tag(current_user.id, "assets")])
     
     return results
 
@@ -1403,36 +1402,14 @@ def get_asset_price_history(
     else:
         raise InvalidPriceHistoryPeriodError(period=period)
     
-    # Fetch prices from database
-    prices = crud_prices.get_prices(
+    # Fetch one price per calendar day (official close preferred, otherwise the
+    # latest update of the day) so we return daily closes, not intraday updates
+    daily_prices = crud_prices.get_daily_closes(
         db,
-        asset_id,
+        [asset_id],
         date_from=start_date,
-        date_to=end_date,
-        limit=10000  # Large limit to get all data for the period
-    )
-    
-    # Group by date (calendar day) and keep only the latest price for each day
-    # This ensures we return daily closes, not intraday updates
-    from collections import defaultdict
-    prices_by_date = defaultdict(list)
-    
-    for price in prices:
-        # Group by calendar date (ignore time component)
-        date_key = price.asof.date()
-        prices_by_date[date_key].append(price)
-    
-    # For each date, take the price with the latest timestamp (closing price)
-    daily_prices = []
-    for date_key in sorted(prices_by_date.keys()):
-        day_prices = prices_by_date[date_key]
-        # Prefer prices from 'yfinance_history' source (official closes), otherwise take latest
-        history_prices = [p for p in day_prices if p.source == 'yfinance_history']
-        if history_prices:
-            latest_price = max(history_prices, key=lambda p: p.asof)
-        else:
-            latest_price = max(day_prices, key=lambda p: p.asof)
-        daily_prices.append(latest_price)
+        date_to=end_date
+    )[asset_id]
     
     result = [
         {
@@ -5,26 +5,34 @@ Intelligently fetches only the data needed for visible widgets
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Set, Tuple
-from fastapi import APIRouter, Depends
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
+from app.config import settings
 from app.errors import PortfolioNotFoundError
-from app.db import get_db
-from app.auth import get_current_verified_user, verify_portfolio_access
+from app.db import get_async_db, get_async_db_context, get_db, get_db_context
+from app.auth import get_current_verified_user, get_current_verified_user_async, verify_portfolio_access
 from app.models import User, Portfolio as PortfolioModel
-from app.crud import portfolios as crud_portfolios
-from app.routers import market
-from app.dependencies import MetricsServiceDep, InsightsServiceDep
-from app.services.cache import CacheService
+from app.crud.aio import portfolios as crud_portfolios
+from app.dependencies import AsyncMetricsServiceDep, InsightsServiceDep
+from app.services.cache import (
+    CacheService, dashboard_widget_key, dashboard_widget_tags, invalidate_dashboard_widgets,
+)
+from app.services.dashboard_context import DashboardContext
+from app.services.insights import InsightsService
+from app.services.market_data import get_market_data
+from app.services.metrics import MetricsService
+from app.services.price_feed import frames_response
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/batch", tags=["batch"])
 
-# Cache TTL for batch responses (5 minutes)
-_BATCH_CACHE_TTL = 300  # 300 seconds (5 minutes)
+# History periods of the performance widget
+_PERFORMANCE_PERIODS = ['1W', '1M', 'YTD', '1Y']
 
 
 def _make_json_serializable(obj, _seen=None):
@@ -179,6 +187,50 @@ WIDGET_DATA_MAP = {
 }
 
 
+# Cache policy per data section: (owner, TTL in seconds)
+# - portfolio: invalidated with the portfolio (transactions, settings)
+# - user: invalidated by the user's watchlist / notification writes
+# - global: market data, shared by every user
+WIDGET_CACHE_POLICY: Dict[str, Tuple[str, int]] = {
+    'metrics': ('portfolio', 300),
+    'positions': ('portfolio', 300),
+    'sold_positions': ('portfolio', 1800),
+    'asset_allocation': ('portfolio', 300),
+    'sector_allocation': ('portfolio', 300),
+    'country_allocation': ('portfolio', 300),
+    'performance_history': ('portfolio', 1800),
+    'risk_metrics': ('portfolio', 1800),
+    'benchmark_comparison': ('portfolio', 1800),
+    'transactions': ('portfolio', 3600),
+    'watchlist': ('user', 300),
+    'notifications': ('user', 60),
+    'market_tnx': ('global', 300),
+    'market_dxy': ('global', 300),
+    'market_vix': ('global', 300),
+    'market_indices': ('global', 300),
+    'sentiment_stock': ('global', 900),
+    'sentiment_crypto': ('global', 900),
+}
+
+# Parameters a section's payload depends on (part of its cache key)
+WIDGET_PARAMS: Dict[str, Dict[str, Any]] = {
+    'performance_history': {'periods': _PERFORMANCE_PERIODS},
+    'risk_metrics': {'period': '1y'},
+    'benchmark_comparison': {'benchmark': 'SPY', 'period': '1y'},
+}
+
+
+def _widget_owner(widget: str, portfolio_id: int, user_id: int) -> str:
+    """Owner a data section is cached under: its portfolio, its user or nobody"""
+    scope, _ = WIDGET_CACHE_POLICY[widget]
+    return {'portfolio': f"p{portfolio_id}", 'user': f"u{user_id}", 'global': "global"}[scope]
+
+
+def _widget_cache_key(widget: str, portfolio_id: int, user_id: int) -> str:
+    """Cache key of one data section, shared by the API workers and the Celery warmup"""
+    return dashboard_widget_key(_widget_owner(widget, portfolio_id, user_id), widget, WIDGET_PARAMS.get(widget))
+
+
 def _extract_required_data(visible_widgets: List[str]) -> Set[str]:
     """
     Determine which data sets are needed based on visible widgets
@@ -260,25 +312,31 @@ async def _fetch_watchlist(user: User, db: Session) -> Optional[List]:
         pricing_service = PricingService(db)
         items = crud_watchlist.get_watchlist_items_by_user(db, user.id)
         
-        result = []
+        valid_items = []
         for item in items:
             # Skip items without valid assets
             if not item.asset or not item.asset.symbol:
                 logger.warning(f"Skipping watchlist item {item.id} - missing or invalid asset")
                 continue
-                
+            valid_items.append(item)
+        
+        # Get current prices and daily changes in one batch
+        try:
+            prices = await pricing_service.get_multiple_prices([item.asset.symbol for item in valid_items])
+        except Exception as e:
+            logger.debug(f"Could not fetch watchlist prices: {e}")
+            prices = {}
+        
+        result = []
+        for item in valid_items:
             item_dict = _serialize_model(item)
             
-            # Get current price and daily change
             current_price = None
             daily_change_pct = None
-            try:
-                price_data = await pricing_service.get_price(item.asset.symbol)
-                if price_data:
-                    current_price = float(price_data.price) if price_data.price else 0
-                    daily_change_pct = float(price_data.daily_change_pct) if price_data.daily_change_pct else None
-            except Exception as e:
-                logger.debug(f"Could not fetch price for {item.asset.symbol}: {e}")
+            price_data = prices.get(item.asset.symbol)
+            if price_data:
+                current_price = float(price_data.price) if price_data.price else 0
+                daily_change_pct = float(price_data.daily_change_pct) if price_data.daily_change_pct else None
             
             # Include asset details with price data
             item_dict['asset'] = {
@@ -313,7 +371,7 @@ async def _fetch_notifications(user: User, db: Session) -> Optional[List]:
 async def _fetch_market_tnx() -> Optional[Dict]:
     """Fetch TNX index data"""
     try:
-        return await market.get_tnx_index()
+        return await get_market_data("index_tnx")
     except Exception as e:
         logger.error(f"Failed to fetch TNX: {e}")
         return None
@@ -322,7 +380,7 @@ async def _fetch_market_tnx() -> Optional[Dict]:
 async def _fetch_market_dxy() -> Optional[Dict]:
     """Fetch DXY index data"""
     try:
-        return await market.get_dxy_index()
+        return await get_market_data("index_dxy")
     except Exception as e:
         logger.error(f"Failed to fetch DXY: {e}")
         return None
@@ -331,79 +389,16 @@ async def _fetch_market_dxy() -> Optional[Dict]:
 async def _fetch_market_vix() -> Optional[Dict]:
     """Fetch VIX index data"""
     try:
-        return await market.get_vix_index()
+        return await get_market_data("index_vix")
     except Exception as e:
         logger.error(f"Failed to fetch VIX: {e}")
         return None
 
 
 async def _fetch_market_indices() -> Optional[Dict]:
-    """Fetch all major market indices"""
+    """Fetch all major market indices, keyed by symbol (e.g. "^GSPC")"""
     try:
-        import yfinance as yf
-        
-        # Define major market indices
-        indices = {
-            'GSPC': '^GSPC',  # S&P 500
-            'DJI': '^DJI',    # Dow Jones
-            'IXIC': '^IXIC',  # NASDAQ
-            'GSPTSE': '^GSPTSE', # S&P/TSX Composite
-            'FTSE': '^FTSE',  # FTSE 100
-            'GDAXI': '^GDAXI', # DAX
-            'FCHI': '^FCHI',  # CAC 40
-            'FTSEMIB.MI': 'FTSEMIB.MI', # FTSE MIB
-            'N225': '^N225',  # Nikkei 225
-            'HSI': '^HSI',    # Hang Seng
-            '000001.SS': '000001.SS', # SSE Composite
-            '^AXJO': '^AXJO',  # ASX 200
-        }
-        
-        # Fetch all indices in parallel
-        async def fetch_index(key: str, symbol: str):
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                
-                current_price = info.get("regularMarketPrice") or info.get("currentPrice")
-                previous_close = info.get("regularMarketPreviousClose") or info.get("previousClose")
-                
-                if current_price is None:
-                    return None
-                
-                change = None
-                change_pct = None
-                
-                if previous_close and previous_close > 0:
-                    change = current_price - previous_close
-                    change_pct = (change / previous_close) * 100
-                
-                return {
-                    "symbol": symbol,
-                    "price": round(current_price, 2),
-                    "current_price": round(current_price, 2),
-                    "change": round(change, 2) if change is not None else None,
-                    "change_pct": round(change_pct, 2) if change_pct is not None else None,
-                    "percent_change": round(change_pct, 2) if change_pct is not None else None,
-                    "daily_change_pct": round(change_pct, 2) if change_pct is not None else None,
-                    "previous_close": round(previous_close, 2) if previous_close else None,
-                }
-            except Exception as e:
-                logger.warning(f"Failed to fetch {symbol}: {e}")
-                return None
-        
-        # Fetch all indices concurrently
-        tasks = [fetch_index(key, symbol) for key, symbol in indices.items()]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Build result dict with non-None values, keyed by symbol (with caret)
-        result = {}
-        for (key, symbol), data in zip(indices.items(), results):
-            if data and not isinstance(data, Exception):
-                result[symbol] = data  # Use symbol (e.g., "^GSPC") as key, not short name
-        
-        logger.info(f"Fetched market indices: {list(result.keys())}")
-        return result if result else None
-        
+        return await get_market_data("indices")
     except Exception as e:
         logger.error(f"Failed to fetch market indices: {e}")
         return None
@@ -412,7 +407,7 @@ async def _fetch_market_indices() -> Optional[Dict]:
 async def _fetch_sentiment_stock() -> Optional[Dict]:
     """Fetch stock market sentiment"""
     try:
-        return await market.get_stock_market_sentiment()
+        return await get_market_data("sentiment_stock")
     except Exception as e:
         logger.error(f"Failed to fetch stock sentiment: {e}")
         return None
@@ -421,7 +416,7 @@ async def _fetch_sentiment_stock() -> Optional[Dict]:
 async def _fetch_sentiment_crypto() -> Optional[Dict]:
     """Fetch crypto market sentiment"""
     try:
-        return await market.get_crypto_market_sentiment()
+        return await get_market_data("sentiment_crypto")
     except Exception as e:
         logger.error(f"Failed to fetch crypto sentiment: {e}")
         return None
@@ -472,22 +467,12 @@ async def _fetch_country_allocation(portfolio_id: int, db: Session, metrics_serv
         return None
 
 
-async def _fetch_performance_history(portfolio_id: int, db: Session) -> Optional[Dict]:
+async def _fetch_performance_history(portfolio_id: int, context: DashboardContext) -> Optional[Dict]:
     """Fetch portfolio performance history for different periods"""
     try:
-        from app.services.metrics import MetricsService
-        metrics_service = MetricsService(db)
-        # Fetch multiple periods in parallel
-        periods = ['1W', '1M', 'YTD', '1Y']
-        results = {}
-        for period in periods:
-            try:
-                history = metrics_service.get_portfolio_history(portfolio_id, period)
-                results[period] = history
-                logger.debug(f"Fetched {period} history: {len(history) if history else 0} data points")
-            except Exception as period_error:
-                logger.error(f"Failed to fetch {period} history: {period_error}", exc_info=True)
-                results[period] = None
+        results = await context.histories(_PERFORMANCE_PERIODS)
+        for period, history in results.items():
+            logger.debug(f"Fetched {period} history: {len(history) if history else 0} data points")
         logger.info(f"Performance history fetch complete. Periods with data: {[k for k,v in results.items() if v]}")
         return results
     except Exception as e:
@@ -550,12 +535,209 @@ async def _fetch_transactions(portfolio_id: int, db: Session) -> Optional[List]:
         return None
 
 
+def _widget_fetcher(
+    widget: str,
+    portfolio_id: int,
+    context: DashboardContext,
+    user: User,
+    db: Session,
+    insights_service,
+) -> Awaitable[Any]:
+    """Coroutine computing one data section"""
+    params = WIDGET_PARAMS.get(widget, {})
+    fetchers: Dict[str, Callable[[], Awaitable[Any]]] = {
+        'metrics': lambda: _fetch_metrics(portfolio_id, context, db),
+        'positions': lambda: _fetch_positions(portfolio_id, context, db),
+        'sold_positions': lambda: _fetch_sold_positions(portfolio_id, context, db),
+        'watchlist': lambda: _fetch_watchlist(user, db),
+        'notifications': lambda: _fetch_notifications(user, db),
+        'market_tnx': _fetch_market_tnx,
+        'market_dxy': _fetch_market_dxy,
+        'market_vix': _fetch_market_vix,
+        'market_indices': _fetch_market_indices,
+        'sentiment_stock': _fetch_sentiment_stock,
+        'sentiment_crypto': _fetch_sentiment_crypto,
+        'asset_allocation': lambda: _fetch_asset_allocation(portfolio_id, db, context, user),
+        'sector_allocation': lambda: _fetch_sector_allocation(portfolio_id, db, context, user),
+        'country_allocation': lambda: _fetch_country_allocation(portfolio_id, db, context, user),
+        'performance_history': lambda: _fetch_performance_history(portfolio_id, context),
+        'risk_metrics': lambda: _fetch_risk_metrics(portfolio_id, insights_service, db, **params),
+        'benchmark_comparison': lambda: _fetch_benchmark_comparison(portfolio_id, insights_service, db, **params),
+        'transactions': lambda: _fetch_transactions(portfolio_id, db),
+    }
+    return fetchers[widget]()
+
+
+def _store_widgets(widgets: Dict[str, Any], portfolio_id: int, user_id: int) -> None:
+    """Cache freshly computed sections, one entry each with its own TTL and invalidation tags"""
+    for widget, payload in widgets.items():
+        _, ttl = WIDGET_CACHE_POLICY[widget]
+        owner = _widget_owner(widget, portfolio_id, user_id)
+        CacheService.set(
+            _widget_cache_key(widget, portfolio_id, user_id), payload, ttl=ttl,
+            tags=dashboard_widget_tags(owner, widget),
+        )
+
+
+def _read_cached_widgets(widgets: List[str], portfolio_id: int, user_id: int) -> Dict[str, Any]:
+    """Cached payload of each section that has one"""
+    keys = [_widget_cache_key(widget, portfolio_id, user_id) for widget in widgets]
+    return {
+        widget: payload
+        for widget, payload in zip(widgets, CacheService.mget(keys))
+        if payload is not None
+    }
+
+
+def _widget_result(widget: str, result: Any) -> Tuple[Any, Optional[str]]:
+    """(payload, error) of a finished fetcher; exactly one of them is None"""
+    if isinstance(result, BaseException):
+        logger.error(f"Error fetching {widget}: {result}")
+        return None, str(result)
+    if result is None:
+        return None, "No data returned"
+    return _make_json_serializable(result), None
+
+
+async def _load_widgets(
+    widgets: Set[str],
+    portfolio_id: int,
+    user: User,
+    context: DashboardContext,
+    db: Session,
+    insights_service,
+    refresh: bool = False,
+) -> Tuple[Dict[str, Any], Dict[str, str], List[str]]:
+    """
+    Assemble data sections from their cache entries, computing only the missing ones
+    
+    Args:
+        widgets: Data sections to return (see WIDGET_CACHE_POLICY)
+        portfolio_id: Portfolio ID
+        user: Portfolio owner
+        context: Shared computation graph of this request
+        db: Sync session for the widgets not on the async path
+        insights_service: InsightsService for risk and benchmark sections
+        refresh: Ignore cached entries and recompute every section (warmup)
+        
+    Returns:
+        (data, errors, cached) - payload per section, error per failed
+        section and the sections served from cache
+    """
+    widgets = sorted(widgets)
+    data = {} if refresh else _read_cached_widgets(widgets, portfolio_id, user.id)
+    cached = list(data)
+    
+    missing = [widget for widget in widgets if widget not in data]
+    results = await asyncio.gather(
+        *(_widget_fetcher(w, portfolio_id, context, user, db, insights_service) for w in missing),
+        return_exceptions=True,
+    )
+    
+    errors: Dict[str, str] = {}
+    fresh: Dict[str, Any] = {}
+    for widget, result in zip(missing, results):
+        payload, error = _widget_result(widget, result)
+        if error:
+            errors[widget] = error
+        else:
+            fresh[widget] = payload
+    
+    # Failures are not cached, the next request retries them
+    _store_widgets(fresh, portfolio_id, user.id)
+    data.update(fresh)
+    
+    if missing:
+        logger.info(f"Dashboard widgets for portfolio {portfolio_id}: {len(cached)} cached, computed {missing}")
+    return data, errors, cached
+
+
+async def _stream_widgets(
+    widgets: Set[str],
+    portfolio_id: int,
+    user: User,
+    context: DashboardContext,
+    db: Session,
+    insights_service,
+    deadline: float,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield one frame per data section as soon as it is available
+    
+    Cached sections come first, then each missing one in the order its fetcher
+    resolves. Fresh payloads are written to the same cache entries as
+    _load_widgets, one at a time, so a section computed before the client went
+    away is not computed again.
+    
+    Args:
+        widgets: Data sections to return (see WIDGET_CACHE_POLICY)
+        portfolio_id: Portfolio ID
+        user: Portfolio owner
+        context: Shared computation graph of this request
+        db: Sync session for the widgets not on the async path
+        insights_service: InsightsService for risk and benchmark sections
+        deadline: Seconds each section may take; later ones get a "pending" frame
+        
+    Yields:
+        {"type": "widget", "widget", "status": "ok", "cached", "data"} or
+        {"type": "widget", "widget", "status": "failed" | "pending", "error"}
+    """
+    widgets = sorted(widgets)
+    cached = _read_cached_widgets(widgets, portfolio_id, user.id)
+    for widget, payload in cached.items():
+        yield {"type": "widget", "widget": widget, "status": "ok", "cached": True, "data": payload}
+    
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+    tasks = {
+        asyncio.ensure_future(_widget_fetcher(w, portfolio_id, context, user, db, insights_service)): w
+        for w in widgets if w not in cached
+    }
+    try:
+        while tasks:
+            remaining = expires_at - loop.time()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                widget = tasks.pop(task)
+                payload, error = _widget_result(widget, task.exception() or task.result())
+                if error:
+                    yield {"type": "widget", "widget": widget, "status": "failed", "error": error}
+                else:
+                    _store_widgets({widget: payload}, portfolio_id, user.id)
+                    yield {"type": "widget", "widget": widget, "status": "ok", "cached": False, "data": payload}
+        
+        for widget in sorted(tasks.values()):
+            logger.warning(f"Dashboard widget {widget} of portfolio {portfolio_id} missed its {deadline}s deadline")
+            yield {
+                "type": "widget", "widget": widget, "status": "pending",
+                "error": f"Not ready after {deadline:g}s",
+            }
+    finally:
+        # Deadline passed or client disconnected: nothing is waiting for these anymore
+        for task in tasks:
+            task.cancel()
+        context.cancel()
+
+
+async def _check_portfolio_owner(async_db: AsyncSession, portfolio_id: int, user: User) -> None:
+    """Raise unless the portfolio exists and belongs to user"""
+    portfolio = await crud_portfolios.get_portfolio(async_db, portfolio_id)
+    if not portfolio:
+        raise PortfolioNotFoundError(portfolio_id)
+    if portfolio.user_id != user.id:
+        from app.errors import UnauthorizedPortfolioAccessError
+        raise UnauthorizedPortfolioAccessError(portfolio_id)
+
+
 @router.post("/dashboard")
 async def get_dashboard_batch(
     request: DashboardBatchRequest,
-    metrics_service: MetricsServiceDep,
+    metrics_service: AsyncMetricsServiceDep,
     insights_service: InsightsServiceDep,
-    current_user: User = Depends(get_current_verified_user),
+    current_user: User = Depends(get_current_verified_user_async),
+    async_db: AsyncSession = Depends(get_async_db),
     db: Session = Depends(get_db)
 ):
     """
@@ -567,135 +749,109 @@ async def get_dashboard_batch(
     Returns:
         - data: Dict of requested data sections
         - errors: Dict of any errors encountered (partial failures allowed)
-        - cached: Whether response was served from cache
+        - cached: Whether every section was served from cache
+        - cached_widgets: Sections served from cache
         - timestamp: When data was fetched
-    """
-    # Verify user has access to portfolio
-    portfolio = crud_portfolios.get_portfolio(db, request.portfolio_id)
-    if not portfolio:
-        raise PortfolioNotFoundError(request.portfolio_id)
-    if portfolio.user_id != current_user.id:
-        from app.errors import UnauthorizedPortfolioAccessError
-        raise UnauthorizedPortfolioAccessError(request.portfolio_id)
-    
-    # Create cache key
-    widget_key = ','.join(sorted(request.visible_widgets))
-    cache_key = f"dashboard_batch:{request.portfolio_id}:{hash(widget_key)}"
     
-    # Check Redis cache
-    cache = CacheService()
-    cached_data = cache.get(cache_key)
+    Each data section is cached on its own (see WIDGET_CACHE_POLICY), so a
+    request only computes the sections missing from the cache.
     
-    if cached_data:
-        logger.info(f"Batch cache hit for portfolio {request.portfolio_id}")
-        return {
-            **cached_data,
-            "cached": True,
-        }
+    Positions, metrics and history run on the async session; the remaining
+    widgets still use the sync one. Every widget reads positions, quotes, FX
+    rates and history from one DashboardContext, so each is computed at most
+    once per request.
+    """
+    # Verify user has access to portfolio
+    await _check_portfolio_owner(async_db, request.portfolio_id, current_user)
     
     # Determine what data to fetch
     required_data = _extract_required_data(request.visible_widgets)
+    if request.include_sold:
+        required_data.add('sold_positions')
     logger.info(f"Fetching data for portfolio {request.portfolio_id}: {required_data}")
     
-    # Build task list based on requirements
-    tasks = {}
-    
-    if 'metrics' in required_data:
-        tasks['metrics'] = _fetch_metrics(request.portfolio_id, metrics_service, db)
-    
-    if 'positions' in required_data:
-        tasks['positions'] = _fetch_positions(request.portfolio_id, metrics_service, db)
-    
-    if 'sold_positions' in required_data or request.include_sold:
-        tasks['sold_positions'] = _fetch_sold_positions(request.portfolio_id, metrics_service, db)
-    
-    if 'watchlist' in required_data:
-        tasks['watchlist'] = _fetch_watchlist(current_user, db)
-    
-    if 'notifications' in required_data:
-        tasks['notifications'] = _fetch_notifications(current_user, db)
-    
-    if 'market_tnx' in required_data:
-        tasks['market_tnx'] = _fetch_market_tnx()
-    
-    if 'market_dxy' in required_data:
-        tasks['market_dxy'] = _fetch_market_dxy()
-    
-    if 'market_vix' in required_data:
-        tasks['market_vix'] = _fetch_market_vix()
-    
-    if 'market_indices' in required_data:
-        tasks['market_indices'] = _fetch_market_indices()
-    
-    if 'sentiment_stock' in required_data:
-        tasks['sentiment_stock'] = _fetch_sentiment_stock()
+    # Shared inputs of every portfolio widget, computed on first use
+    context = DashboardContext(metrics_service, request.portfolio_id)
     
-    if 'sentiment_crypto' in required_data:
-        tasks['sentiment_crypto'] = _fetch_sentiment_crypto()
-    
-    if 'asset_allocation' in required_data:
-        tasks['asset_allocation'] = _fetch_asset_allocation(request.portfolio_id, db, metrics_service, current_user)
-    
-    if 'sector_allocation' in required_data:
-        tasks['sector_allocation'] = _fetch_sector_allocation(request.portfolio_id, db, metrics_service, current_user)
-    
-    if 'country_allocation' in required_data:
-        tasks['country_allocation'] = _fetch_country_allocation(request.portfolio_id, db, metrics_service, current_user)
-    
-    if 'performance_history' in required_data:
-        tasks['performance_history'] = _fetch_performance_history(request.portfolio_id, db)
-    
-    if 'risk_metrics' in required_data:
-        tasks['risk_metrics'] = _fetch_risk_metrics(request.portfolio_id, insights_service, db)
-    
-    if 'benchmark_comparison' in required_data:
-        tasks['benchmark_comparison'] = _fetch_benchmark_comparison(request.portfolio_id, insights_service, db)
-    
-    if 'transactions' in required_data:
-        tasks['transactions'] = _fetch_transactions(request.portfolio_id, db)
-    
-    # Execute all tasks in parallel
-    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
-    
-    # Map results back to keys
-    data = {}
-    errors = {}
-    
-    for (key, _), result in zip(tasks.items(), results):
-        if isinstance(result, Exception):
-            logger.error(f"Error fetching {key}: {result}")
-            errors[key] = str(result)
-        elif result is not None:
-            data[key] = result
-        else:
-            errors[key] = "No data returned"
+    data, errors, cached = await _load_widgets(
+        required_data, request.portfolio_id, current_user, context, db, insights_service
+    )
     
     # Build response
     now = datetime.now()
     response = {
         "data": data,
         "errors": errors if errors else None,
-        "cached": False,
+        "cached": bool(data) and len(cached) == len(required_data),
+        "cached_widgets": cached,
         "timestamp": now.isoformat(),
         "widgets_requested": len(request.visible_widgets),
         "data_fetched": len(data),
     }
     
-    # Ensure the entire response is JSON serializable before caching and returning
-    response = _make_json_serializable(response)
+    # Ensure the entire response is JSON serializable before returning
+    return _make_json_serializable(response)
+
+
+@router.post("/dashboard/stream")
+async def stream_dashboard_batch(
+    request: DashboardBatchRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_verified_user_async),
+    async_db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stream dashboard data, one frame per data section as soon as it resolves
+    
+    Same sections and cache entries as POST /batch/dashboard, but a slow
+    widget no longer holds back the others. Frames are newline-delimited JSON,
+    or Server-Sent Events when the client accepts text/event-stream:
     
-    # Cache the response in Redis (shared across workers)
-    cache.set(cache_key, response, ttl=_BATCH_CACHE_TTL)
+        {"type": "start", "widgets": [...], "deadline": 15.0}
+        {"type": "widget", "widget": "metrics", "status": "ok", "cached": true, "data": {...}}
+        {"type": "widget", "widget": "risk_metrics", "status": "failed", "error": "..."}
+        {"type": "widget", "widget": "benchmark_comparison", "status": "pending", "error": "..."}
+        {"type": "complete", "pending": [...], "failed": [...], "timestamp": "..."}
     
-    return response
+    A section still computing after DASHBOARD_WIDGET_DEADLINE_SECONDS gets a
+    "pending" frame; the client can request it again later.
+    """
+    await _check_portfolio_owner(async_db, request.portfolio_id, current_user)
+    # The request's session only checked ownership: don't hold its connection while streaming
+    await async_db.commit()
+    
+    required_data = _extract_required_data(request.visible_widgets)
+    if request.include_sold:
+        required_data.add('sold_positions')
+    deadline = settings.DASHBOARD_WIDGET_DEADLINE_SECONDS
+    
+    async def generate_frames() -> AsyncIterator[Dict[str, Any]]:
+        """The widget frames between a start and a complete frame, computed on sessions of the stream's own"""
+        yield {"type": "start", "widgets": sorted(required_data), "deadline": deadline}
+        unresolved: Dict[str, List[str]] = {"pending": [], "failed": []}
+        with get_db_context() as db:
+            async with get_async_db_context() as stream_db:
+                context = DashboardContext(MetricsService(stream_db.sync_session), request.portfolio_id)
+                async for frame in _stream_widgets(
+                    required_data, request.portfolio_id, current_user, context, db, InsightsService(db), deadline
+                ):
+                    if frame["status"] in unresolved:
+                        unresolved[frame["status"]].append(frame["widget"])
+                    yield frame
+        yield {"type": "complete", **unresolved, "timestamp": datetime.now().isoformat()}
+    
+    return frames_response(generate_frames(), http_request)
 
 
 @router.delete("/dashboard/cache")
 async def clear_dashboard_cache(
-    current_user: User = Depends(get_current_verified_user)
+    current_user: User = Depends(get_current_verified_user),
+    db: Session = Depends(get_db)
 ):
-    """Clear dashboard batch cache (admin/debugging)"""
-    cache = CacheService()
-    # Clear all dashboard batch cache keys
-    # Note: This is a simple implementation. For production, consider using Redis SCAN pattern
-    return {"message": "Dashboard cache cleared (individual keys will expire)", "timestamp": datetime.now().isoformat()}
+    """Clear the cached dashboard widgets of the current user and their portfolios"""
+    from app.crud import portfolios as crud_portfolios_sync
+    
+    deleted = invalidate_dashboard_widgets(f"u{current_user.id}")
+    for portfolio in crud_portfolios_sync.get_portfolios_by_user(db, current_user.id):
+        deleted += invalidate_dashboard_widgets(f"p{portfolio.id}")
+    return {"message": f"Dashboard cache cleared ({deleted} entries)", "timestamp": datetime.now().isoformat()}
@@ -152,10 +152,37 @@ async def redis_health():
     """
     from app.redis_client import get_redis_manager
     from app.services.cache import CacheService
+    from app.services.single_flight import get_single_flight_stats
     
     redis_manager = get_redis_manager()
     
     return {
         "connection": redis_manager.get_stats(),
-        "cache": CacheService.get_stats()
+        "cache": CacheService.get_stats(),
+        "single_flight": get_single_flight_stats(),
     }
+
+
+@router.get("/health/price-refresh")
+async def price_refresh_health():
+    """
+    Scheduled price refresh statistics (symbols refreshed, skipped on closed
+    exchanges, symbols/sec of the last run) and price alert evaluation counts
+    """
+    from app.services.price_alerts import get_price_alert_stats
+    from app.services.price_refresh import get_price_refresh_stats
+    
+    return {**get_price_refresh_stats(), "alerts": get_price_alert_stats()}
+
+
+@router.get("/health/price-ticks")
+async def price_ticks_health():
+    """
+    Price tick stream statistics: ticks published, per consumer group (ATH,
+    alerts, positions cache, daily changes) its lag and throughput, and the
+    live price connections of this worker
+    """
+    from app.services.price_feed import price_feed
+    from app.services.price_ticks import get_price_tick_stats
+    
+    return {**get_price_tick_stats(), "feed": price_feed.get_stats()}
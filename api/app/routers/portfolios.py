@@ -2,9 +2,11 @@
 """
 Portfolios router
 """
-from typing import List, Annotated, Dict
+from typing import Any, AsyncIterator, List, Annotated, Dict
 from decimal import Decimal
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.errors import (
@@ -15,12 +17,14 @@ from app.errors import (
     PortfolioAlreadyExistsError, 
     PortfolioNotFoundError
 )
-from app.db import get_db
+from app.db import get_async_db, get_async_db_context, get_db
 from app.schemas import Portfolio, PortfolioCreate, PortfolioUpdate, Position, PortfolioMetrics, PortfolioHistoryPoint
 from app.crud import portfolios as crud
+from app.crud.aio import portfolios as crud_aio
+from app.dependencies import get_async_metrics_service
 from app.services.metrics import MetricsService, get_metrics_service
 from app.services.pricing import get_pricing_service
-from app.auth import get_current_user, verify_portfolio_access
+from app.auth import get_current_user, get_current_user_async, verify_portfolio_access, verify_portfolio_access_async
 from app.models import User, Transaction, Asset, TransactionType, Portfolio as PortfolioModel
 
 router = APIRouter()
@@ -29,17 +33,17 @@ router = APIRouter()
 async def get_portfolios(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """Get list of portfolios for the current user"""
-    return crud.get_portfolios_by_user(db, current_user.id, skip=skip, limit=limit)
+    return await crud_aio.get_portfolios_by_user(db, current_user.id, skip=skip, limit=limit)
 
 
 @router.get("/{portfolio_id}", response_model=Portfolio)
 async def get_portfolio(
     portfolio_id: int, 
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """Get portfolio by ID"""
     return portfolio
@@ -87,8 +91,8 @@ async def delete_portfolio(
 @router.get("/{portfolio_id}/positions", response_model=List[Position])
 async def get_portfolio_positions(
     portfolio_id: int,
-    metrics_service = Depends(get_metrics_service),
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    metrics_service = Depends(get_async_metrics_service),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """
     Get current positions for a portfolio
@@ -134,8 +138,8 @@ async def get_position_detailed_metrics(
 @router.get("/{portfolio_id}/sold-positions", response_model=List[Position])
 async def get_sold_positions(
     portfolio_id: int,
-    metrics_service = Depends(get_metrics_service),
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    metrics_service = Depends(get_async_metrics_service),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """
     Get sold positions for a portfolio with realized P&L
@@ -153,8 +157,8 @@ async def get_sold_positions(
 @router.get("/{portfolio_id}/metrics", response_model=PortfolioMetrics)
 async def get_portfolio_metrics(
     portfolio_id: int,
-    metrics_service = Depends(get_metrics_service),
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    metrics_service = Depends(get_async_metrics_service),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """
     Get aggregated metrics for a portfolio
@@ -178,8 +182,8 @@ async def get_portfolio_metrics(
 async def get_portfolio_history(
     portfolio_id: int,
     period: str = "1M",  # 1W, 1M, 3M, 6M, YTD, 1Y, ALL
-    metrics_service = Depends(get_metrics_service),
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    metrics_service = Depends(get_async_metrics_service),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """
     Get portfolio value history for charting
@@ -198,7 +202,7 @@ async def get_portfolio_history(
     - ALL: All available data
     """
     try:
-        return metrics_service.get_portfolio_history(portfolio_id, period)
+        return await metrics_service.get_portfolio_history_shared(portfolio_id, period)
     except ValueError as e:
         raise CannotGetPortfolioHistoryError(portfolio_id, str(e))
 
@@ -248,8 +252,8 @@ async def generate_portfolio_report(
 @router.get("/{portfolio_id}/prices/batch")
 async def get_batch_prices(
     portfolio_id: int,
-    db: Session = Depends(get_db),
-    portfolio: PortfolioModel = Depends(verify_portfolio_access)
+    db: AsyncSession = Depends(get_async_db),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
 ):
     """
     **Ultra-fast endpoint for price-only updates** 🚀
@@ -294,11 +298,10 @@ async def get_batch_prices(
     """
     import logging
     from datetime import datetime
-    from app.services.currency import CurrencyService
     
     logger = logging.getLogger(__name__)
     
-    from app.services.cache import CacheService
+    from app.services.cache import CacheService, portfolio_tag
     
     # Check cache first (5 minute TTL)
     cache = CacheService()
@@ -315,13 +318,11 @@ async def get_batch_prices(
         
         # Get all unique assets in this portfolio (fast query with new index)
         # Only look at assets with current positions (quantity > 0)
-        asset_ids_query = (
-            db.query(Transaction.asset_id)
-            .filter(Transaction.portfolio_id == portfolio_id)
+        asset_ids = list(await db.scalars(
+            select(Transaction.asset_id)
+            .where(Transaction.portfolio_id == portfolio_id)
             .distinct()
-        )
-        
-        asset_ids = [row[0] for row in asset_ids_query.all()]
+        ))
         
         if not asset_ids:
             empty_response = {
@@ -331,61 +332,17 @@ async def get_batch_prices(
                 "updated_at": datetime.utcnow().isoformat(),
                 "count": 0
             }
-            cache.set(cache_key, empty_response, ttl=300)  # 5 min cache
+            cache.set(cache_key, empty_response, ttl=300, tags=[portfolio_tag(portfolio_id)])  # 5 min cache
             return empty_response
         
         # Get asset details (symbol, currency) - fast with new index
-        assets = db.query(Asset).filter(Asset.id.in_(asset_ids)).all()
-        asset_map = {asset.id: asset for asset in assets}
-        
-        # Fetch all prices in parallel (existing optimization)
-        pricing_service = get_pricing_service(db)
-        symbols = [asset.symbol for asset in assets]
+        assets = list(await db.scalars(select(Asset).where(Asset.id.in_(asset_ids))))
         
-        logger.info(f"Batch fetching prices for {len(symbols)} assets in portfolio {portfolio_id}")
+        logger.info(f"Batch fetching prices for {len(assets)} assets in portfolio {portfolio_id}")
         
-        # This already uses parallel fetching internally
-        price_quotes = await pricing_service.get_multiple_prices(symbols)
-        
-        # Build response with currency conversion
-        prices = []
-        for asset in assets:
-            quote = price_quotes.get(asset.symbol)
-            if quote and quote.price:
-                original_price = float(quote.price)
-                current_price = original_price
-                
-                # Convert to portfolio base currency if needed
-                if asset.currency != base_currency:
-                    from decimal import Decimal
-                    converted = CurrencyService.convert(
-                        Decimal(str(original_price)),
-                        from_currency=asset.currency,
-                        to_currency=base_currency
-                    )
-                    if converted:
-                        current_price = float(converted)
-                        logger.debug(
-                            f"Converted {asset.symbol} price: "
-                            f"{original_price} {asset.currency} -> {current_price} {base_currency}"
-                        )
-                    else:
-                        logger.warning(
-                            f"Failed to convert {asset.symbol} from {asset.currency} to {base_currency}, "
-                            f"using original price"
-                        )
-                
-                prices.append({
-                    "symbol": asset.symbol,
-                    "asset_id": asset.id,
-                    "name": asset.name,
-                    "current_price": current_price,
-                    "original_price": original_price,
-                    "original_currency": asset.currency,
-                    "daily_change_pct": float(quote.daily_change_pct) if quote.daily_change_pct else None,
-                    "last_updated": quote.asof.isoformat() if quote.asof else None,
-                    "asset_type": asset.asset_type
-                })
+        # One batched quote fetch, conversion rates resolved up front
+        pricing_service = get_pricing_service(db.sync_session)
+        prices = await pricing_service.get_converted_prices(assets, base_currency)
         
         response = {
             "portfolio_id": portfolio_id,
@@ -396,7 +353,7 @@ async def get_batch_prices(
         }
         
         # Cache the response for 5 minutes
-        cache.set(cache_key, response, ttl=300)
+        cache.set(cache_key, response, ttl=300, tags=[portfolio_tag(portfolio_id)])
         logger.info(f"Cached price batch for portfolio {portfolio_id} ({len(prices)} prices)\")")
         
         return response
@@ -405,3 +362,46 @@ async def get_batch_prices(
         logger.error(f"Failed to fetch batch prices for portfolio {portfolio_id}: {e}", exc_info=True)
         raise CannotGetPortfolioPricesError(portfolio_id, str(e))
 
+
+@router.get("/{portfolio_id}/prices/stream")
+async def stream_portfolio_prices(
+    portfolio_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    portfolio: PortfolioModel = Depends(verify_portfolio_access_async)
+):
+    """
+    Live price updates of the assets in a portfolio, pushed as new quotes land
+    
+    Replaces polling /prices/batch: the same assets and price fields, in the
+    portfolio base currency, sent only for the assets whose quote changed.
+    Frames are newline-delimited JSON, or Server-Sent Events when the client
+    accepts text/event-stream:
+    
+        {"type": "start", "symbols": ["AAPL", "MC.PA"], "base_currency": "EUR"}
+        {"type": "prices", "prices": [{"symbol": "AAPL", "asset_id": 5, "current_price": 168.75,
+                                       "currency": "EUR", "daily_change_pct": 1.25, "last_updated": "..."}]}
+        {"type": "heartbeat", "timestamp": "..."}
+    """
+    from app.services.price_feed import frames_response, stream_price_deltas
+    
+    base_currency = portfolio.base_currency if portfolio.base_currency else "USD"
+    # The request's session only checked access: don't hold its connection while streaming
+    await db.commit()
+    
+    async def generate_frames() -> AsyncIterator[Dict[str, Any]]:
+        async with get_async_db_context() as stream_db:
+            assets = (await stream_db.execute(
+                select(Asset.id, Asset.symbol, Asset.currency).where(
+                    Asset.id.in_(select(Transaction.asset_id).where(Transaction.portfolio_id == portfolio_id).distinct())
+                )
+            )).all()
+        async for frame in stream_price_deltas(
+            {asset_id: (symbol, currency) for asset_id, symbol, currency in assets},
+            base_currency,
+            request.is_disconnected
+        ):
+            yield frame
+    
+    return frames_response(generate_frames(), request)
+
@@ -20,6 +20,7 @@ from app.db import get_db
 from app.schemas import Transaction, TransactionCreate, CsvImportResult, ConversionCreate, ConversionResponse
 from app.crud import transactions as crud, portfolios as portfolio_crud
 from app.models import TransactionType, User, Portfolio as PortfolioModel, Transaction as TransactionModel
+from app.services.cache import user_tag
 from app.services.import_csv import get_csv_import_service, CsvImportService
 from app.services.notifications import notification_service
 from app.auth import get_current_user, verify_portfolio_access
@@ -226,8 +227,7 @@ async def add_position_transaction(
     
     # Invalidate assets cache (held/sold)
     cache_service = CacheService()
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Invalidated caches for portfolio {portfolio_id} after transaction")
     
@@ -445,8 +445,7 @@ async def create_conversion(
     invalidate_positions(portfolio_id)
     
     cache_service = CacheService()
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Created conversion {conversion_id} in portfolio {portfolio_id}")
     
@@ -773,8 +772,7 @@ async def create_transaction(
     
     # Invalidate assets cache (held/sold)
     cache_service = CacheService()
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Invalidated caches for portfolio {portfolio_id} after transaction")
     
@@ -867,8 +865,7 @@ async def update_transaction(
     cache_service.invalidate_portfolio(portfolio_id)  # Invalidates positions, metrics, insights, and batch cache
     
     # Invalidate assets cache (held/sold)
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Invalidated caches for portfolio {portfolio_id} after transaction update")
     
@@ -957,8 +954,7 @@ async def delete_transaction(
     cache_service.invalidate_portfolio(portfolio_id)  # Invalidates positions, metrics, insights, and batch cache
     
     # Invalidate assets cache (held/sold)
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Invalidated caches for portfolio {portfolio_id} after transaction deletion")
     
@@ -1014,8 +1010,7 @@ async def import_csv_stream(
                 
                 # Invalidate assets cache (held/sold)
                 cache_service = CacheService()
-                cache_service.delete_pattern(f"assets_held:{user_id}:*")
-                cache_service.delete_pattern(f"assets_sold:{user_id}:*")
+                cache_service.invalidate_tags(user_tag(user_id, "assets"))
                 
                 logger.info(f"Invalidated caches for portfolio {portfolio_id}")
                 
@@ -1082,8 +1077,7 @@ async def import_csv(
     
     # Invalidate assets cache (held/sold)
     cache_service = CacheService()
-    cache_service.delete_pattern(f"assets_held:{current_user.id}:*")
-    cache_service.delete_pattern(f"assets_sold:{current_user.id}:*")
+    cache_service.invalidate_tags(user_tag(current_user.id, "assets"))
     
     logger.info(f"Invalidated caches for portfolio {portfolio_id} after CSV import")
     
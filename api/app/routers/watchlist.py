@@ -2,13 +2,13 @@
 Watchlist router - Track assets without owning them
 """
 import logging
-from typing import List, Dict, Any, Generator
+from typing import List, Dict, Any, AsyncIterator, Generator
 from decimal import Decimal
 from datetime import datetime, timedelta
 import json
 import csv
 from io import StringIO
-from fastapi import APIRouter, Depends, status, UploadFile, File
+from fastapi import APIRouter, Depends, Request, status, UploadFile, File
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
@@ -25,7 +25,7 @@ from app.errors import (
     NotAuthorizedWatchlistTagAccessError,
     WrongImportFormatError
 )
-from app.db import get_db
+from app.db import get_db, get_db_context
 from app.schemas import (
     WatchlistItem, WatchlistItemCreate, WatchlistItemCreateBySymbol, WatchlistItemUpdate,
     WatchlistItemWithPrice, WatchlistImportItem, WatchlistImportResult,
@@ -206,6 +206,37 @@ async def create_watchlist_item_by_symbol(
     return created_item
 
 
+@router.get("/prices/stream")
+async def stream_watchlist_prices(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Live price updates of the watchlist, pushed as new quotes land
+    
+    Prices are in each asset's own currency, like GET /watchlist. Frames are
+    newline-delimited JSON, or Server-Sent Events when the client accepts
+    text/event-stream (see GET /portfolios/{portfolio_id}/prices/stream).
+    """
+    from app.services.price_feed import frames_response, stream_price_deltas
+    
+    user_id = current_user.id
+    # The request's session only authenticated the user: don't hold its connection while streaming
+    db.commit()
+    
+    async def generate_frames() -> AsyncIterator[Dict[str, Any]]:
+        with get_db_context() as stream_db:
+            assets = {
+                item.asset_id: (item.asset.symbol, item.asset.currency)
+                for item in crud.get_watchlist_items_by_user(stream_db, user_id)
+            }
+        async for frame in stream_price_deltas(assets, None, request.is_disconnected):
+            yield frame
+    
+    return frames_response(generate_frames(), request)
+
+
 # ============================================================================
 # Watchlist Tag Endpoints (must be defined before /{item_id} routes)
 # ============================================================================
@@ -844,17 +875,15 @@ async def refresh_watchlist_prices(
     if not items:
         return {"refreshed_count": 0}
     
-    # Force refresh prices for all watchlist assets
-    count = 0
-    for item in items:
-        try:
-            # Force refresh to get fresh data from Yahoo Finance
-            price = pricing_service.get_price(item.asset.symbol, force_refresh=True)
-            if price:
-                count += 1
-        except Exception:
-            pass  # Continue with other assets
+    # Force refresh prices for all watchlist assets with one batched fetch
+    symbols = [item.asset.symbol for item in items if item.asset and item.asset.symbol]
+    try:
+        prices = await pricing_service.get_multiple_prices(symbols, force_refresh=True)
+    except Exception as e:
+        logger.warning(f"Failed to refresh watchlist prices: {e}")
+        prices = {}
     
+    count = sum(1 for symbol in symbols if prices.get(symbol))
     return {"refreshed_count": count}
 
 
@@ -8,7 +8,7 @@ from datetime import datetime, timedelta
 from typing import Any, Optional, Dict, Callable
 import logging
 
-from app.services.cache import CacheService
+from app.services.cache import CacheService, portfolio_tag
 
 logger = logging.getLogger(__name__)
 
@@ -85,7 +85,7 @@ def get_cached_analytics(
     result = calculator()
     
     # Store in Redis cache
-    CacheService.set(full_key, result, _CACHE_TTL)
+    CacheService.set(full_key, result, _CACHE_TTL, tags=[portfolio_tag(portfolio_id)])
     
     return result
 
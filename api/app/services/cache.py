@@ -1,32 +1,278 @@
 """
 High-level caching service with Redis backend and graceful degradation.
 Provides type-safe caching for common operations.
+
+Reads go through two tiers: a bounded in-process LRU (LocalCache) in front
+of Redis. Every write or delete is published on a Redis channel, so the
+other API and Celery processes drop their local copy. Local entries also
+expire after CACHE_LOCAL_TTL_SECONDS, which bounds staleness if a message is
+missed.
+
+Positions, prices and insights are stale-while-revalidate entries (see
+CacheService.set_swr): past their TTL they are still served for a while,
+flagged stale, while app.services.cache_refresh recomputes them in the
+background.
+
+Values are stored through app.services.cache_codec (msgpack with exact
+Decimal/datetime round trips, compression of large entries, a schema
+version tag), on a Redis connection that returns raw bytes.
 """
+import fnmatch
+import hashlib
 import json
 import logging
-from typing import Optional, Any, Callable, TypeVar, Generic
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Any, Callable, Dict, Iterable, Iterator, Set, Tuple, TypeVar, Generic, Union
 from datetime import datetime, timedelta
-from decimal import Decimal
 from redis.exceptions import RedisError
-from pydantic import BaseModel
 
-from app.redis_client import get_redis
+from app.config import settings
+from app.redis_client import get_redis_binary
+from app.services import cache_codec
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
 
 
+class LocalCache:
+    """
+    Bounded in-process LRU with per-entry expiry, the first cache tier.
+    
+    Values are returned as stored, to every caller of this process. The
+    CacheService tier stores encoded bytes and decodes them on each read, so
+    no caller can mutate another's copy. Entries remember their tags so tag
+    invalidation also works when Redis is unavailable.
+    """
+    
+    def __init__(self, max_entries: int, max_ttl: float):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(found, value) of a live entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, tags: Iterable[str] = ()) -> None:
+        """Store a value for at most max_ttl seconds, evicting the least recently used"""
+        if self.max_entries <= 0:
+            return
+        ttl = min(ttl, self.max_ttl) if ttl and ttl > 0 else self.max_ttl
+        tags = tuple(tags)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+    
+    def discard(self, keys: Iterable[str]) -> None:
+        """Drop entries if present"""
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+    
+    def discard_matching(self, pattern: str) -> None:
+        """Drop entries whose key matches a glob pattern"""
+        with self._lock:
+            for key in [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]:
+                self._remove(key)
+    
+    def discard_tags(self, tags: Iterable[str]) -> None:
+        """Drop the entries stored under any of the tags"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+    
+    def _remove(self, key: str) -> None:
+        """Drop one entry and its tag memberships; caller holds the lock"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            members = self._tags.get(tag)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._tags[tag]
+
+
+local_cache = LocalCache(settings.CACHE_LOCAL_MAX_ENTRIES, settings.CACHE_LOCAL_TTL_SECONDS)
+
+# (tier, key prefix, "hits" | "misses") -> count, for this process
+_tier_counters: Counter = Counter()
+
+
+def _count(tier: str, key: str, hit: bool) -> None:
+    _tier_counters[(tier, key.split(':', 1)[0], "hits" if hit else "misses")] += 1
+
+
+# Cross-process invalidation of the local tier
+INVALIDATION_CHANNEL = "cache_invalidation"
+_PROCESS_ID = uuid.uuid4().hex
+
+
+class _InvalidationListener:
+    """
+    Background pub/sub subscriber dropping local entries other processes changed
+    
+    Started on first use of a Redis client. If the subscription breaks, the
+    local tier is cleared (messages may have been missed) and the listener is
+    restarted by the next cache read.
+    """
+    
+    def __init__(self):
+        self._client = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def ensure(self, redis_client) -> None:
+        """Listen on redis_client, unless already doing so"""
+        if self._client is redis_client and self._thread is not None:
+            return
+        with self._lock:
+            if self._client is redis_client and self._thread is not None:
+                return
+            self._stop()
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_message})
+                self._thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True, exception_handler=self._on_error
+                )
+                self._client = redis_client
+            except RedisError as e:
+                logger.warning(f"Cache invalidation listener not started: {e}")
+                return
+            # Entries cached before listening may have missed invalidations
+            local_cache.clear()
+    
+    def stop(self) -> None:
+        with self._lock:
+            self._stop()
+    
+    def _stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+        self._thread = None
+        self._client = None
+    
+    @staticmethod
+    def _on_message(message) -> None:
+        try:
+            payload = json.loads(message["data"])
+        except (TypeError, ValueError):
+            return
+        if payload.get("origin") == _PROCESS_ID:
+            return
+        if payload.get("keys"):
+            local_cache.discard(payload["keys"])
+        if payload.get("pattern"):
+            local_cache.discard_matching(payload["pattern"])
+    
+    def _on_error(self, exc, pubsub, thread) -> None:
+        logger.warning(f"Cache invalidation listener stopped: {exc}. Clearing the local cache tier.")
+        thread.stop()
+        local_cache.clear()
+        with self._lock:
+            if self._thread is thread:
+                self._thread = None
+                self._client = None
+
+
+_invalidation_listener = _InvalidationListener()
+
+
+def stop_invalidation_listener() -> None:
+    """Stop the local tier's pub/sub subscriber (application shutdown)"""
+    _invalidation_listener.stop()
+
+
+# Stale-while-revalidate
+
+FRESH = "fresh"
+STALE = "stale"
+
+# Field of the envelope an SWR entry is stored in, next to "value": end of its fresh period (epoch seconds)
+_SWR_FRESH_UNTIL = "swr_fresh_until"
+
+# Freshness of the SWR reads made while serving the current request (see freshness_scope)
+_read_freshness: ContextVar[Optional[Set[str]]] = ContextVar("cache_read_freshness", default=None)
+
+# False while a background refresh runs, so it never builds on stale inputs
+_stale_allowed: ContextVar[bool] = ContextVar("cache_stale_allowed", default=True)
+
+
+@contextmanager
+def freshness_scope() -> Iterator[Set[str]]:
+    """
+    Collect the freshness (FRESH / STALE) of the SWR entries read inside the block
+    
+    Tasks started inside the block share the set, so reads made by concurrent
+    widget fetchers are collected too.
+    """
+    states: Set[str] = set()
+    token = _read_freshness.set(states)
+    try:
+        yield states
+    finally:
+        _read_freshness.reset(token)
+
+
+@contextmanager
+def stale_reads_disallowed() -> Iterator[None]:
+    """Inside the block, stale SWR entries read as misses"""
+    token = _stale_allowed.set(False)
+    try:
+        yield
+    finally:
+        _stale_allowed.reset(token)
+
+
 class CacheService:
     """
     High-level caching service with automatic serialization and graceful degradation.
     
     Features:
-    - Automatic JSON serialization with Decimal support
+    - Automatic serialization through cache_codec: exact Decimal/datetime
+      round trips, Pydantic models rebuilt without re-validation
     - TTL (time-to-live) support
     - Graceful degradation when Redis unavailable
     - Type-safe get/set operations
     - Batch operations support
+    - Tag index: writes register their key under tags (portfolio, user, asset,
+      symbol) so invalidation deletes exactly the affected keys, without
+      scanning the keyspace
+    - In-process LRU tier in front of Redis, kept coherent across processes
+      through pub/sub (see LocalCache)
+    - Stale-while-revalidate entries (set_swr / get_swr, and their batch
+      forms) with a soft and a hard expiry
     """
     
     # Cache key prefixes for organization
@@ -37,6 +283,18 @@ class CacheService:
     PREFIX_ASSET = "asset:"
     PREFIX_INSIGHTS = "insights:"
     PREFIX_PORTFOLIO = "portfolio:"
+    PREFIX_FX = "fx:"
+    PREFIX_DASHBOARD = "dashboard_widget:"
+    
+    # Bookkeeping keys: a set of member keys per tag, the tags of each tagged
+    # key (so reads can tag their local copy), and a sorted set of member keys
+    # scored by expiry per key prefix (backs get_stats)
+    PREFIX_TAG = "cache_tag:"
+    PREFIX_KEY_TAGS = "cache_key_tags:"
+    PREFIX_KEY_INDEX = "cache_index:"
+    
+    # Keys deleted per DEL command when invalidating
+    _DELETE_BATCH = 500
     
     # Default TTLs (in seconds)
     TTL_PRICE = 300  # 5 minutes
@@ -46,54 +304,164 @@ class CacheService:
     TTL_ASSET = 3600  # 1 hour
     TTL_INSIGHTS = 300  # 5 minutes
     TTL_PORTFOLIO = 1800  # 30 minutes
+    TTL_FX = 3600  # 1 hour
+    
+    # How long stale-while-revalidate entries are still served after their TTL
+    STALE_TTL_PRICE = 900  # 15 minutes
+    STALE_TTL_POSITION = 3600  # 1 hour
+    STALE_TTL_INSIGHTS = 1800  # 30 minutes
+    
+    @staticmethod
+    def _serialize(value: Any) -> bytes:
+        """Encode a value for Redis (see cache_codec.encode)"""
+        return cache_codec.encode(value)
     
     @staticmethod
-    def _serialize(value: Any) -> str:
-        """Serialize value to JSON string, handling Decimal, datetime, and Pydantic models"""
-        # Handle Pydantic models first
-        if isinstance(value, BaseModel):
-            value = value.model_dump()
+    def _deserialize(value: bytes) -> Any:
+        """
+        Decode a Redis value (see cache_codec.decode)
         
-        def default_handler(obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            if isinstance(obj, BaseModel):
-                return obj.model_dump()
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+        Raises ValueError for entries this process cannot read, which callers
+        treat as a cache miss.
+        """
+        return cache_codec.decode(value)
+    
+    @staticmethod
+    def _keys(replies: Iterable[Any]) -> list[str]:
+        """Key names from a binary connection reply"""
+        return [key.decode() if isinstance(key, bytes) else key for key in replies]
+    
+    @staticmethod
+    def _index_key(key: str) -> str:
+        """Expiry index of the prefix a key belongs to ("positions:3" -> "cache_index:positions")"""
+        return f"{CacheService.PREFIX_KEY_INDEX}{key.split(':', 1)[0]}"
+    
+    @staticmethod
+    def _key_tags_key(key: str) -> str:
+        """Key holding the tags of a key ("positions:3" -> "cache_key_tags:positions:3")"""
+        return f"{CacheService.PREFIX_KEY_TAGS}{key}"
+    
+    @staticmethod
+    def _decode_tags(value: Optional[bytes]) -> Tuple[str, ...]:
+        """Tags of a key as stored by _track (none if missing or unreadable)"""
+        if not value:
+            return ()
+        try:
+            return tuple(json.loads(value))
+        except ValueError:
+            return ()
+    
+    @staticmethod
+    def _track(pipe, key: str, ttl: Optional[int], tags: Iterable[str]) -> None:
+        """
+        Queue the index updates of a write on its pipeline
         
-        return json.dumps(value, default=default_handler)
+        The key is added to its prefix index (dropping expired members on the
+        way) and to the set of each tag, and its tags are stored next to it
+        for the same TTL. A tag set lives as long as its longest-lived member,
+        so it never outlives the keys it lists by more than one TTL.
+        """
+        now = time.time()
+        tags = tuple(tags)
+        index_key = CacheService._index_key(key)
+        pipe.zadd(index_key, {key: now + ttl if ttl else float("inf")})
+        pipe.zremrangebyscore(index_key, "-inf", now)
+        if tags:
+            pipe.set(CacheService._key_tags_key(key), json.dumps(tags), ex=ttl or None)
+        else:
+            pipe.delete(CacheService._key_tags_key(key))
+        for tag in tags:
+            tag_key = f"{CacheService.PREFIX_TAG}{tag}"
+            pipe.sadd(tag_key, key)
+            if ttl:
+                pipe.expire(tag_key, ttl, nx=True)
+                pipe.expire(tag_key, ttl, gt=True)
+            else:
+                pipe.persist(tag_key)
+    
+    @staticmethod
+    def _publish_invalidation(pipe, keys: Iterable[str]) -> None:
+        """Queue the message telling the other processes to drop their local copies"""
+        pipe.publish(INVALIDATION_CHANNEL, json.dumps({"origin": _PROCESS_ID, "keys": list(keys)}))
+    
+    @staticmethod
+    def _delete_keys(redis_client, keys: list[str]) -> int:
+        """Delete keys, their index entries and their local copies in pipelined batches, returns keys deleted"""
+        local_cache.discard(keys)
+        deleted = 0
+        for start in range(0, len(keys), CacheService._DELETE_BATCH):
+            batch = keys[start:start + CacheService._DELETE_BATCH]
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(*batch)
+            pipe.delete(*(CacheService._key_tags_key(key) for key in batch))
+            for key in batch:
+                pipe.zrem(CacheService._index_key(key), key)
+            CacheService._publish_invalidation(pipe, batch)
+            deleted += pipe.execute()[0]
+        return deleted
     
     @staticmethod
-    def _deserialize(value: str) -> Any:
-        """Deserialize JSON string to Python object"""
-        return json.loads(value)
+    def _store_local(key: str, serialized: bytes, ttl: Optional[float], tags: Iterable[str]) -> None:
+        """Keep the encoded form of a value in the local tier"""
+        local_cache.set(key, serialized, ttl, tags)
+    
+    @staticmethod
+    def _get_local(key: str) -> Tuple[bool, Any]:
+        """(found, value) from the local tier, decoded into a copy of the caller's own"""
+        found, serialized = local_cache.get(key)
+        if found:
+            try:
+                return True, CacheService._deserialize(serialized)
+            except ValueError:
+                local_cache.discard([key])
+        return False, None
     
     @staticmethod
     def get(key: str, default: Any = None) -> Any:
         """
         Get value from cache.
         Returns default if key not found or Redis unavailable.
+        
+        The local tier is checked first; a Redis hit is kept locally, with its
+        tags, for the rest of its TTL, capped at CACHE_LOCAL_TTL_SECONDS.
         """
-        redis_client = get_redis()
+        found, value = CacheService._get_local(key)
+        _count("local", key, found)
+        if found:
+            return value
+        
+        redis_client = get_redis_binary()
         if not redis_client:
             return default
+        _invalidation_listener.ensure(redis_client)
         
         try:
-            value = redis_client.get(key)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            pipe.get(CacheService._key_tags_key(key))
+            value, pttl, tags = pipe.execute()
+            _count("redis", key, value is not None)
             if value is None:
                 logger.debug(f"Cache MISS: {key}")
                 return default
             
             logger.debug(f"Cache HIT: {key}")
-            return CacheService._deserialize(value)
-        except (RedisError, json.JSONDecodeError) as e:
+            decoded = CacheService._deserialize(value)
+            CacheService._store_local(key, value, pttl / 1000 if pttl > 0 else None, CacheService._decode_tags(tags))
+            return decoded
+        except (RedisError, ValueError) as e:
             logger.warning(f"Cache get error for key {key}: {e}")
             return default
     
     @staticmethod
-    def set(key: str, value: Any, ttl: Optional[int] = None, nx: bool = False) -> bool:
+    def set(
+        key: str,
+        value: Any,
+        ttl: Optional[int] = None,
+        nx: bool = False,
+        tags: Iterable[str] = (),
+    ) -> bool:
         """
         Set value in cache with optional TTL.
         
@@ -101,14 +469,21 @@ class CacheService:
             key: Cache key
             value: Value to cache
             ttl: Time-to-live in seconds
-            nx: Only set if key doesn't exist (for locking)
+            nx: Only set if key doesn't exist (for locking, not indexed)
+            tags: Tags to invalidate the key with (see invalidate_tags)
         
         Returns:
-            True if successful, False otherwise.
+            True if written to Redis, False otherwise (the local tier still
+            keeps it when Redis is unavailable).
             With nx=True, returns True only if key was set (didn't exist before).
         """
-        redis_client = get_redis()
+        redis_client = get_redis_binary()
         if not redis_client:
+            if not nx:
+                try:
+                    CacheService._store_local(key, CacheService._serialize(value), ttl, tags)
+                except TypeError as e:
+                    logger.warning(f"Cache set error for key {key}: {e}")
             return False
         
         try:
@@ -125,11 +500,16 @@ class CacheService:
                     logger.debug(f"Cache SET (NX): {key} (TTL: {ttl}s)" if ttl else f"Cache SET (NX): {key}")
                 return success
             else:
-                # Normal SET
+                # Normal SET, indexed in the same round trip
+                pipe = redis_client.pipeline(transaction=False)
                 if ttl:
-                    redis_client.setex(key, ttl, serialized)
+                    pipe.setex(key, ttl, serialized)
                 else:
-                    redis_client.set(key, serialized)
+                    pipe.set(key, serialized)
+                CacheService._track(pipe, key, ttl, tags)
+                CacheService._publish_invalidation(pipe, [key])
+                pipe.execute()
+                CacheService._store_local(key, serialized, ttl, tags)
                 
                 logger.debug(f"Cache SET: {key} (TTL: {ttl}s)" if ttl else f"Cache SET: {key}")
                 return True
@@ -143,12 +523,13 @@ class CacheService:
         Delete key from cache.
         Returns True if successful, False otherwise.
         """
-        redis_client = get_redis()
+        redis_client = get_redis_binary()
         if not redis_client:
+            local_cache.discard([key])
             return False
         
         try:
-            redis_client.delete(key)
+            CacheService._delete_keys(redis_client, [key])
             logger.debug(f"Cache DELETE: {key}")
             return True
         except RedisError as e:
@@ -160,15 +541,20 @@ class CacheService:
         """
         Delete all keys matching pattern.
         Returns number of keys deleted, 0 if Redis unavailable.
+        
+        Walks the keyspace with SCAN, so it never blocks Redis, but its cost
+        still grows with the total number of keys. Prefer invalidate_tags for
+        anything on a request or write path.
         """
-        redis_client = get_redis()
+        local_cache.discard_matching(pattern)
+        redis_client = get_redis_binary()
         if not redis_client:
             return 0
         
         try:
-            keys = redis_client.keys(pattern)
+            keys = CacheService._keys(redis_client.scan_iter(match=pattern, count=1000))
             if keys:
-                deleted = redis_client.delete(*keys)
+                deleted = CacheService._delete_keys(redis_client, keys)
                 logger.info(f"Cache DELETE PATTERN: {pattern} ({deleted} keys)")
                 return deleted
             return 0
@@ -176,10 +562,135 @@ class CacheService:
             logger.warning(f"Cache delete pattern error for {pattern}: {e}")
             return 0
     
+    @staticmethod
+    def invalidate_tags(*tags: str) -> int:
+        """
+        Delete every key registered under any of the tags.
+        Returns number of keys deleted, 0 if Redis unavailable.
+        
+        Each tag set is read and dropped in one MULTI, then its members are
+        deleted in pipelined batches: the cost is proportional to the number
+        of tagged keys, not to the size of the keyspace.
+        """
+        local_cache.discard_tags(tags)
+        redis_client = get_redis_binary()
+        if not redis_client or not tags:
+            return 0
+        
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            for tag in tags:
+                tag_key = f"{CacheService.PREFIX_TAG}{tag}"
+                pipe.smembers(tag_key)
+                pipe.delete(tag_key)
+            replies = pipe.execute()
+            keys = sorted(set(CacheService._keys(set().union(*replies[::2]))))
+            if not keys:
+                return 0
+            
+            deleted = CacheService._delete_keys(redis_client, keys)
+            logger.info(f"Cache INVALIDATE TAGS: {', '.join(tags)} ({deleted} keys)")
+            return deleted
+        except RedisError as e:
+            logger.warning(f"Cache invalidate tags error for {tags}: {e}")
+            return 0
+    
+    @staticmethod
+    def set_swr(key: str, value: Any, ttl: int, stale_ttl: int, tags: Iterable[str] = ()) -> bool:
+        """
+        Set a stale-while-revalidate entry
+        
+        The value is fresh for ttl seconds, then served stale for up to
+        stale_ttl more seconds (its hard expiry), while it is refreshed.
+        Read it with get_swr.
+        """
+        envelope = {_SWR_FRESH_UNTIL: time.time() + ttl, "value": value}
+        return CacheService.set(key, envelope, ttl + stale_ttl, tags=tags)
+    
+    @staticmethod
+    def get_swr(key: str) -> Tuple[Any, bool]:
+        """
+        Get a stale-while-revalidate entry.
+        Returns (value, stale), (None, False) if not found.
+        
+        A stale value should be served while the caller triggers its refresh
+        (see cache_refresh.revalidate). Entries written by set() have no fresh
+        period and read as fresh. The freshness of what the caller returns is
+        recorded in the current freshness_scope: on a miss it computes the
+        value, which is fresh.
+        """
+        return CacheService._unwrap_swr(CacheService.get(key))
+    
+    @staticmethod
+    def mget_swr(keys: list[str]) -> list[Tuple[Any, bool]]:
+        """get_swr() for many keys, read with one mget()"""
+        return [CacheService._unwrap_swr(cached) for cached in CacheService.mget(keys)]
+    
+    @staticmethod
+    def set_swr_many(entries: Iterable[Tuple[str, Any, int, int, Iterable[str]]]) -> bool:
+        """set_swr() for many (key, value, ttl, stale_ttl, tags) entries, written with one set_many()"""
+        now = time.time()
+        return CacheService.set_many(
+            (key, {_SWR_FRESH_UNTIL: now + ttl, "value": value}, ttl + stale_ttl, tags)
+            for key, value, ttl, stale_ttl, tags in entries
+        )
+    
+    @staticmethod
+    def expire_swr(keys: list[str]) -> int:
+        """
+        Mark stale-while-revalidate entries stale now, keeping their hard expiry
+        
+        Unlike delete(), their next read still serves them, and triggers their
+        refresh. Entries read with one MGET, rewritten with one pipeline.
+        Returns the number of entries that were fresh.
+        """
+        local_cache.discard(keys)
+        redis_client = get_redis_binary()
+        if not redis_client or not keys:
+            return 0
+        
+        try:
+            now = time.time()
+            pipe = redis_client.pipeline(transaction=False)
+            expired = []
+            for key, value in zip(keys, redis_client.mget(keys)):
+                if value is None:
+                    continue
+                try:
+                    envelope = CacheService._deserialize(value)
+                except ValueError:
+                    continue
+                if not isinstance(envelope, dict) or envelope.get(_SWR_FRESH_UNTIL, 0) <= now:
+                    continue
+                # XX: never bring back an entry deleted since it was read
+                pipe.set(key, CacheService._serialize({**envelope, _SWR_FRESH_UNTIL: now}), keepttl=True, xx=True)
+                expired.append(key)
+            if expired:
+                CacheService._publish_invalidation(pipe, expired)
+                pipe.execute()
+            return len(expired)
+        except (RedisError, TypeError) as e:
+            logger.warning(f"Cache expire error for {len(keys)} keys: {e}")
+            return 0
+    
+    @staticmethod
+    def _unwrap_swr(cached: Any) -> Tuple[Any, bool]:
+        """(value, stale) of a read SWR entry, recorded in the current freshness_scope"""
+        stale = False
+        if isinstance(cached, dict) and _SWR_FRESH_UNTIL in cached:
+            stale = cached[_SWR_FRESH_UNTIL] <= time.time()
+            cached = None if stale and not _stale_allowed.get() else cached["value"]
+            stale = stale and cached is not None
+        
+        states = _read_freshness.get()
+        if states is not None:
+            states.add(STALE if stale else FRESH)
+        return cached, stale
+    
     @staticmethod
     def exists(key: str) -> bool:
         """Check if key exists in cache"""
-        redis_client = get_redis()
+        redis_client = get_redis_binary()
         if not redis_client:
             return False
         
@@ -224,53 +735,102 @@ class CacheService:
         """
         Get multiple values at once.
         Returns list of values (None for missing keys).
+        
+        Keys missing from the local tier are read from Redis, with their tags,
+        in one pipeline.
         """
-        redis_client = get_redis()
+        result: list[Any] = [None] * len(keys)
+        missing: list[int] = []
+        for position, key in enumerate(keys):
+            found, value = CacheService._get_local(key)
+            _count("local", key, found)
+            if found:
+                result[position] = value
+            else:
+                missing.append(position)
+        if not missing:
+            return result
+        
+        redis_client = get_redis_binary()
         if not redis_client:
-            return [None] * len(keys)
+            return result
+        _invalidation_listener.ensure(redis_client)
         
         try:
-            values = redis_client.mget(keys)
-            result = []
-            for value in values:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.mget([keys[position] for position in missing])
+            pipe.mget([CacheService._key_tags_key(keys[position]) for position in missing])
+            for position in missing:
+                pipe.pttl(keys[position])
+            values, tags, *pttls = pipe.execute()
+            for position, value, key_tags, pttl in zip(missing, values, tags, pttls):
+                key = keys[position]
+                _count("redis", key, value is not None)
                 if value is None:
-                    result.append(None)
-                else:
-                    try:
-                        result.append(CacheService._deserialize(value))
-                    except json.JSONDecodeError:
-                        result.append(None)
+                    continue
+                try:
+                    result[position] = CacheService._deserialize(value)
+                except ValueError:
+                    continue
+                CacheService._store_local(
+                    key, value, pttl / 1000 if pttl > 0 else None, CacheService._decode_tags(key_tags)
+                )
             return result
         except RedisError as e:
             logger.warning(f"Cache mget error: {e}")
-            return [None] * len(keys)
+            return result
     
     @staticmethod
-    def mset(mapping: dict[str, Any], ttl: Optional[int] = None) -> bool:
+    def mset(mapping: dict[str, Any], ttl: Optional[int] = None, tags: Iterable[str] = ()) -> bool:
         """
-        Set multiple key-value pairs at once.
-        Returns True if successful, False otherwise.
+        Set multiple key-value pairs at once, each registered under tags.
+        Returns True if written to Redis, False otherwise.
         """
-        redis_client = get_redis()
+        tags = tuple(tags)
+        return CacheService.set_many((key, value, ttl, tags) for key, value in mapping.items())
+    
+    @staticmethod
+    def set_many(entries: Iterable[Tuple[str, Any, Optional[int], Iterable[str]]]) -> bool:
+        """
+        Set many (key, value, ttl, tags) entries, each with its own TTL and tags,
+        in one pipeline (a single round trip) with a single invalidation message.
+        Returns True if written to Redis, False otherwise (the local tier still
+        keeps them when Redis is unavailable).
+        """
+        try:
+            # Serialize all values
+            serialized = [
+                (key, CacheService._serialize(value), ttl, tuple(tags)) for key, value, ttl, tags in entries
+            ]
+        except TypeError as e:
+            logger.warning(f"Cache mset error: {e}")
+            return False
+        if not serialized:
+            return True
+        
+        redis_client = get_redis_binary()
         if not redis_client:
+            for key, value, ttl, tags in serialized:
+                CacheService._store_local(key, value, ttl, tags)
             return False
         
         try:
-            # Serialize all values
-            serialized = {k: CacheService._serialize(v) for k, v in mapping.items()}
-            
             # Use pipeline for atomic operation
             pipe = redis_client.pipeline()
-            for key, value in serialized.items():
+            for key, value, ttl, tags in serialized:
                 if ttl:
                     pipe.setex(key, ttl, value)
                 else:
                     pipe.set(key, value)
+                CacheService._track(pipe, key, ttl, tags)
+            CacheService._publish_invalidation(pipe, [key for key, *_ in serialized])
             pipe.execute()
+            for key, value, ttl, tags in serialized:
+                CacheService._store_local(key, value, ttl, tags)
             
-            logger.debug(f"Cache MSET: {len(mapping)} keys")
+            logger.debug(f"Cache MSET: {len(serialized)} keys")
             return True
-        except (RedisError, TypeError) as e:
+        except RedisError as e:
             logger.warning(f"Cache mset error: {e}")
             return False
     
@@ -279,52 +839,68 @@ class CacheService:
         """
         Invalidate all cache entries for a portfolio.
         Returns number of keys deleted.
-        """
-        patterns = [
-            f"{CacheService.PREFIX_POSITION}{portfolio_id}",  # Exact match for positions:N
-            f"{CacheService.PREFIX_POSITION}{portfolio_id}:*",  # Match any sub-keys
-            f"{CacheService.PREFIX_METRICS}{portfolio_id}:*",
-            f"{CacheService.PREFIX_ANALYTICS}*_{portfolio_id}_*",
-            f"{CacheService.PREFIX_INSIGHTS}{portfolio_id}:*",
-            f"dashboard_batch:{portfolio_id}:*",  # Batch API cache
-            f"portfolio_batch_prices:{portfolio_id}",  # Price batch cache
-        ]
-        
-        total_deleted = 0
-        for pattern in patterns:
-            total_deleted += CacheService.delete_pattern(pattern)
         
+        Positions, metrics, analytics, insights, dashboard widgets and the
+        price batch are all written under the portfolio tag.
+        """
+        total_deleted = CacheService.invalidate_tags(portfolio_tag(portfolio_id))
         logger.info(f"Invalidated {total_deleted} cache entries for portfolio {portfolio_id}")
         return total_deleted
     
+    @staticmethod
+    def get_tier_stats() -> dict:
+        """Hits and misses of this process per tier and key prefix, plus local tier occupancy"""
+        tiers: Dict[str, Any] = {
+            "local": {"entries": len(local_cache), "max_entries": local_cache.max_entries, "by_prefix": {}},
+            "redis": {"by_prefix": {}},
+        }
+        for (tier, prefix, outcome), count in list(_tier_counters.items()):
+            tiers[tier]["by_prefix"].setdefault(prefix, {"hits": 0, "misses": 0})[outcome] = count
+        return tiers
+    
     @staticmethod
     def get_stats() -> dict:
         """Get cache statistics"""
-        redis_client = get_redis()
+        redis_client = get_redis_binary()
         if not redis_client:
-            return {"status": "unavailable"}
+            return {"status": "unavailable", "tiers": CacheService.get_tier_stats()}
         
         try:
             info = redis_client.info()
-            
-            # Count keys by prefix
-            key_counts = {}
-            for prefix in [
+            prefixes = [
                 CacheService.PREFIX_PRICE,
                 CacheService.PREFIX_POSITION,
                 CacheService.PREFIX_METRICS,
                 CacheService.PREFIX_ANALYTICS,
                 CacheService.PREFIX_ASSET,
                 CacheService.PREFIX_INSIGHTS,
-            ]:
-                pattern = f"{prefix}*"
-                keys = redis_client.keys(pattern)
-                key_counts[prefix.rstrip(':')] = len(keys)
+            ]
+            
+            # Count keys by prefix from the expiry indexes kept up to date by every write
+            now = time.time()
+            pipe = redis_client.pipeline(transaction=False)
+            for prefix in prefixes:
+                index_key = CacheService._index_key(prefix)
+                pipe.zremrangebyscore(index_key, "-inf", now)
+                pipe.zcard(index_key)
+            counts = pipe.execute()[1::2]
+            key_counts = {prefix.rstrip(':'): count for prefix, count in zip(prefixes, counts)}
+            
+            # Keys written before the indexes existed: count them with SCAN, which does not block Redis
+            source = "index"
+            if not redis_client.exists(*(CacheService._index_key(prefix) for prefix in prefixes)):
+                source = "scan"
+                for prefix in prefixes:
+                    key_counts[prefix.rstrip(':')] = sum(
+                        1 for _ in redis_client.scan_iter(match=f"{prefix}*", count=1000)
+                    )
             
             return {
                 "status": "available",
                 "total_keys": info.get("db0", {}).get("keys", 0),
                 "keys_by_prefix": key_counts,
+                "keys_by_prefix_source": source,
+                "tiers": CacheService.get_tier_stats(),
                 "memory_used": info.get("used_memory_human", "unknown"),
                 "hits": info.get("keyspace_hits", 0),
                 "misses": info.get("keyspace_misses", 0),
@@ -341,30 +917,73 @@ class CacheService:
             return {"status": "error", "error": str(e)}
 
 
+# Invalidation tags
+
+def portfolio_tag(portfolio_id: int) -> str:
+    """Tag of every entry derived from a portfolio's transactions"""
+    return f"portfolio:{portfolio_id}"
+
+
+def user_tag(user_id: int, scope: Optional[str] = None) -> str:
+    """Tag of a user's entries, optionally narrowed to one scope (e.g. "assets")"""
+    return f"user:{user_id}:{scope}" if scope else f"user:{user_id}"
+
+
+def asset_tag(asset_id: int) -> str:
+    """Tag of the entries describing one asset"""
+    return f"asset:{asset_id}"
+
+
+def symbol_tag(symbol: str) -> str:
+    """Tag of the market data entries of one symbol"""
+    return f"symbol:{symbol}"
+
+
 # Convenience functions for common cache operations
 
-def cache_price(symbol: str, price_data: dict, ttl: int = CacheService.TTL_PRICE) -> bool:
-    """Cache price data for a symbol"""
+def cache_price(symbol: str, price_data: Any, ttl: int = CacheService.TTL_PRICE) -> bool:
+    """Cache price data for a symbol (a PriceQuote, read back as one), served stale after ttl"""
     key = f"{CacheService.PREFIX_PRICE}{symbol}"
-    return CacheService.set(key, price_data, ttl)
+    return CacheService.set_swr(key, price_data, ttl, CacheService.STALE_TTL_PRICE, tags=[symbol_tag(symbol)])
 
 
-def get_cached_price(symbol: str) -> Optional[dict]:
-    """Get cached price data for a symbol"""
+def get_cached_price(symbol: str) -> Optional[Any]:
+    """Get cached price data for a symbol, fresh or stale (a dict for entries written before the binary codec)"""
     key = f"{CacheService.PREFIX_PRICE}{symbol}"
-    return CacheService.get(key)
+    return CacheService.get_swr(key)[0]
+
+
+def cache_prices(quotes: dict[str, Any], ttl: Union[int, Callable[[str], int]] = CacheService.TTL_PRICE) -> bool:
+    """cache_price() for many symbols, written in one pipeline; ttl may be a function of the symbol"""
+    return CacheService.set_swr_many(
+        (
+            f"{CacheService.PREFIX_PRICE}{symbol}", quote, ttl(symbol) if callable(ttl) else ttl,
+            CacheService.STALE_TTL_PRICE, [symbol_tag(symbol)],
+        )
+        for symbol, quote in quotes.items()
+    )
+
+
+def get_cached_prices(symbols: list[str]) -> dict[str, Tuple[Any, bool]]:
+    """(quote, stale) of every cached symbol, read with one MGET"""
+    keys = [f"{CacheService.PREFIX_PRICE}{symbol}" for symbol in symbols]
+    return {
+        symbol: entry for symbol, entry in zip(symbols, CacheService.mget_swr(keys)) if entry[0]
+    }
 
 
 def cache_positions(portfolio_id: int, positions: list, ttl: int = CacheService.TTL_POSITION) -> bool:
-    """Cache portfolio positions"""
+    """Cache portfolio positions (Position models, read back as models), served stale after ttl"""
     key = f"{CacheService.PREFIX_POSITION}{portfolio_id}"
-    return CacheService.set(key, positions, ttl)
+    return CacheService.set_swr(
+        key, positions, ttl, CacheService.STALE_TTL_POSITION, tags=[portfolio_tag(portfolio_id)]
+    )
 
 
 def get_cached_positions(portfolio_id: int) -> Optional[list]:
-    """Get cached portfolio positions"""
+    """Get cached portfolio positions, fresh or stale (dicts for entries written before the binary codec)"""
     key = f"{CacheService.PREFIX_POSITION}{portfolio_id}"
-    return CacheService.get(key)
+    return CacheService.get_swr(key)[0]
 
 
 def invalidate_positions(portfolio_id: int) -> bool:
@@ -373,15 +992,27 @@ def invalidate_positions(portfolio_id: int) -> bool:
     return CacheService.delete(key)
 
 
+def expire_positions(portfolio_ids: Iterable[int]) -> int:
+    """Mark cached positions stale (prices moved): served once more while they are recomputed"""
+    return CacheService.expire_swr([f"{CacheService.PREFIX_POSITION}{portfolio_id}" for portfolio_id in portfolio_ids])
+
+
+# Warmup looks back 24 hours, so a read only needs to write the timestamp once a minute
+_ACCESS_TIME_RESOLUTION = timedelta(minutes=1)
+
+
 def update_portfolio_access_time(db, portfolio_id: int):
     """Update portfolio last_accessed_at timestamp for smart cache warmup"""
     from app.models import Portfolio
-    from datetime import datetime
     
     try:
         portfolio = db.query(Portfolio).filter(Portfolio.id == portfolio_id).first()
-        if portfolio:
-            portfolio.last_accessed_at = datetime.utcnow()
+        now = datetime.utcnow()
+        if portfolio and (
+            portfolio.last_accessed_at is None
+            or now - portfolio.last_accessed_at >= _ACCESS_TIME_RESOLUTION
+        ):
+            portfolio.last_accessed_at = now
             db.commit()
             logger.debug(f"Updated access time for portfolio {portfolio_id}")
     except Exception as e:
@@ -410,10 +1041,45 @@ def invalidate_portfolio(portfolio_id: int) -> bool:
 def cache_asset(asset_id: int, asset_data: dict, ttl: int = CacheService.TTL_ASSET) -> bool:
     """Cache asset data"""
     key = f"{CacheService.PREFIX_ASSET}{asset_id}"
-    return CacheService.set(key, asset_data, ttl)
+    return CacheService.set(key, asset_data, ttl, tags=[asset_tag(asset_id)])
 
 
 def get_cached_asset(asset_id: int) -> Optional[dict]:
     """Get cached asset data"""
     key = f"{CacheService.PREFIX_ASSET}{asset_id}"
     return CacheService.get(key)
+
+
+# Bump when a dashboard widget payload changes shape, so old entries are never read
+_DASHBOARD_WIDGET_VERSION = 1
+
+
+def dashboard_widget_key(owner: str, widget: str, params: Optional[dict] = None) -> str:
+    """
+    Stable cache key of one dashboard widget payload
+    
+    The key only depends on its content (owner, widget, parameters and payload
+    version), never on the process, so every API worker and the Celery warmup
+    read and write the same entries.
+    
+    Args:
+        owner: "p<portfolio_id>", "u<user_id>" or "global"
+        widget: Data section name (e.g. "metrics", "watchlist")
+        params: Parameters the payload depends on (e.g. history periods)
+    """
+    fingerprint = json.dumps([_DASHBOARD_WIDGET_VERSION, params or {}], sort_keys=True)
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+    return f"{CacheService.PREFIX_DASHBOARD}{owner}:{widget}:{digest}"
+
+
+def dashboard_widget_tags(owner: str, widget: str) -> list[str]:
+    """Tags of a dashboard widget entry: its owner, the owner's widget, and its portfolio"""
+    tags = [f"dashboard:{owner}", f"dashboard:{owner}:{widget}"]
+    if owner.startswith("p"):
+        tags.append(portfolio_tag(int(owner[1:])))
+    return tags
+
+
+def invalidate_dashboard_widgets(owner: str, widget: Optional[str] = None) -> int:
+    """Invalidate cached dashboard widgets of an owner (all of them by default)"""
+    return CacheService.invalidate_tags(f"dashboard:{owner}:{widget}" if widget else f"dashboard:{owner}")
@@ -0,0 +1,229 @@
+"""
+Binary codec for cache payloads
+
+Values are packed with msgpack into a small frame:
+
+    0x00 | schema version | codec id | compression id | body
+
+- Decimal, datetime and date round-trip exactly (msgpack extension types),
+  where the JSON encoding turned Decimals into floats and dates into strings.
+- Pydantic models from app.schemas are stored with their class name and
+  their field values by position, and rebuilt with model_construct() on
+  read: cache entries are written by this application, so they are not
+  validated again. A checksum of the field names makes an entry of a model
+  whose fields changed read as a miss.
+- Bodies above CACHE_COMPRESSION_MIN_BYTES are compressed with zstd when the
+  zstandard package is installed, zlib otherwise.
+- Entries written under another CACHE_SCHEMA_VERSION, or with a compressor
+  this process lacks, read as cache misses.
+
+Entries without the leading 0x00 byte are legacy JSON (and what CACHE_CODEC=json
+writes, for rolling back to workers that only read JSON).
+"""
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+import msgpack
+from pydantic import BaseModel
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is used instead
+    zstandard = None
+
+# Bump when a cached payload changes shape, so entries of the old shape are never read
+CACHE_SCHEMA_VERSION = 1
+
+_FRAME_MARKER = 0x00
+
+# Codec ids
+CODEC_MSGPACK = 1
+
+# Compression ids
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+# msgpack extension type codes
+_EXT_DECIMAL = 1
+_EXT_DATETIME = 2
+_EXT_DATE = 3
+_EXT_MODEL = 4
+
+
+class UnreadableEntry(ValueError):
+    """A cache entry this process cannot decode (other schema version, missing compressor)"""
+
+
+# Models that may be rebuilt from cache entries, by class name
+_models: Dict[str, Type[BaseModel]] = {}
+
+# Field names of each model and their checksum, which guards positional field values
+_layouts: Dict[type, Tuple[Tuple[str, ...], int]] = {}
+
+
+def _model_class(name: str) -> Type[BaseModel]:
+    """Model class by name, looked up in app.schemas only"""
+    cls = _models.get(name)
+    if cls is None:
+        from app import schemas
+
+        cls = getattr(schemas, name, None)
+        if not (isinstance(cls, type) and issubclass(cls, BaseModel)):
+            raise UnreadableEntry(f"Unknown cached model {name}")
+        _models[name] = cls
+    return cls
+
+
+def _layout(cls: Type[BaseModel]) -> Tuple[Tuple[str, ...], int]:
+    layout = _layouts.get(cls)
+    if layout is None:
+        names = tuple(cls.model_fields)
+        layout = _layouts[cls] = (names, zlib.crc32(",".join(names).encode()))
+    return layout
+
+
+def _default(obj: Any) -> msgpack.ExtType:
+    """Encode the types msgpack does not know as extension types"""
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(_EXT_DECIMAL, str(obj).encode())
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, BaseModel):
+        # Field values by position (no per-entry field names), plus the positions left unset
+        names, checksum = _layout(type(obj))
+        values = obj.__dict__
+        fields_set = obj.model_fields_set
+        return msgpack.ExtType(_EXT_MODEL, _pack([
+            type(obj).__name__,
+            checksum,
+            [values.get(name) for name in names],
+            [i for i, name in enumerate(names) if name not in fields_set],
+        ]))
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj)} is not serializable")
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_MODEL:
+        name, checksum, values, unset = _unpack(data)
+        cls = _model_class(name)
+        names, expected = _layout(cls)
+        if checksum != expected:
+            raise UnreadableEntry(f"Cached {name} has other fields than the current model")
+        fields_set = set(names).difference(names[i] for i in unset)
+        return cls.model_construct(fields_set, **dict(zip(names, values)))
+    return msgpack.ExtType(code, data)
+
+
+def _pack(value: Any) -> bytes:
+    return msgpack.packb(value, default=_default, use_bin_type=True, datetime=False)
+
+
+def _unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def _json_default(obj: Any) -> Any:
+    """Legacy JSON encoding: Decimals become floats, dates ISO strings"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+# Compressors by id: (compress, decompress), only those available here
+_compressors: Dict[int, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    COMPRESSION_ZLIB: (lambda data: zlib.compress(data, 6), zlib.decompress),
+}
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    _compressors[COMPRESSION_ZSTD] = (_zstd_compressor.compress, _zstd_decompressor.decompress)
+
+
+def _write_compression() -> Optional[int]:
+    """Compression id for new entries, None when disabled"""
+    name = settings.CACHE_COMPRESSION
+    if name == "none":
+        return None
+    if name == "zstd" and zstandard is not None:
+        return COMPRESSION_ZSTD
+    return COMPRESSION_ZLIB
+
+
+def encode(value: Any, codec: Optional[str] = None) -> bytes:
+    """
+    Encode a value for Redis
+
+    Args:
+        value: Value to encode
+        codec: "msgpack" or "json", defaults to CACHE_CODEC
+
+    Raises:
+        TypeError: value holds an object the codec cannot represent
+    """
+    if (codec or settings.CACHE_CODEC) == "json":
+        return json.dumps(value, default=_json_default).encode()
+
+    body = _pack(value)
+    compression = COMPRESSION_NONE
+    if len(body) >= settings.CACHE_COMPRESSION_MIN_BYTES:
+        compression_id = _write_compression()
+        if compression_id is not None:
+            compressed = _compressors[compression_id][0](body)
+            if len(compressed) < len(body):
+                body, compression = compressed, compression_id
+    return bytes((_FRAME_MARKER, CACHE_SCHEMA_VERSION, CODEC_MSGPACK, compression)) + body
+
+
+def decode(data: bytes) -> Any:
+    """
+    Decode an entry written by encode(), or a legacy JSON entry
+
+    Raises:
+        UnreadableEntry: entry of another schema version or compressor
+        ValueError: corrupt entry
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data or data[0] != _FRAME_MARKER:
+        return json.loads(data)
+    if len(data) < 4:
+        raise UnreadableEntry("Truncated cache frame")
+
+    version, codec, compression = data[1], data[2], data[3]
+    if version != CACHE_SCHEMA_VERSION:
+        raise UnreadableEntry(f"Cache schema version {version}, expected {CACHE_SCHEMA_VERSION}")
+    if codec != CODEC_MSGPACK:
+        raise UnreadableEntry(f"Unknown cache codec {codec}")
+
+    body = data[4:]
+    decompress = None
+    if compression != COMPRESSION_NONE:
+        if compression not in _compressors:
+            raise UnreadableEntry(f"Cache compression {compression} unavailable")
+        decompress = _compressors[compression][1]
+    try:
+        return _unpack(decompress(body) if decompress else body)
+    except UnreadableEntry:
+        raise
+    except Exception as e:  # zlib, zstd and msgpack each raise their own errors
+        raise ValueError(f"Corrupt cache entry: {e}") from e
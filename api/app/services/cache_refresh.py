@@ -0,0 +1,153 @@
+"""
+Background refresh of stale-while-revalidate cache entries
+
+A reader that gets a stale entry (CacheService.get_swr) serves it and calls
+revalidate(). Only the process that claims the entry's refresh lock (SET NX
+in Redis, so one refresh across every API worker and replica) recomputes it.
+The lock is never released: it expires after REFRESH_LOCK_SECONDS, which
+also spaces out retries when a refresh fails.
+
+Refreshes do blocking database work, so they run on an event loop of their
+own, on a daemon thread, never on the request loop. Inside a refresh, stale
+entries read as misses: a refreshed entry is never built from stale inputs.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from redis.exceptions import RedisError
+
+from app.redis_client import get_redis_binary
+from app.services.cache import stale_reads_disallowed
+
+logger = logging.getLogger(__name__)
+
+# Longest a refresh may take before another process may start one
+REFRESH_LOCK_SECONDS = 60
+
+PREFIX_REFRESH_LOCK = "swr_lock:"
+
+# Claims made while Redis is unavailable: key -> lock expiry (monotonic)
+_local_claims: Dict[str, float] = {}
+_local_claims_lock = threading.Lock()
+
+
+def claim_refresh(key: str, ttl: int = REFRESH_LOCK_SECONDS) -> bool:
+    """
+    Claim the refresh of a cache entry
+
+    Returns True for exactly one caller per ttl window: across processes
+    through Redis, within this process when Redis is unavailable.
+    """
+    return bool(claim_refreshes([key], ttl))
+
+
+def claim_refreshes(keys: List[str], ttl: int = REFRESH_LOCK_SECONDS) -> List[str]:
+    """claim_refresh() for many entries, in one Redis round trip; returns the keys claimed"""
+    if not keys:
+        return []
+    redis_client = get_redis_binary()
+    if redis_client is not None:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(f"{PREFIX_REFRESH_LOCK}{key}", 1, ex=ttl, nx=True)
+            return [key for key, claimed in zip(keys, pipe.execute()) if claimed]
+        except RedisError as e:
+            logger.warning(f"Cache refresh claim error: {e}")
+            return []
+
+    now = time.monotonic()
+    with _local_claims_lock:
+        claimed = [key for key in keys if _local_claims.get(key, 0) <= now]
+        for key in claimed:
+            _local_claims[key] = now + ttl
+        return claimed
+
+
+class _RefreshLoop:
+    """Event loop on a daemon thread running the refreshes"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="cache-refresh", daemon=True)
+        self.thread.start()
+        self.pending: Set[Future] = set()
+
+
+_refresh: Optional[_RefreshLoop] = None
+_refresh_lock = threading.Lock()
+
+
+def _refresh_loop() -> _RefreshLoop:
+    global _refresh
+    with _refresh_lock:
+        if _refresh is None:
+            _refresh = _RefreshLoop()
+        return _refresh
+
+
+def schedule_refresh(refresh: Callable[[], Awaitable[Any]], description: str) -> None:
+    """
+    Run refresh() on the refresh loop, without waiting for it
+
+    Args:
+        refresh: Coroutine function recomputing and re-caching the entries
+        description: What is refreshed, for logs
+    """
+    runner = _refresh_loop()
+
+    async def run():
+        started = time.perf_counter()
+        try:
+            with stale_reads_disallowed():
+                await refresh()
+            logger.info(f"Refreshed {description} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Background refresh of {description} failed: {e}", exc_info=True)
+
+    future = asyncio.run_coroutine_threadsafe(run(), runner.loop)
+    runner.pending.add(future)
+    future.add_done_callback(runner.pending.discard)
+
+
+def revalidate(key: str, refresh: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    Refresh a stale entry in the background, unless another caller already does
+
+    Returns True if this call scheduled the refresh.
+    """
+    if not claim_refresh(key):
+        return False
+    schedule_refresh(refresh, key)
+    return True
+
+
+def wait_for_refreshes(timeout: Optional[float] = None) -> bool:
+    """Wait for the scheduled refreshes to finish, returns False on timeout"""
+    with _refresh_lock:
+        runner = _refresh
+    if runner is None:
+        return True
+    _, not_done = wait(list(runner.pending), timeout=timeout)
+    return not not_done
+
+
+def shutdown_refresh_loop(timeout: float = 5) -> None:
+    """Let running refreshes finish (up to timeout), close the loop's quote provider and stop it"""
+    global _refresh
+    with _refresh_lock:
+        runner, _refresh = _refresh, None
+    if runner is None:
+        return
+
+    from app.services.quote_provider import close_quote_provider
+
+    wait(list(runner.pending), timeout=timeout)
+    asyncio.run_coroutine_threadsafe(close_quote_provider(), runner.loop).result(timeout)
+    runner.loop.call_soon_threadsafe(runner.loop.stop)
+    runner.thread.join(timeout)
+    runner.loop.close()
@@ -3,15 +3,112 @@ Currency conversion service
 """
 import logging
 from decimal import Decimal
-from typing import Optional, Dict
+from types import MappingProxyType
+from typing import Optional, Dict, Iterable, List, Mapping, Sequence, Set, Tuple
 from datetime import datetime, timedelta
 import yfinance as yf
 
+from app.services.cache import CacheService
+from app.services.quote_provider import run_sync
+
 logger = logging.getLogger(__name__)
 
-# Cache for exchange rates (currency_pair -> (rate, timestamp))
-_exchange_rate_cache: Dict[str, tuple[Decimal, datetime]] = {}
-_CACHE_DURATION = timedelta(hours=1)  # Cache rates for 1 hour
+# Rate matrices are triangulated from one leg per currency against FX_PIVOT;
+# currencies Yahoo does not quote against it go through FX_FALLBACK_PIVOT
+FX_PIVOT = "USD"
+FX_FALLBACK_PIVOT = "EUR"
+
+
+def _rate_cache_key(from_currency: str, to_currency: str) -> str:
+    """Cache key of one exchange rate (1 from_currency = rate to_currency)"""
+    return f"{CacheService.PREFIX_FX}{from_currency}:{to_currency}"
+
+
+class FxMatrix:
+    """
+    Immutable snapshot of exchange rates for a set of currency pairs
+
+    Built by CurrencyService.get_rate_matrix(). Lookups and conversions never
+    do I/O; pairs that could not be resolved convert to None, like
+    CurrencyService.convert().
+    """
+
+    __slots__ = ("_rates", "resolved_at")
+
+    def __init__(self, rates: Mapping[Tuple[str, str], Decimal], resolved_at: Optional[datetime] = None):
+        object.__setattr__(self, "_rates", MappingProxyType(dict(rates)))
+        object.__setattr__(self, "resolved_at", resolved_at or datetime.utcnow())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FxMatrix is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("FxMatrix is immutable")
+
+    def __contains__(self, pair: Tuple[str, str]) -> bool:
+        return pair[0] == pair[1] or pair in self._rates
+
+    def __len__(self) -> int:
+        return len(self._rates)
+
+    def __repr__(self) -> str:
+        return f"FxMatrix({len(self._rates)} pairs, resolved_at={self.resolved_at.isoformat()})"
+
+    @property
+    def rates(self) -> Mapping[Tuple[str, str], Decimal]:
+        """Read-only view of (from_currency, to_currency) -> rate"""
+        return self._rates
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[Decimal]:
+        """Rate for one pair (1 for identical currencies, None if unresolved)"""
+        if from_currency == to_currency:
+            return Decimal(1)
+        return self._rates.get((from_currency, to_currency))
+
+    def convert(self, amount: Decimal, from_currency: str, to_currency: str) -> Optional[Decimal]:
+        """Convert one amount (None if the pair is unresolved)"""
+        if from_currency == to_currency:
+            return amount
+        rate = self._rates.get((from_currency, to_currency))
+        return amount * rate if rate is not None else None
+
+    def convert_many(
+        self, amounts: Iterable[Decimal], from_currency: str, to_currency: str
+    ) -> Optional[List[Decimal]]:
+        """
+        Convert a column of amounts sharing one currency
+
+        Returns:
+            Converted amounts in input order, or None if the pair is unresolved
+        """
+        if from_currency == to_currency:
+            return list(amounts)
+        rate = self._rates.get((from_currency, to_currency))
+        if rate is None:
+            return None
+        return [amount * rate for amount in amounts]
+
+    def convert_column(
+        self, amounts: Sequence[Decimal], currencies: Sequence[str], to_currency: str
+    ) -> List[Optional[Decimal]]:
+        """
+        Convert a column of amounts where each row has its own currency
+
+        Args:
+            amounts: Amounts to convert
+            currencies: Currency of each amount (same length as amounts)
+            to_currency: Target currency
+
+        Returns:
+            Converted amounts in input order (None where the pair is unresolved)
+        """
+        if len(amounts) != len(currencies):
+            raise ValueError("amounts and currencies must have the same length")
+        rates = {currency: self.rate(currency, to_currency) for currency in set(currencies)}
+        return [
+            amount * rates[currency] if rates[currency] is not None else None
+            for amount, currency in zip(amounts, currencies)
+        ]
 
 
 class CurrencyService:
@@ -36,12 +133,11 @@ class CurrencyService:
         if from_currency == to_currency:
             return Decimal(1)
         
-        # Check cache
-        cache_key = f"{from_currency}{to_currency}"
-        if cache_key in _exchange_rate_cache:
-            rate, timestamp = _exchange_rate_cache[cache_key]
-            if datetime.utcnow() - timestamp < _CACHE_DURATION:
-                return rate
+        # Check cache (in-process tier, then Redis); rates are stored as strings so Decimals survive exactly
+        cache_key = _rate_cache_key(from_currency, to_currency)
+        cached = CacheService.get(cache_key)
+        if cached is not None:
+            return Decimal(cached)
         
         # Fetch from Yahoo Finance using forex pair format
         # Yahoo Finance forex pairs: EURUSD=X, GBPUSD=X, etc.
@@ -67,7 +163,7 @@ class CurrencyService:
                             rate = Decimal(1) / inverse_rate
                             
                             # Cache the rate
-                            _exchange_rate_cache[cache_key] = (rate, datetime.utcnow())
+                            CacheService.set(cache_key, str(rate), CacheService.TTL_FX)
                             
                             logger.info(f"Fetched inverse exchange rate {inverse_symbol}: {inverse_rate}, calculated {forex_symbol}: {rate}")
                             return rate
@@ -81,7 +177,7 @@ class CurrencyService:
             rate = Decimal(str(info['Close'].iloc[-1]))
             
             # Cache the rate
-            _exchange_rate_cache[cache_key] = (rate, datetime.utcnow())
+            CacheService.set(cache_key, str(rate), CacheService.TTL_FX)
             
             logger.info(f"Fetched exchange rate {forex_symbol}: {rate}")
             return rate
@@ -231,7 +327,112 @@ class CurrencyService:
         
         return amount * rate
     
+    @staticmethod
+    def get_rate_matrix(pairs: Iterable[Tuple[str, str]]) -> FxMatrix:
+        """
+        Resolve every current rate a computation needs up front
+
+        Each currency is reduced to one leg against FX_PIVOT (1 USD = x CCY) and
+        cross rates are triangulated from the legs, so N currencies cost at most
+        N fetched tickers instead of one per pair. Legs are read from the
+        in-process cache, then Redis (shared by all workers), and whatever is
+        still missing is fetched with batched quote requests.
+
+        Args:
+            pairs: (from_currency, to_currency) pairs, duplicates allowed
+
+        Returns:
+            FxMatrix holding a rate for every resolvable pair
+        """
+        wanted = {(f, t) for f, t in pairs if f and t}
+        currencies = {c for f, t in wanted if f != t for c in (f, t)}
+        legs = CurrencyService._resolve_pivot_legs(currencies)
+        
+        rates: Dict[Tuple[str, str], Decimal] = {}
+        for from_currency, to_currency in wanted:
+            if from_currency == to_currency:
+                rates[(from_currency, to_currency)] = Decimal(1)
+            elif from_currency in legs and to_currency in legs:
+                rates[(from_currency, to_currency)] = legs[to_currency] / legs[from_currency]
+            else:
+                logger.warning(f"No exchange rate available for {from_currency} to {to_currency}")
+        return FxMatrix(rates)
+    
+    @staticmethod
+    def _resolve_pivot_legs(currencies: Set[str]) -> Dict[str, Decimal]:
+        """
+        Get the FX_PIVOT -> currency rate for each currency
+        
+        Returns dict of currency -> rate; unresolvable currencies are omitted.
+        """
+        legs: Dict[str, Decimal] = {FX_PIVOT: Decimal(1)}
+        missing = sorted(currencies - {FX_PIVOT})
+        if not missing:
+            return legs
+        
+        # Two-tier cache (shared with get_exchange_rate); legs are stored as strings so Decimals survive exactly
+        cache_keys = [_rate_cache_key(FX_PIVOT, currency) for currency in missing]
+        for currency, value in zip(list(missing), CacheService.mget(cache_keys)):
+            if value is not None:
+                legs[currency] = Decimal(value)
+                missing.remove(currency)
+        if not missing:
+            return legs
+        
+        # Yahoo Finance, one batched download for every missing leg
+        fetched = CurrencyService._fetch_fx_closes([f"{FX_PIVOT}{currency}=X" for currency in missing])
+        new_legs = {
+            currency: fetched[f"{FX_PIVOT}{currency}=X"]
+            for currency in missing
+            if f"{FX_PIVOT}{currency}=X" in fetched
+        }
+        missing = [currency for currency in missing if currency not in new_legs]
+        
+        # Triangulate the rest through the fallback pivot
+        if missing:
+            fallback = FX_FALLBACK_PIVOT
+            symbols = [f"{fallback}{currency}=X" for currency in missing if currency != fallback]
+            pivot_leg = legs.get(fallback) or new_legs.get(fallback)
+            if pivot_leg is None:
+                symbols.append(f"{FX_PIVOT}{fallback}=X")
+            fetched = CurrencyService._fetch_fx_closes(symbols) if symbols else {}
+            pivot_leg = pivot_leg or fetched.get(f"{FX_PIVOT}{fallback}=X")
+            if pivot_leg is not None:
+                new_legs.setdefault(fallback, pivot_leg)
+                for currency in missing:
+                    cross = fetched.get(f"{fallback}{currency}=X")
+                    if cross is not None:
+                        new_legs[currency] = pivot_leg * cross
+            for currency in missing:
+                if currency not in new_legs:
+                    logger.error(f"No exchange rate data available for {FX_PIVOT} to {currency}")
+        
+        if new_legs:
+            CacheService.mset(
+                {_rate_cache_key(FX_PIVOT, currency): str(rate) for currency, rate in new_legs.items()},
+                ttl=CacheService.TTL_FX,
+            )
+            legs.update(new_legs)
+        return legs
+    
+    @staticmethod
+    def _fetch_fx_closes(symbols: List[str]) -> Dict[str, Decimal]:
+        """
+        Fetch the latest close of many forex tickers with batched quote requests
+        
+        Returns dict of symbol -> rate; symbols without usable data are omitted.
+        """
+        try:
+            quotes = run_sync(lambda provider: provider.get_quotes(symbols))
+        except Exception as e:
+            logger.warning(f"Batch exchange rate download failed for {len(symbols)} pairs: {e}")
+            return {}
+        
+        rates = {symbol: quote["price"] for symbol, quote in quotes.items()}
+        logger.info(f"Fetched {len(rates)}/{len(symbols)} exchange rates in one batch")
+        return rates
+    
     @staticmethod
     def clear_cache():
         """Clear the exchange rate cache"""
-        _exchange_rate_cache.clear()
+        CacheService.delete_pattern(f"{CacheService.PREFIX_FX}*")
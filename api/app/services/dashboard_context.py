@@ -0,0 +1,150 @@
+"""
+Request-scoped computation graph for the dashboard batch endpoint
+
+Every dashboard widget is derived from the same few inputs: the position
+snapshots, the quotes of the held assets, the FX rates, the positions built
+from them and the daily history. DashboardContext computes each of those
+nodes at most once per request and hands the result to every widget fetcher
+that asks for it:
+
+    snapshots --+--> quotes --+
+                |             +--> all positions --> held / sold --> metrics
+                +--> fx ------+
+    history (widest interval, sliced per interval)
+
+Nodes are asyncio tasks started on first use, so concurrent fetchers await the
+same computation. Database work goes through app.db.run_db on the request's
+session, which serializes it on async sessions.
+
+The context exposes the MetricsService read methods (get_positions,
+get_sold_positions_only, get_metrics) for its own portfolio, so it can be
+passed wherever a metrics service is expected.
+"""
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.db import run_db
+from app.schemas import PortfolioMetrics, Position
+from app.services.cache import CacheService, cache_positions, update_portfolio_access_time
+from app.services.metrics import MetricsService
+from app.services.position_calculator import FxRates
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardContext:
+    """Memoized positions, quotes, FX rates and history of one portfolio for one request"""
+
+    def __init__(self, metrics_service: MetricsService, portfolio_id: int):
+        self.metrics_service = metrics_service
+        self.db = metrics_service.db
+        self.portfolio_id = portfolio_id
+        self._nodes: Dict[Hashable, asyncio.Task] = {}
+
+    async def _node(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of a node, started on first use and shared by every later caller"""
+        task = self._nodes.get(key)
+        if task is None:
+            task = self._nodes[key] = asyncio.ensure_future(compute())
+        # A cancelled caller must not cancel the computation other widgets wait for
+        return await asyncio.shield(task)
+
+    def cancel(self) -> None:
+        """Cancel the nodes still running, once no widget is left to wait for them"""
+        for task in self._nodes.values():
+            if not task.done():
+                task.cancel()
+
+    # Nodes
+
+    async def snapshots(self) -> Tuple[Optional[str], List[Any]]:
+        """Portfolio base currency and its position snapshots"""
+        async def compute():
+            await run_db(self.db, update_portfolio_access_time, self.db, self.portfolio_id)
+            return await run_db(self.db, self.metrics_service._load_position_snapshots, self.portfolio_id)
+        return await self._node("snapshots", compute)
+
+    async def states(self) -> List[Tuple[Any, Any]]:
+        """(asset, folded state) per snapshot"""
+        async def compute():
+            _, snapshots = await self.snapshots()
+            return MetricsService._position_states(snapshots)
+        return await self._node("states", compute)
+
+    async def quotes(self) -> Dict[str, Any]:
+        """Quotes of every held asset, fetched in one batch"""
+        async def compute():
+            return await self.metrics_service._fetch_quotes(await self.states())
+        return await self._node("quotes", compute)
+
+    async def fx(self) -> FxRates:
+        """Current and historical rates every position needs"""
+        async def compute():
+            base_currency, _ = await self.snapshots()
+            return await self.metrics_service._resolve_fx(await self.states(), base_currency)
+        return await self._node("fx", compute)
+
+    async def all_positions(self) -> List[Position]:
+        """Held and sold positions, as MetricsService.get_positions(include_sold=True)"""
+        async def compute():
+            base_currency, _ = await self.snapshots()
+            states = await self.states()
+            quotes, fx = await asyncio.gather(self.quotes(), self.fx())
+            positions = MetricsService._build_positions(states, quotes, fx, base_currency, include_sold=True)
+
+            # Keep the shared positions cache warm for the single-widget endpoints
+            held = [pos for pos in positions if pos.quantity > 0]
+            if held:
+                cache_positions(self.portfolio_id, held, CacheService.TTL_POSITION)
+            return positions
+        return await self._node("all_positions", compute)
+
+    async def metrics(self) -> PortfolioMetrics:
+        """Portfolio metrics aggregated from the shared positions"""
+        async def compute():
+            from app.crud.portfolios import get_portfolio
+
+            portfolio = await run_db(self.db, get_portfolio, self.db, self.portfolio_id)
+            if not portfolio:
+                raise ValueError(f"Portfolio {self.portfolio_id} not found")
+            _, snapshots = await self.snapshots()
+            return MetricsService._build_metrics(
+                portfolio,
+                await self.all_positions(),
+                sum((s.total_dividends for s in snapshots), Decimal(0)),
+                sum((s.total_fees for s in snapshots), Decimal(0)),
+            )
+        return await self._node("metrics", compute)
+
+    async def histories(self, intervals: Sequence[str]) -> Dict[str, list]:
+        """History of each interval, computed once for the widest one"""
+        intervals = tuple(intervals)
+
+        async def compute():
+            return await run_db(
+                self.db, self.metrics_service.get_portfolio_histories, self.portfolio_id, list(intervals)
+            )
+        return await self._node(("histories", intervals), compute)
+
+    # MetricsService-compatible reads
+
+    async def get_positions(self, portfolio_id: int, include_sold: bool = False) -> List[Position]:
+        """Same result as MetricsService.get_positions, from the shared graph"""
+        if portfolio_id != self.portfolio_id:
+            return await self.metrics_service.get_positions(portfolio_id, include_sold)
+        positions = await self.all_positions()
+        return positions if include_sold else [pos for pos in positions if pos.quantity > 0]
+
+    async def get_sold_positions_only(self, portfolio_id: int) -> List[Position]:
+        """Same result as MetricsService.get_sold_positions_only, from the shared graph"""
+        if portfolio_id != self.portfolio_id:
+            return await self.metrics_service.get_sold_positions_only(portfolio_id)
+        return [pos for pos in await self.all_positions() if pos.quantity == 0]
+
+    async def get_metrics(self, portfolio_id: int) -> PortfolioMetrics:
+        """Same result as MetricsService.get_metrics, from the shared graph"""
+        if portfolio_id != self.portfolio_id:
+            return await self.metrics_service.get_metrics(portfolio_id)
+        return await self.metrics()
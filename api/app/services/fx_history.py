@@ -0,0 +1,302 @@
+"""
+Historical FX series store
+
+Daily USD legs (1 USD = x CCY) are persisted in fx_rates and kept in memory
+as one sorted array per currency. A cross rate on any date is triangulated
+from two legs, like CurrencyService.get_rate_matrix() does for spot rates.
+Lookups are as-of (last close on or before the date): bisect for one date,
+numpy.searchsorted for a whole date column.
+
+History is backfilled incrementally: only the days before the first stored
+close and since the last stored close are downloaded, one batch of concurrent
+history requests per distinct window for every currency that needs it.
+"""
+import asyncio
+import bisect
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.crud import fx_rates as crud_fx_rates
+from app.services.cache import LocalCache
+from app.services.currency import FX_PIVOT
+from app.services.quote_provider import run_sync
+
+logger = logging.getLogger(__name__)
+
+# Days fetched before a requested start so the first as-of lookup lands on a close
+BACKFILL_LOOKBACK_DAYS = 7
+
+# Per-process series (currency -> FxSeries), refreshed once per day; a bounded LRU
+# like the local cache tier, with entries expiring after a day
+_FX_SERIES_MAX_ENTRIES = 256
+_FX_SERIES_TTL_SECONDS = 24 * 60 * 60
+_fx_series_cache = LocalCache(_FX_SERIES_MAX_ENTRIES, _FX_SERIES_TTL_SECONDS)
+
+
+def _as_date(value) -> date:
+    """Accept dates and datetimes"""
+    return value.date() if isinstance(value, datetime) else value
+
+
+class FxSeries:
+    """
+    Immutable daily series of one USD leg, sorted by date
+
+    covers_from is the earliest date history was requested (and fetched) for;
+    synced_on is the day the series was last extended to the present.
+    """
+
+    __slots__ = ("currency", "dates", "rates", "covers_from", "synced_on", "_ordinals")
+
+    def __init__(self, currency: str, points: Sequence[Tuple[date, Decimal]], covers_from: date, synced_on: date):
+        points = sorted(points)
+        self.currency = currency
+        self.dates = tuple(point[0] for point in points)
+        self.rates = tuple(point[1] for point in points)
+        self.covers_from = covers_from
+        self.synced_on = synced_on
+        self._ordinals = np.fromiter((d.toordinal() for d in self.dates), dtype=np.int64, count=len(self.dates))
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def covers(self, start: date, today: date) -> bool:
+        """Whether the series holds everything from start up to today"""
+        return self.covers_from <= start and self.synced_on >= today
+
+    def rate_asof(self, on) -> Optional[Decimal]:
+        """Rate of the last close on or before a date (None before the series starts)"""
+        index = bisect.bisect_right(self.dates, _as_date(on)) - 1
+        return self.rates[index] if index >= 0 else None
+
+    def rates_asof(self, dates: Sequence) -> List[Optional[Decimal]]:
+        """rate_asof() for a whole column of dates at once"""
+        query = np.fromiter((_as_date(d).toordinal() for d in dates), dtype=np.int64, count=len(dates))
+        indexes = np.searchsorted(self._ordinals, query, side="right") - 1
+        return [self.rates[i] if i >= 0 else None for i in indexes.tolist()]
+
+
+class FxHistoryStore:
+    """Historical exchange rates backed by fx_rates and the in-process series"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load(self, currencies: Iterable[str], start) -> Dict[str, FxSeries]:
+        """
+        Make sure the series of each currency covers start..today
+
+        Reads the stored rows of every stale currency in one query and
+        downloads only the missing head/tail windows.
+
+        Returns:
+            Dict of currency -> FxSeries (USD and currencies without data omitted)
+        """
+        start = _as_date(start)
+        today = datetime.utcnow().date()
+        wanted = sorted({currency for currency in currencies if currency and currency != FX_PIVOT})
+
+        series = {}
+        stale = []
+        for currency in wanted:
+            _, cached = _fx_series_cache.get(currency)
+            if cached is not None and cached.covers(start, today):
+                series[currency] = cached
+            else:
+                stale.append(currency)
+        if not stale:
+            return {currency: s for currency, s in series.items() if len(s)}
+
+        stored = crud_fx_rates.get_fx_series(self.db, FX_PIVOT, stale)
+
+        # Group currencies by the window they are missing so each window is one download
+        windows: Dict[Tuple[date, date], List[str]] = defaultdict(list)
+        covers_from: Dict[str, date] = {}
+        for currency in stale:
+            points = stored[currency]
+            _, cached = _fx_series_cache.get(currency)
+            known = [d for d in (points[0][0] if points else None, cached.covers_from if cached else None) if d]
+            known_from = min(known) if known else None
+            if known_from is None:
+                windows[(start - timedelta(days=BACKFILL_LOOKBACK_DAYS), today)].append(currency)
+            else:
+                if start < known_from:
+                    windows[(start - timedelta(days=BACKFILL_LOOKBACK_DAYS), known_from)].append(currency)
+                if cached is None or cached.synced_on < today:
+                    # Re-fetch the last stored day too, it may have been an intraday rate
+                    last = points[-1][0] if points else known_from
+                    windows[(last, today)].append(currency)
+            covers_from[currency] = min(start, known_from) if known_from else start
+
+        fetched: Dict[str, List[Tuple[date, Decimal]]] = defaultdict(list)
+        failed = set()
+        for (window_start, window_end), window_currencies in windows.items():
+            for currency, points in self._download(window_currencies, window_start, window_end).items():
+                if points is None:
+                    failed.add(currency)
+                else:
+                    fetched[currency].extend(points)
+
+        if fetched:
+            crud_fx_rates.upsert_fx_rates(self.db, (
+                {"base_currency": FX_PIVOT, "quote_currency": currency, "date": day, "rate": rate}
+                for currency, points in fetched.items()
+                for day, rate in points
+            ))
+            self.db.commit()
+
+        for currency in stale:
+            merged = dict(stored[currency])
+            merged.update(fetched.get(currency, ()))
+            if currency in failed:
+                # Usable for what is stored, but retried on the next call
+                if merged:
+                    series[currency] = FxSeries(currency, list(merged.items()), min(merged), min(merged))
+                continue
+            if not merged:
+                logger.warning(f"No historical exchange rates available for {FX_PIVOT} to {currency}")
+            # Cached even when empty so unknown currencies are not re-fetched on every lookup
+            series[currency] = FxSeries(currency, list(merged.items()), covers_from[currency], today)
+            _fx_series_cache.set(currency, series[currency])
+        return {currency: s for currency, s in series.items() if len(s)}
+
+    def _download(
+        self, currencies: List[str], start: date, end: date
+    ) -> Dict[str, Optional[List[Tuple[date, Decimal]]]]:
+        """
+        Fetch daily closes of many USD legs over one window, concurrently
+
+        Returns dict of currency -> (date, rate) points, None for currencies
+        whose request failed.
+        """
+        symbols = [f"{FX_PIVOT}{currency}=X" for currency in currencies]
+
+        async def fetch(provider):
+            return await asyncio.gather(*(
+                provider.get_history(symbol, start, end + timedelta(days=1)) for symbol in symbols
+            ))
+
+        try:
+            frames = run_sync(fetch)
+        except Exception as e:
+            logger.warning(f"Historical exchange rate download failed for {len(symbols)} pairs: {e}")
+            return {currency: None for currency in currencies}
+
+        points: Dict[str, Optional[List[Tuple[date, Decimal]]]] = {}
+        for currency, frame in zip(currencies, frames):
+            if frame is None:
+                points[currency] = None
+                continue
+            closes = frame["Close"].dropna()
+            points[currency] = [
+                (pd.Timestamp(index).date(), Decimal(str(float(value))))
+                for index, value in closes.items()
+                if value > 0
+            ]
+
+        backfilled = {currency: p for currency, p in points.items() if p}
+        logger.info(f"Backfilled {sum(len(p) for p in backfilled.values())} daily rates for {len(backfilled)} currencies")
+        return points
+
+    def _legs(self, series: Dict[str, FxSeries], currency: str, dates: Sequence) -> List[Optional[Decimal]]:
+        """USD leg of a currency on each date"""
+        if currency == FX_PIVOT:
+            return [Decimal(1)] * len(dates)
+        if currency not in series:
+            return [None] * len(dates)
+        return series[currency].rates_asof(dates)
+
+    def pair_rates(self, from_currency: str, to_currency: str, dates: Sequence) -> List[Optional[Decimal]]:
+        """
+        Historical rate of a pair on each date
+
+        Args:
+            from_currency: Source currency code
+            to_currency: Target currency code
+            dates: Dates (or datetimes) to resolve, any order
+
+        Returns:
+            Rates in input order (None where a leg has no close on or before the date)
+        """
+        if not dates:
+            return []
+        if from_currency == to_currency:
+            return [Decimal(1)] * len(dates)
+
+        series = self.load((from_currency, to_currency), min(_as_date(d) for d in dates))
+        return self._pair_rates(series, from_currency, to_currency, dates)
+
+    def _pair_rates(
+        self, series: Dict[str, FxSeries], from_currency: str, to_currency: str, dates: Sequence
+    ) -> List[Optional[Decimal]]:
+        """Triangulate a pair from already loaded legs"""
+        from_legs = self._legs(series, from_currency, dates)
+        to_legs = self._legs(series, to_currency, dates)
+        return [
+            to_leg / from_leg if from_leg is not None and to_leg is not None else None
+            for from_leg, to_leg in zip(from_legs, to_legs)
+        ]
+
+    def rate(self, from_currency: str, to_currency: str, on) -> Optional[Decimal]:
+        """Historical rate of a pair on one date"""
+        return self.pair_rates(from_currency, to_currency, [on])[0]
+
+    def convert(self, amount: Decimal, from_currency: str, to_currency: str, on) -> Optional[Decimal]:
+        """Convert an amount at the rate of a given date (None if unavailable)"""
+        if from_currency == to_currency:
+            return amount
+        rate = self.rate(from_currency, to_currency, on)
+        return amount * rate if rate is not None else None
+
+    def convert_series(
+        self, amounts: Sequence[Decimal], dates: Sequence, from_currency: str, to_currency: str
+    ) -> List[Optional[Decimal]]:
+        """
+        Convert a column of dated amounts, each at the rate of its own date
+
+        Returns:
+            Converted amounts in input order (None where no rate is available)
+        """
+        if from_currency == to_currency:
+            return list(amounts)
+        rates = self.pair_rates(from_currency, to_currency, dates)
+        return [
+            amount * rate if rate is not None else None
+            for amount, rate in zip(amounts, rates)
+        ]
+
+    def resolve(self, historical_pairs: Iterable[Tuple[str, str, object]]) -> Dict[Tuple[str, str, object], Optional[Decimal]]:
+        """
+        Rates for many (from_currency, to_currency, date) triples
+
+        Every involved currency is loaded once from the earliest date, so a
+        whole portfolio costs at most one backfill download per window.
+        """
+        triples = [
+            (from_currency, to_currency, on)
+            for from_currency, to_currency, on in set(historical_pairs)
+            if from_currency and to_currency and from_currency != to_currency and on
+        ]
+        if not triples:
+            return {}
+
+        series = self.load(
+            {currency for from_currency, to_currency, _ in triples for currency in (from_currency, to_currency)},
+            min(_as_date(on) for _, _, on in triples),
+        )
+        return {
+            (from_currency, to_currency, on): self._pair_rates(series, from_currency, to_currency, [on])[0]
+            for from_currency, to_currency, on in triples
+        }
+
+
+def clear_cache():
+    """Clear the in-process FX series"""
+    _fx_series_cache.clear()
@@ -19,10 +19,10 @@ from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
 from pydantic import BaseModel, Field
 
-from app.models import Portfolio, Price, Transaction
+from app.crud import prices as crud_prices
+from app.models import Portfolio, Transaction
 from app.services.risk_analysis import RiskAnalysisService
 
 logger = logging.getLogger(__name__)
@@ -134,30 +134,24 @@ class GoalProjectionsService:
             # Get unique asset IDs
             asset_ids = list(set(t.asset_id for t in transactions))
             
-            # Preload ALL price data for all assets in one query (performance optimization)
-            prices_data = (
-                self.db.query(Price.asset_id, Price.asof, Price.price)
-                .filter(
-                    and_(
-                        Price.asset_id.in_(asset_ids),
-                        Price.asof >= start_date,
-                        Price.asof <= now
-                    )
-                )
-                .order_by(Price.asset_id, Price.asof)
-                .all()
+            # Preload one daily close per asset for all assets in one query (performance optimization)
+            daily_closes = crud_prices.get_daily_closes(
+                self.db,
+                asset_ids,
+                date_from=start_date,
+                date_to=now
             )
             
-            if not prices_data:
+            if not any(daily_closes.values()):
                 logger.warning(f"No price data found for portfolio {portfolio_id} assets")
                 return self._default_performance()
             
             # Build price lookup: {asset_id: {date: price}}
-            price_lookup: Dict[int, Dict[datetime, float]] = {}
-            for asset_id, asof, price in prices_data:
-                if asset_id not in price_lookup:
-                    price_lookup[asset_id] = {}
-                price_lookup[asset_id][asof.date() if isinstance(asof, datetime) else asof] = float(price)
+            price_lookup: Dict[int, Dict[datetime, float]] = {
+                asset_id: {close.asof.date(): float(close.price) for close in closes}
+                for asset_id, closes in daily_closes.items()
+                if closes
+            }
             
             # Build time series of portfolio values
             portfolio_values = self._build_portfolio_time_series(
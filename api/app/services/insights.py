@@ -11,6 +11,7 @@ import math
 import hashlib
 import json
 
+from app.db import get_db_context
 from app.models import Transaction, Asset, TransactionType, Price
 from app.services.analytics_cache import get_cached_analytics
 from app.schemas import (
@@ -28,10 +29,14 @@ from app.services.metrics import MetricsService
 from app.services.pricing import PricingService
 from app.crud import portfolios as crud_portfolios
 from app.crud import prices as crud_prices
+from app.services.cache import CacheService, portfolio_tag
+from app.services.cache_refresh import revalidate
+from app.services.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
-from app.services.cache import CacheService
+# Single-flight lease of an insights computation (positions, history, benchmark, risk)
+_INSIGHTS_LEASE_SECONDS = 120
 
 
 class InsightsService:
@@ -70,32 +75,59 @@ class InsightsService:
         """Generate cache key for insights"""
         return f"{CacheService.PREFIX_INSIGHTS}{portfolio_id}:{period}:{benchmark_symbol}"
     
-    def _get_cached_insights(self, cache_key: str) -> Optional[PortfolioInsights]:
-        """Get insights from Redis cache if available"""
-        cached = CacheService.get(cache_key)
+    def _get_cached_insights(self, cache_key: str) -> Tuple[Optional[PortfolioInsights], bool]:
+        """Get insights from Redis cache if available, as (insights, stale)"""
+        cached, stale = CacheService.get_swr(cache_key)
         if cached:
-            logger.info("Returning cached insights from Redis")
-            return PortfolioInsights(**cached)
-        return None
+            logger.info("Returning cached insights from Redis" + (" (stale)" if stale else ""))
+            return (cached if isinstance(cached, PortfolioInsights) else PortfolioInsights(**cached)), stale
+        return None, False
     
     def _cache_insights(self, cache_key: str, insights: PortfolioInsights) -> None:
-        """Store insights in Redis cache"""
-        CacheService.set(cache_key, insights.model_dump(), CacheService.TTL_INSIGHTS)
+        """Store insights in Redis cache, served stale while refreshed once TTL_INSIGHTS is over"""
+        CacheService.set_swr(
+            cache_key, insights, CacheService.TTL_INSIGHTS, CacheService.STALE_TTL_INSIGHTS,
+            tags=[portfolio_tag(insights.portfolio_id)],
+        )
     
     async def get_portfolio_insights(
         self,
         portfolio_id: int,
         user_id: int,
         period: str = "1y",
-        benchmark_symbol: str = "SPY"
+        benchmark_symbol: str = "SPY",
+        refresh: bool = False,
     ) -> PortfolioInsights:
-        """Get comprehensive portfolio insights with user-specific metadata overrides"""
+        """
+        Get comprehensive portfolio insights with user-specific metadata overrides
+        
+        Cached insights are returned first; stale ones are refreshed in the
+        background. refresh=True recomputes (and re-caches) them regardless.
+        Insights are computed by one process at a time (single flight), the
+        others wait for its result.
+        """
         # Check cache first
         cache_key = self._get_cache_key(portfolio_id, period, benchmark_symbol)
-        cached_insights = self._get_cached_insights(cache_key)
+        cached_insights, stale = (None, False) if refresh else self._get_cached_insights(cache_key)
         if cached_insights:
+            if stale:
+                revalidate(
+                    cache_key,
+                    lambda: _refresh_cached_insights(portfolio_id, user_id, period, benchmark_symbol),
+                )
             return cached_insights
         
+        return await single_flight(
+            cache_key,
+            lambda: self._compute_insights(portfolio_id, user_id, period, benchmark_symbol),
+            store=lambda insights: self._cache_insights(cache_key, insights),
+            lease_seconds=_INSIGHTS_LEASE_SECONDS,
+        )
+    
+    async def _compute_insights(
+        self, portfolio_id: int, user_id: int, period: str, benchmark_symbol: str
+    ) -> PortfolioInsights:
+        """Compute the insights of a portfolio from its positions, history and benchmark"""
         logger.info(f"Computing fresh insights for portfolio {portfolio_id}, period {period}, benchmark {benchmark_symbol}")
         
         portfolio = crud_portfolios.get_portfolio(self.db, portfolio_id)
@@ -184,9 +216,6 @@ class InsightsService:
             diversification_score=diversification_score
         )
         
-        # Cache the result
-        self._cache_insights(cache_key, insights)
-        
         return insights
     
     async def get_asset_allocation(self, portfolio_id: int) -> List[AssetAllocation]:
@@ -647,14 +676,13 @@ class InsightsService:
             datetime.combine(end_date, datetime.max.time())
         )
         
-        # Get benchmark prices
-        benchmark_prices = crud_prices.get_prices(
+        # Get benchmark daily closes
+        benchmark_prices = crud_prices.get_daily_closes(
             self.db,
-            benchmark_asset.id,
+            [benchmark_asset.id],
             date_from=datetime.combine(start_date, datetime.min.time()),
-            date_to=datetime.combine(end_date, datetime.max.time()),
-            limit=10000
-        )
+            date_to=datetime.combine(end_date, datetime.max.time())
+        )[benchmark_asset.id]
         
         # Build benchmark dictionary
         benchmark_dict = {p.asof.date(): p.price for p in benchmark_prices}
@@ -945,14 +973,13 @@ class InsightsService:
             logger.warning(f"Failed to fetch benchmark prices for beta calculation: {e}")
             return None
         
-        # Get benchmark prices
-        benchmark_prices = crud_prices.get_prices(
+        # Get benchmark daily closes
+        benchmark_prices = crud_prices.get_daily_closes(
             self.db,
-            benchmark_asset.id,
+            [benchmark_asset.id],
             date_from=datetime.combine(start_date, datetime.min.time()),
-            date_to=datetime.combine(end_date, datetime.max.time()),
-            limit=10000
-        )
+            date_to=datetime.combine(end_date, datetime.max.time())
+        )[benchmark_asset.id]
         
         if not benchmark_prices or len(benchmark_prices) < 2:
             return None
@@ -1156,3 +1183,11 @@ class InsightsService:
         # Calculate average
         avg_days = sum(holding_periods) / len(holding_periods)
         return Decimal(str(round(avg_days, 1)))
+
+
+async def _refresh_cached_insights(portfolio_id: int, user_id: int, period: str, benchmark_symbol: str) -> None:
+    """Background refresh of a stale insights entry, on its own session"""
+    with get_db_context() as db:
+        await InsightsService(db).get_portfolio_insights(
+            portfolio_id, user_id, period, benchmark_symbol, refresh=True
+        )
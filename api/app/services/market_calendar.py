@@ -0,0 +1,260 @@
+"""
+Trading calendars of the exchanges quotes come from
+
+Symbols are mapped to their exchange by their Yahoo Finance suffix (AIR.PA
+trades on Euronext Paris, 7203.T in Tokyo, no suffix in New York), crypto
+pairs (BTC-USD) trade around the clock and currency/futures quotes (EURUSD=X,
+GC=F) on weekdays. An exchange is open on its weekdays, within its regular
+session in its own time zone, outside its holidays.
+
+Holidays are only listed for the exchanges most holdings trade on (US, UK,
+Euronext, Xetra, Tokyo's year-end break); other exchanges know their weekends
+and New Year's Day. Lunch breaks, early closes and unlisted holidays count as
+open: a calendar may refresh a quote needlessly, never skip one that moves.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Optional
+from zoneinfo import ZoneInfo
+
+from app.models.enums import AssetClass
+
+# Quote currencies of Yahoo Finance crypto pairs (BTC-USD, ETH-EUR)
+_CRYPTO_QUOTE_CURRENCIES = frozenset({
+    "USD", "EUR", "GBP", "JPY", "CAD", "AUD", "CHF", "CNY", "KRW", "INR", "BRL",
+    "USDT", "USDC", "BUSD", "BTC", "ETH",
+})
+
+
+def _easter(year: int) -> date:
+    """Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-th given weekday (0=Monday) of a month, counted from the end when n < 0"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def _observed_us(day: date) -> Optional[date]:
+    """NYSE observance: Saturday holidays move to Friday (not across a year end), Sunday ones to Monday"""
+    if day.weekday() == 5:
+        friday = day - timedelta(days=1)
+        return friday if friday.year == day.year else None
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def _nyse_holidays(year: int) -> FrozenSet[date]:
+    days = {
+        _observed_us(date(year, 1, 1)),
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed_us(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed_us(date(year, 12, 25)),
+    }
+    if year >= 2022:
+        days.add(_observed_us(date(year, 6, 19)))  # Juneteenth
+    # A Saturday New Year's Day is not observed (its Friday is in the previous year)
+    days.discard(None)
+    return frozenset(days)
+
+
+def _lse_holidays(year: int) -> FrozenSet[date]:
+    new_year = date(year, 1, 1)
+    christmas, boxing_day = date(year, 12, 25), date(year, 12, 26)
+    # Weekend holidays are substituted by the following weekdays
+    if new_year.weekday() >= 5:
+        new_year += timedelta(days=7 - new_year.weekday())
+    if christmas.weekday() >= 5:
+        christmas += timedelta(days=2)
+        boxing_day += timedelta(days=2) if boxing_day.weekday() == 6 else timedelta(days=1)
+    elif boxing_day.weekday() >= 5:
+        boxing_day += timedelta(days=2)
+    easter = _easter(year)
+    return frozenset({
+        new_year,
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        _nth_weekday(year, 5, 0, 1),  # Early May bank holiday
+        _nth_weekday(year, 5, 0, -1),  # Spring bank holiday
+        _nth_weekday(year, 8, 0, -1),  # Summer bank holiday
+        christmas,
+        boxing_day,
+    })
+
+
+def _euronext_holidays(year: int) -> FrozenSet[date]:
+    easter = _easter(year)
+    return frozenset({
+        date(year, 1, 1),
+        easter - timedelta(days=2),  # Good Friday
+        easter + timedelta(days=1),  # Easter Monday
+        date(year, 5, 1),
+        date(year, 12, 25),
+        date(year, 12, 26),
+    })
+
+
+def _xetra_holidays(year: int) -> FrozenSet[date]:
+    return _euronext_holidays(year) | {date(year, 12, 24), date(year, 12, 31)}
+
+
+def _tse_holidays(year: int) -> FrozenSet[date]:
+    return frozenset({date(year, 1, 1), date(year, 1, 2), date(year, 1, 3), date(year, 12, 31)})
+
+
+def _new_year_only(year: int) -> FrozenSet[date]:
+    return frozenset({date(year, 1, 1)})
+
+
+def _no_holidays(year: int) -> FrozenSet[date]:
+    return frozenset()
+
+
+@dataclass(frozen=True)
+class Exchange:
+    """Regular trading session of an exchange"""
+    code: str
+    timezone: str
+    opens: time = time(0, 0)
+    closes: Optional[time] = None  # None: trades until midnight
+    weekdays: FrozenSet[int] = frozenset(range(5))
+    holidays: Callable[[int], FrozenSet[date]] = field(default=_new_year_only, compare=False)
+
+    def is_open(self, at: Optional[datetime] = None) -> bool:
+        """Whether the exchange is in its regular session at a time (naive times are UTC, default now)"""
+        local = self._local(at)
+        if local.weekday() not in self.weekdays or local.date() in _holidays(self, local.year):
+            return False
+        return self.opens <= local.time() and (self.closes is None or local.time() < self.closes)
+
+    def session_date(self, at: Optional[datetime] = None) -> date:
+        """Trading day of the exchange at a time: its local date (naive times are UTC, default now)"""
+        return self._local(at).date()
+
+    def _local(self, at: Optional[datetime]) -> datetime:
+        at = at or datetime.now(timezone.utc)
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        return at.astimezone(_zone(self.timezone))
+
+
+@lru_cache(maxsize=None)
+def _zone(name: str) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=256)
+def _holidays(exchange: Exchange, year: int) -> FrozenSet[date]:
+    return exchange.holidays(year)
+
+
+CRYPTO = Exchange("CRYPTO", "UTC", weekdays=frozenset(range(7)), holidays=_no_holidays)
+FX = Exchange("FX", "UTC", holidays=_no_holidays)
+NYSE = Exchange("NYSE", "America/New_York", time(9, 30), time(16, 0), holidays=_nyse_holidays)
+
+_EXCHANGES = [
+    CRYPTO,
+    FX,
+    NYSE,
+    Exchange("TSX", "America/Toronto", time(9, 30), time(16, 0)),
+    Exchange("B3", "America/Sao_Paulo", time(10, 0), time(17, 0)),
+    Exchange("BMV", "America/Mexico_City", time(8, 30), time(15, 0)),
+    Exchange("LSE", "Europe/London", time(8, 0), time(16, 30), holidays=_lse_holidays),
+    Exchange("EURONEXT", "Europe/Paris", time(9, 0), time(17, 30), holidays=_euronext_holidays),
+    Exchange("XETRA", "Europe/Berlin", time(9, 0), time(17, 30), holidays=_xetra_holidays),
+    Exchange("MIL", "Europe/Rome", time(9, 0), time(17, 30), holidays=_euronext_holidays),
+    Exchange("BME", "Europe/Madrid", time(9, 0), time(17, 30), holidays=_euronext_holidays),
+    Exchange("SIX", "Europe/Zurich", time(9, 0), time(17, 30), holidays=_xetra_holidays),
+    Exchange("WBAG", "Europe/Vienna", time(9, 0), time(17, 30), holidays=_xetra_holidays),
+    Exchange("NORDIC", "Europe/Stockholm", time(9, 0), time(17, 30), holidays=_euronext_holidays),
+    Exchange("OSE", "Europe/Oslo", time(9, 0), time(16, 20), holidays=_euronext_holidays),
+    Exchange("TSE", "Asia/Tokyo", time(9, 0), time(15, 30), holidays=_tse_holidays),
+    Exchange("HKEX", "Asia/Hong_Kong", time(9, 30), time(16, 0)),
+    Exchange("SSE", "Asia/Shanghai", time(9, 30), time(15, 0)),
+    Exchange("KRX", "Asia/Seoul", time(9, 0), time(15, 30)),
+    Exchange("NSE", "Asia/Kolkata", time(9, 15), time(15, 30)),
+    Exchange("ASX", "Australia/Sydney", time(10, 0), time(16, 0)),
+    Exchange("NZX", "Pacific/Auckland", time(10, 0), time(16, 45)),
+]
+EXCHANGES: Dict[str, Exchange] = {exchange.code: exchange for exchange in _EXCHANGES}
+
+# Yahoo Finance ticker suffix -> exchange code
+_SUFFIXES = {
+    "TO": "TSX", "V": "TSX", "NE": "TSX", "CN": "TSX",
+    "SA": "B3",
+    "MX": "BMV",
+    "L": "LSE", "IL": "LSE",
+    "PA": "EURONEXT", "AS": "EURONEXT", "BR": "EURONEXT", "LS": "EURONEXT", "IR": "EURONEXT",
+    "DE": "XETRA", "F": "XETRA", "BE": "XETRA", "DU": "XETRA", "HM": "XETRA", "MU": "XETRA",
+    "SG": "XETRA", "HA": "XETRA",
+    "MI": "MIL",
+    "MC": "BME",
+    "SW": "SIX",
+    "VI": "WBAG",
+    "ST": "NORDIC", "CO": "NORDIC", "HE": "NORDIC",
+    "OL": "OSE",
+    "T": "TSE",
+    "HK": "HKEX",
+    "SS": "SSE", "SZ": "SSE",
+    "KS": "KRX", "KQ": "KRX",
+    "NS": "NSE", "BO": "NSE",
+    "AX": "ASX",
+    "NZ": "NZX",
+}
+
+# Suffixes without a calendar: open on weekdays, around the clock
+_UNKNOWN = FX
+
+
+def exchange_for_symbol(symbol: str, asset_class: Optional[AssetClass] = None) -> Exchange:
+    """
+    Exchange a symbol trades on
+
+    Args:
+        symbol: Yahoo Finance ticker
+        asset_class: Asset class when known (crypto trades around the clock
+            whatever its ticker looks like)
+    """
+    if asset_class == AssetClass.CRYPTO:
+        return CRYPTO
+    symbol = symbol.upper()
+    if symbol.endswith("=X") or symbol.endswith("=F"):
+        return FX
+    base, dash, quote = symbol.rpartition("-")
+    if dash and base and quote in _CRYPTO_QUOTE_CURRENCIES:
+        return CRYPTO
+    base, dot, suffix = symbol.rpartition(".")
+    if not dot or not base:
+        return NYSE
+    code = _SUFFIXES.get(suffix)
+    if code is None:
+        # Share classes (BRK.B) trade in New York, anything else on an exchange we do not know
+        return NYSE if len(suffix) == 1 else _UNKNOWN
+    return EXCHANGES[code]
+
+
+def is_market_open(symbol: str, asset_class: Optional[AssetClass] = None, at: Optional[datetime] = None) -> bool:
+    """Whether the exchange of a symbol is in its regular session (default now)"""
+    return exchange_for_symbol(symbol, asset_class).is_open(at)
@@ -0,0 +1,245 @@
+"""
+Market-wide data: sentiment indices and market quotes
+
+The same for every user, so each item is fetched once for all API workers and
+kept in the shared cache as a stale-while-revalidate entry: fresh for
+_CACHE_TTL seconds, then served stale for up to MARKET_DATA_MAX_STALE_SECONDS
+more while it is refreshed, so an upstream outage shows the last known values.
+
+The refresh_market_data scheduler job re-fetches every item each
+MARKET_DATA_REFRESH_SECONDS (before its entry goes stale), claiming each
+refresh so one process does it per cycle; readers only read the cache. Only
+a cold cache (before the first refresh, or after Redis was flushed) makes a
+reader wait for upstream, once across processes (single_flight).
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.errors import (
+    DXYDataFetchError,
+    ExternalServiceError,
+    FailedToFetchCryptoSentimentError,
+    FailedToFetchMarketSentimentError,
+    TNXDataFetchError,
+    VIXDataFetchError,
+)
+from app.services.cache import CacheService
+from app.services.cache_refresh import claim_refreshes, revalidate
+from app.services.quote_provider import get_quote_provider
+from app.services.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+_CACHE_PREFIX = "market:"
+_CACHE_TTL = 300  # Fresh for 5 minutes
+
+# Headers of a browser request, which the sentiment sources expect
+_BROWSER_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+# Major market indices shown by the market_indices dashboard widget
+MARKET_INDICES = [
+    "^GSPC",  # S&P 500
+    "^DJI",  # Dow Jones
+    "^IXIC",  # NASDAQ
+    "^GSPTSE",  # S&P/TSX Composite
+    "^FTSE",  # FTSE 100
+    "^GDAXI",  # DAX
+    "^FCHI",  # CAC 40
+    "FTSEMIB.MI",  # FTSE MIB
+    "^N225",  # Nikkei 225
+    "^HSI",  # Hang Seng
+    "000001.SS",  # SSE Composite
+    "^AXJO",  # ASX 200
+]
+
+
+def _change(price: float, previous_close: Optional[float]) -> Dict[str, Optional[float]]:
+    """Point and percent change against the previous close"""
+    if not previous_close or previous_close <= 0:
+        return {"change": None, "change_pct": None}
+    change = price - previous_close
+    return {"change": round(change, 2), "change_pct": round(change / previous_close * 100, 2)}
+
+
+async def _fetch_stock_sentiment() -> Dict[str, Any]:
+    """CNN Fear & Greed Index"""
+    try:
+        today = datetime.now().strftime("%Y-%m-%d")
+        url = f"https://production.dataviz.cnn.io/index/fearandgreed/graphdata/{today}"
+        headers = {
+            "User-Agent": _BROWSER_USER_AGENT,
+            "Accept": "application/json, text/plain, */*",
+            "Accept-Language": "en-US,en;q=0.9",
+            "Referer": "https://www.cnn.com/",
+            "Origin": "https://www.cnn.com",
+        }
+
+        data = await get_quote_provider().get_json(url, headers=headers, timeout=10.0)
+        fear_and_greed = data.get("fear_and_greed", {})
+
+        return {
+            "score": round(fear_and_greed.get("score", 0)),
+            "rating": fear_and_greed.get("rating", "unknown").lower(),
+            "previous_close": round(fear_and_greed.get("previous_close", 0)),
+            "timestamp": fear_and_greed.get("timestamp"),
+        }
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch stock sentiment: {e}")
+        raise FailedToFetchMarketSentimentError(str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error fetching stock sentiment: {e}")
+        raise ExternalServiceError("stock market sentiment", str(e))
+
+
+async def _fetch_crypto_sentiment() -> Dict[str, Any]:
+    """Alternative.me crypto Fear & Greed Index"""
+    try:
+        url = "https://api.alternative.me/fng/?limit=2"
+        headers = {"User-Agent": _BROWSER_USER_AGENT, "Accept": "application/json"}
+
+        data = await get_quote_provider().get_json(url, headers=headers, timeout=10.0)
+        if not data.get("data") or len(data["data"]) == 0:
+            raise FailedToFetchCryptoSentimentError("No sentiment data returned")
+
+        current = data["data"][0]
+        previous = data["data"][1] if len(data["data"]) > 1 else None
+
+        return {
+            "score": int(current.get("value", 0)),
+            "rating": current.get("value_classification", "unknown").lower(),
+            "previous_value": int(previous.get("value", 0)) if previous else None,
+            "timestamp": current.get("timestamp"),
+        }
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch crypto sentiment: {e}")
+        raise FailedToFetchCryptoSentimentError(str(e))
+    except Exception as e:
+        logger.error(f"Unexpected error fetching crypto sentiment: {e}")
+        raise ExternalServiceError("crypto market sentiment", str(e))
+
+
+def _index_quote(symbol: str, error_class, name: str) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    """Fetcher of an index quote: price, change and change_pct against the previous close"""
+    async def fetch() -> Dict[str, Any]:
+        try:
+            quote = await get_quote_provider().get_quote(symbol)
+            if quote is None:
+                raise error_class(f"{name} data not available")
+
+            current_price = float(quote["price"])
+            previous_close = float(quote["previous_close"]) if "previous_close" in quote else None
+            return {
+                "price": round(current_price, 2),
+                **_change(current_price, previous_close),
+                "previous_close": round(previous_close, 2) if previous_close else None,
+                "timestamp": datetime.now().isoformat(),
+            }
+        except Exception as e:
+            logger.error(f"Failed to fetch {name} data: {e}")
+            raise error_class(str(e))
+
+    return fetch
+
+
+async def _fetch_market_indices() -> Dict[str, Dict[str, Any]]:
+    """Quotes of MARKET_INDICES keyed by symbol, in one batched request"""
+    quotes = await get_quote_provider().get_quotes(MARKET_INDICES)
+    result = {}
+    for symbol in MARKET_INDICES:
+        quote = quotes.get(symbol)
+        if quote is None:
+            continue
+        current_price = float(quote["price"])
+        previous_close = float(quote["previous_close"]) if "previous_close" in quote else None
+        change = _change(current_price, previous_close)
+        result[symbol] = {
+            "symbol": symbol,
+            "price": round(current_price, 2),
+            "current_price": round(current_price, 2),
+            **change,
+            "percent_change": change["change_pct"],
+            "daily_change_pct": change["change_pct"],
+            "previous_close": round(previous_close, 2) if previous_close else None,
+        }
+    if not result:
+        raise ExternalServiceError("market indices", "No index quotes returned")
+    return result
+
+
+# Market data item -> fetcher
+MARKET_DATA: Dict[str, Callable[[], Awaitable[Any]]] = {
+    "sentiment_stock": _fetch_stock_sentiment,
+    "sentiment_crypto": _fetch_crypto_sentiment,
+    "index_vix": _index_quote("^VIX", VIXDataFetchError, "VIX"),
+    "index_tnx": _index_quote("^TNX", TNXDataFetchError, "TNX"),
+    "index_dxy": _index_quote("DX-Y.NYB", DXYDataFetchError, "DXY"),
+    "indices": _fetch_market_indices,
+}
+
+
+def _cache_key(name: str) -> str:
+    return f"{_CACHE_PREFIX}{name}"
+
+
+def _store(name: str, value: Any) -> None:
+    CacheService.set_swr(_cache_key(name), value, ttl=_CACHE_TTL, stale_ttl=settings.MARKET_DATA_MAX_STALE_SECONDS)
+
+
+async def _fetch_and_store(names: List[str]) -> List[str]:
+    """Fetch items concurrently and cache those fetched; a failed item keeps its cached value"""
+    results = await asyncio.gather(*(MARKET_DATA[name]() for name in names), return_exceptions=True)
+    fetched = {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Market data refresh of {name} failed, serving the cached value: {result}")
+        else:
+            fetched[name] = result
+    CacheService.set_swr_many(
+        (_cache_key(name), value, _CACHE_TTL, settings.MARKET_DATA_MAX_STALE_SECONDS, ())
+        for name, value in fetched.items()
+    )
+    return list(fetched)
+
+
+async def refresh_market_data(names: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Fetch market data items concurrently and cache them
+
+    Items another process is refreshing are skipped. Returns the names refreshed.
+
+    Args:
+        names: Items to refresh (default: all of MARKET_DATA)
+    """
+    keys = claim_refreshes([_cache_key(name) for name in (names or MARKET_DATA)])
+    if not keys:
+        return []
+    return await _fetch_and_store([key[len(_CACHE_PREFIX):] for key in keys])
+
+
+async def get_market_data(name: str) -> Any:
+    """
+    Cached market data item
+
+    A stale entry is served while it is refreshed in the background. On a
+    cold cache the item is fetched here, once across processes.
+
+    Raises:
+        The item's fetch error, when it is not cached and cannot be fetched
+    """
+    key = _cache_key(name)
+    value, stale = CacheService.get_swr(key)
+    if value is not None:
+        if stale:
+            revalidate(key, lambda: _fetch_and_store([name]))
+        return value
+
+    logger.info(f"Market data {name} not cached yet, fetching it")
+    return await single_flight(key, MARKET_DATA[name], store=lambda value: _store(name, value))
@@ -5,27 +5,33 @@ import asyncio
 import logging
 from decimal import Decimal
 from typing import Any, List, Dict, Optional, Tuple
-from datetime import datetime
-from sqlalchemy.orm import Session, joinedload
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
 from sqlalchemy import func
 from fastapi import Depends
 
 from app.models import Transaction, Asset, TransactionType, Price, Portfolio
 from app.schemas import Position, PortfolioMetrics
+from app.crud import positions as crud_positions
 from app.crud import prices as crud_prices
-from app.db import get_db
-from app.services.cache import CacheService, cache_positions, get_cached_positions, invalidate_positions
+from app.db import get_db, get_db_context, run_db
+from app.services.cache import CacheService, cache_positions, invalidate_positions
+from app.services.cache_refresh import revalidate
+from app.services.single_flight import COALESCED_LOCAL, record, single_flight
 from app.services.currency import CurrencyService
+from app.services.fx_history import FxHistoryStore
+from app.services.position_calculator import FxRates, calculate_position, fx_requirements
+from app.services.position_state import PositionState, parse_split_ratio
 
 logger = logging.getLogger(__name__)
 
-# Lock to prevent concurrent database access in async position calculations
-_db_lock = asyncio.Lock()
-
 # Task cache for deduplicating concurrent position calculations
 _ongoing_calculations: Dict[Tuple[int, bool], asyncio.Task] = {}
 _cache_lock = asyncio.Lock()
 
+# Single-flight lease of a history calculation (every daily close since the first transaction)
+_HISTORY_LEASE_SECONDS = 60
+
 
 class MetricsService:
     """Service for calculating portfolio metrics"""
@@ -36,8 +42,12 @@ class MetricsService:
     async def get_positions(self, portfolio_id: int, include_sold: bool = False) -> List[Position]:
         """
         Calculate current positions for a portfolio with Redis caching and task deduplication:
-        1. Redis cache: Serves recent results (10 min TTL), shared across instances
+        1. Redis cache: Serves recent results, shared across instances. Past
+           TTL_POSITION the entry is still served (stale) while one background
+           refresh recalculates it
         2. Task cache: Deduplicates concurrent requests (shares ongoing calculation)
+        3. Single flight: one calculation per portfolio across processes, the
+           other API and Celery workers wait for its result
         
         For each asset:
         - Net quantity (BUY/TRANSFER_IN - SELL/TRANSFER_OUT, adjusted for SPLIT)
@@ -51,16 +61,19 @@ class MetricsService:
         """
         # Update portfolio access time for smart cache warmup
         from app.services.cache import update_portfolio_access_time
-        update_portfolio_access_time(self.db, portfolio_id)
+        await run_db(self.db, update_portfolio_access_time, self.db, portfolio_id)
         
         cache_key = (portfolio_id, include_sold)
         
-        # Check Redis cache first
-        redis_cached = get_cached_positions(portfolio_id)
-        if redis_cached and not include_sold:  # Only use cache for active positions
-            logger.info(f"Using Redis cached positions for portfolio {portfolio_id}")
-            # Convert dict back to Position objects
-            return [Position(**pos) for pos in redis_cached]
+        # Check Redis cache first (only for active positions)
+        positions_key = f"{CacheService.PREFIX_POSITION}{portfolio_id}"
+        redis_cached, stale = CacheService.get_swr(positions_key) if not include_sold else (None, False)
+        if redis_cached:
+            logger.info(f"Using Redis cached positions for portfolio {portfolio_id}" + (" (stale)" if stale else ""))
+            if stale:
+                revalidate(positions_key, lambda: _refresh_cached_positions(portfolio_id))
+            # Entries are rebuilt as Position models by the cache codec; legacy JSON entries hold dicts
+            return [pos if isinstance(pos, Position) else Position(**pos) for pos in redis_cached]
         
         # Variable to track if we need to wait for an ongoing task
         ongoing_task = None
@@ -69,22 +82,18 @@ class MetricsService:
             # Check if calculation is already ongoing
             if cache_key in _ongoing_calculations:
                 ongoing_task = _ongoing_calculations[cache_key]
+                record(positions_key, COALESCED_LOCAL)
                 logger.info(f"Reusing ongoing position calculation for portfolio {portfolio_id}")
             else:
                 # Start new calculation
                 logger.info(f"Starting new position calculation for portfolio {portfolio_id}")
-                ongoing_task = asyncio.create_task(self._calculate_positions_internal(portfolio_id, include_sold))
+                ongoing_task = asyncio.create_task(self._calculate_positions_shared(portfolio_id, include_sold))
                 _ongoing_calculations[cache_key] = ongoing_task
         
         # Wait for the task to complete (outside the lock to allow concurrent access)
         try:
             result = await ongoing_task
             
-            # Store result in Redis cache (only for active positions)
-            if not include_sold and result:
-                positions_data = [pos.model_dump() for pos in result]
-                cache_positions(portfolio_id, positions_data, CacheService.TTL_POSITION)
-            
             # Remove from ongoing calculations
             async with _cache_lock:
                 if _ongoing_calculations.get(cache_key) == ongoing_task:
@@ -98,73 +107,109 @@ class MetricsService:
                     _ongoing_calculations.pop(cache_key, None)
             raise
     
-    async def _calculate_positions_internal(self, portfolio_id: int, include_sold: bool = False) -> List[Position]:
+    async def refresh_cached_positions(self, portfolio_id: int) -> List[Position]:
         """
-        Internal method that actually calculates positions
+        Recalculate the held positions and cache them, whatever the cache holds
+        
+        Used by the background refresh of stale entries, the scheduled warmup
+        and the Celery metrics task.
         """
-        # Get portfolio to access base currency
-        from app.models import Portfolio as PortfolioModel
-        portfolio = self.db.query(PortfolioModel).filter_by(id=portfolio_id).first()
-        portfolio_base_currency = portfolio.base_currency if portfolio else None
+        positions = await self._calculate_positions_internal(portfolio_id)
+        if positions:
+            cache_positions(portfolio_id, list(positions), CacheService.TTL_POSITION)
+        return positions
+    
+    async def _calculate_positions_shared(self, portfolio_id: int, include_sold: bool = False) -> List[Position]:
+        """
+        _calculate_positions_internal() once across processes
         
-        # Get all transactions for portfolio, ordered by date
-        # Use joinedload to eagerly fetch assets and prevent N+1 queries
-        transactions = (
-            self.db.query(Transaction)
-            .options(joinedload(Transaction.asset))
-            .filter(Transaction.portfolio_id == portfolio_id)
-            .order_by(Transaction.tx_date, Transaction.created_at)
-            .all()
-        )
+        The process holding the lease caches the held positions; the others
+        get its result without calculating.
+        """
+        positions_key = f"{CacheService.PREFIX_POSITION}{portfolio_id}"
         
-        # Group by asset and pre-calculate dividends/fees while iterating
-        asset_txs: Dict[int, List[Transaction]] = {}
-        total_dividends = Decimal(0)
-        total_fees = Decimal(0)
+        def store(positions: List[Position]) -> None:
+            if positions:
+                cache_positions(portfolio_id, list(positions), CacheService.TTL_POSITION)
         
-        for tx in transactions:
-            if tx.asset_id not in asset_txs:
-                asset_txs[tx.asset_id] = []
-            asset_txs[tx.asset_id].append(tx)
-            
-            # Calculate dividends and fees in this loop to avoid separate queries
-            if tx.type == TransactionType.DIVIDEND:
-                total_dividends += tx.price * tx.quantity
-            total_fees += tx.fees
+        return await single_flight(
+            f"{positions_key}:all" if include_sold else positions_key,
+            lambda: self._calculate_positions_internal(portfolio_id, include_sold),
+            store=None if include_sold else store,
+        )
+    
+    async def _calculate_positions_internal(self, portfolio_id: int, include_sold: bool = False) -> List[Position]:
+        """
+        Internal method that actually calculates positions
+
+        Reads the persisted per-asset position snapshots (app.crud.positions),
+        so the cost is independent of the number of transactions.
+        """
+        portfolio_base_currency, snapshots = await run_db(self.db, self._load_position_snapshots, portfolio_id)
         
         # Store pre-calculated values for later use in get_metrics
-        self._cached_dividends = {portfolio_id: total_dividends}
-        self._cached_fees = {portfolio_id: total_fees}
-        
-        # Calculate positions sequentially to avoid database session concurrency issues
+        self._remember_totals(portfolio_id, snapshots)
         
-        # Batch fetch all assets at once to prevent N+1 queries
-        asset_ids = list(asset_txs.keys())
-        assets = self.db.query(Asset).filter(Asset.id.in_(asset_ids)).all()
-        asset_map = {asset.id: asset for asset in assets}
-        
-        # Pre-fetch all prices in parallel before calculating positions
-        # This dramatically reduces the time from sequential fetches
-        asset_symbols = [asset.symbol for asset in assets]
-        asset_id_to_symbol = {asset.id: asset.symbol for asset in assets}
+        states = self._position_states(snapshots)
+        quotes, fx = await asyncio.gather(
+            self._fetch_quotes(states),
+            self._resolve_fx(states, portfolio_base_currency),
+        )
+        return self._build_positions(states, quotes, fx, portfolio_base_currency, include_sold)
+
+    def _remember_totals(self, portfolio_id: int, snapshots: List[Any]) -> None:
+        """Keep the dividend and fee totals of the snapshots for get_metrics"""
+        self._cached_dividends = {portfolio_id: sum((s.total_dividends for s in snapshots), Decimal(0))}
+        self._cached_fees = {portfolio_id: sum((s.total_fees for s in snapshots), Decimal(0))}
+
+    @staticmethod
+    def _position_states(snapshots: List[Any]) -> List[Tuple[Asset, PositionState]]:
+        """(asset, folded state) per position snapshot"""
+        return [(snapshot.asset, PositionState.from_row(snapshot)) for snapshot in snapshots]
+
+    async def _fetch_quotes(self, states: List[Tuple[Asset, PositionState]]) -> Dict[str, Any]:
+        """Batch fetch the quotes of every held asset"""
+        # Sold positions are valued from their own totals, only held ones need a quote
+        asset_symbols = [asset.symbol for asset, state in states if state.quantity > 0]
         
-        # Batch fetch all prices in parallel
         from app.services.pricing import get_pricing_service
         pricing_service = get_pricing_service(self.db)
         logger.info(f"Pre-fetching prices for {len(asset_symbols)} assets in parallel")
-        await pricing_service.get_multiple_prices(asset_symbols)
+        quotes = await pricing_service.get_multiple_prices(asset_symbols)
         logger.info(f"Finished pre-fetching prices")
-        
-        # Now calculate positions - prices will be cached
+        return quotes
+
+    async def _resolve_fx(
+        self, states: List[Tuple[Asset, PositionState]], portfolio_base_currency: Optional[str]
+    ) -> FxRates:
+        """One rate per currency pair for the whole portfolio"""
+        pairs, historical_pairs = set(), set()
+        for asset, state in states:
+            needed, needed_historical = fx_requirements(asset, state, portfolio_base_currency)
+            pairs |= needed
+            historical_pairs |= needed_historical
+        return await run_db(self.db, FxRates.resolve, pairs, historical_pairs, db=self.db)
+
+    @staticmethod
+    def _build_positions(
+        states: List[Tuple[Asset, PositionState]],
+        quotes: Dict[str, Any],
+        fx: FxRates,
+        portfolio_base_currency: Optional[str],
+        include_sold: bool = False,
+    ) -> List[Position]:
+        """Pure calculation from the preloaded inputs - no further I/O"""
         all_positions = []
-        for asset_id, txs in asset_txs.items():
+        for asset, state in states:
             try:
-                position = await self._calculate_position(asset_id, txs, portfolio_base_currency, include_sold)
+                position = calculate_position(
+                    asset, state, quotes.get(asset.symbol), fx, portfolio_base_currency, include_sold
+                )
                 if position:
-                    logger.info(f"Calculated position for asset {asset_id}: {position.symbol}, qty={position.quantity}")
+                    logger.info(f"Calculated position for asset {asset.id}: {position.symbol}, qty={position.quantity}")
                 all_positions.append(position)
             except Exception as e:
-                logger.error(f"Error calculating position for asset {asset_id}: {e}", exc_info=True)
+                logger.error(f"Error calculating position for asset {asset.id}: {e}", exc_info=True)
                 all_positions.append(e)
         
         positions = []
@@ -182,6 +227,18 @@ class MetricsService:
         
         return positions
 
+    def _load_position_snapshots(self, portfolio_id: int) -> Tuple[Optional[str], List[Any]]:
+        """Portfolio base currency and its position snapshots, rebuilt first if never synced"""
+        portfolio = self.db.query(Portfolio).filter_by(id=portfolio_id).first()
+        
+        # Portfolios created before snapshots existed are replayed once
+        if portfolio and portfolio.positions_synced_at is None:
+            crud_positions.rebuild_portfolio_positions(self.db, portfolio_id)
+        
+        # One row per asset with its folded state, assets eagerly loaded
+        snapshots = crud_positions.get_position_snapshots(self.db, portfolio_id)
+        return (portfolio.base_currency if portfolio else None), snapshots
+
     async def get_sold_positions_only(self, portfolio_id: int) -> List[Position]:
         """
         Get only sold positions for a portfolio (optimized to use cached data)
@@ -203,11 +260,35 @@ class MetricsService:
         """Calculate portfolio-level metrics (async to avoid blocking)"""
         from app.crud.portfolios import get_portfolio
         
-        portfolio = get_portfolio(self.db, portfolio_id)
+        portfolio = await run_db(self.db, get_portfolio, self.db, portfolio_id)
         if not portfolio:
             raise ValueError(f"Portfolio {portfolio_id} not found")
         
-        positions = await self.get_positions(portfolio_id)
+        # Held and sold positions come out of the same calculation
+        all_positions = await self.get_positions(portfolio_id, include_sold=True)
+        
+        total_dividends = await run_db(self.db, self._calculate_total_dividends, portfolio_id)
+        total_fees = await run_db(self.db, self._calculate_total_fees, portfolio_id)
+        
+        return self._build_metrics(portfolio, all_positions, total_dividends, total_fees)
+    
+    @staticmethod
+    def _build_metrics(
+        portfolio: Portfolio,
+        all_positions: List[Position],
+        total_dividends: Decimal,
+        total_fees: Decimal,
+    ) -> PortfolioMetrics:
+        """
+        Aggregate portfolio metrics from its positions (pure, no I/O)
+        
+        Args:
+            portfolio: Portfolio row (id and name)
+            all_positions: Held and sold positions, as get_positions(include_sold=True)
+            total_dividends: Dividends received
+            total_fees: Fees paid
+        """
+        positions = [pos for pos in all_positions if pos.quantity > 0]
         
         # Aggregate metrics
         total_value = Decimal(0)
@@ -241,24 +322,19 @@ class MetricsService:
             daily_change_pct = None
             total_daily_change = None
         
-        # Calculate realized P&L and dividends
         # Calculate realized P&L by summing up all sold positions
-        sold_positions = await self.get_positions(portfolio_id, include_sold=True)
         realized_pnl = sum(
-            pos.unrealized_pnl for pos in sold_positions 
+            pos.unrealized_pnl for pos in all_positions 
             if pos.quantity == 0 and pos.unrealized_pnl
         ) or Decimal(0)
         
-        total_dividends = self._calculate_total_dividends(portfolio_id)
-        total_fees = self._calculate_total_fees(portfolio_id)
-        
         # P&L percentage
         unrealized_pct = (
             (total_unrealized / total_cost * 100) if total_cost > 0 else Decimal(0)
         )
         
         return PortfolioMetrics(
-            portfolio_id=portfolio_id,
+            portfolio_id=portfolio.id,
             portfolio_name=portfolio.name,
             total_value=total_value,
             total_cost=total_cost,
@@ -273,336 +349,6 @@ class MetricsService:
             last_updated=datetime.utcnow()
         )
     
-    async def _calculate_position(
-        self, 
-        asset_id: int, 
-        transactions: List[Transaction],
-        portfolio_base_currency: Optional[str] = None,
-        include_sold: bool = False
-    ) -> Optional[Position]:
-        """
-        Calculate position for a single asset (async to fetch prices without blocking)
-        
-        Args:
-            asset_id: Asset ID
-            transactions: List of transactions for this asset
-            portfolio_base_currency: Portfolio base currency
-            include_sold: If True, calculate realized P&L for sold positions
-        """
-        asset = self.db.query(Asset).filter(Asset.id == asset_id).first()
-        if not asset:
-            return None
-        
-        quantity = Decimal(0)
-        total_cost = Decimal(0)
-        total_shares_for_cost = Decimal(0)
-        realized_pnl = Decimal(0)  # Track realized P&L for sold positions
-        # Track totals for sold position statistics
-        total_buy_cost = Decimal(0)  # Total cost of all buys
-        total_buy_shares = Decimal(0)  # Total shares bought
-        total_sell_proceeds = Decimal(0)  # Total proceeds from all sells
-        total_sell_shares = Decimal(0)  # Total shares sold
-        # Use the currency from the first BUY transaction (most common currency for this position)
-        position_currency = None
-        
-        for tx in transactions:
-            if tx.type in [TransactionType.BUY, TransactionType.TRANSFER_IN, TransactionType.CONVERSION_IN]:
-                # Set position currency from first BUY/CONVERSION_IN transaction
-                if position_currency is None:
-                    position_currency = tx.currency
-                quantity += tx.quantity
-                cost = (tx.quantity * tx.price) + tx.fees
-                total_cost += cost
-                total_shares_for_cost += tx.quantity
-                # Track for sold position stats
-                total_buy_cost += cost
-                total_buy_shares += tx.quantity
-                
-            elif tx.type in [TransactionType.SELL, TransactionType.TRANSFER_OUT, TransactionType.CONVERSION_OUT]:
-                quantity -= tx.quantity
-                # Calculate realized P&L and reduce cost basis proportionally (FIFO simplification)
-                if total_shares_for_cost > 0:
-                    avg_cost = total_cost / total_shares_for_cost
-                    cost_reduction = tx.quantity * avg_cost
-                    # Realized P&L = proceeds - cost basis
-                    proceeds = (tx.quantity * tx.price) - tx.fees
-                    realized_pnl += proceeds - cost_reduction
-                    total_cost -= cost_reduction
-                    total_shares_for_cost -= tx.quantity
-                # Track for sold position stats
-                total_sell_proceeds += (tx.quantity * tx.price) - tx.fees
-                total_sell_shares += tx.quantity
-                
-            elif tx.type == TransactionType.SPLIT:
-                # Handle stock split (e.g., 2:1 means double shares, half price)
-                split_ratio = self._parse_split_ratio(tx.meta_data.get("split", "1:1"))
-                quantity *= split_ratio
-                total_shares_for_cost *= split_ratio
-                # Cost basis stays the same, just spread over more shares
-                # Adjust buy shares for split
-                total_buy_shares *= split_ratio
-                total_sell_shares *= split_ratio
-        
-        # For sold positions, return with realized P&L and statistics
-        if include_sold and quantity <= 0:
-            # Calculate average buy and sell prices
-            avg_buy_price = total_buy_cost / total_buy_shares if total_buy_shares > 0 else Decimal(0)
-            avg_sell_price = total_sell_proceeds / total_sell_shares if total_sell_shares > 0 else Decimal(0)
-            
-            # Calculate realized P&L percentage
-            realized_pnl_pct = None
-            if total_buy_cost > 0:
-                realized_pnl_pct = (realized_pnl / total_buy_cost * 100)
-            
-            # Convert values to target currency if needed
-            target_currency = portfolio_base_currency or position_currency or asset.currency
-            if position_currency and position_currency != target_currency:
-                from app.services.currency import CurrencyService
-                converted_pnl = CurrencyService.convert(
-                    realized_pnl,
-                    from_currency=position_currency,
-                    to_currency=target_currency
-                )
-                converted_buy_price = CurrencyService.convert(
-                    avg_buy_price,
-                    from_currency=position_currency,
-                    to_currency=target_currency
-                )
-                converted_sell_price = CurrencyService.convert(
-                    avg_sell_price,
-                    from_currency=position_currency,
-                    to_currency=target_currency
-                )
-                if converted_pnl:
-                    realized_pnl = converted_pnl
-                if converted_buy_price:
-                    avg_buy_price = converted_buy_price
-                if converted_sell_price:
-                    avg_sell_price = converted_sell_price
-            
-            return Position(
-                asset_id=asset_id,
-                symbol=asset.symbol,
-                name=asset.name,
-                quantity=Decimal(0),  # Sold, so quantity is 0
-                avg_cost=avg_buy_price,  # Average buy price
-                current_price=avg_sell_price,  # Repurpose as average sell price
-                market_value=Decimal(0),
-                cost_basis=total_buy_cost if position_currency == target_currency else Decimal(0),
-                unrealized_pnl=realized_pnl,  # Use unrealized_pnl field for realized P&L
-                unrealized_pnl_pct=realized_pnl_pct,
-                daily_change_pct=None,
-                currency=target_currency,
-                last_updated=None,
-                asset_type=asset.asset_type
-            )
-        
-        if quantity <= 0:
-            return None
-        
-        # Get pricing and currency services
-        from app.services.pricing import PricingService
-        from app.services.currency import CurrencyService
-        pricing_service = PricingService(self.db)
-        
-        # Determine target currency: prefer portfolio base currency, fallback to position currency
-        target_currency = portfolio_base_currency or position_currency or asset.currency
-        
-        # Convert cost basis to target currency if needed
-        if position_currency and position_currency != target_currency:
-            logger.info(
-                f"Converting {asset.symbol} cost basis from {position_currency} to {target_currency}"
-            )
-            converted_cost = CurrencyService.convert(
-                total_cost,
-                from_currency=position_currency,
-                to_currency=target_currency
-            )
-            if converted_cost:
-                total_cost = converted_cost
-                logger.info(
-                    f"Converted cost basis for {asset.symbol} to {target_currency}"
-                )
-        
-        # Calculate average cost (PRU) in target currency
-        avg_cost = total_cost / quantity if quantity > 0 else Decimal(0)
-        
-        # Get current price and daily change from pricing service (async)
-        price_quote = await pricing_service.get_price(asset.symbol)
-        current_price = price_quote.price if price_quote else None
-        daily_change_pct = price_quote.daily_change_pct if price_quote else None
-        last_updated = price_quote.asof if price_quote else None
-        
-        # Convert current price to target currency if needed
-        if current_price and asset.currency != target_currency:
-            logger.info(
-                f"Converting {asset.symbol} price from {asset.currency} to {target_currency}"
-            )
-            converted_price = CurrencyService.convert(
-                current_price,
-                from_currency=asset.currency,
-                to_currency=target_currency
-            )
-            if converted_price:
-                current_price = converted_price
-                logger.info(
-                    f"Converted price for {asset.symbol}: "
-                    f"{price_quote.price} {asset.currency} -> {current_price} {target_currency}"
-                )
-            else:
-                logger.error(
-                    f"Failed to convert price for {asset.symbol} from "
-                    f"{asset.currency} to {target_currency}. Skipping this position to avoid incorrect valuation."
-                )
-                # Return None instead of using unconverted price to avoid massive valuation errors
-                return None
-        
-        # Calculate market value and P&L
-        market_value = quantity * current_price if current_price else None
-        unrealized_pnl = None
-        unrealized_pnl_pct = None
-        breakeven_gain_pct = None
-        breakeven_target_price = None
-        
-        if market_value:
-            unrealized_pnl = market_value - total_cost
-            unrealized_pnl_pct = (
-                (unrealized_pnl / total_cost * 100) if total_cost > 0 else Decimal(0)
-            )
-            
-            # Calculate breakeven metrics for negative positions
-            if unrealized_pnl < 0 and current_price and current_price > 0:
-                # Gain % needed to return to average cost
-                # If current price is below avg cost, calculate required gain %
-                # Formula: ((avg_cost - current_price) / current_price) * 100
-                breakeven_gain_pct = ((avg_cost - current_price) / current_price) * Decimal(100)
-                
-                # Target price to reach (it's simply the average cost)
-                breakeven_target_price = avg_cost
-        
-        # Advanced metrics moved to lazy-loaded endpoint
-        distance_to_ath_pct = None
-        avg_buy_zone_pct = None
-        personal_drawdown_pct = None
-        local_ath_price = None
-        local_ath_date = None
-        vol_contribution_pct = None  # Will be calculated at portfolio level
-        cost_to_average_down = None
-        
-        # Convert ATH price to target currency for display
-        ath_price_display = asset.ath_price
-        if asset.ath_price and asset.currency != target_currency:
-            # Try historical rate first if date available
-            if asset.ath_date:
-                converted_ath_display = CurrencyService.convert_historical(
-                    asset.ath_price,
-                    from_currency=asset.currency,
-                    to_currency=target_currency,
-                    date=asset.ath_date
-                )
-                if not converted_ath_display:
-                    # Fallback to current rate
-                    converted_ath_display = CurrencyService.convert(
-                        asset.ath_price,
-                        from_currency=asset.currency,
-                        to_currency=target_currency
-                    )
-            else:
-                # No date, use current rate
-                converted_ath_display = CurrencyService.convert(
-                    asset.ath_price,
-                    from_currency=asset.currency,
-                    to_currency=target_currency
-                )
-            
-            if converted_ath_display:
-                ath_price_display = converted_ath_display
-        
-        return Position(
-            asset_id=asset_id,
-            symbol=asset.symbol,
-            name=asset.name,
-            quantity=quantity,
-            avg_cost=avg_cost,
-            current_price=current_price,
-            market_value=market_value,
-            cost_basis=total_cost,
-            unrealized_pnl=unrealized_pnl,
-            unrealized_pnl_pct=unrealized_pnl_pct,
-            daily_change_pct=daily_change_pct,
-            breakeven_gain_pct=breakeven_gain_pct,
-            breakeven_target_price=breakeven_target_price,
-            distance_to_ath_pct=distance_to_ath_pct,
-            avg_buy_zone_pct=avg_buy_zone_pct,
-            personal_drawdown_pct=personal_drawdown_pct,
-            local_ath_price=local_ath_price,
-            local_ath_date=local_ath_date,
-            vol_contribution_pct=vol_contribution_pct,
-            cost_to_average_down=cost_to_average_down,
-            ath_price=ath_price_display,  # Return ATH in target currency
-            ath_price_native=asset.ath_price,  # Return ATH in native currency
-            ath_currency=asset.currency,  # Asset's native currency
-            ath_date=asset.ath_date,
-            relative_perf_30d=None,  # Lazy-loaded via separate endpoint
-            relative_perf_90d=None,
-            relative_perf_ytd=None,
-            relative_perf_1y=None,
-            sector=asset.sector,
-            industry=asset.industry,
-            sector_etf=None,  # Will be populated on-demand
-            currency=target_currency,  # Use portfolio base currency if available
-            last_updated=last_updated,
-            asset_type=asset.asset_type
-        )
-    
-    def _calculate_realized_pnl(self, portfolio_id: int) -> Decimal:
-        """
-        DEPRECATED: This method doesn't account for splits properly.
-        Use get_positions(portfolio_id, include_sold=True) instead.
-        
-        Calculate realized P&L from SELL transactions
-        """
-        # NOTE: This simplified calculation doesn't handle splits correctly
-        # The metrics now use the accurate calculation from get_positions()
-        # which properly tracks all transactions chronologically including splits
-        
-        sells = (
-            self.db.query(Transaction)
-            .filter(
-                Transaction.portfolio_id == portfolio_id,
-                Transaction.type == TransactionType.SELL
-            )
-            .all()
-        )
-        
-        total_realized = Decimal(0)
-        
-        for sell in sells:
-            # Get average cost at time of sale (simplified)
-            buys = (
-                self.db.query(Transaction)
-                .filter(
-                    Transaction.portfolio_id == portfolio_id,
-                    Transaction.asset_id == sell.asset_id,
-                    Transaction.type == TransactionType.BUY,
-                    Transaction.tx_date <= sell.tx_date
-                )
-                .all()
-            )
-            
-            if buys:
-                total_qty = sum(b.quantity for b in buys)
-                total_cost = sum(b.quantity * b.price + b.fees for b in buys)
-                avg_cost = total_cost / total_qty if total_qty > 0 else Decimal(0)
-                
-                # Realized P&L = (sell_price * qty - fees) - (avg_cost * qty)
-                proceeds = (sell.price * sell.quantity) - sell.fees
-                cost_basis = avg_cost * sell.quantity
-                realized = proceeds - cost_basis
-                total_realized += realized
-        
-        return total_realized
-    
     def _calculate_total_dividends(self, portfolio_id: int) -> Decimal:
         """Calculate total dividends received (uses pre-calculated cache if available)"""
         # Use pre-calculated value from transaction loop if available
@@ -638,30 +384,32 @@ class MetricsService:
         """
         Parse split ratio string (e.g., "2:1" -> 2.0, "1:2" -> 0.5)
         """
-        try:
-            parts = split_str.split(":")
-            if len(parts) == 2:
-                numerator = Decimal(parts[0])
-                denominator = Decimal(parts[1])
-                return numerator / denominator
-        except:
-            pass
-        return Decimal(1)
+        return parse_split_ratio(split_str)
 
 
+    async def get_portfolio_history_shared(self, portfolio_id: int, interval: str = "daily") -> list:
+        """
+        get_portfolio_history() on the session's thread, computed by one
+        process at a time per portfolio and interval (single flight)
+        """
+        return await single_flight(
+            f"history:{portfolio_id}:{interval}",
+            lambda: run_db(self.db, self.get_portfolio_history, portfolio_id, interval),
+            lease_seconds=_HISTORY_LEASE_SECONDS,
+        )
+
     def get_portfolio_history(self, portfolio_id: int, interval: str = "daily") -> list:
         """
         Return portfolio value history for charting using saved closing prices
         - Uses historical closing prices from asset_price table (yfinance_history source)
         - Calculates portfolio value at each date by: quantity * closing_price (in portfolio currency)
-        - Handles currency conversion to portfolio base currency
+        - Converts to portfolio base currency at each day's historical rate
         - IMPORTANT: Does NOT manually apply splits because Yahoo Finance prices are already split-adjusted
         """
         from app.schemas import PortfolioHistoryPoint
         from datetime import timedelta, date, datetime
         from app.models import Portfolio as PortfolioModel
-        from app.crud import prices as crud_prices
-        from app.services.currency import CurrencyService
+        from app.services.portfolio_history import build_history_points
         from collections import defaultdict
         
         portfolio = self.db.query(PortfolioModel).filter_by(id=portfolio_id).first()
@@ -684,22 +432,8 @@ class MetricsService:
         today: date = datetime.utcnow().date()
         first_tx_date: date = transactions[0].tx_date
         
-        if interval == "1W":
-            start_date = max(first_tx_date, today - timedelta(days=7))
-        elif interval == "1M":
-            start_date = max(first_tx_date, today - timedelta(days=30))
-        elif interval == "3M":
-            start_date = max(first_tx_date, today - timedelta(days=90))
-        elif interval == "6M":
-            start_date = max(first_tx_date, today - timedelta(days=180))
-        elif interval == "YTD":
-            start_date = max(first_tx_date, date(today.year, 1, 1))
-        elif interval == "1Y":
-            start_date = max(first_tx_date, today - timedelta(days=365))
-        elif interval == "ALL":
-            start_date = first_tx_date
-        else:  # default to 1M
-            start_date = max(first_tx_date, today - timedelta(days=30))
+        window_start = history_window_start(interval, today)
+        start_date = max(first_tx_date, window_start) if window_start else first_tx_date
         
         end_date = today
         
@@ -707,214 +441,53 @@ class MetricsService:
         asset_ids = list(set(tx.asset_id for tx in transactions))
         
         # Load all assets to get their currencies
-        assets_dict = {}
-        for asset_id in asset_ids:
-            asset = self.db.query(Asset).filter(Asset.id == asset_id).first()
-            if asset:
-                assets_dict[asset_id] = asset
+        assets_dict = {
+            asset.id: asset
+            for asset in self.db.query(Asset).filter(Asset.id.in_(asset_ids)).all()
+        }
+        
+        # Historical rate series for every asset currency, loaded (and backfilled) once
+        fx_history = FxHistoryStore(self.db)
+        fx_history.load(
+            {asset.currency for asset in assets_dict.values()} | {portfolio_currency}, start_date
+        )
         
-        # Fetch all prices for all assets in the date range
-        asset_prices_dict: Dict[int, Dict[date, Decimal]] = defaultdict(dict)
+        # Fetch one daily close per asset and day (official close preferred) in one query
+        daily_closes = crud_prices.get_daily_closes(
+            self.db,
+            asset_ids,
+            date_from=datetime.combine(start_date, datetime.min.time()),
+            date_to=datetime.combine(end_date, datetime.max.time())
+        )
         
-        for asset_id in asset_ids:
-            prices = crud_prices.get_prices(
-                self.db,
-                asset_id,
-                date_from=datetime.combine(start_date, datetime.min.time()),
-                date_to=datetime.combine(end_date, datetime.max.time()),
-                limit=10000
-            )
+        asset_prices_dict: Dict[int, Dict[date, Decimal]] = defaultdict(dict)
+        for asset_id, closes in daily_closes.items():
+            asset = assets_dict.get(asset_id)
+            days = [close.asof.date() for close in closes]
+            prices = [close.price for close in closes]
             
-            # Group by date and prefer yfinance_history source (official closing prices)
-            prices_by_date = defaultdict(list)
-            for price in prices:
-                price_date = price.asof.date()
-                prices_by_date[price_date].append(price)
+            # Convert each close at the rate of its own day (native price if no rate)
+            if asset and asset.currency != portfolio_currency:
+                converted = fx_history.convert_series(prices, days, asset.currency, portfolio_currency)
+                prices = [c if c is not None else p for c, p in zip(converted, prices)]
             
-            # For each date, prefer yfinance_history source, then take the latest price
-            for price_date, day_prices in prices_by_date.items():
-                history_prices = [p for p in day_prices if p.source == 'yfinance_history']
-                if history_prices:
-                    best_price = max(history_prices, key=lambda p: p.asof)
-                else:
-                    best_price = max(day_prices, key=lambda p: p.asof)
-                
-                # Convert price to portfolio currency if needed
-                price_value = best_price.price
-                asset = assets_dict.get(asset_id)
-                if asset and asset.currency != portfolio_currency:
-                    converted_price = CurrencyService.convert(
-                        price_value,
-                        from_currency=asset.currency,
-                        to_currency=portfolio_currency
-                    )
-                    if converted_price:
-                        price_value = converted_price
-                
-                asset_prices_dict[asset_id][price_date] = price_value
+            asset_prices_dict[asset_id] = dict(zip(days, prices))
         
         # Build a set of all unique dates that have at least one price
         all_dates = set()
         for asset_id in asset_ids:
             all_dates.update(asset_prices_dict[asset_id].keys())
         
-        # Sort dates
-        sorted_dates = sorted(all_dates)
-        
-        # HYBRID APPROACH - The correct solution:
-        # 1. Track holdings using dashboard logic (splits applied chronologically)
-        # 2. When calculating value, compensate for Yahoo's retroactive price adjustments
-        #
-        # For each asset, calculate the "price adjustment factor" - the cumulative
-        # effect of splits that have occurred AFTER the current date in the loop.
-        # This compensates for Yahoo's retroactive adjustments.
-        
-        # Pre-calculate when each split occurs for each asset
-        asset_splits: Dict[int, List[Tuple[date, Decimal]]] = defaultdict(list)
-        for tx in transactions:
-            if tx.type == TransactionType.SPLIT:
-                ratio = self._parse_split_ratio((tx.meta_data or {}).get("split", "1:1"))
-                asset_splits[tx.asset_id].append((tx.tx_date, ratio))
-        
-        # Track holdings, applying splits AS they occur chronologically
-        # Also track total invested amount (cash flow) AND cost basis of current holdings
-        holdings: Dict[int, Decimal] = defaultdict(lambda: Decimal(0))
-        cost_basis: Dict[int, Decimal] = defaultdict(lambda: Decimal(0))  # Track cost basis per asset
-        total_invested = Decimal(0)  # Running total of net cash invested (includes sold positions)
-        history: List[PortfolioHistoryPoint] = []
-        tx_idx = 0
-        
-        logger.info("Portfolio history: Hybrid approach with split compensation")
-        
-        for current_date in sorted_dates:
-            # Process ALL transactions including SPLITs up to current_date
-            while tx_idx < len(transactions) and transactions[tx_idx].tx_date <= current_date:
-                tx = transactions[tx_idx]
-                
-                if tx.type in [TransactionType.BUY, TransactionType.TRANSFER_IN, TransactionType.CONVERSION_IN]:
-                    holdings[tx.asset_id] += tx.quantity
-                    # Add to cost basis for this asset
-                    cost_basis[tx.asset_id] += (tx.quantity * tx.price) + tx.fees
-                    # Add cost to invested amount (quantity * price + fees) - but not for conversions (they're swaps)
-                    if tx.type != TransactionType.CONVERSION_IN:
-                        total_invested += (tx.quantity * tx.price) + tx.fees
-                elif tx.type in [TransactionType.SELL, TransactionType.TRANSFER_OUT, TransactionType.CONVERSION_OUT]:
-                    # Calculate the proportion of position being sold
-                    if holdings[tx.asset_id] > 0:
-                        # Prevent overselling - cap at 100% of holdings
-                        actual_quantity_sold = min(tx.quantity, holdings[tx.asset_id])
-                        if tx.quantity > holdings[tx.asset_id]:
-                            logger.warning(
-                                f"OVERSELLING detected on {current_date}: Asset {tx.asset_id}, "
-                                f"trying to sell {float(tx.quantity):.8f} but only have {float(holdings[tx.asset_id]):.8f}. "
-                                f"Capping at holdings amount."
-                            )
-                        
-                        sell_proportion = actual_quantity_sold / holdings[tx.asset_id]
-                        # Calculate the cost basis being removed
-                        cost_removed = cost_basis[tx.asset_id] * sell_proportion
-                        # Reduce cost basis proportionally
-                        cost_basis[tx.asset_id] -= cost_removed
-                        # Subtract the cost basis (not proceeds) from invested amount - but not for conversions
-                        if tx.type != TransactionType.CONVERSION_OUT:
-                            total_invested -= cost_removed
-                        holdings[tx.asset_id] -= actual_quantity_sold
-                    else:
-                        # Trying to sell with no holdings - skip this transaction
-                        logger.warning(
-                            f"INVALID SELL on {current_date}: Asset {tx.asset_id}, "
-                            f"no holdings to sell (tried to sell {float(tx.quantity):.8f})"
-                        )
-                elif tx.type == TransactionType.SPLIT:
-                    # Apply split to holdings (dashboard logic)
-                    # Splits don't affect cost basis or invested amount
-                    ratio = self._parse_split_ratio((tx.meta_data or {}).get("split", "1:1"))
-                    holdings[tx.asset_id] *= ratio
-                
-                tx_idx += 1
-            
-            # Calculate value, compensating for Yahoo's retroactive adjustments
-            total_value = Decimal(0)
-            daily_breakdown = []
-            
-            for asset_id, quantity in holdings.items():
-                if quantity <= 0:
-                    continue
-                
-                # Get price for this date, or the most recent price before it
-                price = None
-                if current_date in asset_prices_dict[asset_id]:
-                    price = asset_prices_dict[asset_id][current_date]
-                else:
-                    # Find the most recent price before current_date
-                    available_dates = sorted([d for d in asset_prices_dict[asset_id].keys() if d <= current_date])
-                    if available_dates:
-                        price = asset_prices_dict[asset_id][available_dates[-1]]
-                
-                if price is not None:
-                    # Calculate the adjustment factor: product of all splits AFTER current_date
-                    # This compensates for Yahoo's retroactive price adjustments
-                    adjustment_factor = Decimal(1)
-                    for split_date, ratio in asset_splits.get(asset_id, []):
-                        if split_date > current_date:
-                            # This split happened in the future, but Yahoo has already
-                            # adjusted the price backwards. We need to multiply quantity
-                            # by the ratio to compensate.
-                            adjustment_factor *= ratio
-                    
-                    adjusted_quantity = quantity * adjustment_factor
-                    value = adjusted_quantity * price
-                    total_value += value
-                    
-                    # Log for Sept 1 debugging
-                    if current_date.month == 9 and current_date.day == 1:
-                        daily_breakdown.append(f"Asset {asset_id}: {float(quantity):.4f} × {float(adjustment_factor):.4f} × €{float(price):.2f} = €{float(value):.2f}")
-            
-            # Log Sept 1 details
-            if current_date.month == 9 and current_date.day == 1 and total_value < 6000:
-                logger.info(f"LOW VALUE on {current_date}: Total €{float(total_value):.2f}")
-                for detail in daily_breakdown:
-                    logger.info(f"  {detail}")
-            
-            # Calculate total cost basis of current holdings
-            total_cost_basis = sum(cost_basis[asset_id] for asset_id in holdings.keys() if holdings[asset_id] > 0)
-            
-            # DEBUG: Log cost_basis calculation for troubleshooting
-            if total_cost_basis == 0 and total_value > 0:
-                logger.warning(f"ZERO cost_basis on {current_date} despite having value €{float(total_value):.2f}")
-                logger.warning(f"  Holdings: {dict(holdings)}")
-                logger.warning(f"  Cost basis per asset: {dict(cost_basis)}")
-            
-            # Calculate gain percentage (value vs invested, excluding deposits/withdrawals)
-            gain_pct = None
-            if total_invested > 0:
-                gain = total_value - total_invested
-                gain_pct = float((gain / total_invested) * 100)
-            elif total_invested < 0:
-                # This should never happen - log for debugging
-                logger.warning(f"NEGATIVE total_invested on {current_date}: {float(total_invested):.2f}, value: {float(total_value):.2f}")
-                # Set gain_pct to None to avoid invalid calculations
-                gain_pct = None
-            
-            # Calculate unrealized P&L percentage (current holdings only, matches Dashboard)
-            unrealized_pnl_pct = None
-            if total_cost_basis > 0:
-                unrealized_gain = total_value - total_cost_basis
-                unrealized_pnl_pct = float((unrealized_gain / total_cost_basis) * 100)
-            elif total_cost_basis < 0:
-                # This should never happen - log for debugging
-                logger.warning(f"NEGATIVE cost_basis on {current_date}: {float(total_cost_basis):.2f}, value: {float(total_value):.2f}")
-                unrealized_pnl_pct = None
-            
-            point = PortfolioHistoryPoint(
-                date=current_date.isoformat(),
-                value=float(total_value),
-                invested=float(total_invested),
-                gain_pct=gain_pct,
-                cost_basis=float(total_cost_basis),
-                unrealized_pnl_pct=unrealized_pnl_pct
-            )
-            history.append(point)
+        # HYBRID APPROACH - holdings follow the dashboard logic (splits applied
+        # chronologically) and values compensate for Yahoo's retroactive
+        # split adjustments. See app.services.portfolio_history for the
+        # vectorized implementation and its parity tolerance.
+        history: List[PortfolioHistoryPoint] = build_history_points(
+            sorted(all_dates),
+            asset_prices_dict,
+            transactions,
+            self._parse_split_ratio,
+        )
         
         if history:
             logger.info(f"Portfolio history final value: €{history[-1].value:.2f} on {history[-1].date}")
@@ -938,6 +511,32 @@ class MetricsService:
         return history
 
 
+    def get_portfolio_histories(self, portfolio_id: int, intervals: List[str]) -> Dict[str, list]:
+        """
+        Return the history of several intervals from one history calculation
+        
+        Only the widest interval is computed; the others are its points from
+        their own window start on. Unlike separate get_portfolio_history()
+        calls, an asset without a close on the first day of a narrow window
+        is valued at its last earlier close instead of being left out.
+        """
+        today = datetime.utcnow().date()
+        starts = {interval: history_window_start(interval, today) for interval in intervals}
+        widest = min(intervals, key=lambda interval: starts[interval] or date.min)
+        history = self.get_portfolio_history(portfolio_id, widest)
+        
+        # "ALL" starts with a synthetic zero point that belongs to no other window
+        points = history[1:] if widest == "ALL" and history else history
+        
+        histories = {}
+        for interval in intervals:
+            start = starts[interval]
+            if start is None or interval == widest:
+                histories[interval] = history
+            else:
+                histories[interval] = [p for p in points if date.fromisoformat(p.date) >= start]
+        return histories
+
     async def get_position_detailed_metrics(
         self,
         portfolio_id: int,
@@ -955,6 +554,22 @@ class MetricsService:
         return await position_details_service.get_position_detailed_metrics(portfolio_id, asset_id)
 
 
+def history_window_start(interval: str, today: date) -> Optional[date]:
+    """First date of a history interval ending today (None for "ALL", unknown intervals are 1M)"""
+    if interval == "ALL":
+        return None
+    if interval == "YTD":
+        return date(today.year, 1, 1)
+    days = {"1W": 7, "1M": 30, "3M": 90, "6M": 180, "1Y": 365}.get(interval, 30)
+    return today - timedelta(days=days)
+
+
+async def _refresh_cached_positions(portfolio_id: int) -> None:
+    """Background refresh of a stale positions entry, on its own session"""
+    with get_db_context() as db:
+        await MetricsService(db).refresh_cached_positions(portfolio_id)
+
+
 def get_metrics_service(db: Session = Depends(get_db)) -> MetricsService:
     """Dependency for getting metrics service"""
     return MetricsService(db)
@@ -0,0 +1,271 @@
+"""
+Vectorized portfolio history engine
+
+Computes the value / invested / cost-basis series behind
+MetricsService.get_portfolio_history() as NumPy array operations:
+
+1. Ledger pass - one sequential walk over the transactions (O(transactions)),
+   in Decimal so holdings signs, oversell capping and proportional cost-basis
+   removal behave exactly like the dashboard logic
+2. Price matrix - dense date x asset matrix, forward-filled along the date axis
+3. Holdings / cost-basis matrices - state after the last transaction on or
+   before each date, looked up with searchsorted
+4. Split factors - product of the splits still *ahead* of each date (Yahoo
+   prices are retroactively split-adjusted), via a suffix product
+5. Series - value = sum(holdings * factor * price) over held assets
+
+Tolerance: value, invested and cost_basis match the per-date Decimal loop to
+a relative error of HISTORY_RTOL (float64 products and sums instead of Decimal).
+gain_pct and unrealized_pnl_pct are derived from those and match to the same
+relative tolerance; None/not-None decisions are identical because all sign
+checks use the Decimal ledger.
+"""
+import logging
+import math
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from app.models import Transaction, TransactionType
+from app.schemas import PortfolioHistoryPoint
+
+logger = logging.getLogger(__name__)
+
+# Documented parity tolerance against the reference Decimal implementation
+HISTORY_RTOL = 1e-9
+
+_INFLOW_TYPES = (TransactionType.BUY, TransactionType.TRANSFER_IN, TransactionType.CONVERSION_IN)
+_OUTFLOW_TYPES = (TransactionType.SELL, TransactionType.TRANSFER_OUT, TransactionType.CONVERSION_OUT)
+
+
+def _ledger(
+    transactions: Sequence[Transaction],
+    columns: Dict[int, int],
+    split_ratio: Callable[[str], Decimal],
+) -> Dict[str, np.ndarray]:
+    """
+    Walk transactions once and record the state of the touched asset after each one
+
+    Returns arrays indexed by transaction: date ordinal, asset column, holdings
+    after, holdings-positive flag, cost basis after and running total invested,
+    plus the transaction rows and ratios of all splits.
+    """
+    tx_ord: List[int] = []
+    tx_col: List[int] = []
+    hold_after: List[float] = []
+    held_after: List[bool] = []
+    cost_after: List[float] = []
+    invested_after: List[float] = []
+    split_rows: List[int] = []
+    split_ratios: List[float] = []
+
+    holdings = [Decimal(0)] * len(columns)
+    cost_basis = [Decimal(0)] * len(columns)
+    total_invested = Decimal(0)
+
+    for i, tx in enumerate(transactions):
+        j = columns[tx.asset_id]
+
+        if tx.type in _INFLOW_TYPES:
+            holdings[j] += tx.quantity
+            cost = (tx.quantity * tx.price) + tx.fees
+            cost_basis[j] += cost
+            # Conversions are swaps, not new money
+            if tx.type != TransactionType.CONVERSION_IN:
+                total_invested += cost
+        elif tx.type in _OUTFLOW_TYPES:
+            if holdings[j] > 0:
+                # Prevent overselling - cap at 100% of holdings
+                actual_quantity_sold = min(tx.quantity, holdings[j])
+                if tx.quantity > holdings[j]:
+                    logger.warning(
+                        f"OVERSELLING detected on {tx.tx_date}: Asset {tx.asset_id}, "
+                        f"trying to sell {float(tx.quantity):.8f} but only have {float(holdings[j]):.8f}. "
+                        f"Capping at holdings amount."
+                    )
+                cost_removed = cost_basis[j] * (actual_quantity_sold / holdings[j])
+                cost_basis[j] -= cost_removed
+                if tx.type != TransactionType.CONVERSION_OUT:
+                    total_invested -= cost_removed
+                holdings[j] -= actual_quantity_sold
+            else:
+                logger.warning(
+                    f"INVALID SELL on {tx.tx_date}: Asset {tx.asset_id}, "
+                    f"no holdings to sell (tried to sell {float(tx.quantity):.8f})"
+                )
+        elif tx.type == TransactionType.SPLIT:
+            # Splits change holdings only, never cost basis or invested amount
+            ratio = split_ratio((tx.meta_data or {}).get("split", "1:1"))
+            holdings[j] *= ratio
+            split_rows.append(i)
+            split_ratios.append(float(ratio))
+
+        tx_ord.append(tx.tx_date.toordinal())
+        tx_col.append(j)
+        hold_after.append(float(holdings[j]))
+        held_after.append(holdings[j] > 0)
+        cost_after.append(float(cost_basis[j]))
+        invested_after.append(float(total_invested))
+
+    return {
+        "ord": np.array(tx_ord, dtype=np.int64),
+        "col": np.array(tx_col, dtype=np.int64),
+        "holdings": np.array(hold_after, dtype=np.float64),
+        "held": np.array(held_after, dtype=bool),
+        "cost_basis": np.array(cost_after, dtype=np.float64),
+        "invested": np.array(invested_after, dtype=np.float64),
+        "split_rows": np.array(split_rows, dtype=np.int64),
+        "split_ratios": np.array(split_ratios, dtype=np.float64),
+    }
+
+
+def _price_matrix(
+    dates: Sequence[date],
+    prices: Dict[int, Dict[date, Decimal]],
+    columns: Dict[int, int],
+) -> np.ndarray:
+    """Dense date x asset price matrix, forward-filled; NaN before an asset's first price"""
+    matrix = np.full((len(dates), len(columns)), np.nan)
+    row_of = {d: k for k, d in enumerate(dates)}
+
+    rows: List[int] = []
+    cols: List[int] = []
+    values: List[float] = []
+    for asset_id, by_date in prices.items():
+        j = columns.get(asset_id)
+        if j is None:
+            continue
+        for price_date, price in by_date.items():
+            k = row_of.get(price_date)
+            if k is not None:
+                rows.append(k)
+                cols.append(j)
+                values.append(float(price))
+    matrix[rows, cols] = values
+
+    # Forward-fill: index of the last observed row for every cell
+    last_seen = np.where(~np.isnan(matrix), np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(last_seen, axis=0, out=last_seen)
+    return matrix[last_seen, np.arange(len(columns))]
+
+
+def compute_history_series(
+    dates: Sequence[date],
+    prices: Dict[int, Dict[date, Decimal]],
+    transactions: Sequence[Transaction],
+    split_ratio: Callable[[str], Decimal],
+) -> Dict[str, np.ndarray]:
+    """
+    Compute per-date portfolio series
+
+    Args:
+        dates: Sorted chart dates (every date with at least one price)
+        prices: asset_id -> {date: close in portfolio currency}
+        transactions: Portfolio transactions ordered by tx_date, created_at
+        split_ratio: Parser for SPLIT meta_data ratios (e.g. "2:1" -> 2)
+
+    Returns:
+        Dict of float arrays (value, invested, cost_basis) and bool arrays
+        (invested_positive, invested_negative, cost_basis_positive,
+        cost_basis_negative), each of length len(dates)
+    """
+    asset_ids = sorted({tx.asset_id for tx in transactions})
+    columns = {asset_id: j for j, asset_id in enumerate(asset_ids)}
+    n_dates, n_assets = len(dates), len(asset_ids)
+    date_ord = np.fromiter((d.toordinal() for d in dates), dtype=np.int64, count=n_dates)
+
+    ledger = _ledger(transactions, columns, split_ratio)
+    price = _price_matrix(dates, prices, columns)
+
+    holdings = np.zeros((n_dates, n_assets))
+    held = np.zeros((n_dates, n_assets), dtype=bool)
+    cost_basis = np.zeros((n_dates, n_assets))
+    factor = np.ones((n_dates, n_assets))
+
+    for j in range(n_assets):
+        mine = np.flatnonzero(ledger["col"] == j)
+        # Last transaction of this asset on or before each date (-1 = none yet)
+        last = np.searchsorted(ledger["ord"][mine], date_ord, side="right") - 1
+        seen = last >= 0
+        picked = mine[last[seen]]
+        holdings[seen, j] = ledger["holdings"][picked]
+        held[seen, j] = ledger["held"][picked]
+        cost_basis[seen, j] = ledger["cost_basis"][picked]
+
+        splits = ledger["split_rows"][ledger["col"][ledger["split_rows"]] == j]
+        if len(splits):
+            split_ord = ledger["ord"][splits]
+            ratios = ledger["split_ratios"][np.searchsorted(ledger["split_rows"], splits)]
+            # suffix[n] = product of ratios of splits n.. (splits after the first n)
+            suffix = np.append(np.cumprod(ratios[::-1])[::-1], 1.0)
+            factor[:, j] = suffix[np.searchsorted(split_ord, date_ord, side="right")]
+
+    priced = held & ~np.isnan(price)
+    value = np.where(priced, holdings * factor * np.where(priced, price, 0.0), 0.0).sum(axis=1)
+    total_cost_basis = np.where(held, cost_basis, 0.0).sum(axis=1)
+
+    last_tx = np.searchsorted(ledger["ord"], date_ord, side="right") - 1
+    invested = np.where(last_tx >= 0, ledger["invested"][np.maximum(last_tx, 0)], 0.0)
+
+    return {
+        "value": value,
+        "invested": invested,
+        "cost_basis": total_cost_basis,
+        "invested_positive": invested > 0,
+        "invested_negative": invested < 0,
+        "cost_basis_positive": total_cost_basis > 0,
+        "cost_basis_negative": total_cost_basis < 0,
+    }
+
+
+def build_history_points(
+    dates: Sequence[date],
+    prices: Dict[int, Dict[date, Decimal]],
+    transactions: Sequence[Transaction],
+    split_ratio: Callable[[str], Decimal],
+) -> List[PortfolioHistoryPoint]:
+    """Build PortfolioHistoryPoint list from compute_history_series() (same arguments)"""
+    if not dates or not transactions:
+        return []
+
+    series = compute_history_series(dates, prices, transactions, split_ratio)
+    value = series["value"]
+    invested = series["invested"]
+    cost_basis = series["cost_basis"]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gain_pct = np.where(series["invested_positive"], (value - invested) / invested * 100, np.nan)
+        unrealized_pct = np.where(series["cost_basis_positive"], (value - cost_basis) / cost_basis * 100, np.nan)
+
+    if series["invested_negative"].any():
+        first = int(np.argmax(series["invested_negative"]))
+        logger.warning(
+            f"NEGATIVE total_invested on {int(series['invested_negative'].sum())} dates "
+            f"(first {dates[first]}: {invested[first]:.2f})"
+        )
+    if series["cost_basis_negative"].any():
+        first = int(np.argmax(series["cost_basis_negative"]))
+        logger.warning(
+            f"NEGATIVE cost_basis on {int(series['cost_basis_negative'].sum())} dates "
+            f"(first {dates[first]}: {cost_basis[first]:.2f})"
+        )
+
+    values = value.tolist()
+    invested_list = invested.tolist()
+    cost_list = cost_basis.tolist()
+    gains = gain_pct.tolist()
+    unrealized = unrealized_pct.tolist()
+
+    return [
+        PortfolioHistoryPoint(
+            date=d.isoformat(),
+            value=values[k],
+            invested=invested_list[k],
+            gain_pct=None if math.isnan(gains[k]) else gains[k],
+            cost_basis=cost_list[k],
+            unrealized_pnl_pct=None if math.isnan(unrealized[k]) else unrealized[k],
+        )
+        for k, d in enumerate(dates)
+    ]
@@ -0,0 +1,344 @@
+"""
+Pure position calculator
+
+Turns a folded PositionState into a Position schema. Everything the
+calculation needs is passed in: the asset row, the price quote already
+fetched for it and an FxRates table resolved up front. The calculator never
+touches the database, Redis or Yahoo Finance. MetricsService resolves those
+inputs in batch (one snapshot query, one get_multiple_prices() call, one
+FX matrix) and runs the calculator once per position.
+"""
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models import Asset
+from app.schemas import Position, PriceQuote
+from app.services.position_state import PositionState
+
+logger = logging.getLogger(__name__)
+
+
+class FxRates:
+    """
+    Pre-resolved exchange rates used by calculate_position()
+
+    Same contract as CurrencyService.convert / convert_historical (None when
+    a rate is unavailable) without any I/O.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[Dict[Tuple[str, str], Optional[Decimal]]] = None,
+        historical: Optional[Dict[Tuple[str, str, date], Optional[Decimal]]] = None,
+    ):
+        self.rates = dict(rates or {})
+        self.historical = dict(historical or {})
+
+    @classmethod
+    def resolve(
+        cls,
+        pairs: Iterable[Tuple[str, str]],
+        historical_pairs: Iterable[Tuple[str, str, date]] = (),
+        db: Optional[Session] = None,
+    ) -> "FxRates":
+        """
+        Resolve current rates as one FX matrix and historical rates in batch
+
+        Historical rates come from the FX series store when a session is given,
+        otherwise each distinct pair is fetched once through CurrencyService.
+        """
+        from app.services.currency import CurrencyService
+        from app.services.fx_history import FxHistoryStore
+
+        rates = dict(CurrencyService.get_rate_matrix(pairs).rates)
+        if db is not None:
+            return cls(rates, FxHistoryStore(db).resolve(historical_pairs))
+
+        historical = {}
+        for from_currency, to_currency, on in set(historical_pairs):
+            if from_currency and to_currency and from_currency != to_currency:
+                historical[(from_currency, to_currency, on)] = CurrencyService.get_historical_exchange_rate(
+                    from_currency, to_currency, on
+                )
+        return cls(rates, historical)
+
+    def convert(self, amount: Decimal, from_currency: str, to_currency: str) -> Optional[Decimal]:
+        """Convert with the current rate (None if the pair is not resolved)"""
+        if from_currency == to_currency:
+            return amount
+        rate = self.rates.get((from_currency, to_currency))
+        return amount * rate if rate is not None else None
+
+    def convert_historical(
+        self, amount: Decimal, from_currency: str, to_currency: str, date: datetime
+    ) -> Optional[Decimal]:
+        """Convert with the rate of a given date (None if the pair is not resolved)"""
+        if from_currency == to_currency:
+            return amount
+        rate = self.historical.get((from_currency, to_currency, date))
+        return amount * rate if rate is not None else None
+
+
+def fx_requirements(
+    asset: Asset,
+    state: PositionState,
+    portfolio_base_currency: Optional[str] = None,
+) -> Tuple[Set[Tuple[str, str]], Set[Tuple[str, str, date]]]:
+    """
+    Currency pairs calculate_position() may need for one position
+
+    Returns:
+        (current (from, to) pairs, historical (from, to, date) pairs)
+    """
+    target_currency = portfolio_base_currency or state.position_currency or asset.currency
+    pairs = set()
+    historical = set()
+    if state.position_currency and state.position_currency != target_currency:
+        pairs.add((state.position_currency, target_currency))
+    if state.quantity > 0 and asset.currency != target_currency:
+        pairs.add((asset.currency, target_currency))
+        if asset.ath_price and asset.ath_date:
+            historical.add((asset.currency, target_currency, asset.ath_date))
+    return pairs, historical
+
+
+def calculate_position(
+    asset: Asset,
+    state: PositionState,
+    quote: Optional[PriceQuote],
+    fx: FxRates,
+    portfolio_base_currency: Optional[str] = None,
+    include_sold: bool = False,
+) -> Optional[Position]:
+    """
+    Build the position of a single asset from its folded state
+
+    Args:
+        asset: Asset row (symbol, currency, ATH, sector, ...)
+        state: Folded position state (snapshot or replay)
+        quote: Current price quote of the asset (None if unavailable)
+        fx: Exchange rates covering fx_requirements() of this position
+        portfolio_base_currency: Portfolio base currency
+        include_sold: If True, calculate realized P&L for sold positions
+
+    Returns:
+        Position, or None when nothing is held (unless include_sold) or the
+        price cannot be converted to the target currency
+    """
+    quantity = state.quantity
+    total_cost = state.total_cost
+    realized_pnl = state.realized_pnl
+    total_buy_cost = state.total_buy_cost
+    total_buy_shares = state.total_buy_shares
+    total_sell_proceeds = state.total_sell_proceeds
+    total_sell_shares = state.total_sell_shares
+    position_currency = state.position_currency
+    
+    # For sold positions, return with realized P&L and statistics
+    if include_sold and quantity <= 0:
+        # Calculate average buy and sell prices
+        avg_buy_price = total_buy_cost / total_buy_shares if total_buy_shares > 0 else Decimal(0)
+        avg_sell_price = total_sell_proceeds / total_sell_shares if total_sell_shares > 0 else Decimal(0)
+        
+        # Calculate realized P&L percentage
+        realized_pnl_pct = None
+        if total_buy_cost > 0:
+            realized_pnl_pct = (realized_pnl / total_buy_cost * 100)
+        
+        # Convert values to target currency if needed
+        target_currency = portfolio_base_currency or position_currency or asset.currency
+        if position_currency and position_currency != target_currency:
+            converted_pnl = fx.convert(
+                realized_pnl,
+                from_currency=position_currency,
+                to_currency=target_currency
+            )
+            converted_buy_price = fx.convert(
+                avg_buy_price,
+                from_currency=position_currency,
+                to_currency=target_currency
+            )
+            converted_sell_price = fx.convert(
+                avg_sell_price,
+                from_currency=position_currency,
+                to_currency=target_currency
+            )
+            if converted_pnl:
+                realized_pnl = converted_pnl
+            if converted_buy_price:
+                avg_buy_price = converted_buy_price
+            if converted_sell_price:
+                avg_sell_price = converted_sell_price
+        
+        return Position(
+            asset_id=asset.id,
+            symbol=asset.symbol,
+            name=asset.name,
+            quantity=Decimal(0),  # Sold, so quantity is 0
+            avg_cost=avg_buy_price,  # Average buy price
+            current_price=avg_sell_price,  # Repurpose as average sell price
+            market_value=Decimal(0),
+            cost_basis=total_buy_cost if position_currency == target_currency else Decimal(0),
+            unrealized_pnl=realized_pnl,  # Use unrealized_pnl field for realized P&L
+            unrealized_pnl_pct=realized_pnl_pct,
+            daily_change_pct=None,
+            currency=target_currency,
+            last_updated=None,
+            asset_type=asset.asset_type
+        )
+    
+    if quantity <= 0:
+        return None
+    
+    # Determine target currency: prefer portfolio base currency, fallback to position currency
+    target_currency = portfolio_base_currency or position_currency or asset.currency
+    
+    # Convert cost basis to target currency if needed
+    if position_currency and position_currency != target_currency:
+        logger.info(
+            f"Converting {asset.symbol} cost basis from {position_currency} to {target_currency}"
+        )
+        converted_cost = fx.convert(
+            total_cost,
+            from_currency=position_currency,
+            to_currency=target_currency
+        )
+        if converted_cost:
+            total_cost = converted_cost
+            logger.info(
+                f"Converted cost basis for {asset.symbol} to {target_currency}"
+            )
+    
+    # Calculate average cost (PRU) in target currency
+    avg_cost = total_cost / quantity if quantity > 0 else Decimal(0)
+    
+    # Current price and daily change from the pre-fetched quote
+    current_price = quote.price if quote else None
+    daily_change_pct = quote.daily_change_pct if quote else None
+    last_updated = quote.asof if quote else None
+    
+    # Convert current price to target currency if needed
+    if current_price and asset.currency != target_currency:
+        logger.info(
+            f"Converting {asset.symbol} price from {asset.currency} to {target_currency}"
+        )
+        converted_price = fx.convert(
+            current_price,
+            from_currency=asset.currency,
+            to_currency=target_currency
+        )
+        if converted_price:
+            current_price = converted_price
+            logger.info(
+                f"Converted price for {asset.symbol}: "
+                f"{quote.price} {asset.currency} -> {current_price} {target_currency}"
+            )
+        else:
+            logger.error(
+                f"Failed to convert price for {asset.symbol} from "
+                f"{asset.currency} to {target_currency}. Skipping this position to avoid incorrect valuation."
+            )
+            # Return None instead of using unconverted price to avoid massive valuation errors
+            return None
+    
+    # Calculate market value and P&L
+    market_value = quantity * current_price if current_price else None
+    unrealized_pnl = None
+    unrealized_pnl_pct = None
+    breakeven_gain_pct = None
+    breakeven_target_price = None
+    
+    if market_value:
+        unrealized_pnl = market_value - total_cost
+        unrealized_pnl_pct = (
+            (unrealized_pnl / total_cost * 100) if total_cost > 0 else Decimal(0)
+        )
+        
+        # Calculate breakeven metrics for negative positions
+        if unrealized_pnl < 0 and current_price and current_price > 0:
+            # Gain % needed to return to average cost
+            # If current price is below avg cost, calculate required gain %
+            # Formula: ((avg_cost - current_price) / current_price) * 100
+            breakeven_gain_pct = ((avg_cost - current_price) / current_price) * Decimal(100)
+            
+            # Target price to reach (it's simply the average cost)
+            breakeven_target_price = avg_cost
+    
+    # Advanced metrics moved to lazy-loaded endpoint
+    distance_to_ath_pct = None
+    avg_buy_zone_pct = None
+    personal_drawdown_pct = None
+    local_ath_price = None
+    local_ath_date = None
+    vol_contribution_pct = None  # Will be calculated at portfolio level
+    cost_to_average_down = None
+    
+    # Convert ATH price to target currency for display
+    ath_price_display = asset.ath_price
+    if asset.ath_price and asset.currency != target_currency:
+        # Try historical rate first if date available
+        if asset.ath_date:
+            converted_ath_display = fx.convert_historical(
+                asset.ath_price,
+                from_currency=asset.currency,
+                to_currency=target_currency,
+                date=asset.ath_date
+            )
+            if not converted_ath_display:
+                # Fallback to current rate
+                converted_ath_display = fx.convert(
+                    asset.ath_price,
+                    from_currency=asset.currency,
+                    to_currency=target_currency
+                )
+        else:
+            # No date, use current rate
+            converted_ath_display = fx.convert(
+                asset.ath_price,
+                from_currency=asset.currency,
+                to_currency=target_currency
+            )
+        
+        if converted_ath_display:
+            ath_price_display = converted_ath_display
+    
+    return Position(
+        asset_id=asset.id,
+        symbol=asset.symbol,
+        name=asset.name,
+        quantity=quantity,
+        avg_cost=avg_cost,
+        current_price=current_price,
+        market_value=market_value,
+        cost_basis=total_cost,
+        unrealized_pnl=unrealized_pnl,
+        unrealized_pnl_pct=unrealized_pnl_pct,
+        daily_change_pct=daily_change_pct,
+        breakeven_gain_pct=breakeven_gain_pct,
+        breakeven_target_price=breakeven_target_price,
+        distance_to_ath_pct=distance_to_ath_pct,
+        avg_buy_zone_pct=avg_buy_zone_pct,
+        personal_drawdown_pct=personal_drawdown_pct,
+        local_ath_price=local_ath_price,
+        local_ath_date=local_ath_date,
+        vol_contribution_pct=vol_contribution_pct,
+        cost_to_average_down=cost_to_average_down,
+        ath_price=ath_price_display,  # Return ATH in target currency
+        ath_price_native=asset.ath_price,  # Return ATH in native currency
+        ath_currency=asset.currency,  # Asset's native currency
+        ath_date=asset.ath_date,
+        relative_perf_30d=None,  # Lazy-loaded via separate endpoint
+        relative_perf_90d=None,
+        relative_perf_ytd=None,
+        relative_perf_1y=None,
+        sector=asset.sector,
+        industry=asset.industry,
+        sector_etf=None,  # Will be populated on-demand
+        currency=target_currency,  # Use portfolio base currency if available
+        last_updated=last_updated,
+        asset_type=asset.asset_type
+    )
@@ -9,6 +9,7 @@ from sqlalchemy.orm import Session
 
 from app.models import Transaction, Asset, TransactionType, Price, Portfolio
 from app.services.currency import CurrencyService
+from app.services.fx_history import FxHistoryStore
 from app.services.fundamentals import FundamentalsService
 from app.services.risk_analysis import RiskAnalysisService
 
@@ -166,11 +167,11 @@ class PositionDetailsService:
                 if asset.currency != target_currency:
                     # Try historical rate first (most accurate)
                     if asset.ath_date:
-                        converted_ath = CurrencyService.convert_historical(
+                        converted_ath = FxHistoryStore(self.db).convert(
                             asset.ath_price,
-                            from_currency=asset.currency,
-                            to_currency=target_currency,
-                            date=asset.ath_date
+                            asset.currency,
+                            target_currency,
+                            asset.ath_date
                         )
                         if not converted_ath:
                             # Fallback to current rate
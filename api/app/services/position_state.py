@@ -0,0 +1,126 @@
+"""
+Position state folding
+
+A position is the left fold of its transactions in (tx_date, created_at, id)
+order. PositionState holds the running values and applies one transaction at
+a time, so the same logic serves a full replay (MetricsService tests,
+snapshot rebuilds) and incremental maintenance of persisted snapshots
+(app.crud.positions).
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.models import TransactionType
+
+INFLOW_TYPES = (TransactionType.BUY, TransactionType.TRANSFER_IN, TransactionType.CONVERSION_IN)
+OUTFLOW_TYPES = (TransactionType.SELL, TransactionType.TRANSFER_OUT, TransactionType.CONVERSION_OUT)
+
+# Persisted state columns (shared by PositionSnapshot and PositionCheckpoint)
+STATE_FIELDS = (
+    "quantity",
+    "total_cost",
+    "shares_for_cost",
+    "realized_pnl",
+    "total_buy_cost",
+    "total_buy_shares",
+    "total_sell_proceeds",
+    "total_sell_shares",
+    "total_dividends",
+    "total_fees",
+)
+
+
+def parse_split_ratio(split_str: str) -> Decimal:
+    """
+    Parse split ratio string (e.g., "2:1" -> 2.0, "1:2" -> 0.5)
+    """
+    try:
+        parts = split_str.split(":")
+        if len(parts) == 2:
+            numerator = Decimal(parts[0])
+            denominator = Decimal(parts[1])
+            return numerator / denominator
+    except Exception:
+        pass
+    return Decimal(1)
+
+
+def fold_key(tx_date: date, created_at: Optional[datetime], tx_id: Optional[int]) -> Tuple[date, datetime, int]:
+    """Sort key of a transaction in fold order"""
+    return (tx_date, created_at or datetime.min, tx_id or 0)
+
+
+class PositionState:
+    """Running position values of one (portfolio, asset) pair"""
+
+    __slots__ = STATE_FIELDS + ("position_currency",)
+
+    def __init__(self, **values: Any):
+        for field in STATE_FIELDS:
+            value = values.get(field)
+            setattr(self, field, Decimal(0) if value is None else Decimal(value))
+        # Currency of the first inflow (most common currency for this position)
+        self.position_currency: Optional[str] = values.get("position_currency")
+
+    @classmethod
+    def from_row(cls, row: Any) -> "PositionState":
+        """Build state from a snapshot/checkpoint row or ORM object"""
+        return cls(**{field: getattr(row, field) for field in cls.__slots__})
+
+    @classmethod
+    def from_transactions(cls, transactions: Iterable[Any]) -> "PositionState":
+        """Full replay of transactions already sorted in fold order"""
+        state = cls()
+        for tx in transactions:
+            state.apply(tx)
+        return state
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Column values for persisting this state"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def apply(self, tx: Any) -> None:
+        """
+        Fold one transaction into the state
+
+        Args:
+            tx: Transaction (or row) with type, quantity, price, fees,
+                currency and meta_data
+        """
+        if tx.type == TransactionType.DIVIDEND:
+            self.total_dividends += tx.price * tx.quantity
+        self.total_fees += tx.fees
+
+        if tx.type in INFLOW_TYPES:
+            if self.position_currency is None:
+                self.position_currency = tx.currency
+            self.quantity += tx.quantity
+            cost = (tx.quantity * tx.price) + tx.fees
+            self.total_cost += cost
+            self.shares_for_cost += tx.quantity
+            # Track for sold position stats
+            self.total_buy_cost += cost
+            self.total_buy_shares += tx.quantity
+
+        elif tx.type in OUTFLOW_TYPES:
+            self.quantity -= tx.quantity
+            # Realized P&L and proportional cost basis reduction (FIFO simplification)
+            if self.shares_for_cost > 0:
+                avg_cost = self.total_cost / self.shares_for_cost
+                cost_reduction = tx.quantity * avg_cost
+                proceeds = (tx.quantity * tx.price) - tx.fees
+                self.realized_pnl += proceeds - cost_reduction
+                self.total_cost -= cost_reduction
+                self.shares_for_cost -= tx.quantity
+            # Track for sold position stats
+            self.total_sell_proceeds += (tx.quantity * tx.price) - tx.fees
+            self.total_sell_shares += tx.quantity
+
+        elif tx.type == TransactionType.SPLIT:
+            # e.g. 2:1 doubles shares; cost basis is spread over more shares
+            split_ratio = parse_split_ratio((tx.meta_data or {}).get("split", "1:1"))
+            self.quantity *= split_ratio
+            self.shares_for_cost *= split_ratio
+            self.total_buy_shares *= split_ratio
+            self.total_sell_shares *= split_ratio
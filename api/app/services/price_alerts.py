@@ -0,0 +1,281 @@
+"""
+Price alerts evaluated against every quote written
+
+Enabled watchlist alerts are indexed per asset in a Redis sorted set
+(alerts:asset:<asset_id>, member = watchlist id, score = target price), kept
+in sync by app.crud.watchlist on every commit and rebuilt from the database
+by rebuild_alert_index().
+
+Each freshly fetched price is a tick. The previous price of the asset is
+swapped for it atomically (SET ... GET), so consecutive ticks, from whichever
+process, cover the whole price path without gaps. An alert fires when its
+target lies on the move: (previous, current] when rising, [current, previous)
+when falling, one ZRANGEBYSCORE per moving asset, O(log n) in its alerts. A
+move straight through a target between two polls is caught, and the cost
+follows price ticks, not alerts times polling frequency.
+
+The process whose ZREM removes a crossed alert fires it, after checking it
+against the database (the index may lag an edit). Without Redis, the index
+and the previous prices are kept in this process.
+"""
+import bisect
+import logging
+import threading
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import Watchlist
+from app.redis_client import get_redis_binary
+
+logger = logging.getLogger(__name__)
+
+PREFIX_ALERT_INDEX = "alerts:asset:"
+PREFIX_LAST_PRICE = "alerts:last:"
+
+# Assets without a tick for this long start over without a previous price
+LAST_PRICE_TTL_SECONDS = 7 * 24 * 3600
+
+# (watchlist id, asset id, target price); a None target drops the alert from the index
+AlertEntry = Tuple[int, int, Optional[Decimal]]
+
+_alert_counters: Counter = Counter()
+
+
+class _LocalAlertIndex:
+    """Sorted (target, watchlist id) lists per asset and previous prices, when Redis is unavailable"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.targets: Dict[int, List[Tuple[float, int]]] = {}
+        self.assets: Dict[int, Tuple[int, float]] = {}  # watchlist id -> (asset id, target)
+        self.last_prices: Dict[int, Decimal] = {}
+
+    def apply(self, entries: Iterable[AlertEntry]) -> None:
+        with self.lock:
+            for watchlist_id, asset_id, target in entries:
+                self._remove(watchlist_id)
+                if target is not None:
+                    bisect.insort(self.targets.setdefault(asset_id, []), (float(target), watchlist_id))
+                    self.assets[watchlist_id] = (asset_id, float(target))
+
+    def _remove(self, watchlist_id: int) -> bool:
+        indexed = self.assets.pop(watchlist_id, None)
+        if indexed is None:
+            return False
+        asset_id, target = indexed
+        targets = self.targets[asset_id]
+        del targets[bisect.bisect_left(targets, (target, watchlist_id))]
+        return True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.targets.clear()
+            self.assets.clear()
+
+    def swap_prices(self, prices: Dict[int, Decimal]) -> Dict[int, Optional[Decimal]]:
+        with self.lock:
+            previous = {asset_id: self.last_prices.get(asset_id) for asset_id in prices}
+            self.last_prices.update(prices)
+            return previous
+
+    def claim_crossed(self, moves: Dict[int, Tuple[Decimal, Decimal]]) -> Dict[int, List[int]]:
+        crossed: Dict[int, List[int]] = {}
+        with self.lock:
+            for asset_id, (previous, current) in moves.items():
+                targets = self.targets.get(asset_id, [])
+                if current > previous:
+                    lo = bisect.bisect_right(targets, (float(previous), float("inf")))
+                    hi = bisect.bisect_right(targets, (float(current), float("inf")))
+                else:
+                    lo = bisect.bisect_left(targets, (float(current), -1))
+                    hi = bisect.bisect_left(targets, (float(previous), -1))
+                ids = [watchlist_id for _, watchlist_id in targets[lo:hi]]
+                for watchlist_id in ids:
+                    self._remove(watchlist_id)
+                if ids:
+                    crossed[asset_id] = ids
+        return crossed
+
+
+_local_index = _LocalAlertIndex()
+
+
+def _index_key(asset_id: int) -> str:
+    return f"{PREFIX_ALERT_INDEX}{asset_id}"
+
+
+def _decode_price(value) -> Optional[Decimal]:
+    if value is None:
+        return None
+    return Decimal(value.decode() if isinstance(value, bytes) else value)
+
+
+def apply_alert_changes(entries: List[AlertEntry]) -> None:
+    """Index enabled alerts at their target and drop the others (one pipeline)"""
+    if not entries:
+        return
+    redis_client = get_redis_binary()
+    if redis_client is None:
+        _local_index.apply(entries)
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for watchlist_id, asset_id, target in entries:
+            if target is None:
+                pipe.zrem(_index_key(asset_id), watchlist_id)
+            else:
+                pipe.zadd(_index_key(asset_id), {watchlist_id: float(target)})
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Price alert index update error: {e}")
+
+
+def rebuild_alert_index(db: Session) -> int:
+    """Rebuild the whole index from the enabled alerts in the database, returns alerts indexed"""
+    rows = (
+        db.query(Watchlist.id, Watchlist.asset_id, Watchlist.alert_target_price)
+        .filter(Watchlist.alert_enabled == True)  # noqa: E712
+        .filter(Watchlist.alert_target_price.isnot(None))
+        .all()
+    )
+    by_asset: Dict[int, Dict[int, float]] = {}
+    for watchlist_id, asset_id, target in rows:
+        by_asset.setdefault(asset_id, {})[watchlist_id] = float(target)
+
+    redis_client = get_redis_binary()
+    if redis_client is None:
+        _local_index.clear()
+        _local_index.apply(rows)
+        return len(rows)
+    try:
+        stale = [
+            key for key in redis_client.scan_iter(match=f"{PREFIX_ALERT_INDEX}*", count=1000)
+            if int(key.decode().rsplit(":", 1)[1]) not in by_asset
+        ]
+        pipe = redis_client.pipeline()
+        if stale:
+            pipe.delete(*stale)
+        for asset_id, targets in by_asset.items():
+            pipe.delete(_index_key(asset_id))
+            pipe.zadd(_index_key(asset_id), targets)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Price alert index rebuild error: {e}")
+        return 0
+    return len(rows)
+
+
+def _swap_prices(prices: Dict[int, Decimal]) -> Dict[int, Optional[Decimal]]:
+    """Record the new prices, returning the previous ones (None when unknown)"""
+    redis_client = get_redis_binary()
+    if redis_client is None:
+        return _local_index.swap_prices(prices)
+    pipe = redis_client.pipeline(transaction=False)
+    for asset_id, price in prices.items():
+        pipe.set(f"{PREFIX_LAST_PRICE}{asset_id}", str(price), ex=LAST_PRICE_TTL_SECONDS, get=True)
+    return {asset_id: _decode_price(previous) for asset_id, previous in zip(prices, pipe.execute())}
+
+
+def _claim_crossed(moves: Dict[int, Tuple[Decimal, Decimal]]) -> Dict[int, List[int]]:
+    """Alerts whose target lies on each move, removed from the index by this call"""
+    redis_client = get_redis_binary()
+    if redis_client is None:
+        return _local_index.claim_crossed(moves)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for asset_id, (previous, current) in moves.items():
+        if current > previous:
+            pipe.zrangebyscore(_index_key(asset_id), f"({float(previous)!r}", float(current))
+        else:
+            pipe.zrangebyscore(_index_key(asset_id), float(current), f"({float(previous)!r}")
+    candidates = [
+        (asset_id, int(member)) for asset_id, members in zip(moves, pipe.execute()) for member in members
+    ]
+    if not candidates:
+        return {}
+
+    # One claim per alert: only the ZREM that removes it fires it
+    pipe = redis_client.pipeline(transaction=False)
+    for asset_id, watchlist_id in candidates:
+        pipe.zrem(_index_key(asset_id), watchlist_id)
+    crossed: Dict[int, List[int]] = {}
+    for (asset_id, watchlist_id), removed in zip(candidates, pipe.execute()):
+        if removed:
+            crossed.setdefault(asset_id, []).append(watchlist_id)
+    return crossed
+
+
+def _on_move(target: Decimal, previous: Decimal, current: Decimal) -> bool:
+    if current > previous:
+        return previous < target <= current
+    return current <= target < previous
+
+
+def evaluate_price_alerts(db: Session, prices: Dict[int, Decimal]) -> int:
+    """
+    Evaluate price ticks (asset id -> new price) against the alert index
+
+    Crossed alerts get their notification and are disabled (committed on db).
+    Returns the number of alerts triggered.
+    """
+    if not prices:
+        return 0
+    try:
+        previous = _swap_prices(prices)
+        moves = {
+            asset_id: (previous[asset_id], price) for asset_id, price in prices.items()
+            if previous[asset_id] is not None and previous[asset_id] != price
+        }
+        crossed = _claim_crossed(moves) if moves else {}
+    except RedisError as e:
+        logger.warning(f"Price alert evaluation error: {e}")
+        return 0
+    _alert_counters.update(ticks=len(prices), moves=len(moves))
+    if not crossed:
+        return 0
+
+    from app.services.notifications import notification_service
+
+    ids = [watchlist_id for watchlist_ids in crossed.values() for watchlist_id in watchlist_ids]
+    items = db.query(Watchlist).options(joinedload(Watchlist.asset)).filter(Watchlist.id.in_(ids)).all()
+    triggered = 0
+    lagging: List[AlertEntry] = []
+    for item in items:
+        move = moves[item.asset_id]
+        target = item.alert_target_price
+        if not item.alert_enabled or target is None:
+            continue
+        if not _on_move(Decimal(str(target)), *move):
+            # Target edited since it was indexed: put the alert back at its current target
+            lagging.append((item.id, item.asset_id, target))
+            continue
+
+        current_price = move[1]
+        notification_service.create_price_alert_notification(
+            db=db,
+            user_id=item.user_id,
+            watchlist_item=item,
+            current_price=current_price,
+            target_price=Decimal(str(target))
+        )
+        # Disable alert to prevent repeated notifications
+        item.alert_enabled = False
+        db.commit()
+        triggered += 1
+        logger.info(
+            f"Price alert triggered for {item.asset.symbol if item.asset else item.asset_id}: "
+            f"moved {move[0]} -> {current_price} through target {target}"
+        )
+
+    apply_alert_changes(lagging)
+    _alert_counters.update(triggered=triggered, lagging=len(lagging))
+    return triggered
+
+
+def get_price_alert_stats() -> Dict[str, int]:
+    """Ticks evaluated, moving ticks, alerts triggered and alerts found lagging an edit, in this process"""
+    return {name: _alert_counters[name] for name in ("ticks", "moves", "triggered", "lagging")}
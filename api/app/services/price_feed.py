@@ -0,0 +1,249 @@
+"""
+Live price feed
+
+Pushes new quotes to connected clients (GET /portfolios/{id}/prices/stream,
+GET /watchlist/prices/stream) instead of having them poll the batch price
+endpoints. Each worker has one PriceFeed: connections subscribe to the assets
+they show, the feed keeps one subscription per asset shared by all of them,
+and one reader of the price tick stream (app.services.price_ticks) per worker
+fans each tick out to the connections showing its asset.
+
+A connection holds the latest tick of each of its assets until it sends them:
+a slow client skips intermediate prices, it never builds up a backlog.
+Without Redis, the ticks published by this process are delivered directly.
+"""
+import asyncio
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.redis_client import get_redis_binary
+from app.services.cache import CacheService
+from app.services.currency import CurrencyService, FxMatrix
+from app.services.price_ticks import STREAM_KEY, PriceTick
+
+logger = logging.getLogger(__name__)
+
+# XREAD blocks in a worker thread for at most this long, below REDIS_SOCKET_TIMEOUT
+_READ_BLOCK_MS = 2000
+_READ_COUNT = 1000
+
+
+class Subscription:
+    """Assets one connection shows, and their ticks not sent yet"""
+
+    def __init__(self, asset_ids: Iterable[int]):
+        self.asset_ids = frozenset(asset_ids)
+        self._pending: Dict[int, PriceTick] = {}
+        self._ready = asyncio.Event()
+
+    def deliver(self, tick: PriceTick) -> None:
+        self._pending[tick.asset_id] = tick
+        self._ready.set()
+
+    async def next(self, timeout: float) -> List[PriceTick]:
+        """Latest tick of each asset that ticked since the last call (empty after timeout seconds without one)"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        ticks, self._pending = list(self._pending.values()), {}
+        return ticks
+
+
+class PriceFeed:
+    """Per worker fan-out of price ticks to the subscriptions of its connections"""
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._connections = 0
+        self._counters: Counter = Counter()
+
+    def subscribe(self, asset_ids: Iterable[int]) -> Subscription:
+        """Subscribe a connection to the ticks of some assets (on the event loop serving it)"""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(asset_ids)
+        for asset_id in subscription.asset_ids:
+            self._subscriptions.setdefault(asset_id, set()).add(subscription)
+        self._connections += 1
+        if self._reader is None or self._reader.done():
+            if get_redis_binary() is not None:
+                self._reader = self._loop.create_task(self._read_stream())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for asset_id in subscription.asset_ids:
+            subscriptions = self._subscriptions.get(asset_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[asset_id]
+        self._connections -= 1
+        if not self._connections and self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+
+    def publish_local(self, ticks: List[PriceTick]) -> None:
+        """Deliver ticks published by this process (from any thread); used when there is no stream to read"""
+        loop = self._loop
+        if loop is None or not self._subscriptions:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, ticks)
+        except RuntimeError:
+            # The loop serving the connections is closed
+            self._loop = None
+
+    def _dispatch(self, ticks: List[PriceTick]) -> None:
+        for tick in ticks:
+            for subscription in self._subscriptions.get(tick.asset_id, ()):
+                subscription.deliver(tick)
+                self._counters.update(delivered=1)
+
+    async def _read_stream(self) -> None:
+        """Read the ticks every process publishes, from the newest entry on, while anyone is subscribed"""
+        last_id: Optional[bytes] = None
+        while True:
+            redis_client = get_redis_binary()
+            if redis_client is None:
+                return
+            try:
+                if last_id is None:
+                    newest = await asyncio.to_thread(redis_client.xrevrange, STREAM_KEY, count=1)
+                    last_id = newest[0][0] if newest else b"0-0"
+                reply = await asyncio.to_thread(
+                    redis_client.xread, {STREAM_KEY: last_id}, count=_READ_COUNT, block=_READ_BLOCK_MS
+                )
+            except RedisError as e:
+                logger.warning(f"Price feed stream read error: {e}")
+                await asyncio.sleep(1)
+                continue
+            for _, entries in reply or []:
+                if entries:
+                    last_id = entries[-1][0]
+                    self._counters.update(read=len(entries))
+                    self._dispatch([PriceTick.from_fields(fields) for _, fields in entries if fields])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Connections and symbols followed on this worker, ticks read from the stream and delivered"""
+        return {
+            "connections": self._connections,
+            "symbols": len(self._subscriptions),
+            "read": self._counters["read"],
+            "delivered": self._counters["delivered"],
+            "reading_stream": self._reader is not None and not self._reader.done(),
+        }
+
+
+price_feed = PriceFeed()
+
+
+def encode_frame(frame: Dict[str, Any], sse: bool) -> str:
+    """One frame as a Server-Sent Event named after its type, or as an NDJSON line"""
+    body = json.dumps(frame)
+    return f"event: {frame['type']}\ndata: {body}\n\n" if sse else body + "\n"
+
+
+def frames_response(frames: AsyncIterator[Dict[str, Any]], request: Request) -> StreamingResponse:
+    """
+    Stream frames as Server-Sent Events when the client accepts
+    text/event-stream, as newline-delimited JSON otherwise
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def encoded() -> AsyncIterator[str]:
+        async for frame in frames:
+            yield encode_frame(frame, sse)
+
+    return StreamingResponse(
+        encoded(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+def _price_deltas(
+    ticks: List[PriceTick],
+    currencies: Dict[int, str],
+    base_currency: Optional[str],
+    fx: Optional[FxMatrix],
+) -> List[Dict[str, Any]]:
+    """Compact price updates, converted to base_currency when given and a rate is known"""
+    deltas = []
+    for tick in ticks:
+        price, currency = tick.price, currencies[tick.asset_id]
+        if base_currency and fx is not None:
+            converted = fx.convert(price, from_currency=currency, to_currency=base_currency)
+            if converted is not None:
+                price, currency = converted, base_currency
+        delta = {
+            "symbol": tick.symbol,
+            "asset_id": tick.asset_id,
+            "current_price": float(price),
+            "currency": currency,
+            "last_updated": tick.asof.isoformat(),
+        }
+        if tick.daily_change_pct is not None:
+            delta["daily_change_pct"] = float(tick.daily_change_pct)
+        deltas.append(delta)
+    return deltas
+
+
+async def stream_price_deltas(
+    assets: Dict[int, Tuple[str, str]],
+    base_currency: Optional[str],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Frames of a live price connection, until the client disconnects
+
+        {"type": "start", "symbols": [...], "base_currency": "EUR"}
+        {"type": "prices", "prices": [{"symbol", "asset_id", "current_price", "currency", "daily_change_pct", "last_updated"}]}
+        {"type": "heartbeat", "timestamp": "..."}
+
+    A prices frame is sent when new quotes land, with the latest quote of
+    each asset that moved, in the base currency (in its own currency while
+    no rate is known); a heartbeat after PRICE_FEED_HEARTBEAT_SECONDS
+    without one keeps proxies from closing the connection.
+
+    Args:
+        assets: asset id -> (symbol, quote currency) of the assets to follow
+        base_currency: Currency prices are converted to (None: quote currency)
+        is_disconnected: Whether the client went away
+    """
+    currencies = {asset_id: currency for asset_id, (_, currency) in assets.items()}
+    fx: Optional[FxMatrix] = None
+
+    subscription = price_feed.subscribe(assets)
+    try:
+        yield {
+            "type": "start",
+            "symbols": sorted(symbol for symbol, _ in assets.values()),
+            "base_currency": base_currency,
+        }
+        while not await is_disconnected():
+            ticks = await subscription.next(timeout=settings.PRICE_FEED_HEARTBEAT_SECONDS)
+            if not ticks:
+                yield {"type": "heartbeat", "timestamp": datetime.utcnow().isoformat()}
+                continue
+            # Rates are resolved once per connection and again when they are as old as the cached ones
+            if base_currency and (fx is None or (datetime.utcnow() - fx.resolved_at).total_seconds() > CacheService.TTL_FX):
+                fx = await asyncio.to_thread(
+                    CurrencyService.get_rate_matrix, ((currency, base_currency) for currency in set(currencies.values()))
+                )
+            yield {"type": "prices", "prices": _price_deltas(ticks, currencies, base_currency, fx)}
+    finally:
+        price_feed.unsubscribe(subscription)
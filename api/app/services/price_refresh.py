@@ -0,0 +1,195 @@
+"""
+Scheduled refresh of held quotes
+
+plan_price_refresh() picks the symbols worth refreshing: assets held in at
+least one portfolio (sold out and delisted ones drop out with their
+positions) whose exchange is in its regular session (market_calendar;
+crypto always). The least recently priced come first, so when a run is cut
+short by its budget the next run picks up where it stopped.
+plan_alert_refresh() does the same for the symbols with a watchlist alert.
+
+run_price_refresh() resolves them in rounds of get_multiple_prices() (one
+batched upstream fetch per round, each on its own database session), a
+bounded number of rounds at a time. No new round starts once the run's time
+budget is spent. Stale cached quotes read as misses during a run: a refresh
+that served them back would refresh nothing.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.crud import positions as crud_positions
+from app.crud import prices as crud_prices
+from app.crud import watchlist as crud_watchlist
+from app.db import get_db_context
+from app.models import Asset
+from app.models.enums import AssetClass
+from app.services.cache import stale_reads_disallowed
+from app.services.market_calendar import exchange_for_symbol
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RefreshPlan:
+    """Symbols one run refreshes, and why the other candidates are left out"""
+    symbols: List[str]
+    held: int = 0  # candidate symbols (held, or with an alert for plan_alert_refresh())
+    closed: Dict[str, int] = field(default_factory=dict)  # exchange code -> candidates skipped
+    deferred: int = 0  # open symbols beyond the per-run cap
+
+
+@dataclass
+class RefreshRun:
+    """Outcome of run_price_refresh()"""
+    planned: int
+    refreshed: int = 0
+    failed: int = 0
+    not_started: int = 0  # symbols of rounds the time budget left out
+    rounds: int = 0
+    duration_seconds: float = 0.0
+
+    @property
+    def symbols_per_second(self) -> float:
+        attempted = self.refreshed + self.failed
+        return attempted / self.duration_seconds if self.duration_seconds > 0 else 0.0
+
+
+# Totals of this process since start, and the last plan and run
+_refresh_counters: Counter = Counter()
+_last_refresh: Dict[str, Any] = {}
+
+
+def plan_price_refresh(db: Session, at: Optional[datetime] = None, max_symbols: Optional[int] = None) -> RefreshPlan:
+    """
+    Held symbols whose exchange is open, the least recently priced first
+
+    Args:
+        db: Database session
+        at: Time to check the exchanges at (default now)
+        max_symbols: Cap on the symbols planned (default PRICE_REFRESH_MAX_SYMBOLS)
+    """
+    return _plan(db, crud_positions.get_held_assets(db), at, max_symbols)
+
+
+def plan_alert_refresh(db: Session, at: Optional[datetime] = None, max_symbols: Optional[int] = None) -> RefreshPlan:
+    """
+    Symbols with an enabled watchlist alert whose exchange is open, the least recently priced first
+
+    Their refreshed quotes are evaluated against the alerts as they are written
+    (app.services.price_alerts). Same arguments as plan_price_refresh().
+    """
+    return _plan(db, crud_watchlist.get_alert_assets(db), at, max_symbols)
+
+
+def _plan(db: Session, assets: List[Asset], at: Optional[datetime], max_symbols: Optional[int]) -> RefreshPlan:
+    max_symbols = settings.PRICE_REFRESH_MAX_SYMBOLS if max_symbols is None else max_symbols
+    held = [asset for asset in assets if asset.class_ != AssetClass.CASH]
+
+    open_assets = []
+    closed: Counter = Counter()
+    for asset in held:
+        exchange = exchange_for_symbol(asset.symbol, asset.class_)
+        if exchange.is_open(at):
+            open_assets.append(asset)
+        else:
+            closed[exchange.code] += 1
+
+    latest = crud_prices.get_latest_prices(db, [asset.id for asset in open_assets])
+    open_assets.sort(key=lambda asset: latest[asset.id].asof if asset.id in latest else datetime.min)
+
+    return RefreshPlan(
+        symbols=[asset.symbol for asset in open_assets[:max_symbols]],
+        held=len(held),
+        closed=dict(closed),
+        deferred=max(len(open_assets) - max_symbols, 0),
+    )
+
+
+async def run_price_refresh(
+    symbols: List[str],
+    round_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    budget_seconds: Optional[float] = None,
+) -> RefreshRun:
+    """
+    Refresh quotes in batched rounds, a bounded number at a time, within a time budget
+
+    Args:
+        symbols: Symbols to refresh, in priority order
+        round_size: Symbols per round (default PRICE_REFRESH_ROUND_SIZE)
+        concurrency: Rounds in flight at once (default PRICE_REFRESH_CONCURRENCY)
+        budget_seconds: No round starts after this long (default PRICE_REFRESH_BUDGET_SECONDS)
+    """
+    from app.services.pricing import PricingService
+
+    round_size = round_size or settings.PRICE_REFRESH_ROUND_SIZE
+    concurrency = concurrency or settings.PRICE_REFRESH_CONCURRENCY
+    budget_seconds = settings.PRICE_REFRESH_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+
+    run = RefreshRun(planned=len(symbols))
+    started = time.perf_counter()
+    deadline = started + budget_seconds
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def refresh_round(chunk: List[str]) -> None:
+        async with semaphore:
+            if time.perf_counter() >= deadline:
+                run.not_started += len(chunk)
+                return
+            run.rounds += 1
+            try:
+                with get_db_context() as db:
+                    quotes = await PricingService(db).get_multiple_prices(chunk)
+            except Exception as e:
+                logger.error(f"Price refresh round of {len(chunk)} symbols failed: {e}")
+                run.failed += len(chunk)
+                return
+            run.refreshed += len(quotes)
+            run.failed += len(chunk) - len(quotes)
+            missing = [symbol for symbol in chunk if symbol not in quotes]
+            if missing:
+                logger.warning(f"Failed to refresh {len(missing)} prices: {', '.join(missing[:10])}")
+
+    with stale_reads_disallowed():
+        await asyncio.gather(*(
+            refresh_round(symbols[start:start + round_size]) for start in range(0, len(symbols), round_size)
+        ))
+
+    run.duration_seconds = time.perf_counter() - started
+    return run
+
+
+def record_refresh(plan: RefreshPlan, run: RefreshRun) -> None:
+    """Keep a run's figures for get_price_refresh_stats() and log them"""
+    _refresh_counters.update(
+        runs=1, refreshed=run.refreshed, failed=run.failed, not_started=run.not_started,
+        skipped_closed=sum(plan.closed.values()), deferred=plan.deferred,
+    )
+    _last_refresh.clear()
+    _last_refresh.update(
+        finished_at=datetime.utcnow().isoformat(),
+        held=plan.held,
+        closed=plan.closed,
+        deferred=plan.deferred,
+        **asdict(run),
+        symbols_per_second=round(run.symbols_per_second, 2),
+    )
+    logger.info(
+        f"Price refresh completed. Refreshed: {run.refreshed}, Failed: {run.failed}, "
+        f"Not started (budget): {run.not_started}, Deferred (cap): {plan.deferred}, "
+        f"Closed exchanges: {sum(plan.closed.values())} of {plan.held} held, "
+        f"{run.symbols_per_second:.1f} symbols/s over {run.duration_seconds:.1f}s"
+    )
+
+
+def get_price_refresh_stats() -> Dict[str, Any]:
+    """Totals of this process and the figures of its last scheduled refresh"""
+    return {"totals": dict(_refresh_counters), "last_run": dict(_last_refresh) or None}
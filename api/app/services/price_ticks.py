@@ -0,0 +1,378 @@
+"""
+Price tick stream
+
+Every price PricingService fetches is published as a tick (asset, price, asof,
+daily change) on a Redis Stream, one pipelined XADD per batch of quotes. What
+follows from a new price is done by consumer groups, one per kind of work,
+which read ticks in batches, coalesce them per asset and apply each batch
+set-based:
+
+- ath: one UPDATE raising the all-time high of the assets a tick beat
+- alerts: watchlist alerts the moves crossed (app.services.price_alerts)
+- positions: cached positions of the portfolios holding a ticked asset are
+  marked stale, so their next read serves them while they are recomputed
+- daily_change: holders whose threshold the daily change reached, while the
+  asset's exchange trades, are notified once per trading day
+
+Every process running the scheduler is a consumer of every group, so a batch
+is handled by one of them. Ticks are acknowledged once applied; those a
+consumer failed on (or died holding) are claimed again after
+PRICE_TICK_CLAIM_IDLE_SECONDS and dropped after PRICE_TICK_MAX_DELIVERIES
+attempts. Without Redis, the publisher applies its ticks inline.
+
+The live price feed (app.services.price_feed) reads the same stream, without
+a group: every worker serving connections sees every tick.
+"""
+import logging
+import os
+import socket
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.crud import assets as crud_assets
+from app.crud import positions as crud_positions
+from app.db import get_db_context
+from app.models import Asset, Notification, NotificationType, Portfolio, PositionSnapshot, User
+from app.redis_client import get_redis_binary
+from app.services.cache import expire_positions
+from app.services.market_calendar import exchange_for_symbol
+from app.services.price_alerts import evaluate_price_alerts
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "prices:ticks"
+
+# Batches a group handles per consume_price_ticks() call, so one busy group cannot hold up the others
+_MAX_BATCHES_PER_RUN = 20
+
+
+@dataclass(frozen=True)
+class PriceTick:
+    """One fetched price"""
+    asset_id: int
+    symbol: str
+    price: Decimal
+    asof: datetime
+    daily_change_pct: Optional[Decimal] = None
+
+    def to_fields(self) -> Dict[str, str]:
+        fields = {
+            "asset_id": str(self.asset_id),
+            "symbol": self.symbol,
+            "price": str(self.price),
+            "asof": self.asof.isoformat(),
+        }
+        if self.daily_change_pct is not None:
+            fields["daily_change_pct"] = str(self.daily_change_pct)
+        return fields
+
+    @classmethod
+    def from_fields(cls, fields: Dict[bytes, bytes]) -> "PriceTick":
+        values = {key.decode(): value.decode() for key, value in fields.items()}
+        change = values.get("daily_change_pct")
+        return cls(
+            asset_id=int(values["asset_id"]),
+            symbol=values["symbol"],
+            price=Decimal(values["price"]),
+            asof=datetime.fromisoformat(values["asof"]),
+            daily_change_pct=Decimal(change) if change is not None else None,
+        )
+
+
+# Publisher counts and per group handling counts, in this process
+_publish_counters: Counter = Counter()
+_group_counters: Dict[str, Counter] = defaultdict(Counter)
+
+# Groups this process has created (or found) on the stream
+_groups_ready: Set[str] = set()
+
+
+def _latest(ticks: Iterable[PriceTick]) -> Dict[int, PriceTick]:
+    """Last tick of each asset, in stream order"""
+    return {tick.asset_id: tick for tick in ticks}
+
+
+def _track_all_time_highs(db: Session, ticks: List[PriceTick]) -> None:
+    highs: Dict[int, Tuple[Decimal, datetime]] = {}
+    for tick in ticks:
+        if tick.asset_id not in highs or tick.price > highs[tick.asset_id][0]:
+            highs[tick.asset_id] = (tick.price, tick.asof)
+    raised = crud_assets.raise_all_time_highs(db, highs)
+    if raised:
+        logger.info(f"Raised the all-time high of {raised} assets")
+
+
+def _evaluate_alerts(db: Session, ticks: List[PriceTick]) -> None:
+    # Each asset's ticks in order, one per evaluation: a move reverted within the batch still crosses its targets
+    rounds: List[Dict[int, Decimal]] = []
+    seen: Counter = Counter()
+    for tick in ticks:
+        if seen[tick.asset_id] == len(rounds):
+            rounds.append({})
+        rounds[seen[tick.asset_id]][tick.asset_id] = tick.price
+        seen[tick.asset_id] += 1
+    for prices in rounds:
+        evaluate_price_alerts(db, prices)
+
+
+def _expire_positions(db: Session, ticks: List[PriceTick]) -> None:
+    portfolio_ids = crud_positions.get_holding_portfolios(db, list(_latest(ticks)))
+    if portfolio_ids:
+        expired = expire_positions(portfolio_ids)
+        logger.debug(f"Marked the positions of {expired}/{len(portfolio_ids)} portfolios stale")
+
+
+def _notified_sessions(db: Session, user_ids: Set[int]) -> Set[Tuple[int, int, str]]:
+    """(user id, asset id, session id) of the daily change notifications of the last two days"""
+    notifications = (
+        db.query(Notification.user_id, Notification.meta_data)
+        .filter(Notification.user_id.in_(user_ids))
+        .filter(Notification.type.in_([NotificationType.DAILY_CHANGE_UP, NotificationType.DAILY_CHANGE_DOWN]))
+        .filter(Notification.created_at >= datetime.utcnow() - timedelta(days=2))
+        .all()
+    )
+    return {
+        (user_id, metadata.get("asset_id"), metadata.get("session_id"))
+        for user_id, metadata in notifications if metadata
+    }
+
+
+def _notify_daily_changes(db: Session, ticks: List[PriceTick]) -> None:
+    from app.services.notifications import notification_service
+
+    latest = _latest(tick for tick in ticks if tick.daily_change_pct is not None)
+    if not latest:
+        return
+    holdings = (
+        db.query(PositionSnapshot, Asset, User.id, User.daily_change_threshold_pct)
+        .join(Asset, Asset.id == PositionSnapshot.asset_id)
+        .join(Portfolio, Portfolio.id == PositionSnapshot.portfolio_id)
+        .join(User, User.id == Portfolio.user_id)
+        .filter(PositionSnapshot.asset_id.in_(list(latest)))
+        .filter(PositionSnapshot.quantity > 0)
+        .filter(User.is_active == True)  # noqa: E712
+        .filter(User.daily_change_notifications_enabled == True)  # noqa: E712
+        .order_by(PositionSnapshot.portfolio_id)
+        .all()
+    )
+
+    # Holders past their threshold, on exchanges in session (a closed one quotes the last session's change)
+    due = []
+    for snapshot, asset, user_id, threshold in holdings:
+        tick = latest[asset.id]
+        if abs(tick.daily_change_pct) < Decimal(str(threshold or 5.0)):
+            continue
+        exchange = exchange_for_symbol(asset.symbol, asset.class_)
+        if exchange.is_open():
+            due.append((snapshot, asset, user_id, tick, exchange.session_date().isoformat()))
+    if not due:
+        return
+
+    # One notification per asset per user per trading day, whatever the number of portfolios holding it
+    sent = _notified_sessions(db, {user_id for _, _, user_id, _, _ in due})
+    for snapshot, asset, user_id, tick, session_id in due:
+        if (user_id, asset.id, session_id) in sent:
+            continue
+        sent.add((user_id, asset.id, session_id))
+        notification_service.create_daily_change_notification(
+            db=db,
+            user_id=user_id,
+            symbol=asset.symbol,
+            asset_name=asset.name or asset.symbol,
+            asset_id=asset.id,
+            portfolio_id=snapshot.portfolio_id,
+            current_price=tick.price,
+            daily_change_pct=tick.daily_change_pct,
+            quantity=snapshot.quantity,
+            session_id=session_id
+        )
+
+
+# Consumer group -> handler of a batch of ticks
+CONSUMER_GROUPS: Dict[str, Callable[[Session, List[PriceTick]], None]] = {
+    "ath": _track_all_time_highs,
+    "alerts": _evaluate_alerts,
+    "positions": _expire_positions,
+    "daily_change": _notify_daily_changes,
+}
+
+
+def _apply(group: str, db: Session, ticks: List[PriceTick]) -> None:
+    started = time.perf_counter()
+    CONSUMER_GROUPS[group](db, ticks)
+    db.commit()
+    counters = _group_counters[group]
+    counters.update(handled=len(ticks), batches=1)
+    counters["busy_seconds"] += time.perf_counter() - started
+
+
+def publish_price_ticks(ticks: List[PriceTick]) -> None:
+    """
+    Publish fetched prices to their consumer groups (one pipeline)
+
+    Without Redis they are applied here by every group in turn, each in a
+    session of its own so a failure never touches the caller's transaction,
+    and pushed to this worker's live price connections. Never raises: a
+    failing group is logged and rolled back.
+    """
+    from app.services.price_feed import price_feed
+
+    if not ticks:
+        return
+    redis_client = get_redis_binary()
+    if redis_client is not None:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for tick in ticks:
+                pipe.xadd(STREAM_KEY, tick.to_fields(), maxlen=settings.PRICE_TICK_STREAM_MAXLEN, approximate=True)
+            pipe.execute()
+            _publish_counters.update(published=len(ticks))
+            return
+        except RedisError as e:
+            logger.warning(f"Price tick publish error, applying {len(ticks)} ticks inline: {e}")
+
+    _publish_counters.update(inline=len(ticks))
+    price_feed.publish_local(ticks)
+    for group in CONSUMER_GROUPS:
+        try:
+            with get_db_context() as db:
+                _apply(group, db, ticks)
+        except Exception as e:
+            _group_counters[group].update(failed=len(ticks))
+            logger.warning(f"Price tick handling by {group} failed: {e}")
+
+
+def _consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _ensure_group(redis_client, group: str) -> None:
+    if group in _groups_ready:
+        return
+    try:
+        # From the start of the stream: a group created after ticks were published still gets them
+        redis_client.xgroup_create(STREAM_KEY, group, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    _groups_ready.add(group)
+
+
+def _claim_abandoned(redis_client, group: str) -> List[Tuple[bytes, Optional[Dict[bytes, bytes]]]]:
+    """Entries left unacknowledged for PRICE_TICK_CLAIM_IDLE_SECONDS, claimed for another attempt"""
+    idle_ms = settings.PRICE_TICK_CLAIM_IDLE_SECONDS * 1000
+    pending = redis_client.xpending_range(
+        STREAM_KEY, group, min="-", max="+", count=settings.PRICE_TICK_BATCH_SIZE, idle=idle_ms
+    )
+    exhausted = [entry["message_id"] for entry in pending if entry["times_delivered"] >= settings.PRICE_TICK_MAX_DELIVERIES]
+    retry = [entry["message_id"] for entry in pending if entry["times_delivered"] < settings.PRICE_TICK_MAX_DELIVERIES]
+    if exhausted:
+        redis_client.xack(STREAM_KEY, group, *exhausted)
+        _group_counters[group].update(dropped=len(exhausted))
+        logger.error(f"Dropped {len(exhausted)} price ticks {group} failed on {settings.PRICE_TICK_MAX_DELIVERIES} times")
+    if not retry:
+        return []
+    return redis_client.xclaim(STREAM_KEY, group, _consumer_name(), min_idle_time=idle_ms, message_ids=retry)
+
+
+def consume_price_ticks(group: str, max_batches: int = _MAX_BATCHES_PER_RUN) -> int:
+    """
+    Apply the ticks waiting for a consumer group, in batches of PRICE_TICK_BATCH_SIZE
+
+    Abandoned entries are retried first, then new ones read until the stream
+    is drained or max_batches were handled. Each batch runs on its own
+    database session and is acknowledged once committed.
+
+    Returns:
+        Number of ticks applied
+    """
+    redis_client = get_redis_binary()
+    if redis_client is None:
+        return 0
+
+    applied = 0
+    try:
+        _ensure_group(redis_client, group)
+        entries = _claim_abandoned(redis_client, group)
+        for _ in range(max_batches):
+            if not entries:
+                reply = redis_client.xreadgroup(
+                    group, _consumer_name(), {STREAM_KEY: ">"}, count=settings.PRICE_TICK_BATCH_SIZE
+                )
+                entries = reply[0][1] if reply else []
+                if not entries:
+                    break
+            ids = [entry_id for entry_id, _ in entries]
+            # Entries trimmed from the stream while pending come back without fields
+            ticks = [PriceTick.from_fields(fields) for _, fields in entries if fields]
+            entries = []
+            try:
+                with get_db_context() as db:
+                    _apply(group, db, ticks)
+            except Exception as e:
+                _group_counters[group].update(failed=len(ids))
+                logger.error(f"Price tick handling by {group} failed, {len(ids)} ticks left for a retry: {e}")
+                continue
+            redis_client.xack(STREAM_KEY, group, *ids)
+            applied += len(ticks)
+    except ResponseError as e:
+        if "NOGROUP" in str(e):
+            # Stream deleted (Redis flushed): recreate the group next time
+            _groups_ready.discard(group)
+        logger.warning(f"Price tick consumer {group} error: {e}")
+    except RedisError as e:
+        logger.warning(f"Price tick consumer {group} error: {e}")
+    return applied
+
+
+def get_price_tick_stats() -> Dict[str, Any]:
+    """
+    Ticks published by this process and, per consumer group, its lag and throughput
+
+    lag: ticks in the stream not yet delivered to the group (None when Redis
+    cannot tell); pending: delivered, not yet acknowledged. Handling counts
+    and ticks_per_second (ticks applied per second spent applying them) are
+    this process's.
+    """
+    stream_length = None
+    groups_info: Dict[str, Dict[str, Any]] = {}
+    redis_client = get_redis_binary()
+    if redis_client is not None:
+        try:
+            stream_length = redis_client.xlen(STREAM_KEY)
+            if stream_length:
+                groups_info = {
+                    info["name"].decode() if isinstance(info["name"], bytes) else info["name"]: info
+                    for info in redis_client.xinfo_groups(STREAM_KEY)
+                }
+        except RedisError as e:
+            logger.warning(f"Price tick stream stats error: {e}")
+
+    groups = {}
+    for group in CONSUMER_GROUPS:
+        counters = _group_counters[group]
+        info = groups_info.get(group, {})
+        busy = counters["busy_seconds"]
+        groups[group] = {
+            "lag": info.get("lag"),
+            "pending": info.get("pending"),
+            "handled": counters["handled"],
+            "batches": counters["batches"],
+            "failed": counters["failed"],
+            "dropped": counters["dropped"],
+            "ticks_per_second": round(counters["handled"] / busy, 1) if busy else 0.0,
+        }
+    return {
+        "published": _publish_counters["published"],
+        "applied_inline": _publish_counters["inline"],
+        "stream_length": stream_length,
+        "groups": groups,
+    }
@@ -1,104 +1,45 @@
 """
-Pricing service using yfinance with Redis caching
+Pricing service backed by the shared upstream quote provider with Redis caching
 """
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Dict, List, Optional, Tuple
-import yfinance as yf
+import pandas as pd
 from sqlalchemy.orm import Session
 from fastapi import Depends
 
 from app.config import settings
 from app.models import Asset, Price
 from app.crud import prices as crud_prices
-from app.schemas import PriceCreate, PriceQuote
-from app.db import get_db
-from app.services.cache import CacheService, cache_price, get_cached_price
+from app.schemas import PriceQuote
+from app.db import get_db, get_db_context, run_db
+from app.services.cache import CacheService, cache_prices, get_cached_prices
+from app.services.cache_refresh import claim_refreshes, revalidate, schedule_refresh
+from app.services.currency import CurrencyService
+from app.services.market_calendar import is_market_open
+from app.services.price_ticks import PriceTick, publish_price_ticks
+from app.services.quote_provider import get_quote_provider, run_sync
+from app.services.single_flight import (
+    COALESCED_LOCAL, COALESCED_REMOTE, FALLBACK, complete_many, held, record, single_flight,
+    try_acquire_many, wait_for,
+)
 
 logger = logging.getLogger(__name__)
 
-# In-memory cache for price fetches (symbol -> (quote, timestamp))
-_price_memory_cache: Dict[str, Tuple[PriceQuote, datetime]] = {}
-_memory_cache_lock: Optional[asyncio.Lock] = None
-_memory_cache_loop: Optional[asyncio.AbstractEventLoop] = None
-_MEMORY_CACHE_TTL = timedelta(seconds=30)  # Very short TTL for in-memory cache
+# Deduplication map for ongoing fetches, keyed by (event loop, symbol) so a
+# future is only ever awaited on the loop that created it. Tasks from
+# get_price(), plain futures from batches. Entries are removed by their owner
+# when the fetch completes; no lock is needed since claiming a symbol never
+# awaits between the lookup and the insert.
+_ongoing_fetches: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
 
-# Deduplication cache for ongoing fetches
-_ongoing_fetches: Dict[str, asyncio.Task] = {}
-_fetch_lock: Optional[asyncio.Lock] = None
-_fetch_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+# Single-flight lease of a quote fetch, across processes (within the 20s fetch timeouts)
+_FETCH_LEASE_SECONDS = 15
 
-
-def _cleanup_stale_tasks():
-    """
-    Clean up tasks from different event loops to prevent 'attached to a different loop' errors.
-    This should be called when switching between event loops (e.g., in scheduler jobs).
-    """
-    global _ongoing_fetches, _fetch_lock, _fetch_lock_loop
-    
-    try:
-        current_loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # No running loop, clear everything to be safe
-        _ongoing_fetches.clear()
-        _fetch_lock = None
-        _fetch_lock_loop = None
-        return
-    
-    # Clear tasks that are from a different loop
-    stale_symbols = []
-    for symbol, task in _ongoing_fetches.items():
-        try:
-            if task._loop != current_loop:
-                stale_symbols.append(symbol)
-        except AttributeError:
-            stale_symbols.append(symbol)
-    
-    for symbol in stale_symbols:
-        _ongoing_fetches.pop(symbol, None)
-    
-    # Reset lock if it's from a different loop
-    if _fetch_lock_loop is not None and _fetch_lock_loop != current_loop:
-        _fetch_lock = None
-        _fetch_lock_loop = None
-
-
-def _get_memory_lock() -> asyncio.Lock:
-    """Get or create the memory cache lock for the current event loop"""
-    global _memory_cache_lock, _memory_cache_loop
-    
-    try:
-        current_loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # No running loop, create one
-        current_loop = asyncio.get_event_loop()
-    
-    # Check if lock exists and is bound to the current loop
-    if _memory_cache_lock is None or _memory_cache_loop is not current_loop:
-        _memory_cache_lock = asyncio.Lock()
-        _memory_cache_loop = current_loop
-    
-    return _memory_cache_lock
-
-
-def _get_fetch_lock() -> asyncio.Lock:
-    """Get or create the fetch lock for the current event loop"""
-    global _fetch_lock, _fetch_lock_loop
-    
-    try:
-        current_loop = asyncio.get_running_loop()
-    except RuntimeError:
-        # No running loop, create one
-        current_loop = asyncio.get_event_loop()
-    
-    # Check if lock exists and is bound to the current loop
-    if _fetch_lock is None or _fetch_lock_loop is not current_loop:
-        _fetch_lock = asyncio.Lock()
-        _fetch_lock_loop = current_loop
-    
-    return _fetch_lock
+# Upstream time allowed per chunk of PRICE_BATCH_FETCH_SIZE symbols of a batch
+_UPSTREAM_TIMEOUT_PER_CHUNK = 20.0
 
 
 class PricingService:
@@ -113,74 +54,56 @@ class PricingService:
         Get current price for a symbol (async to avoid blocking)
         
         Uses multi-level caching:
-        1. Redis cache (30-60 seconds TTL) - fastest, shared across instances
+        1. CacheService (in-process tier, then Redis) - fastest, shared across instances;
+           a stale quote is returned while one background refresh fetches a new one
         2. Database cache (configured TTL) - persistent across restarts
-        3. yfinance API - fallback
+        3. Upstream quote provider (Yahoo Finance) - fallback
         
-        Also deduplicates concurrent requests for the same symbol.
-        Includes timeout to prevent hanging on slow yfinance calls.
+        Also deduplicates concurrent requests for the same symbol, within this
+        event loop and across processes (single flight).
+        Upstream calls have per-request timeouts; the whole fetch is bounded too.
         """
         # Check Redis cache first (very fast, shared across instances)
         if not force_refresh:
-            cached = get_cached_price(symbol)
+            price_key = f"{CacheService.PREFIX_PRICE}{symbol}"
+            cached, stale = CacheService.get_swr(price_key)
             if cached:
-                logger.debug(f"Using Redis cached price for {symbol}")
-                return PriceQuote(**cached)
+                logger.debug(f"Using Redis cached price for {symbol}" + (" (stale)" if stale else ""))
+                if stale:
+                    revalidate(price_key, lambda: _refresh_cached_prices([symbol]))
+                return cached if isinstance(cached, PriceQuote) else PriceQuote(**cached)
         
-        # Get the current event loop to ensure task is created in the right loop
-        try:
-            current_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            # No running loop - this shouldn't happen in async context
-            logger.warning(f"No running event loop when fetching price for {symbol}")
-            return await self._get_price_internal(symbol, force_refresh)
-        
-        # Check if there's an ongoing fetch for this symbol in the current loop
-        async with _get_fetch_lock():
-            if symbol in _ongoing_fetches:
-                existing_task = _ongoing_fetches[symbol]
-                # Verify the task is from the same event loop
-                try:
-                    # Check if task's loop matches current loop
-                    if existing_task._loop == current_loop:
-                        logger.info(f"Reusing ongoing price fetch for {symbol}")
-                        try:
-                            return await asyncio.wait_for(existing_task, timeout=15.0)
-                        except asyncio.TimeoutError:
-                            logger.warning(f"Timeout waiting for ongoing fetch for {symbol}")
-                            return None
-                        except asyncio.CancelledError:
-                            logger.warning(f"Task cancelled while waiting for ongoing fetch for {symbol}")
-                            _ongoing_fetches.pop(symbol, None)
-                            return None
-                    else:
-                        # Task is from a different loop, remove it and create a new one
-                        logger.warning(f"Removing stale task for {symbol} (different event loop)")
-                        _ongoing_fetches.pop(symbol, None)
-                except AttributeError:
-                    # Task doesn't have _loop attribute (shouldn't happen), treat as stale
-                    logger.warning(f"Removing invalid task for {symbol}")
-                    _ongoing_fetches.pop(symbol, None)
-            
-            # Create a new task for this fetch in the current loop
-            task = asyncio.create_task(self._get_price_internal(symbol, force_refresh))
-            _ongoing_fetches[symbol] = task
+        key = (asyncio.get_running_loop(), symbol)
+        
+        # Reuse an ongoing fetch for this symbol on this event loop
+        existing = _ongoing_fetches.get(key)
+        if existing is not None and not existing.done():
+            record(f"{CacheService.PREFIX_PRICE}{symbol}", COALESCED_LOCAL)
+            logger.info(f"Reusing ongoing price fetch for {symbol}")
+            try:
+                return await asyncio.wait_for(asyncio.shield(existing), timeout=15.0)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout waiting for ongoing fetch for {symbol}")
+                return None
+            except Exception as e:
+                logger.error(f"Error fetching price for {symbol}: {e}")
+                return None
+        
+        def store(quote: Optional[PriceQuote]) -> None:
+            if quote:
+                cache_prices({symbol: quote}, self._quote_cache_ttl)
+        
+        task = asyncio.create_task(single_flight(
+            f"{CacheService.PREFIX_PRICE}{symbol}",
+            lambda: self._get_price_internal(symbol, force_refresh),
+            store=store,
+            lease_seconds=_FETCH_LEASE_SECONDS,
+        ))
+        _ongoing_fetches[key] = task
         
         try:
             # Add timeout to prevent hanging
-            result = await asyncio.wait_for(task, timeout=20.0)
-            
-            # Update Redis cache
-            if result:
-                # Cache with shorter TTL during market hours, longer after close
-                now = datetime.utcnow()
-                # Market hours: 14:30-21:00 UTC (9:30-16:00 EST)
-                is_market_hours = 14 <= now.hour < 21 and now.weekday() < 5
-                ttl = 60 if is_market_hours else 300  # 1 min or 5 min
-                
-                cache_price(symbol, result.model_dump(), ttl)
-            
-            return result
+            return await asyncio.wait_for(task, timeout=20.0)
         except asyncio.TimeoutError:
             logger.warning(f"Timeout fetching price for {symbol}")
             return None
@@ -188,165 +111,456 @@ class PricingService:
             logger.warning(f"Task cancelled while fetching price for {symbol}")
             return None
         finally:
-            # Remove from ongoing fetches
-            async with _get_fetch_lock():
-                _ongoing_fetches.pop(symbol, None)
+            if _ongoing_fetches.get(key) is task:
+                _ongoing_fetches.pop(key, None)
     
     async def _get_price_internal(self, symbol: str, force_refresh: bool = False) -> Optional[PriceQuote]:
         """
         Internal method that actually fetches the price
         
         1. Check cache (DB) with TTL
-        2. If stale/missing or force_refresh, fetch from yfinance
+        2. If stale/missing or force_refresh, fetch from the upstream provider
         3. Update cache
         """
-        # Get asset
-        asset = self.db.query(Asset).filter(Asset.symbol == symbol).first()
+        # Get asset and check DB cache
+        asset, latest_price = await run_db(self.db, self._load_asset_with_latest_price, symbol)
         if not asset:
             logger.warning(f"Asset not found: {symbol}")
             return None
         
-        # Check DB cache
-        latest_price = crud_prices.get_latest_price(self.db, asset.id)
-        
         if not force_refresh and latest_price and self._is_price_fresh(latest_price.asof):
             logger.info(f"Using DB cached price for {symbol}")
-            # Try to get the official previous close price from DB first
-            daily_change_pct = self._calculate_daily_change_with_official_close(asset.id, latest_price.price)
-            
-            # If we don't have a daily change (no historical data), try to fetch just the previous close from yfinance
-            if daily_change_pct is None:
-                logger.info(f"No historical data for {symbol}, fetching previous close from yfinance")
-                prev_close_data = await asyncio.to_thread(self._fetch_previous_close_only, symbol, asset.id)
-                if prev_close_data:
-                    daily_change_pct = (
-                        (latest_price.price - prev_close_data) / prev_close_data * 100
-                    )
-            
-            return PriceQuote(
-                symbol=symbol,
-                price=latest_price.price,
-                asof=latest_price.asof,
+            return await self._quote_from_db_price(asset, latest_price)
+        
+        logger.info(f"Fetching fresh price for {symbol} upstream")
+        price = await self._fetch_quote(symbol)
+        
+        if price:
+            return await run_db(self.db, self._save_fetched_price, asset, price)
+        
+        # Fallback to last known price
+        if latest_price:
+            logger.warning(f"Upstream fetch failed, using last known price for {symbol}")
+            return await run_db(self.db, self._quote_from_last_known, asset, latest_price)
+        
+        return None
+    
+    def _load_asset_with_latest_price(self, symbol: str) -> Tuple[Optional[Asset], Optional[Price]]:
+        """Asset by symbol and its latest stored price"""
+        asset = self.db.query(Asset).filter(Asset.symbol == symbol).first()
+        if not asset:
+            return None, None
+        return asset, crud_prices.get_latest_price(self.db, asset.id)
+    
+    async def _quote_from_db_price(self, asset: Asset, latest_price: Price) -> PriceQuote:
+        """Build a quote from a fresh DB price, fetching the previous close if we have none"""
+        return (await self._quotes_from_db_prices([(asset, latest_price)]))[asset.symbol]
+    
+    async def _quotes_from_db_prices(self, stored: List[Tuple[Asset, Price]]) -> Dict[str, PriceQuote]:
+        """
+        Build quotes from fresh DB prices
+        
+        Daily changes come from the stored previous closes of all the assets
+        (one query); the previous closes of assets without history are fetched
+        upstream in one batch and stored with one write.
+        """
+        daily_changes = await run_db(
+            self.db, self._calculate_daily_changes, {asset.id: latest.price for asset, latest in stored}
+        )
+        
+        # If we don't have a daily change (no historical data), try to fetch just the previous close upstream
+        missing = [(asset, latest) for asset, latest in stored if daily_changes.get(asset.id) is None]
+        if missing:
+            logger.info(f"No historical data for {len(missing)} symbols, fetching previous close upstream")
+            closes = await self._fetch_previous_closes([asset for asset, _ in missing])
+            for asset, latest in missing:
+                prev_close = closes.get(asset.id)
+                if prev_close:
+                    daily_changes[asset.id] = (latest.price - prev_close) / prev_close * 100
+        
+        return {
+            asset.symbol: PriceQuote(
+                symbol=asset.symbol,
+                price=latest.price,
+                asof=latest.asof,
                 currency=asset.currency,
-                daily_change_pct=daily_change_pct
+                daily_change_pct=daily_changes.get(asset.id)
             )
+            for asset, latest in stored
+        }
+    
+    def _quote_from_last_known(self, asset: Asset, latest_price: Price) -> PriceQuote:
+        """Build a quote from the last stored price when the upstream fetch failed"""
+        return self._quotes_from_last_known([(asset, latest_price)])[asset.symbol]
+    
+    def _quotes_from_last_known(self, stored: List[Tuple[Asset, Price]]) -> Dict[str, PriceQuote]:
+        """Build quotes from the last stored prices when the upstream fetch failed"""
+        daily_changes = self._calculate_daily_changes({asset.id: latest.price for asset, latest in stored})
+        return {
+            asset.symbol: PriceQuote(
+                symbol=asset.symbol,
+                price=latest.price,
+                asof=latest.asof,
+                currency=asset.currency,
+                daily_change_pct=daily_changes.get(asset.id)
+            )
+            for asset, latest in stored
+        }
+    
+    def _save_fetched_price(self, asset: Asset, price: Dict) -> PriceQuote:
+        """
+        Persist a freshly fetched price (and its official previous close) and build the quote
         
-        # Fetch from yfinance (in thread pool to avoid blocking event loop)
-        logger.info(f"Fetching fresh price for {symbol} from yfinance")
-        price = await asyncio.to_thread(self._fetch_from_yfinance, symbol)
+        Args:
+            asset: Asset the price belongs to
+            price: Dict as returned by _fetch_quote()/_fetch_quotes()
+        """
+        return self._save_fetched_prices([(asset, price)])[asset.symbol]
+    
+    def _save_fetched_prices(self, fetched: List[Tuple[Asset, Dict]]) -> Dict[str, PriceQuote]:
+        """
+        Persist freshly fetched prices (and their official previous closes) and build the quotes
         
-        if price:
-            # Calculate daily change percentage
-            daily_change_pct = None
+        Prices are written with one bulk upsert, previous closes with another,
+        then published as price ticks (app.services.price_ticks).
+        
+        Args:
+            fetched: (asset, price) pairs, prices as returned by
+                _fetch_quote()/_fetch_quotes()
+        """
+        # Calculate daily change percentages
+        daily_changes: Dict[int, Decimal] = {}
+        previous_closes: Dict[int, Decimal] = {}
+        for asset, price in fetched:
             if "previous_close" in price and price["previous_close"] > 0:
-                daily_change_pct = (
+                daily_changes[asset.id] = (
                     (price["price"] - price["previous_close"]) / price["previous_close"] * 100
                 )
-                
-                # Save the official previous close as a historical price point
-                # Use a special source tag to distinguish it from intraday prices
-                yesterday = datetime.utcnow() - timedelta(days=1)
-                # Check if we already have an official previous close stored
-                existing_prev = crud_prices.get_prices(
-                    self.db, 
-                    asset.id, 
-                    date_from=yesterday - timedelta(hours=12),
-                    date_to=yesterday + timedelta(hours=12),
-                    limit=10  # Get more to check for official close
-                )
-                # Only save if we don't have a yfinance_prev_close for this time period
-                has_official_close = any(p.source == "yfinance_prev_close" for p in existing_prev)
-                if not has_official_close:
-                    try:
-                        prev_price_create = PriceCreate(
-                            asset_id=asset.id,
-                            asof=yesterday,
-                            price=price["previous_close"],
-                            volume=None,
-                            source="yfinance_prev_close"
-                        )
-                        crud_prices.create_price(self.db, prev_price_create)
-                        logger.info(f"Saved previous close price for {symbol}: {price['previous_close']}")
-                    except Exception as e:
-                        logger.warning(f"Failed to save previous close for {symbol}: {e}")
-            
-            # Save current price to cache
-            price_create = PriceCreate(
+                previous_closes[asset.id] = price["previous_close"]
+        
+        # Save the official previous closes as historical price points
+        # Use a special source tag to distinguish them from intraday prices
+        if previous_closes:
+            try:
+                stored = self._store_previous_closes(previous_closes)
+                if stored:
+                    logger.info(f"Saved previous close prices for {len(stored)} assets")
+            except Exception as e:
+                self.db.rollback()
+                logger.warning(f"Failed to save previous closes: {e}")
+        
+        # Save current prices
+        crud_prices.bulk_upsert_prices(self.db, [
+            {
+                "asset_id": asset.id,
+                "asof": price["asof"],
+                "price": price["price"],
+                "volume": price.get("volume"),
+                "source": "yfinance",
+            }
+            for asset, price in fetched
+        ])
+        
+        # Hand the prices to what follows them: ATH, price alerts, positions cache, daily change notifications
+        publish_price_ticks([
+            PriceTick(
                 asset_id=asset.id,
-                asof=price["asof"],
+                symbol=asset.symbol,
                 price=price["price"],
-                volume=price.get("volume"),
-                source="yfinance"
+                asof=price["asof"] or datetime.utcnow(),
+                daily_change_pct=daily_changes.get(asset.id)
             )
-            crud_prices.create_price(self.db, price_create)
-            
-            # Trigger ATH update in background
-            try:
-                from app.tasks.ath_tasks import update_asset_ath
-                update_asset_ath.delay(
-                    asset_id=asset.id,
-                    current_price=float(price["price"]),
-                    price_date=price["asof"].isoformat() if price["asof"] else None
-                )
-            except Exception as e:
-                logger.warning(f"Failed to trigger ATH update for {symbol}: {e}")
-            
-            return PriceQuote(
-                symbol=symbol,
+            for asset, price in fetched
+        ])
+        
+        return {
+            asset.symbol: PriceQuote(
+                symbol=asset.symbol,
                 price=price["price"],
                 asof=price["asof"],
                 currency=asset.currency,
-                daily_change_pct=daily_change_pct
+                daily_change_pct=daily_changes.get(asset.id)
             )
+            for asset, price in fetched
+        }
+    
+    @staticmethod
+    def _quote_cache_ttl(symbol: str) -> int:
+        """Redis TTL for a quote: shorter while its exchange trades, longer after close"""
+        return 60 if is_market_open(symbol) else 300  # 1 min or 5 min
+    
+    async def get_multiple_prices(self, symbols: List[str], force_refresh: bool = False) -> Dict[str, PriceQuote]:
+        """
+        Get prices for multiple symbols with a single batched upstream fetch.
         
-        # Fallback to last known price
-        if latest_price:
-            logger.warning(f"yfinance failed, using last known price for {symbol}")
-            daily_change_pct = self._calculate_daily_change_with_official_close(asset.id, latest_price.price)
+        With force_refresh, cached and fresh DB quotes are skipped (as in
+        get_price()) and every symbol is fetched upstream, still as one batch.
+        
+        Unlike calling get_price() per symbol, every step is multi-key:
+        1. One MGET reads every symbol's cached quote; hits are returned directly,
+           stale ones are refreshed together by one background batch
+        2. Symbols already being fetched (by get_price or another batch) reuse that fetch
+        3. All remaining symbols are registered in the dedup map and resolved by
+           _get_prices_batch_shared(): symbols another process is fetching are
+           awaited, the rest go through _get_prices_batch_internal(): DB cache
+           check, then one spark request per chunk of symbols for everything stale
+        4. Fetched quotes are written back in one pipeline (each with its TTL
+           and tag), then fanned back out to the per-symbol futures
+        
+        Performance (cold cache, 100 symbols):
+        - Per-symbol: 100 chart requests
+        - Batched: 5 spark requests (20 symbols each), run concurrently
+        """
+        results: Dict[str, PriceQuote] = {}
+        
+        # Deduplicate while preserving order, then serve Redis hits (one MGET)
+        unique = list(dict.fromkeys(symbols))
+        cached_quotes = get_cached_prices(unique) if not force_refresh else {}
+        pending = []
+        stale_symbols = []
+        for symbol in unique:
+            if symbol in cached_quotes:
+                cached, stale = cached_quotes[symbol]
+                results[symbol] = cached if isinstance(cached, PriceQuote) else PriceQuote(**cached)
+                if stale:
+                    stale_symbols.append(symbol)
+            else:
+                pending.append(symbol)
+        
+        claimed = claim_refreshes([f"{CacheService.PREFIX_PRICE}{symbol}" for symbol in stale_symbols])
+        refresh = [key[len(CacheService.PREFIX_PRICE):] for key in claimed]
+        if refresh:
+            schedule_refresh(lambda: _refresh_cached_prices(refresh), f"{len(refresh)} stale prices")
+        
+        if not pending:
+            return results
+        
+        loop = asyncio.get_running_loop()
+        owned: Dict[str, asyncio.Future] = {}
+        shared: Dict[str, asyncio.Future] = {}
+        
+        # Claim every symbol nobody is fetching yet on this loop; reuse the others
+        for symbol in pending:
+            existing = _ongoing_fetches.get((loop, symbol))
+            if existing is not None and not existing.done():
+                record(f"{CacheService.PREFIX_PRICE}{symbol}", COALESCED_LOCAL)
+                shared[symbol] = existing
+            else:
+                future = loop.create_future()
+                _ongoing_fetches[(loop, symbol)] = future
+                owned[symbol] = future
+        
+        if owned:
+            quotes: Dict[str, PriceQuote] = {}
+            try:
+                # Upstream requests time out on their own (_fetch_upstream), so DB and cache hits always come back
+                quotes = await self._get_prices_batch_shared(list(owned), force_refresh=force_refresh)
+            except Exception as e:
+                logger.error(f"Error batch fetching prices: {e}", exc_info=True)
+            finally:
+                for symbol, future in owned.items():
+                    quote = quotes.get(symbol)
+                    if quote:
+                        results[symbol] = quote
+                    if not future.done():
+                        future.set_result(quote)
+                
+                for symbol, future in owned.items():
+                    if _ongoing_fetches.get((loop, symbol)) is future:
+                        _ongoing_fetches.pop((loop, symbol), None)
+        
+        for symbol, fetch in shared.items():
+            try:
+                quote = await asyncio.wait_for(asyncio.shield(fetch), timeout=15.0)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout waiting for ongoing fetch for {symbol}")
+                continue
+            except Exception as e:
+                logger.error(f"Error fetching price for {symbol}: {e}")
+                continue
+            if quote is not None:
+                results[symbol] = quote
+        
+        return results
+    
+    async def get_converted_prices(self, assets: List[Asset], base_currency: str) -> List[Dict]:
+        """
+        Current price and daily change of each asset, converted to base_currency
+        
+        Entries of the portfolio price batch (GET /portfolios/{id}/prices/batch).
+        Every conversion rate is resolved up front, in a worker thread so the
+        event loop keeps serving; a price that cannot be converted is returned
+        as is, with its original_currency.
+        """
+        price_quotes = await self.get_multiple_prices([asset.symbol for asset in assets])
+        pairs = [(asset.currency, base_currency) for asset in assets]
+        fx = await asyncio.to_thread(CurrencyService.get_rate_matrix, pairs)
+        
+        prices = []
+        for asset in assets:
+            quote = price_quotes.get(asset.symbol)
+            if not (quote and quote.price):
+                continue
+            original_price = float(quote.price)
+            current_price = original_price
             
-            return PriceQuote(
-                symbol=symbol,
-                price=latest_price.price,
-                asof=latest_price.asof,
-                currency=asset.currency,
-                daily_change_pct=daily_change_pct
+            if asset.currency != base_currency:
+                converted = fx.convert(
+                    Decimal(str(original_price)), from_currency=asset.currency, to_currency=base_currency
+                )
+                if converted:
+                    current_price = float(converted)
+                else:
+                    logger.warning(
+                        f"Failed to convert {asset.symbol} from {asset.currency} to {base_currency}, "
+                        f"using original price"
+                    )
+            
+            prices.append({
+                "symbol": asset.symbol,
+                "asset_id": asset.id,
+                "name": asset.name,
+                "current_price": current_price,
+                "original_price": original_price,
+                "original_currency": asset.currency,
+                "daily_change_pct": float(quote.daily_change_pct) if quote.daily_change_pct else None,
+                "last_updated": quote.asof.isoformat() if quote.asof else None,
+                "asset_type": asset.asset_type
+            })
+        return prices
+    
+    async def _get_prices_batch_shared(self, symbols: List[str], force_refresh: bool = False) -> Dict[str, PriceQuote]:
+        """
+        Quotes of the symbols, each fetched by a single process
+        
+        Symbols nobody else is fetching are leased and resolved here in one
+        batch, then cached and handed to the processes waiting for them.
+        Symbols another process holds the lease of are awaited; those it
+        fails to deliver are fetched here afterwards.
+        """
+        acquired = try_acquire_many([f"{CacheService.PREFIX_PRICE}{symbol}" for symbol in symbols], _FETCH_LEASE_SECONDS)
+        leases = {symbol: acquired[f"{CacheService.PREFIX_PRICE}{symbol}"] for symbol in symbols}
+        leased = [symbol for symbol, lease in leases.items() if lease is not None]
+        elsewhere = [symbol for symbol, lease in leases.items() if lease is None]
+        
+        async def fetch_leased() -> Dict[str, PriceQuote]:
+            if not leased:
+                return {}
+            try:
+                fetched = await self._get_prices_batch_internal(leased, force_refresh=force_refresh)
+            except BaseException:
+                for symbol in leased:
+                    leases[symbol].release()
+                raise
+            # Cache the quotes whose lease still holds (one MGET, one pipeline), then hand them over
+            holding = {lease.key for lease in held(leases[symbol] for symbol in leased)}
+            cache_prices(
+                {
+                    symbol: fetched[symbol] for symbol in leased
+                    if fetched.get(symbol) and leases[symbol].key in holding
+                },
+                self._quote_cache_ttl,
             )
+            complete_many((leases[symbol], fetched.get(symbol)) for symbol in leased)
+            return fetched
         
-        return None
+        quotes, waited = await asyncio.gather(
+            fetch_leased(),
+            asyncio.gather(*(
+                wait_for(f"{CacheService.PREFIX_PRICE}{symbol}", _FETCH_LEASE_SECONDS) for symbol in elsewhere
+            )),
+        )
+        
+        undelivered = []
+        for symbol, (completed, quote) in zip(elsewhere, waited):
+            if not completed:
+                undelivered.append(symbol)
+                continue
+            record(f"{CacheService.PREFIX_PRICE}{symbol}", COALESCED_REMOTE)
+            if quote:
+                quotes[symbol] = quote
+        
+        if undelivered:
+            logger.warning(f"{len(undelivered)} prices fetched by another process did not arrive, fetching them here")
+            fetched = await self._get_prices_batch_internal(undelivered, force_refresh=force_refresh)
+            for symbol in undelivered:
+                record(f"{CacheService.PREFIX_PRICE}{symbol}", FALLBACK)
+            cache_prices({symbol: quote for symbol, quote in fetched.items() if quote}, self._quote_cache_ttl)
+            quotes.update(fetched)
+        return quotes
     
-    async def get_multiple_prices(self, symbols: List[str]) -> Dict[str, PriceQuote]:
+    async def _get_prices_batch_internal(self, symbols: List[str], force_refresh: bool = False) -> Dict[str, PriceQuote]:
         """
-        Get prices for multiple symbols concurrently using asyncio.gather().
+        Resolve many symbols at once: DB cache first, then one bulk upstream fetch
         
-        This method fetches prices in TRUE parallel, dramatically reducing latency
-        when cache is cold. Each get_price() call handles its own:
-        - Redis caching (shared, fast)
-        - Request deduplication (prevents duplicate fetches)
-        - Database writes (each symbol manages its own DB session)
+        With force_refresh every symbol is fetched upstream, whatever its DB age.
         
-        Performance: 
-        - Sequential: 30 symbols * 1.2s = 36 seconds
-        - Parallel: max(1.2s for all 30) = 1.2 seconds
+        The assets and their latest prices are loaded with two queries, the
+        daily changes of the fresh ones with one more. Symbols the bulk request
+        could not resolve fall back to the single-symbol path (_fetch_quote),
+        fetched concurrently, then to the last known DB price.
         """
-        results = {}
+        fresh: List[Tuple[Asset, Price]] = []
+        stale: Dict[str, Tuple[Asset, Optional[Price]]] = {}
         
-        # Launch all fetches in parallel using gather
-        # return_exceptions=True prevents one failure from killing all fetches
-        tasks = [self.get_price(symbol) for symbol in symbols]
-        prices = await asyncio.gather(*tasks, return_exceptions=True)
+        for asset, latest_price in await run_db(self.db, self._load_assets_with_latest_prices, symbols):
+            if not force_refresh and latest_price and self._is_price_fresh(latest_price.asof):
+                fresh.append((asset, latest_price))
+            else:
+                stale[asset.symbol] = (asset, latest_price)
         
-        # Collect results, filtering out exceptions and None values
-        for symbol, price in zip(symbols, prices):
-            if isinstance(price, Exception):
-                logger.error(f"Error fetching price for {symbol}: {price}")
-            elif price is not None:
-                results[symbol] = price
+        quotes = await self._quotes_from_db_prices(fresh) if fresh else {}
+        if not stale:
+            return quotes
         
-        return results
+        chunks = -(-len(stale) // settings.PRICE_BATCH_FETCH_SIZE)
+        try:
+            fetched = await asyncio.wait_for(self._fetch_upstream(list(stale)), timeout=_UPSTREAM_TIMEOUT_PER_CHUNK * chunks)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout fetching {len(stale)} prices upstream, using the last known prices")
+            fetched = {}
+        
+        quotes.update(await run_db(self.db, self._save_batch, stale, fetched))
+        return quotes
+    
+    async def _fetch_upstream(self, symbols: List[str]) -> Dict[str, Optional[Dict]]:
+        """One bulk upstream fetch, then single-symbol fetches for what it missed"""
+        logger.info(f"Batch fetching {len(symbols)} prices upstream")
+        fetched: Dict[str, Optional[Dict]] = dict(await self._fetch_quotes(symbols))
+        
+        missing = [symbol for symbol in symbols if symbol not in fetched]
+        if missing:
+            logger.info(f"{len(missing)} symbols missing from batch download, fetching individually")
+            singles = await asyncio.gather(*(self._fetch_quote(symbol) for symbol in missing))
+            fetched.update(zip(missing, singles))
+        return fetched
+    
+    def _load_assets_with_latest_prices(self, symbols: List[str]) -> List[Tuple[Asset, Optional[Price]]]:
+        """Assets for the symbols, each with its latest stored price (two queries)"""
+        assets = self.db.query(Asset).filter(Asset.symbol.in_(symbols)).all()
+        latest_prices = crud_prices.get_latest_prices(self.db, [asset.id for asset in assets])
+        return [(asset, latest_prices.get(asset.id)) for asset in assets]
+    
+    def _save_batch(
+        self, stale: Dict[str, Tuple[Asset, Optional[Price]]], fetched: Dict[str, Optional[Dict]]
+    ) -> Dict[str, PriceQuote]:
+        """Persist fetched prices of a batch, falling back to the last known price"""
+        saved = [(asset, fetched[symbol]) for symbol, (asset, _) in stale.items() if fetched.get(symbol)]
+        last_known = [
+            (asset, latest_price) for symbol, (asset, latest_price) in stale.items()
+            if not fetched.get(symbol) and latest_price
+        ]
+        for asset, _ in last_known:
+            logger.warning(f"Upstream fetch failed, using last known price for {asset.symbol}")
+        
+        quotes = self._save_fetched_prices(saved) if saved else {}
+        if last_known:
+            quotes.update(self._quotes_from_last_known(last_known))
+        return quotes
     
     async def refresh_all_portfolio_prices(self, portfolio_id: int) -> int:
         """
-        Refresh prices for all assets in a portfolio concurrently
+        Force refresh prices for all assets in a portfolio as one batch
         Returns number of prices updated
         """
         from app.models import Transaction
@@ -360,12 +574,9 @@ class PricingService:
             .all()
         )
         
-        # Force refresh all prices concurrently
-        symbols = [asset.symbol for asset in assets]
-        tasks = [self.get_price(symbol, force_refresh=True) for symbol in symbols]
-        prices = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        count = sum(1 for price in prices if not isinstance(price, Exception) and price)
+        # Force refresh all prices with one batched fetch
+        prices = await self.get_multiple_prices([asset.symbol for asset in assets], force_refresh=True)
+        count = len(prices)
         
         logger.info(f"Refreshed {count} prices for portfolio {portfolio_id}")
         return count
@@ -373,202 +584,167 @@ class PricingService:
     def ensure_historical_prices(self, asset: Asset, start_date: datetime, end_date: datetime, interval: str = '1d') -> int:
         """
         Ensure historical close prices exist in DB for an asset over [start_date, end_date].
-        Returns number of new price rows saved.
+        Returns number of new price rows saved (existing days are refreshed in place).
         """
         try:
-            # Fetch history from yfinance
-            ticker = yf.Ticker(asset.symbol)
-            # Map our interval to yfinance interval
-            yf_interval = '1d' if interval in ('1d', '1w') else '1d'
-            hist = ticker.history(start=start_date.date(), end=(end_date + timedelta(days=1)).date(), interval=yf_interval)
+            # Daily bars for every supported interval
+            hist = run_sync(lambda provider: provider.get_history(
+                asset.symbol, start_date.date(), (end_date + timedelta(days=1)).date(), interval='1d'
+            ))
             if hist is None or hist.empty:
                 return 0
 
-            from app.schemas import PriceCreate
-            from app.crud import prices as crud_prices
-
-            new_count = 0
-            # Save close prices by day
-            for idx, row in hist.iterrows():
-                try:
-                    asof_dt = datetime(idx.year, idx.month, idx.day)
-                    price_val = Decimal(str(float(row.get('Close'))))
-                    if price_val and price_val > 0:
-                        pc = PriceCreate(
-                            asset_id=asset.id,
-                            asof=asof_dt,
-                            price=price_val,
-                            volume=int(row.get('Volume', 0)) if 'Volume' in row else None,
-                            source='yfinance_history'
-                        )
-                        crud_prices.create_price(self.db, pc)
-                        new_count += 1
-                except Exception:
-                    # Skip bad row
-                    continue
-            return new_count
+            counts = crud_prices.bulk_upsert_prices(
+                self.db,
+                self._history_to_price_rows(asset.id, hist, source='yfinance_history')
+            )
+            logger.info(
+                f"Saved history for {asset.symbol}: {counts['inserted']} new, {counts['updated']} updated"
+            )
+            return counts["inserted"]
         except Exception as e:
             logger.warning(f"Failed to fetch history for {asset.symbol}: {e}")
+            self.db.rollback()
             return 0
     
-    def _fetch_from_yfinance(self, symbol: str) -> Optional[Dict]:
+    @staticmethod
+    def _history_to_price_rows(asset_id: int, hist: pd.DataFrame, source: str) -> List[Dict]:
+        """
+        Convert a quote provider history frame to price rows for bulk_upsert_prices()
+        
+        Column-wise instead of iterrows(): one row per day at midnight of the
+        exchange-local date, rows without a positive close are dropped.
+        """
+        closes = pd.to_numeric(hist['Close'], errors='coerce')
+        valid = (closes > 0).to_numpy()
+        if not valid.any():
+            return []
+        
+        index = pd.DatetimeIndex(hist.index[valid])
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        days = index.normalize().to_pydatetime()
+        prices = closes.to_numpy()[valid].tolist()
+        
+        if 'Volume' in hist:
+            volumes = pd.to_numeric(hist['Volume'], errors='coerce').fillna(0).astype('int64').to_numpy()[valid].tolist()
+        else:
+            volumes = [None] * len(prices)
+        
+        return [
+            {
+                "asset_id": asset_id,
+                "asof": day,
+                "price": Decimal(str(price)),
+                "volume": volume,
+                "source": source,
+            }
+            for day, price, volume in zip(days, prices, volumes)
+        ]
+    
+    async def _fetch_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
         """
-        Fetch price from Yahoo Finance
+        Fetch prices for many symbols with batched upstream requests
+        
+        Uses the last two daily closes of a 5-day window for price and previous
+        close, like the history fallback of _fetch_quote().
+        
+        Returns dict of symbol -> {price, asof, volume, previous_close}. Symbols
+        without usable data are omitted so callers can fall back individually.
+        """
+        results = await get_quote_provider().get_quotes(symbols)
+        logger.info(f"Batch download resolved {len(results)}/{len(symbols)} symbols")
+        return results
+    
+    async def _fetch_quote(self, symbol: str) -> Optional[Dict]:
+        """
+        Fetch the current quote of one symbol from the quote provider
         
         Returns dict with price, asof, volume, previous_close or None
         
-        Strategy: Use ticker.info for both current price and previousClose.
+        The Yahoo provider uses regularMarketPrice and previousClose from the chart meta.
         This matches what Yahoo Finance website and other platforms (Trade Republic) show.
         The previousClose includes after-hours trading and is the reference point for
         intraday percentage calculations that users expect to see.
         """
-        import socket
-        # Set socket timeout to prevent hanging on slow network
-        old_timeout = socket.getdefaulttimeout()
-        socket.setdefaulttimeout(10.0)  # 10 second timeout
-        
+        logger.info(f"Fetching data for {symbol}")
         try:
-            ticker = yf.Ticker(symbol)
-            
-            # Try to get current price and previous close from info
-            # This is what Yahoo Finance website uses and what users expect
-            logger.info(f"Fetching data for {symbol}")
-            try:
-                info = ticker.info
-                current_price = info.get('regularMarketPrice') or info.get('currentPrice')
-                prev_close = info.get('previousClose')
-                
-                if current_price and current_price > 0:
-                    result = {
-                        "price": Decimal(str(current_price)),
-                        "asof": datetime.utcnow(),
-                        "volume": info.get('regularMarketVolume')
-                    }
-                    
-                    if prev_close and prev_close > 0:
-                        result["previous_close"] = Decimal(str(prev_close))
-                        logger.info(f"Yahoo Finance for {symbol}: price=${current_price}, prev_close=${prev_close}")
-                    
-                    return result
-            except Exception as e:
-                logger.warning(f"ticker.info failed for {symbol}: {e}")
-            
-            # Fallback to history for both current and previous close
-            logger.info(f"Fetching history for {symbol}")
-            hist = ticker.history(period="10d")
-            
-            if not hist.empty:
-                logger.info(f"History data for {symbol}: {len(hist)} rows")
-                last_row = hist.iloc[-1]
-                current_price = Decimal(str(float(last_row["Close"])))
-                
-                result = {
-                    "price": current_price,
-                    "asof": datetime.utcnow(),
-                    "volume": int(last_row.get("Volume", 0)) if "Volume" in last_row else None
-                }
-                
-                # Get previous close from history
-                if len(hist) > 1:
-                    prev_row = hist.iloc[-2]
-                    prev_close_val = Decimal(str(float(prev_row["Close"])))
-                    result["previous_close"] = prev_close_val
-                    logger.info(f"Using history for {symbol}: price=${current_price}, prev_close=${prev_close_val}")
-                
-                return result
-            
-            logger.error(f"No data returned from yfinance for {symbol}")
-            return None
-            
+            result = await get_quote_provider().get_quote(symbol)
         except Exception as e:
             logger.error(f"Error fetching price for {symbol}: {e}")
             return None
-        finally:
-            # Restore original timeout
-            socket.setdefaulttimeout(old_timeout)
+        
+        if result is None:
+            logger.error(f"No data returned upstream for {symbol}")
+        elif "previous_close" in result:
+            logger.info(f"Quote for {symbol}: price=${result['price']}, prev_close=${result['previous_close']}")
+        return result
     
     def _is_price_fresh(self, asof: datetime) -> bool:
         """Check if price is within TTL"""
         age = datetime.utcnow() - asof
         return age < self.cache_ttl
     
-    def _fetch_previous_close_only(self, symbol: str, asset_id: int) -> Optional[Decimal]:
+    async def _fetch_previous_closes(self, assets: List[Asset]) -> Dict[int, Decimal]:
         """
-        Fetch only the previous close from yfinance and save it to DB.
-        This is used when we have a cached price but no historical data for daily change calculation.
-        Returns the previous close price if found, None otherwise.
+        Fetch only the previous closes of assets (batched upstream) and save them to DB
         
-        Uses ticker.info previousClose to match what Yahoo Finance website shows.
+        Used when we have a cached price but no historical data for daily change
+        calculation. Returns asset id -> previous close for the assets resolved.
         """
         try:
-            ticker = yf.Ticker(symbol)
-            
-            # Try ticker.info first - matches Yahoo Finance website
+            quotes = await get_quote_provider().get_quotes([asset.symbol for asset in assets])
+        except Exception as e:
+            logger.error(f"Error fetching previous closes for {len(assets)} symbols: {e}")
+            return {}
+        
+        closes = {
+            asset.id: quotes[asset.symbol]["previous_close"]
+            for asset in assets
+            if "previous_close" in quotes.get(asset.symbol, {})
+        }
+        if closes:
             try:
-                info = ticker.info
-                prev_close = info.get('previousClose')
-                
-                if prev_close and prev_close > 0:
-                    prev_close_decimal = Decimal(str(prev_close))
-                    
-                    # Save to DB if not already saved
-                    yesterday = datetime.utcnow() - timedelta(days=1)
-                    existing_prev = crud_prices.get_prices(
-                        self.db, 
-                        asset_id, 
-                        date_from=yesterday - timedelta(hours=12),
-                        date_to=yesterday + timedelta(hours=12),
-                        limit=10
-                    )
-                    has_official_close = any(p.source == "yfinance_prev_close" for p in existing_prev)
-                    if not has_official_close:
-                        prev_price_create = PriceCreate(
-                            asset_id=asset_id,
-                            asof=yesterday,
-                            price=prev_close_decimal,
-                            volume=None,
-                            source="yfinance_prev_close"
-                        )
-                        crud_prices.create_price(self.db, prev_price_create)
-                        logger.info(f"Saved previous close from info for {symbol}: {prev_close_decimal}")
-                    
-                    return prev_close_decimal
+                stored = await run_db(self.db, self._store_previous_closes, closes)
+                if stored:
+                    logger.info(f"Saved previous close prices for {len(stored)} assets")
             except Exception as e:
-                logger.warning(f"ticker.info failed for {symbol}, trying history: {e}")
-            
-            # Fallback to history
-            hist = ticker.history(period="10d")
-            if not hist.empty and len(hist) > 1:
-                prev_row = hist.iloc[-2]
-                prev_close_decimal = Decimal(str(float(prev_row["Close"])))
-                
-                # Save to DB
-                yesterday = datetime.utcnow() - timedelta(days=1)
-                existing_prev = crud_prices.get_prices(
-                    self.db, 
-                    asset_id, 
-                    date_from=yesterday - timedelta(hours=12),
-                    date_to=yesterday + timedelta(hours=12),
-                    limit=10
-                )
-                has_official_close = any(p.source == "yfinance_prev_close" for p in existing_prev)
-                if not has_official_close:
-                    prev_price_create = PriceCreate(
-                        asset_id=asset_id,
-                        asof=yesterday,
-                        price=prev_close_decimal,
-                        volume=None,
-                        source="yfinance_prev_close"
-                    )
-                    crud_prices.create_price(self.db, prev_price_create)
-                    logger.info(f"Saved previous close from history for {symbol}: {prev_close_decimal}")
-                
-                return prev_close_decimal
-            
-            return None
-        except Exception as e:
-            logger.error(f"Error fetching previous close for {symbol}: {e}")
-            return None
+                await run_db(self.db, self.db.rollback)
+                logger.warning(f"Failed to save previous closes: {e}")
+        return closes
+    
+    def _store_previous_closes(self, previous_closes: Dict[int, Decimal]) -> List[int]:
+        """
+        Save official previous closes (asset id -> close) as yfinance_prev_close price points
+        
+        Assets that already have one stored for yesterday are skipped; one query
+        checks them all and one bulk upsert writes the others. Returns the asset
+        ids saved.
+        """
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        existing_prev = crud_prices.get_recent_prices(
+            self.db,
+            list(previous_closes),
+            date_from=yesterday - timedelta(hours=12),
+            date_to=yesterday + timedelta(hours=12),
+            limit=10  # Get more to check for official close
+        )
+        missing = [
+            asset_id for asset_id in previous_closes
+            if not any(p.source == "yfinance_prev_close" for p in existing_prev.get(asset_id, []))
+        ]
+        if missing:
+            crud_prices.bulk_upsert_prices(self.db, [
+                {
+                    "asset_id": asset_id,
+                    "asof": yesterday,
+                    "price": previous_closes[asset_id],
+                    "volume": None,
+                    "source": "yfinance_prev_close",
+                }
+                for asset_id in missing
+            ])
+        return missing
     
     def _calculate_daily_change_with_official_close(self, asset_id: int, current_price: Decimal) -> Optional[Decimal]:
         """
@@ -584,47 +760,74 @@ class PricingService:
                 date_from=lookback,
                 limit=100  # Get enough to find official close or good approximation
             )
-            
-            if previous_prices:
-                # First, try to find an official previous close (source = yfinance_prev_close)
-                official_closes = [p for p in previous_prices if p.source == "yfinance_prev_close"]
-                if official_closes:
-                    # Use the most recent official close
-                    prev_price = official_closes[0].price
-                    if prev_price and prev_price > 0:
-                        return ((current_price - prev_price) / prev_price * 100)
-                
-                # Fallback: get a price from approximately 1 day ago
-                # Look for prices between 18-30 hours ago (to approximate previous day's close)
-                target_time = datetime.utcnow() - timedelta(hours=24)
-                min_time = datetime.utcnow() - timedelta(hours=30)
-                max_time = datetime.utcnow() - timedelta(hours=18)
-                
-                approximate_prices = [
-                    p for p in previous_prices 
-                    if min_time <= p.asof <= max_time
-                ]
-                
-                if approximate_prices:
-                    # Use the closest price to 24 hours ago
-                    closest_price = min(approximate_prices, key=lambda p: abs((p.asof - target_time).total_seconds()))
-                    prev_price = closest_price.price
-                    if prev_price and prev_price > 0:
-                        return ((current_price - prev_price) / prev_price * 100)
-                
-                # Last fallback: use any price from at least 12 hours ago
-                old_cutoff = datetime.utcnow() - timedelta(hours=12)
-                old_prices = [p for p in previous_prices if p.asof < old_cutoff]
-                if old_prices:
-                    # Get the most recent of the old prices (first in list since ordered DESC)
-                    prev_price = old_prices[0].price
-                    if prev_price and prev_price > 0:
-                        return ((current_price - prev_price) / prev_price * 100)
-            
-            return None
+            return self._daily_change_from_prices(previous_prices, current_price)
         except Exception as e:
             logger.error(f"Error calculating daily change for asset {asset_id}: {e}")
             return None
+    
+    def _calculate_daily_changes(self, current_prices: Dict[int, Decimal]) -> Dict[int, Optional[Decimal]]:
+        """_calculate_daily_change_with_official_close() for many assets (asset id -> price), in one query"""
+        if not current_prices:
+            return {}
+        try:
+            lookback = datetime.utcnow() - timedelta(days=5)
+            previous_prices = crud_prices.get_recent_prices(self.db, list(current_prices), date_from=lookback, limit=100)
+            return {
+                asset_id: self._daily_change_from_prices(previous_prices.get(asset_id, []), price)
+                for asset_id, price in current_prices.items()
+            }
+        except Exception as e:
+            logger.error(f"Error calculating daily changes for {len(current_prices)} assets: {e}")
+            return {}
+    
+    @staticmethod
+    def _daily_change_from_prices(previous_prices: List[Price], current_price: Decimal) -> Optional[Decimal]:
+        """Daily change against the recent prices of an asset (newest first)"""
+        if previous_prices:
+            # First, try to find an official previous close (source = yfinance_prev_close)
+            official_closes = [p for p in previous_prices if p.source == "yfinance_prev_close"]
+            if official_closes:
+                # Use the most recent official close
+                prev_price = official_closes[0].price
+                if prev_price and prev_price > 0:
+                    return ((current_price - prev_price) / prev_price * 100)
+            
+            # Fallback: get a price from approximately 1 day ago
+            # Look for prices between 18-30 hours ago (to approximate previous day's close)
+            target_time = datetime.utcnow() - timedelta(hours=24)
+            min_time = datetime.utcnow() - timedelta(hours=30)
+            max_time = datetime.utcnow() - timedelta(hours=18)
+            
+            approximate_prices = [
+                p for p in previous_prices 
+                if min_time <= p.asof <= max_time
+            ]
+            
+            if approximate_prices:
+                # Use the closest price to 24 hours ago
+                closest_price = min(approximate_prices, key=lambda p: abs((p.asof - target_time).total_seconds()))
+                prev_price = closest_price.price
+                if prev_price and prev_price > 0:
+                    return ((current_price - prev_price) / prev_price * 100)
+            
+            # Last fallback: use any price from at least 12 hours ago
+            old_cutoff = datetime.utcnow() - timedelta(hours=12)
+            old_prices = [p for p in previous_prices if p.asof < old_cutoff]
+            if old_prices:
+                # Get the most recent of the old prices (first in list since ordered DESC)
+                prev_price = old_prices[0].price
+                if prev_price and prev_price > 0:
+                    return ((current_price - prev_price) / prev_price * 100)
+        
+        return None
+
+
+async def _refresh_cached_prices(symbols: List[str]) -> None:
+    """Background refresh of stale cached quotes, resolved as one batch on its own session"""
+    with get_db_context() as db:
+        service = PricingService(db)
+        quotes = await service._get_prices_batch_internal(symbols)
+        cache_prices(quotes, service._quote_cache_ttl)
 
 
 def get_pricing_service(db: Session = Depends(get_db)) -> PricingService:
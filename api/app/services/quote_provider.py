@@ -0,0 +1,476 @@
+"""
+Upstream market data provider
+
+Every quote consumer (PricingService, CurrencyService, FX history, the market
+router, relative performance) talks to the Yahoo Finance HTTP API through one
+long-lived httpx.AsyncClient per event loop, so connections are pooled and
+reused instead of being set up per ticker.
+
+Upstream pressure is bounded twice:
+- a semaphore caps in-flight requests per event loop (UPSTREAM_MAX_CONCURRENCY)
+- a token bucket shared by the whole process caps the request rate across
+  loops and threads (UPSTREAM_RATE_PER_SECOND, UPSTREAM_RATE_BURST)
+
+Every request carries its own timeout; nothing touches global socket state.
+
+Async code uses get_quote_provider(). Sync code (scheduler jobs, Celery tasks,
+the sync service methods) uses run_sync(), which runs the coroutine on one
+background event loop so sync callers share a pooled client too.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+import pandas as pd
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The spark endpoint rejects larger symbol lists
+SPARK_MAX_SYMBOLS = 20
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+}
+
+
+def _positive_decimal(value) -> Optional[Decimal]:
+    """Decimal of a positive number, None for missing/zero/NaN values"""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not value > 0:
+        return None
+    return Decimal(str(value))
+
+
+def _epoch(value) -> int:
+    """Unix timestamp of a date/datetime (naive values are UTC)"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp())
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every event loop in the process
+
+    acquire() reserves a token immediately and sleeps on the caller's loop
+    until it is due, so waiting callers are served in arrival order.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        """Wait for a token"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_rate_limiter: Optional[TokenBucket] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucket:
+    """Process-wide upstream token bucket"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(settings.UPSTREAM_RATE_PER_SECOND, settings.UPSTREAM_RATE_BURST)
+        return _rate_limiter
+
+
+class UpstreamClient:
+    """
+    Pooled async HTTP client bound to one event loop
+
+    All requests share the loop's concurrency semaphore and the process-wide
+    token bucket.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
+        max_concurrency = max_concurrency or settings.UPSTREAM_MAX_CONCURRENCY
+        self.timeout = timeout or settings.UPSTREAM_TIMEOUT_SECONDS
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = rate_limiter or get_rate_limiter()
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            headers=DEFAULT_HEADERS,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            follow_redirects=True,
+        )
+
+    async def get_json(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        GET a JSON document
+
+        Args:
+            url: Absolute URL
+            params: Query parameters
+            headers: Extra headers for this request
+            timeout: Timeout of this request in seconds (defaults to UPSTREAM_TIMEOUT_SECONDS)
+
+        Raises:
+            httpx.HTTPError: On transport errors, timeouts and non-2xx responses
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        async with self._semaphore:
+            await self._rate_limiter.acquire()
+            # httpx bounds each connect/read; wait_for bounds the whole request
+            try:
+                response = await asyncio.wait_for(
+                    self._client.get(url, params=params, headers=headers, timeout=timeout),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                raise httpx.TimeoutException(f"Request to {url} timed out after {timeout}s")
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        """Close pooled connections"""
+        await self._client.aclose()
+
+
+class QuoteProvider(UpstreamClient, ABC):
+    """
+    Market data interface shared by every quote consumer
+
+    Quote dicts have price, asof and volume, plus previous_close when known.
+    Methods log failures and return None (or omit symbols) instead of raising.
+    """
+
+    @abstractmethod
+    async def get_quote(self, symbol: str) -> Optional[Dict]:
+        """Current quote of one symbol"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Current quotes of many symbols, batched upstream"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_history(self, symbol: str, start, end, interval: str = "1d") -> Optional[pd.DataFrame]:
+        """Bars of one symbol over [start, end), indexed by exchange-local time (None if the request failed)"""
+        raise NotImplementedError
+
+    async def get_histories(self, symbols: List[str], start, end, interval: str = "1d") -> Dict[str, pd.DataFrame]:
+        """get_history() for many symbols, concurrently within the upstream limits"""
+        frames = await asyncio.gather(*(self.get_history(symbol, start, end, interval) for symbol in symbols))
+        return {symbol: frame for symbol, frame in zip(symbols, frames) if frame is not None and not frame.empty}
+
+
+class YahooQuoteProvider(QuoteProvider):
+    """QuoteProvider backed by the Yahoo Finance chart and spark endpoints"""
+
+    def __init__(self, base_url: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = (base_url or settings.YAHOO_BASE_URL).rstrip("/")
+
+    async def _chart(self, symbol: str, params: Dict[str, Any]) -> Optional[Dict]:
+        """
+        First chart result of a symbol
+
+        Returns None if the request failed and an empty dict if Yahoo has no
+        data for the symbol, so callers can retry the former only.
+        """
+        try:
+            data = await self.get_json(f"{self.base_url}/v8/finance/chart/{symbol}", params=params)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                logger.warning(f"No chart data for {symbol}")
+                return {}
+            logger.warning(f"Chart request failed for {symbol}: {e}")
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Chart request failed for {symbol}: {e!r}")
+            return None
+
+        chart = (data or {}).get("chart") or {}
+        if chart.get("error"):
+            logger.warning(f"Chart error for {symbol}: {chart['error']}")
+            return {}
+        results = chart.get("result") or []
+        return results[0] if results else {}
+
+    async def get_quote(self, symbol: str) -> Optional[Dict]:
+        """
+        Current quote from the chart endpoint
+
+        Uses the chart meta (regularMarketPrice, previousClose), which is what
+        the Yahoo Finance website shows, and falls back to the last two daily
+        closes of a 5-day window.
+        """
+        result = await self._chart(symbol, {"range": "5d", "interval": "1d"})
+        if not result:
+            return None
+
+        meta = result.get("meta") or {}
+        quote = ((result.get("indicators") or {}).get("quote") or [{}])[0]
+        closes = [c for c in (_positive_decimal(v) for v in quote.get("close") or []) if c is not None]
+        volumes = [v for v in quote.get("volume") or [] if v is not None]
+
+        price = _positive_decimal(meta.get("regularMarketPrice")) or (closes[-1] if closes else None)
+        if price is None:
+            logger.warning(f"No price returned for {symbol}")
+            return None
+
+        volume = meta.get("regularMarketVolume")
+        if volume is None and volumes:
+            volume = volumes[-1]
+
+        quote_data = {
+            "price": price,
+            "asof": datetime.utcnow(),
+            "volume": int(volume) if volume is not None else None,
+        }
+        previous_close = _positive_decimal(meta.get("previousClose")) or (closes[-2] if len(closes) > 1 else None)
+        if previous_close is not None:
+            quote_data["previous_close"] = previous_close
+        return quote_data
+
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        Current quotes from the spark endpoint, one request per chunk of symbols
+
+        Chunks hold at most min(PRICE_BATCH_FETCH_SIZE, SPARK_MAX_SYMBOLS)
+        symbols and run concurrently. Previous close and volume come from the
+        spark meta, as get_quote() reads the chart meta; symbols whose meta has
+        no previous close are quoted through the chart endpoint instead.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        chunk_size = max(1, min(settings.PRICE_BATCH_FETCH_SIZE, SPARK_MAX_SYMBOLS))
+        chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+        results: Dict[str, Dict] = {}
+        for chunk_results in await asyncio.gather(*(self._spark(chunk) for chunk in chunks)):
+            results.update(chunk_results)
+        return results
+
+    async def _spark(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Quotes of one chunk of symbols"""
+        try:
+            # range=1d so chartPreviousClose is the previous session's close
+            data = await self.get_json(
+                f"{self.base_url}/v8/finance/spark",
+                params={"symbols": ",".join(symbols), "range": "1d", "interval": "1d"},
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Spark request failed for {len(symbols)} symbols: {e!r}")
+            return {}
+
+        asof = datetime.utcnow()
+        results: Dict[str, Dict] = {}
+        missing: List[str] = []
+        for symbol in symbols:
+            entry = (data or {}).get(symbol)
+            if not entry:
+                continue
+            closes = [c for c in (_positive_decimal(v) for v in entry.get("close") or []) if c is not None]
+            volumes = [v for v in entry.get("volume") or [] if v is not None]
+            price = _positive_decimal(entry.get("regularMarketPrice")) or (closes[-1] if closes else None)
+            if price is None:
+                continue
+            previous_close = _positive_decimal(entry.get("previousClose")) or _positive_decimal(entry.get("chartPreviousClose"))
+            if previous_close is None:
+                missing.append(symbol)
+                continue
+
+            volume = entry.get("regularMarketVolume")
+            if volume is None and volumes:
+                volume = volumes[-1]
+            results[symbol] = {
+                "price": price,
+                "asof": asof,
+                "volume": int(volume) if volume is not None else None,
+                "previous_close": previous_close,
+            }
+
+        if missing:
+            quotes = await asyncio.gather(*(self.get_quote(symbol) for symbol in missing))
+            results.update({symbol: quote for symbol, quote in zip(missing, quotes) if quote is not None})
+        return results
+
+    async def get_history(self, symbol: str, start, end, interval: str = "1d") -> Optional[pd.DataFrame]:
+        """
+        Bars over [start, end) as a Close/Volume frame
+
+        The index is tz-aware in the exchange time zone; daily bars are
+        normalized to local midnight like yfinance does. Returns an empty frame
+        for symbols without data and None if the request failed.
+        """
+        result = await self._chart(symbol, {
+            "period1": _epoch(start),
+            "period2": _epoch(end),
+            "interval": interval,
+            "includePrePost": "false",
+        })
+        if result is None:
+            return None
+
+        timestamps = result.get("timestamp") or []
+        quote = ((result.get("indicators") or {}).get("quote") or [{}])[0]
+        if not timestamps:
+            return pd.DataFrame(columns=["Close", "Volume"])
+
+        tz = (result.get("meta") or {}).get("exchangeTimezoneName") or "UTC"
+        index = pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(tz)
+        if interval.endswith(("d", "wk", "mo")):
+            index = index.normalize()
+        frame = pd.DataFrame(
+            {
+                "Close": pd.to_numeric(pd.Series(quote.get("close") or [None] * len(timestamps)), errors="coerce").to_numpy(),
+                "Volume": pd.to_numeric(pd.Series(quote.get("volume") or [None] * len(timestamps)), errors="coerce").to_numpy(),
+            },
+            index=index,
+        )
+        return frame[~frame.index.duplicated(keep="last")]
+
+
+# One provider per event loop (httpx clients and semaphores are loop-bound)
+_providers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, QuoteProvider]" = weakref.WeakKeyDictionary()
+_providers_lock = threading.Lock()
+
+# Transport override for tests and benchmarks (None = real network)
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def get_quote_provider() -> QuoteProvider:
+    """Provider of the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    with _providers_lock:
+        provider = _providers.get(loop)
+        if provider is None:
+            provider = YahooQuoteProvider(transport=_transport)
+            _providers[loop] = provider
+        return provider
+
+
+async def close_quote_provider():
+    """Close the provider of the running event loop, if any"""
+    with _providers_lock:
+        provider = _providers.pop(asyncio.get_running_loop(), None)
+    if provider is not None:
+        await provider.aclose()
+
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """
+    Route every provider through a transport (e.g. httpx.ASGITransport of a fake server)
+
+    Existing providers are dropped so the next call picks up the transport.
+    """
+    global _transport
+    with _providers_lock:
+        _transport = transport
+        _providers.clear()
+
+
+class _BackgroundLoop:
+    """Event loop on a daemon thread serving sync callers"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="quote-provider", daemon=True)
+        self.thread.start()
+
+
+_background: Optional[_BackgroundLoop] = None
+_background_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _background
+    with _background_lock:
+        if _background is None:
+            _background = _BackgroundLoop()
+        return _background.loop
+
+
+def run_sync(call: Callable[[QuoteProvider], Awaitable[T]], timeout: Optional[float] = None) -> T:
+    """
+    Run a provider call from sync code
+
+    Example:
+        quotes = run_sync(lambda provider: provider.get_quotes(["AAPL", "MSFT"]))
+
+    Args:
+        call: Function taking the provider and returning the coroutine to run
+        timeout: Seconds to wait for the result (defaults to 3x UPSTREAM_TIMEOUT_SECONDS)
+
+    Raises:
+        TimeoutError: If the call did not finish in time
+    """
+    loop = _background_loop()
+    if threading.current_thread() is _background.thread:
+        raise RuntimeError("run_sync() called from the provider loop; await the provider instead")
+
+    async def invoke():
+        return await call(get_quote_provider())
+
+    future = asyncio.run_coroutine_threadsafe(invoke(), loop)
+    try:
+        return future.result(timeout if timeout is not None else settings.UPSTREAM_TIMEOUT_SECONDS * 3)
+    except FutureTimeoutError:
+        future.cancel()
+        raise TimeoutError("Upstream market data call timed out")
+
+
+def shutdown_background_loop():
+    """Close the sync bridge's provider and stop its loop"""
+    global _background
+    with _background_lock:
+        background, _background = _background, None
+    if background is None:
+        return
+    asyncio.run_coroutine_threadsafe(close_quote_provider(), background.loop).result(5)
+    background.loop.call_soon_threadsafe(background.loop.stop)
+    background.thread.join(5)
+    background.loop.close()
@@ -7,9 +7,9 @@ from typing import Dict, Optional
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-import yfinance as yf
 
 from app.models import Asset, Price
+from app.services.quote_provider import run_sync
 
 logger = logging.getLogger(__name__)
 
@@ -72,7 +72,7 @@ class RelativePerformanceService:
     def _get_price_at_date(self, symbol: str, target_date: datetime, is_etf: bool = False) -> Optional[Decimal]:
         """
         Get price closest to target date (within 7 days)
-        For ETFs not in DB, fetches from yfinance API
+        For ETFs not in DB, fetches from Yahoo Finance
         """
         if not is_etf:
             # For user assets, check database first
@@ -107,21 +107,19 @@ class RelativePerformanceService:
             if price_record:
                 return Decimal(str(price_record.price))
         
-        # For ETFs or if DB lookup failed, fetch from yfinance
+        # For ETFs or if DB lookup failed, fetch from Yahoo Finance
         try:
-            ticker = yf.Ticker(symbol)
-            
             # Ensure target_date is timezone-naive for datetime arithmetic
             if target_date.tzinfo is not None:
                 target_date = target_date.replace(tzinfo=None)
             
             # Fetch historical data around target date (±7 days window)
-            start = (target_date - timedelta(days=7)).strftime('%Y-%m-%d')
-            end = (target_date + timedelta(days=7)).strftime('%Y-%m-%d')
+            start = (target_date - timedelta(days=7)).date()
+            end = (target_date + timedelta(days=7)).date()
             
-            hist = ticker.history(start=start, end=end)
+            hist = run_sync(lambda provider: provider.get_history(symbol, start, end))
             
-            if hist.empty:
+            if hist is None or hist.empty:
                 logger.warning(f"No price data found for {symbol} around {target_date.date()}")
                 return None
             
@@ -134,11 +132,11 @@ class RelativePerformanceService:
             closest_price = hist.iloc[closest_idx]['Close']
             closest_date = hist.index[closest_idx].date()
             
-            logger.debug(f"Fetched {symbol} price from yfinance: {closest_price} on {closest_date}")
+            logger.debug(f"Fetched {symbol} price from Yahoo Finance: {closest_price} on {closest_date}")
             return Decimal(str(closest_price))
             
         except Exception as e:
-            logger.error(f"Error fetching price for {symbol} from yfinance: {e}")
+            logger.error(f"Error fetching price for {symbol} from Yahoo Finance: {e}")
             return None
     
     def _calculate_return(
@@ -185,16 +183,15 @@ class RelativePerformanceService:
             logger.debug(f"No sector ETF mapping for sector: {sector}")
             return result
         
-        # Get current ETF price from yfinance
+        # Get current ETF price from the upstream provider
         try:
-            ticker = yf.Ticker(etf_symbol)
-            hist = ticker.history(period="5d")  # Get last 5 days to ensure we have data
+            quote = run_sync(lambda provider: provider.get_quote(etf_symbol))
             
-            if hist.empty:
+            if quote is None:
                 logger.warning(f"No current price data for ETF {etf_symbol}")
                 return result
             
-            etf_current_price = Decimal(str(hist.iloc[-1]['Close']))
+            etf_current_price = quote["price"]
             logger.debug(f"Current {etf_symbol} price: {etf_current_price}")
             
         except Exception as e:
@@ -218,7 +215,7 @@ class RelativePerformanceService:
                 logger.debug(f"No price found for {asset_symbol} at {start_date.date()} ({period_key})")
                 continue
             
-            # Get ETF price at start date (from yfinance)
+            # Get ETF price at start date (from Yahoo Finance)
             etf_start_price = self._get_price_at_date(etf_symbol, start_date, is_etf=True)
             if not etf_start_price:
                 logger.debug(f"No price found for {etf_symbol} at {start_date.date()} ({period_key})")
@@ -250,7 +247,7 @@ class RelativePerformanceService:
         period_days: int = 365
     ) -> Optional[float]:
         """
-        Calculate Beta for an asset using yfinance for both
+        Calculate Beta for an asset using Yahoo Finance for both
         the asset and the benchmark.
         """
         benchmark_symbol = self.get_beta_benchmark(sector)
@@ -278,28 +275,21 @@ class RelativePerformanceService:
         min_points: int = 60
     ) -> Optional[float]:
         """
-        Internal beta calc using yfinance only (asset + benchmark).
+        Internal beta calc using Yahoo Finance only (asset + benchmark).
         Beta = Cov(R_asset, R_benchmark) / Var(R_benchmark)
         """
         end = datetime.utcnow()
         start = end - timedelta(days=period_days)
 
         try:
-            # Asset history
-            asset_ticker = yf.Ticker(symbol)
-            asset_hist = asset_ticker.history(
-                start=start.strftime("%Y-%m-%d"),
-                end=end.strftime("%Y-%m-%d")
-            )
-
-            # Benchmark history
-            bench_ticker = yf.Ticker(benchmark_symbol)
-            bench_hist = bench_ticker.history(
-                start=start.strftime("%Y-%m-%d"),
-                end=end.strftime("%Y-%m-%d")
-            )
+            # Asset and benchmark history, fetched concurrently
+            histories = run_sync(lambda provider: provider.get_histories(
+                [symbol, benchmark_symbol], start.date(), end.date()
+            ))
+            asset_hist = histories.get(symbol)
+            bench_hist = histories.get(benchmark_symbol)
 
-            if asset_hist.empty or bench_hist.empty:
+            if asset_hist is None or bench_hist is None:
                 logger.warning(f"No history for {symbol} or {benchmark_symbol}")
                 return None
 
@@ -8,7 +8,7 @@ from decimal import Decimal
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
-from app.models import Price
+from app.crud import prices as crud_prices
 
 logger = logging.getLogger(__name__)
 
@@ -155,15 +155,12 @@ class RiskAnalysisService:
         """
         now = datetime.utcnow()
         
-        prices = (
-            self.db.query(Price.price, Price.asof)
-            .filter(
-                Price.asset_id == asset_id,
-                Price.asof >= now - timedelta(days=days)
-            )
-            .order_by(Price.asof)
-            .all()
-        )
+        # One close per day so intraday refreshes don't count as daily returns
+        prices = crud_prices.get_daily_closes(
+            self.db,
+            [asset_id],
+            date_from=now - timedelta(days=days)
+        )[asset_id]
         
         if len(prices) < 2:
             return None
@@ -171,8 +168,8 @@ class RiskAnalysisService:
         # Calculate daily returns
         returns = []
         for i in range(1, len(prices)):
-            prev_price = Decimal(str(prices[i-1][0]))
-            curr_price = Decimal(str(prices[i][0]))
+            prev_price = Decimal(str(prices[i-1].price))
+            curr_price = Decimal(str(prices[i].price))
             if prev_price > 0:
                 daily_return = float((curr_price - prev_price) / prev_price)
                 returns.append(daily_return)
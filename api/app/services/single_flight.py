@@ -0,0 +1,419 @@
+"""
+Single-flight computations across processes
+
+When a popular cache entry expires, every API and Celery worker reading it
+would recompute it, each making the same upstream calls. single_flight()
+lets one of them do it:
+
+- The first caller takes a lease: a Redis lock (SET NX PX) holding a fencing
+  token, drawn from a counter that only grows. It computes the value.
+- The other callers wait for the lease's completion message on a pub/sub
+  channel (one pattern subscription per process, see _CompletionListener),
+  then read the result the holder left in Redis for RESULT_TTL_SECONDS.
+- The holder publishes only while the lock still holds its token: the result
+  write, the lock release and the message are one WATCH/MULTI transaction.
+  A holder that stalled past its lease, and was replaced by a caller with a
+  higher token, neither overwrites the newer result nor releases the newer
+  lock.
+- Waiters take over when the holder fails or its lease expires, and compute
+  on their own once they have waited as long as the lease.
+
+Without Redis, single_flight() just computes; callers keep their in-process
+deduplication (_ongoing_calculations in metrics, _ongoing_fetches in pricing).
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError, WatchError
+
+from app.redis_client import get_redis_binary
+from app.services import cache_codec
+
+logger = logging.getLogger(__name__)
+
+# Longest a computation may hold its lease before another caller takes over
+LEASE_SECONDS = 30
+
+# How long a completed result stays readable by the waiters
+RESULT_TTL_SECONDS = 30
+
+PREFIX_LOCK = "single_flight:lock:"
+PREFIX_RESULT = "single_flight:result:"
+CHANNEL_PREFIX = "single_flight:done:"
+FENCE_KEY = "single_flight:fence"
+
+# Outcomes counted per key prefix
+LED = "led"  # computed under a lease
+COALESCED_LOCAL = "coalesced_local"  # shared an ongoing computation of this process
+COALESCED_REMOTE = "coalesced_remote"  # got the result of another process' lease
+LEASE_LOST = "lease_lost"  # lease expired before the computation ended, result discarded
+FALLBACK = "fallback"  # waited in vain, computed without a lease
+OUTCOMES = (LED, COALESCED_LOCAL, COALESCED_REMOTE, LEASE_LOST, FALLBACK)
+
+# (key prefix, outcome) -> count, for this process
+_flight_counters: Counter = Counter()
+
+
+def record(key: str, outcome: str) -> None:
+    """Count an outcome for the prefix of key ("positions:3" -> "positions")"""
+    _flight_counters[(key.split(':', 1)[0], outcome)] += 1
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Outcome counts of this process per key prefix"""
+    stats: Dict[str, Dict[str, int]] = {}
+    for (prefix, outcome), count in list(_flight_counters.items()):
+        stats.setdefault(prefix, dict.fromkeys(OUTCOMES, 0))[outcome] = count
+    return stats
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _CompletionListener:
+    """
+    Background pattern subscription to completion messages, waking the
+    waiters of this process
+
+    Started by the first wait. If the subscription breaks, waiters still
+    wake when the lease they wait on expires, and the next wait restarts it.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._waiters_lock = threading.Lock()
+
+    def ensure(self, redis_client) -> None:
+        """Listen on redis_client, unless already doing so"""
+        if self._client is redis_client and self._thread is not None:
+            return
+        with self._lock:
+            if self._client is redis_client and self._thread is not None:
+                return
+            self._stop()
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(**{f"{CHANNEL_PREFIX}*": self._on_message})
+                self._thread = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True, exception_handler=self._on_error
+                )
+                self._client = redis_client
+            except RedisError as e:
+                logger.warning(f"Single-flight completion listener not started: {e}")
+
+    def register(self, key: str) -> asyncio.Future:
+        """Future of the running loop resolved by the next completion of key"""
+        future = asyncio.get_running_loop().create_future()
+        with self._waiters_lock:
+            self._waiters.setdefault(key, set()).add(future)
+        return future
+
+    def unregister(self, key: str, future: asyncio.Future) -> None:
+        with self._waiters_lock:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop()
+
+    def _stop(self) -> None:
+        if self._thread is not None:
+            self._thread.stop()
+        self._thread = None
+        self._client = None
+
+    def _on_message(self, message) -> None:
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        key = channel[len(CHANNEL_PREFIX):]
+        with self._waiters_lock:
+            waiters = self._waiters.pop(key, ())
+        for future in waiters:
+            try:
+                future.get_loop().call_soon_threadsafe(_wake, future)
+            except RuntimeError:  # The waiter's loop is closed
+                pass
+
+    def _on_error(self, exc, pubsub, thread) -> None:
+        logger.warning(f"Single-flight completion listener stopped: {exc}")
+        thread.stop()
+        with self._lock:
+            if self._thread is thread:
+                self._thread = None
+                self._client = None
+
+
+_listener = _CompletionListener()
+
+
+def stop_single_flight_listener() -> None:
+    """Stop the completion subscriber (application shutdown)"""
+    _listener.stop()
+
+
+class Lease:
+    """
+    Right to compute a key, held until complete() or release()
+
+    Without Redis there is nobody to coordinate with: the lease has no token
+    and always holds.
+    """
+
+    def __init__(self, key: str, token: Optional[int], redis_client=None):
+        self.key = key
+        self.token = token
+        self._client = redis_client
+
+    def holds(self) -> bool:
+        """Whether the lock still carries this lease's token"""
+        return bool(held([self]))
+
+    def complete(self, value: Any) -> bool:
+        """
+        Hand value to the waiters and release the lease
+
+        Returns False, publishing nothing, if the lease was lost to another caller.
+        """
+        return bool(complete_many([(self, value)]))
+
+    def release(self) -> None:
+        """Release the lease without a result (the computation failed), so a waiter takes over"""
+        _release_many([(self, None)])
+
+
+def try_acquire(key: str, lease_seconds: int = LEASE_SECONDS) -> Optional[Lease]:
+    """
+    Take the lease on key, None if another caller holds it
+
+    Returns a token-less lease when Redis is unavailable.
+    """
+    return try_acquire_many([key], lease_seconds)[key]
+
+
+def try_acquire_many(keys: List[str], lease_seconds: int = LEASE_SECONDS) -> Dict[str, Optional[Lease]]:
+    """try_acquire() for many keys: one INCRBY for their tokens, one pipeline of SET NX"""
+    leases: Dict[str, Optional[Lease]] = {}
+    redis_client = get_redis_binary()
+    if redis_client is not None and keys:
+        try:
+            last = redis_client.incrby(FENCE_KEY, len(keys))
+            tokens = range(last - len(keys) + 1, last + 1)
+            pipe = redis_client.pipeline(transaction=False)
+            for key, token in zip(keys, tokens):
+                pipe.set(f"{PREFIX_LOCK}{key}", token, nx=True, ex=lease_seconds)
+            for key, token, acquired in zip(keys, tokens, pipe.execute()):
+                leases[key] = Lease(key, token, redis_client) if acquired else None
+        except RedisError as e:
+            logger.warning(f"Single-flight leases not taken: {e}")
+            leases = {}
+    for key in keys:
+        if key not in leases:
+            leases[key] = Lease(key, None)
+        if leases[key] is not None:
+            record(key, LED)
+    return leases
+
+
+def held(leases: Iterable[Lease]) -> List[Lease]:
+    """The leases whose lock still carries their token, checked with one MGET"""
+    leases = list(leases)
+    coordinated = [lease for lease in leases if lease._client is not None]
+    if not coordinated:
+        return leases
+    try:
+        tokens = coordinated[0]._client.mget([f"{PREFIX_LOCK}{lease.key}" for lease in coordinated])
+    except RedisError as e:
+        logger.warning(f"Single-flight lease check failed: {e}")
+        return leases
+    current = {id(lease) for lease, token in zip(coordinated, tokens) if token == str(lease.token).encode()}
+    return [lease for lease in leases if lease._client is None or id(lease) in current]
+
+
+def complete_many(completions: Iterable[Tuple[Lease, Any]]) -> List[Lease]:
+    """
+    complete() for many leases, in one WATCH/MULTI transaction
+
+    Returns the leases completed; the others were lost and publish nothing.
+    """
+    releases = []
+    for lease, value in completions:
+        payload = None
+        if lease._client is not None:
+            try:
+                # Only processes running this code read results: no legacy JSON
+                payload = cache_codec.encode([lease.token, value], codec="msgpack")
+            except TypeError as e:
+                logger.warning(f"Single-flight result of {lease.key} not shared: {e}")
+        releases.append((lease, payload))
+    return _release_many(releases)
+
+
+# Attempts of a release transaction interrupted by a lock changing hands
+_RELEASE_ATTEMPTS = 3
+
+
+def _release_many(releases: List[Tuple[Lease, Optional[bytes]]]) -> List[Lease]:
+    """
+    Publish the payloads (None: no result) and release the leases still held
+
+    Returns the leases released.
+    """
+    released = [lease for lease, _ in releases if lease._client is None]
+    releases = [(lease, payload) for lease, payload in releases if lease._client is not None]
+    if not releases:
+        return released
+
+    redis_client = releases[0][0]._client
+    lock_keys = [f"{PREFIX_LOCK}{lease.key}" for lease, _ in releases]
+    for _ in range(_RELEASE_ATTEMPTS):
+        try:
+            with redis_client.pipeline() as pipe:
+                pipe.watch(*lock_keys)
+                tokens = pipe.mget(lock_keys)
+                holding = [
+                    (lease, payload) for (lease, payload), token in zip(releases, tokens)
+                    if token == str(lease.token).encode()
+                ]
+                if holding:
+                    pipe.multi()
+                    for lease, payload in holding:
+                        if payload is not None:
+                            pipe.set(f"{PREFIX_RESULT}{lease.key}", payload, ex=RESULT_TTL_SECONDS)
+                        pipe.delete(f"{PREFIX_LOCK}{lease.key}")
+                        pipe.publish(f"{CHANNEL_PREFIX}{lease.key}", lease.token)
+                    pipe.execute()
+        except WatchError:
+            continue  # A lock changed hands meanwhile: check them again
+        except RedisError as e:
+            logger.warning(f"Single-flight release failed: {e}")
+            return released + [lease for lease, _ in releases]
+        break
+    else:
+        holding = []
+
+    holding_ids = {id(lease) for lease, _ in holding}
+    for lease, _ in releases:
+        if id(lease) not in holding_ids:
+            record(lease.key, LEASE_LOST)
+            logger.warning(f"Single-flight lease on {lease.key} (token {lease.token}) expired before completion")
+    return released + [lease for lease, _ in holding]
+
+
+async def wait_for(key: str, timeout: float) -> Tuple[bool, Any]:
+    """
+    Wait for the holder of key's lease to complete
+
+    Returns (True, value) with the holder's result, or (False, None) when the
+    holder released its lease without one, lost it, or timeout passed.
+    
+    Only results of the lease seen when joining (or a later one) are taken:
+    if no lease is held by then, whatever result is left may predate an
+    invalidation, so the caller computes instead.
+    """
+    redis_client = get_redis_binary()
+    if redis_client is None or timeout <= 0:
+        return False, None
+    _listener.ensure(redis_client)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    joined = False
+    fence: Optional[int] = None
+    waiter = _listener.register(key)
+    try:
+        while True:
+            # Registered before reading, so a completion in between still wakes us
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.get(f"{PREFIX_LOCK}{key}")
+                pipe.pttl(f"{PREFIX_LOCK}{key}")
+                pipe.get(f"{PREFIX_RESULT}{key}")
+                lock_token, pttl, payload = pipe.execute()
+            except RedisError as e:
+                logger.warning(f"Single-flight wait failed for {key}: {e}")
+                return False, None
+
+            lock_token = int(lock_token) if lock_token is not None else None
+            if not joined:
+                # Fence token of the lease we wait for, seen at join time
+                joined, fence = True, lock_token
+            if fence is None:
+                return False, None
+            if payload is not None:
+                try:
+                    token, value = cache_codec.decode(payload)
+                except ValueError:
+                    token, value = None, None
+                # A result left by an earlier lease is not the one we wait for
+                if token is not None and token >= fence:
+                    return True, value
+            if lock_token != fence:
+                return False, None
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False, None
+            if waiter.done():
+                _listener.unregister(key, waiter)
+                waiter = _listener.register(key)
+            # Also wake when the lease expires, in case its holder died
+            await asyncio.wait({waiter}, timeout=min(remaining, max(pttl, 0) / 1000 + 0.05))
+    finally:
+        _listener.unregister(key, waiter)
+
+
+async def single_flight(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    store: Optional[Callable[[Any], None]] = None,
+    lease_seconds: int = LEASE_SECONDS,
+) -> Any:
+    """
+    Compute the value of key once across processes
+
+    Args:
+        key: What is computed, usually the cache key of the value
+        compute: Coroutine function computing the value
+        store: Called with the value by the lease holder, only while it still
+            holds the lease (e.g. to write the cache entry)
+        lease_seconds: Longest compute() may take; also how long callers wait
+            for another process before computing on their own
+
+    Returns the value computed here, or by the process holding the lease.
+    """
+    deadline = time.monotonic() + lease_seconds
+    while True:
+        lease = try_acquire(key, lease_seconds)
+        if lease is not None:
+            try:
+                value = await compute()
+            except BaseException:
+                lease.release()
+                raise
+            if store is not None and lease.holds():
+                store(value)
+            lease.complete(value)
+            return value
+
+        completed, value = await wait_for(key, deadline - time.monotonic())
+        if completed:
+            record(key, COALESCED_REMOTE)
+            return value
+        if time.monotonic() >= deadline:
+            record(key, FALLBACK)
+            logger.warning(f"Waited {lease_seconds}s for another process computing {key}, computing it here")
+            return await compute()
@@ -12,33 +12,17 @@ from sqlalchemy import select, and_, func
 from app.celery_app import celery_app
 from app.db import get_db_context
 from app.models import User, Portfolio, DashboardLayout
-from app.routers.batch import (
-    _extract_required_data,
-    _fetch_metrics,
-    _fetch_positions,
-    _fetch_watchlist,
-    _fetch_notifications,
-    _fetch_market_tnx,
-    _fetch_market_dxy,
-    _fetch_market_vix,
-    _fetch_market_indices,
-    _fetch_sentiment_stock,
-    _fetch_sentiment_crypto,
-    _fetch_asset_allocation,
-    _fetch_sector_allocation,
-    _fetch_country_allocation,
-    _fetch_performance_history,
-    _fetch_transactions,
-    _make_json_serializable,
-)
+from app.routers.batch import _extract_required_data, _load_widgets, _widget_cache_key
 from app.services.metrics import MetricsService
+from app.services.dashboard_context import DashboardContext
 from app.services.insights import InsightsService
-from app.services.cache import CacheService
+from app.services.quote_provider import close_quote_provider
+from app.services.cache import CacheService, portfolio_tag
 from app.tasks.decorators import singleton_task, deduplicate_task
 
 logger = logging.getLogger(__name__)
 
-# Cache TTL for warmed dashboard data (5 minutes)
+# Cache TTL for the warmed price batch (5 minutes)
 _DASHBOARD_WARMUP_CACHE_TTL = 300
 
 
@@ -102,168 +86,42 @@ def warmup_user_dashboard(self, user_id: int, portfolio_id: int, widget_ids: Opt
             logger.warning(f"User {user_id} not found")
             return {"success": False, "error": "User not found"}
         
-        # Fetch all required data
+        # Compute every section and write it under the keys the batch endpoint reads
         async def fetch_all_data():
-            tasks = {}
-            task_names = []
-            
-            if 'metrics' in required_data:
-                tasks['metrics'] = _fetch_metrics(portfolio_id, metrics_service, db)
-                task_names.append('metrics')
-            
-            if 'positions' in required_data:
-                tasks['positions'] = _fetch_positions(portfolio_id, metrics_service, db)
-                task_names.append('positions')
-            
-            if 'watchlist' in required_data:
-                tasks['watchlist'] = _fetch_watchlist(user, db)
-                task_names.append('watchlist')
-            
-            if 'notifications' in required_data:
-                tasks['notifications'] = _fetch_notifications(user, db)
-                task_names.append('notifications')
-            
-            if 'market_tnx' in required_data:
-                tasks['market_tnx'] = _fetch_market_tnx()
-                task_names.append('market_tnx')
-            
-            if 'market_dxy' in required_data:
-                tasks['market_dxy'] = _fetch_market_dxy()
-                task_names.append('market_dxy')
-            
-            if 'market_vix' in required_data:
-                tasks['market_vix'] = _fetch_market_vix()
-                task_names.append('market_vix')
-            
-            if 'market_indices' in required_data:
-                tasks['market_indices'] = _fetch_market_indices()
-                task_names.append('market_indices')
-            
-            if 'sentiment_stock' in required_data:
-                tasks['sentiment_stock'] = _fetch_sentiment_stock()
-                task_names.append('sentiment_stock')
-            
-            if 'sentiment_crypto' in required_data:
-                tasks['sentiment_crypto'] = _fetch_sentiment_crypto()
-                task_names.append('sentiment_crypto')
-            
-            if 'asset_allocation' in required_data:
-                tasks['asset_allocation'] = _fetch_asset_allocation(portfolio_id, db, metrics_service, user)
-                task_names.append('asset_allocation')
-            
-            if 'sector_allocation' in required_data:
-                tasks['sector_allocation'] = _fetch_sector_allocation(portfolio_id, db, metrics_service, user)
-                task_names.append('sector_allocation')
-            
-            if 'country_allocation' in required_data:
-                tasks['country_allocation'] = _fetch_country_allocation(portfolio_id, db, metrics_service, user)
-                task_names.append('country_allocation')
-            
-            if 'performance_history' in required_data:
-                tasks['performance_history'] = _fetch_performance_history(portfolio_id, db)
-                task_names.append('performance_history')
-            
-            if 'transactions' in required_data:
-                tasks['transactions'] = _fetch_transactions(portfolio_id, db)
-                task_names.append('transactions')
-            
-            # Execute all in parallel
-            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
-            
-            # Build data dict from results
-            data = {}
-            errors = {}
-            for i, (name, result) in enumerate(zip(task_names, results)):
-                if isinstance(result, Exception):
-                    errors[name] = str(result)
-                    logger.error(f"Error fetching {name} during warmup: {result}")
-                else:
-                    data[name] = result
-            
-            return data, errors
-        
-        # Run the async fetch
-        data, errors = asyncio.run(fetch_all_data())
+            # Same shared graph as the batch endpoint (positions computed once)
+            context = DashboardContext(metrics_service, portfolio_id)
+            return await _load_widgets(
+                required_data, portfolio_id, user, context, db, insights_service, refresh=True
+            )
         
-        # Build response matching batch endpoint format
         now = datetime.utcnow()
-        response = {
-            "data": data,
-            "errors": errors,
-            "cached": False,
-            "timestamp": now.isoformat(),
-            "widgets_requested": len(widget_ids),
-            "data_fetched": len(data),
-        }
-        
-        # Make response JSON serializable
-        response = _make_json_serializable(response)
-        
-        # Cache the response in Redis using the same key format as batch endpoint
         cache = CacheService()
-        widget_key = ','.join(sorted(widget_ids))
-        cache_key = f"dashboard_batch:{portfolio_id}:{hash(widget_key)}"
-        cache.set(cache_key, response, ttl=_DASHBOARD_WARMUP_CACHE_TTL)
         
         # ALSO warm up the price batch cache (used by auto-refresh)
-        price_batch_warmed = False
-        try:
-            from app.routers.portfolios import get_batch_prices
-            from fastapi import Request
-            
-            # Import the batch prices functionality
-            from app.services.pricing import PricingService
-            from app.services.currency import CurrencyService
-            from app.models import Asset, Transaction
-            from decimal import Decimal
-            
-            # Get base currency
-            base_currency = portfolio.base_currency if portfolio.base_currency else "USD"
-            
-            # Get all unique assets
-            asset_ids = (
-                db.query(Transaction.asset_id)
-                .filter(Transaction.portfolio_id == portfolio_id)
-                .distinct()
-                .all()
-            )
-            asset_ids = [row[0] for row in asset_ids]
-            
-            if asset_ids:
+        async def warm_price_batch() -> bool:
+            try:
+                from app.services.pricing import PricingService
+                from app.models import Asset, Transaction
+                
+                # Get base currency
+                base_currency = portfolio.base_currency if portfolio.base_currency else "USD"
+                
+                # Get all unique assets
+                asset_ids = (
+                    db.query(Transaction.asset_id)
+                    .filter(Transaction.portfolio_id == portfolio_id)
+                    .distinct()
+                    .all()
+                )
+                asset_ids = [row[0] for row in asset_ids]
+                
+                if not asset_ids:
+                    return False
+                
                 assets = db.query(Asset).filter(Asset.id.in_(asset_ids)).all()
-                symbols = [asset.symbol for asset in assets]
-                asset_map = {asset.id: asset for asset in assets}
                 
                 pricing_service = PricingService(db)
-                price_quotes = asyncio.run(pricing_service.get_multiple_prices(symbols))
-                
-                prices = []
-                for asset in assets:
-                    quote = price_quotes.get(asset.symbol)
-                    if quote and quote.price:
-                        original_price = float(quote.price)
-                        current_price = original_price
-                        
-                        if asset.currency != base_currency:
-                            converted = CurrencyService.convert(
-                                Decimal(str(original_price)),
-                                from_currency=asset.currency,
-                                to_currency=base_currency
-                            )
-                            current_price = float(converted) if converted else original_price
-                        
-                        price_data = {
-                            "symbol": asset.symbol,
-                            "asset_id": asset.id,
-                            "name": asset.name,
-                            "current_price": current_price,
-                            "original_price": original_price,
-                            "original_currency": asset.currency,
-                            "daily_change_pct": float(quote.daily_change_pct) if quote.daily_change_pct else None,
-                            "last_updated": quote.asof.isoformat() if quote.asof else None,
-                            "asset_type": asset.asset_type
-                        }
-                        prices.append(price_data)
+                prices = await pricing_service.get_converted_prices(assets, base_currency)
                 
                 price_batch_response = {
                     "portfolio_id": portfolio_id,
@@ -274,11 +132,25 @@ def warmup_user_dashboard(self, user_id: int, portfolio_id: int, widget_ids: Opt
                 }
                 
                 price_cache_key = f"portfolio_batch_prices:{portfolio_id}"
-                cache.set(price_cache_key, price_batch_response, ttl=_DASHBOARD_WARMUP_CACHE_TTL)
-                price_batch_warmed = True
+                cache.set(
+                    price_cache_key, price_batch_response, ttl=_DASHBOARD_WARMUP_CACHE_TTL,
+                    tags=[portfolio_tag(portfolio_id)],
+                )
                 logger.info(f"Warmed price batch cache for portfolio {portfolio_id} ({len(prices)} prices)")
-        except Exception as e:
-            logger.error(f"Failed to warm price batch cache for portfolio {portfolio_id}: {e}")
+                return True
+            except Exception as e:
+                logger.error(f"Failed to warm price batch cache for portfolio {portfolio_id}: {e}")
+                return False
+        
+        # Both steps share one event loop; its pooled quote provider is closed with it
+        async def warm_up():
+            try:
+                return await fetch_all_data(), await warm_price_batch()
+            finally:
+                await close_quote_provider()
+        
+        (data, errors, _), price_batch_warmed = asyncio.run(warm_up())
+        cache_keys = [_widget_cache_key(widget, portfolio_id, user_id) for widget in sorted(data)]
         
         logger.info(
             f"Dashboard warmup complete for portfolio {portfolio_id}: "
@@ -292,8 +164,7 @@ def warmup_user_dashboard(self, user_id: int, portfolio_id: int, widget_ids: Opt
             "widgets_warmed": len(widget_ids),
             "data_sets_cached": len(data),
             "errors": len(errors),
-            "cache_key": cache_key,
-            "cache_ttl": _DASHBOARD_WARMUP_CACHE_TTL,
+            "cache_keys": cache_keys,
             "price_batch_warmed": price_batch_warmed,
             "timestamp": now.isoformat()
         }
@@ -51,7 +51,10 @@ def calculate_portfolio_insights(self, portfolio_id: int, user_id: int, period:
             # Calculate insights using InsightsService (with default benchmark SPY)
             insights_service = InsightsService(db)
             benchmark = "SPY"  # Default benchmark
-            insights = asyncio.run(insights_service.get_portfolio_insights(portfolio_id, user_id, period, benchmark))
+            # refresh=True: recalculated even when cached, the cached entry may be what this task replaces
+            insights = asyncio.run(
+                insights_service.get_portfolio_insights(portfolio_id, user_id, period, benchmark, refresh=True)
+            )
             
             # Note: Caching is handled by InsightsService._cache_insights internally
             # The cache key format is: insights:{portfolio_id}:{period}:{benchmark}
@@ -11,7 +11,7 @@ from app.celery_app import celery_app
 from app.db import get_db_context
 from app.models import Portfolio, User
 from app.services.metrics import MetricsService
-from app.services.cache import CacheService
+from app.services.cache import CacheService, portfolio_tag
 from app.tasks.decorators import singleton_task, deduplicate_task
 
 logger = logging.getLogger(__name__)
@@ -45,16 +45,9 @@ def calculate_portfolio_metrics(self, portfolio_id: int, user_id: int) -> dict:
                 return {"status": "error", "message": "Portfolio not found"}
             
             # Calculate metrics using MetricsService
+            # Recalculated even when cached: the cached entry may be what this task replaces
             metrics_service = MetricsService(db)
-            positions = asyncio.run(metrics_service.get_positions(portfolio_id, include_sold=False))
-            
-            # Cache the results (convert to dict for serialization)
-            positions_data = [pos.model_dump() for pos in positions]
-            CacheService.set(
-                f"{CacheService.PREFIX_POSITION}{portfolio_id}",
-                positions_data,
-                ttl=CacheService.TTL_POSITION
-            )
+            positions = asyncio.run(metrics_service.refresh_cached_positions(portfolio_id))
             
             logger.info(
                 f"Task {self.request.id}: Successfully calculated and cached metrics "
@@ -160,7 +153,8 @@ def calculate_sold_positions(self, portfolio_id: int, user_id: int) -> dict:
             CacheService.set(
                 f"{CacheService.PREFIX_METRICS}{portfolio_id}:sold",
                 sold_positions,
-                ttl=CacheService.TTL_METRICS
+                ttl=CacheService.TTL_METRICS,
+                tags=[portfolio_tag(portfolio_id)],
             )
             
             logger.info(
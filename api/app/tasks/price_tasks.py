@@ -0,0 +1,44 @@
+"""
+Background tasks for price storage maintenance
+"""
+import logging
+from typing import Optional
+
+from app.celery_app import celery_app
+from app.db import get_db
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="tasks.backfill_daily_closes")
+def backfill_daily_closes(asset_id: Optional[int] = None) -> dict:
+    """
+    Rebuild the daily_closes table from the raw prices table
+    
+    Incremental maintenance happens on every price write; this is the one-off
+    backfill (e.g. after a manual import or to repair drift).
+    
+    Args:
+        asset_id: Optional asset ID to rebuild. If None, rebuilds all assets.
+        
+    Returns:
+        dict with keys:
+            - rows: int, number of daily close rows written
+            - errors: list of error messages
+    """
+    from app.crud import prices as crud_prices
+    
+    db = next(get_db())
+    try:
+        rows = crud_prices.rebuild_daily_closes(
+            db,
+            asset_ids=[asset_id] if asset_id else None
+        )
+        logger.info(f"Daily closes backfill complete: {rows} rows written")
+        return {"rows": rows, "errors": []}
+    except Exception as e:
+        logger.error(f"Error in daily closes backfill: {e}")
+        db.rollback()
+        return {"rows": 0, "errors": [str(e)]}
+    finally:
+        db.close()
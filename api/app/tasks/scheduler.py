@@ -8,9 +8,9 @@ from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime, timedelta
 
+from app.config import settings
 from app.db import SessionLocal
 from app.services.pricing import PricingService
-from app.services.notifications import notification_service
 
 logger = logging.getLogger(__name__)
 
@@ -19,67 +19,46 @@ scheduler = AsyncIOScheduler()
 
 async def refresh_all_prices():
     """
-    Background job to refresh prices for all active assets
+    Background job to refresh the prices of held assets whose exchange is open
     
-    This runs periodically to keep price cache up-to-date
+    This runs periodically to keep price cache up-to-date: held symbols are
+    planned from the exchange calendars and refreshed in batched rounds
+    (see app.services.price_refresh)
     Runs asynchronously to avoid blocking the main event loop
     """
     logger.info("Starting scheduled price refresh...")
     
     # Run database operations in a thread pool to avoid blocking
     def _refresh_prices():
-        db = SessionLocal()
         try:
-            from app.models import Asset, Transaction
-            from sqlalchemy import distinct
-            from app.services.pricing import _cleanup_stale_tasks
-            
-            # Get all unique assets that have transactions
-            active_assets = (
-                db.query(Asset)
-                .join(Transaction)
-                .distinct()
-                .all()
-            )
+            from app.services.price_refresh import RefreshRun, plan_price_refresh, record_refresh, run_price_refresh
+            from app.services.quote_provider import close_quote_provider
             
-            pricing_service = PricingService(db)
+            db = SessionLocal()
+            try:
+                plan = plan_price_refresh(db)
+            finally:
+                db.close()
             
-            refreshed = 0
-            failed = 0
+            if not plan.symbols:
+                logger.info(f"No held asset trades right now ({plan.held} held), skipping price refresh")
+                record_refresh(plan, RefreshRun(planned=0))
+                return
             
             # Create event loop for async operations
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
             try:
-                # Clean up any stale tasks from previous event loops
-                _cleanup_stale_tasks()
-                
-                for asset in active_assets:
-                    try:
-                        # Run async get_price in the event loop
-                        price = loop.run_until_complete(pricing_service.get_price(asset.symbol))
-                        if price:
-                            refreshed += 1
-                            logger.debug(f"Refreshed {asset.symbol}: {price.price}")
-                        else:
-                            failed += 1
-                            logger.warning(f"Failed to refresh {asset.symbol}")
-                    except Exception as e:
-                        failed += 1
-                        logger.error(f"Error refreshing {asset.symbol}: {e}")
+                run = loop.run_until_complete(run_price_refresh(plan.symbols))
             finally:
+                loop.run_until_complete(close_quote_provider())
                 loop.close()
             
-            logger.info(
-                f"Price refresh completed. Refreshed: {refreshed}, Failed: {failed}, "
-                f"Total: {len(active_assets)}"
-            )
+            record_refresh(plan, run)
             
         except Exception as e:
             logger.error(f"Scheduled price refresh failed: {e}")
-        finally:
-            db.close()
     
     # Run in thread pool to avoid blocking the event loop
     loop = asyncio.get_event_loop()
@@ -88,173 +67,75 @@ async def refresh_all_prices():
 
 async def check_price_alerts():
     """
-    Background job to check watchlist price alerts
+    Background job to keep the quotes of watchlist alert symbols fresh
     
-    This runs periodically to check if any watchlist items with alerts
-    have reached their target price
+    Alerts are evaluated by app.services.price_alerts against every quote
+    written, so this job only refreshes the symbols with an enabled alert whose
+    exchange is open; crossing detection happens as their quotes are saved.
     Runs asynchronously to avoid blocking the main event loop
     """
     logger.info("Starting scheduled price alert check...")
     
     # Run database operations in a thread pool to avoid blocking
     def _check_alerts():
-        db = SessionLocal()
         try:
-            from app.models import Watchlist, Asset
-            from decimal import Decimal
-            from app.services.pricing import _cleanup_stale_tasks
+            from app.services.price_refresh import plan_alert_refresh, run_price_refresh
+            from app.services.quote_provider import close_quote_provider
             
-            # Get all watchlist items with alerts enabled
-            watchlist_items = (
-                db.query(Watchlist)
-                .filter(Watchlist.alert_enabled == True)
-                .filter(Watchlist.alert_target_price.isnot(None))
-                .all()
-            )
+            db = SessionLocal()
+            try:
+                plan = plan_alert_refresh(db)
+            finally:
+                db.close()
             
-            if not watchlist_items:
-                logger.info("No active price alerts to check")
+            if not plan.symbols:
+                logger.info(f"No alert symbol trades right now ({plan.held} with alerts)")
                 return
             
-            pricing_service = PricingService(db)
-            
-            alerts_triggered = 0
-            
             # Create event loop for async operations
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
             try:
-                # Clean up any stale tasks from previous event loops
-                _cleanup_stale_tasks()
-                
-                for item in watchlist_items:
-                    try:
-                        asset = db.query(Asset).filter(Asset.id == item.asset_id).first()
-                        if not asset:
-                            continue
-                        
-                        # Get current price (async call)
-                        price_data = loop.run_until_complete(pricing_service.get_price(asset.symbol))
-                        if not price_data:
-                            continue
-                        
-                        current_price = Decimal(str(price_data.price))
-                        target_price = Decimal(str(item.alert_target_price))
-                        
-                        # Check if alert should be triggered
-                        # Alert triggers if price crosses the target (either above or below)
-                        # For simplicity, we'll trigger if current price >= target for upward alerts
-                        # or current price <= target for downward alerts
-                        should_alert = False
-                        
-                        # Determine alert direction based on whether price is close to target
-                        # If target is above current, we want to alert when price reaches or exceeds target
-                        # If target is below current, we want to alert when price reaches or falls below target
-                        
-                        # Simple approach: alert if price is within 1% of target or has crossed it
-                        price_diff_pct = abs((current_price - target_price) / target_price * 100)
-                        
-                        if price_diff_pct <= 1.0:  # Within 1% of target
-                            should_alert = True
-                        
-                        if should_alert:
-                            # Create notification
-                            notification_service.create_price_alert_notification(
-                                db=db,
-                                user_id=item.user_id,
-                                watchlist_item=item,
-                                current_price=current_price,
-                                target_price=target_price
-                            )
-                            
-                            # Disable alert to prevent repeated notifications
-                            item.alert_enabled = False
-                            db.commit()
-                            
-                            alerts_triggered += 1
-                            logger.info(
-                                f"Price alert triggered for {asset.symbol}: "
-                                f"current=${current_price}, target=${target_price}"
-                            )
-                            
-                    except Exception as e:
-                        logger.error(f"Error checking price alert for watchlist item {item.id}: {e}")
+                run = loop.run_until_complete(run_price_refresh(plan.symbols))
             finally:
+                loop.run_until_complete(close_quote_provider())
                 loop.close()
             
             logger.info(
-                f"Price alert check completed. Alerts triggered: {alerts_triggered}, "
-                f"Total checked: {len(watchlist_items)}"
+                f"Price alert check completed. Refreshed: {run.refreshed}, Failed: {run.failed}, "
+                f"Symbols with alerts: {plan.held}"
             )
             
         except Exception as e:
             logger.error(f"Scheduled price alert check failed: {e}")
-        finally:
-            db.close()
     
     # Run in thread pool to avoid blocking the event loop
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, _check_alerts)
 
 
-def get_market_session_id() -> str:
+async def rebuild_price_alert_index():
     """
-    Get a unique identifier for the current market session.
-    Returns date in format YYYY-MM-DD for US Eastern Time.
-    This ensures we only send one notification per asset per user per trading day.
-    """
-    try:
-        from zoneinfo import ZoneInfo
-        ny_tz = ZoneInfo("America/New_York")
-    except Exception:
-        from datetime import timezone, timedelta
-        ny_tz = timezone(timedelta(hours=-5))
-    
-    now = datetime.now(ny_tz)
-    return now.strftime("%Y-%m-%d")
-
-
-def is_notification_sent_this_session(
-    db, user_id: int, asset_id: int, session_id: str
-) -> bool:
-    """
-    Check if a daily change notification has already been sent for this 
-    asset/user combination during the current market session.
-    """
-    from app.models import Notification, NotificationType
-    from sqlalchemy import text
-    
-    # Look for any daily change notification (up or down) created today
-    # Using raw SQL for JSON field comparison to ensure it works correctly
-    existing = (
-        db.query(Notification)
-        .filter(Notification.user_id == user_id)
-        .filter(
-            Notification.type.in_([
-                NotificationType.DAILY_CHANGE_UP,
-                NotificationType.DAILY_CHANGE_DOWN
-            ])
-        )
-        .filter(text("metadata->>'asset_id' = :asset_id"))
-        .filter(text("metadata->>'session_id' = :session_id"))
-        .params(asset_id=str(asset_id), session_id=session_id)
-        .first()
-    )
+    Background job to rebuild the price alert index from the database
     
-    return existing is not None
-
-
-def should_check_daily_changes() -> bool:
-    """
-    Determine if we should check for daily changes based on market status.
-    Only check during market hours (open + afterhours).
+    Commits keep the index in sync; this repairs what they cannot see (bulk
+    deletes, a Redis flush) and fills it on startup.
     """
-    from app.routers.health import get_market_status
+    def _rebuild():
+        db = SessionLocal()
+        try:
+            from app.services.price_alerts import rebuild_alert_index
+            
+            indexed = rebuild_alert_index(db)
+            logger.info(f"Price alert index rebuilt: {indexed} alerts")
+        except Exception as e:
+            logger.error(f"Price alert index rebuild failed: {e}")
+        finally:
+            db.close()
     
-    market_status = get_market_status()
-    # Check during market open and afterhours (when most trading happens)
-    return market_status in ["open", "afterhours"]
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, _rebuild)
 
 
 async def warmup_position_caches():
@@ -273,6 +154,7 @@ async def warmup_position_caches():
             from app.models import Portfolio
             from app.services.metrics import MetricsService
             from app.services.cache import get_cached_positions
+            from app.services.quote_provider import close_quote_provider
             import time
             from datetime import datetime, timedelta
             
@@ -304,9 +186,9 @@ async def warmup_position_caches():
                         start_time = time.time()
                         
                         # This will fetch fresh prices and recalculate positions
-                        # Result is automatically cached for 30 minutes
+                        # Result is cached for 30 minutes, then served stale while refreshed
                         positions = loop.run_until_complete(
-                            metrics_service.get_positions(portfolio.id, include_sold=False)
+                            metrics_service.refresh_cached_positions(portfolio.id)
                         )
                         
                         elapsed = time.time() - start_time
@@ -320,6 +202,7 @@ async def warmup_position_caches():
                         failed += 1
                         logger.error(f"Error warming up cache for portfolio {portfolio.id}: {e}")
             finally:
+                loop.run_until_complete(close_quote_provider())
                 loop.close()
             
             logger.info(
@@ -337,137 +220,54 @@ async def warmup_position_caches():
     await loop.run_in_executor(None, _warmup_caches)
 
 
-async def check_daily_changes():
+async def process_price_ticks():
     """
-    Background job to check for significant daily price changes in user holdings
+    Background job applying the price ticks waiting for each consumer group
     
-    This runs periodically (every 10-15 minutes during market hours) to notify 
-    users about significant price movements in their portfolio positions.
-    Only sends ONE notification per asset per user per market session, even if 
-    price oscillates around the threshold.
-    Runs asynchronously to avoid blocking the main event loop
+    ATH, price alerts, cached positions and daily change notifications follow
+    the prices fetched since the last run (see app.services.price_ticks).
+    Runs in a thread pool to avoid blocking the main event loop
     """
-    # Skip if market is not open or in afterhours
-    if not should_check_daily_changes():
-        logger.debug("Market closed, skipping daily change check")
-        return
+    def _process_ticks():
+        from app.services.price_ticks import CONSUMER_GROUPS, consume_price_ticks
+        
+        for group in CONSUMER_GROUPS:
+            try:
+                applied = consume_price_ticks(group)
+                if applied:
+                    logger.debug(f"Price tick consumer {group} applied {applied} ticks")
+            except Exception as e:
+                logger.error(f"Price tick consumer {group} failed: {e}")
     
-    logger.info("Starting scheduled daily change check...")
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, _process_ticks)
+
+
+async def refresh_market_widgets():
+    """
+    Background job refreshing the market sentiment and index data
     
-    # Run database operations in a thread pool to avoid blocking
-    def _check_changes():
-        db = SessionLocal()
+    Keeps every market widget's cache entry fresh, so the market endpoints
+    serve it without waiting on upstream (see app.services.market_data).
+    Runs in a thread pool to avoid blocking the main event loop
+    """
+    def _refresh():
+        from app.services.market_data import refresh_market_data
+        from app.services.quote_provider import close_quote_provider
+        
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
         try:
-            from app.models import User, Portfolio
-            from app.services.metrics import MetricsService
-            from decimal import Decimal
-            from app.services.pricing import _cleanup_stale_tasks
-            
-            # Get current market session identifier
-            session_id = get_market_session_id()
-            
-            # Get all active users with notifications enabled
-            users = (
-                db.query(User)
-                .filter(User.is_active == True)
-                .filter(User.daily_change_notifications_enabled == True)
-                .all()
-            )
-            
-            if not users:
-                logger.info("No users with daily change notifications enabled")
-                return
-            
-            total_notifications = 0
-            total_skipped = 0
-            
-            for user in users:
-                try:
-                    threshold = Decimal(str(user.daily_change_threshold_pct or 5.0))
-                    logger.debug(f"Checking daily changes for user {user.id} (threshold: {threshold}%)")
-                    
-                    # Get all user portfolios
-                    portfolios = db.query(Portfolio).filter(Portfolio.user_id == user.id).all()
-                    
-                    for portfolio in portfolios:
-                        try:
-                            # Get positions for this portfolio
-                            metrics_service = MetricsService(db)
-                            # Run async method in event loop
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            try:
-                                # Clean up any stale tasks from previous event loops
-                                _cleanup_stale_tasks()
-                                
-                                positions = loop.run_until_complete(
-                                    metrics_service.get_positions(portfolio.id)
-                                )
-                            finally:
-                                loop.close()
-                            
-                            for position in positions:
-                                # Check if daily change exceeds threshold
-                                if position.daily_change_pct is None:
-                                    continue
-                                
-                                daily_change = abs(position.daily_change_pct)
-                                
-                                if daily_change >= threshold:
-                                    # Check if we already sent a notification this session
-                                    if is_notification_sent_this_session(
-                                        db, user.id, position.asset_id, session_id
-                                    ):
-                                        total_skipped += 1
-                                        logger.debug(
-                                            f"Skipping duplicate notification for {position.symbol} "
-                                            f"(user {user.id}, session {session_id})"
-                                        )
-                                        continue
-                                    
-                                    # Create notification with session tracking
-                                    notification_service.create_daily_change_notification(
-                                        db=db,
-                                        user_id=user.id,
-                                        symbol=position.symbol,
-                                        asset_name=position.name or position.symbol,
-                                        asset_id=position.asset_id,
-                                        portfolio_id=portfolio.id,
-                                        current_price=position.current_price,
-                                        daily_change_pct=position.daily_change_pct,
-                                        quantity=position.quantity,
-                                        session_id=session_id
-                                    )
-                                    
-                                    total_notifications += 1
-                                    logger.info(
-                                        f"Daily change notification created: {position.symbol} "
-                                        f"{position.daily_change_pct:+.2f}% for user {user.id}"
-                                    )
-                        
-                        except Exception as e:
-                            logger.error(
-                                f"Error checking positions for portfolio {portfolio.id}: {e}"
-                            )
-                            continue
-                
-                except Exception as e:
-                    logger.error(f"Error checking daily changes for user {user.id}: {e}")
-                    continue
-            
-            logger.info(
-                f"Daily change check completed. Notifications created: {total_notifications}, "
-                f"Skipped (already notified): {total_skipped}, Users checked: {len(users)}"
-            )
-            
+            refreshed = loop.run_until_complete(refresh_market_data())
+            logger.debug(f"Market data refreshed: {refreshed}")
         except Exception as e:
-            logger.error(f"Scheduled daily change check failed: {e}")
+            logger.error(f"Market data refresh failed: {e}")
         finally:
-            db.close()
+            loop.run_until_complete(close_quote_provider())
+            loop.close()
     
-    # Run in thread pool to avoid blocking the event loop
     loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, _check_changes)
+    await loop.run_in_executor(None, _refresh)
 
 
 async def fetch_daily_closing_prices():
@@ -485,7 +285,6 @@ async def fetch_daily_closing_prices():
         db = SessionLocal()
         try:
             from app.models import Asset, Transaction, TransactionType
-            from sqlalchemy import distinct
             from datetime import datetime, timedelta
             
             # Get all unique assets that have current holdings (BUY - SELL > 0)
@@ -648,7 +447,7 @@ async def send_daily_reports():
             from app.services.pdf_reports import PDFReportService
             from app.services.email import email_service
             from app.services.notifications import notification_service
-            from app.services.pricing import _cleanup_stale_tasks
+            from app.services.quote_provider import close_quote_provider
             from zoneinfo import ZoneInfo
             
             # Get current date in EST timezone (report for the trading day that just ended)
@@ -689,9 +488,6 @@ async def send_daily_reports():
                     asyncio.set_event_loop(loop)
                     
                     try:
-                        # Clean up any stale tasks from previous event loops
-                        _cleanup_stale_tasks()
-                        
                         # Generate PDFs for each portfolio
                         pdf_attachments = []
                         for portfolio in portfolios:
@@ -708,6 +504,7 @@ async def send_daily_reports():
                             pdf_attachments.append((filename, pdf_data))
                             logger.info(f"Generated PDF for portfolio '{portfolio.name}' ({portfolio.id})")
                     finally:
+                        loop.run_until_complete(close_quote_provider())
                         loop.close()
                     
                     # Send email with multiple PDF attachments (one per portfolio)
@@ -795,19 +592,42 @@ def start_scheduler():
         coalesce=True
     )
     
-    # Schedule daily change check every 10 minutes during market hours
-    # This will check for significant price movements and send notifications
-    # Only one notification per asset per user per market session
+    # Rebuild the price alert index on startup, then hourly
     scheduler.add_job(
-        check_daily_changes,
-        trigger=IntervalTrigger(minutes=10),
-        id="check_daily_changes",
-        name="Check daily price changes",
+        rebuild_price_alert_index,
+        trigger=IntervalTrigger(hours=1),
+        id="rebuild_price_alert_index",
+        name="Rebuild price alert index",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    
+    # Apply price ticks every few seconds: ATH, alerts, positions cache and
+    # daily change notifications (one per asset per user per trading day)
+    scheduler.add_job(
+        process_price_ticks,
+        trigger=IntervalTrigger(seconds=settings.PRICE_TICK_POLL_SECONDS),
+        id="process_price_ticks",
+        name="Apply price ticks",
         replace_existing=True,
         max_instances=1,
         coalesce=True
     )
     
+    # Refresh market sentiment and indices on startup, then before their cache entries go stale
+    scheduler.add_job(
+        refresh_market_widgets,
+        trigger=IntervalTrigger(seconds=settings.MARKET_DATA_REFRESH_SECONDS),
+        id="refresh_market_widgets",
+        name="Refresh market data",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    
     # Schedule daily report generation and distribution
     # Run at 4:00 PM EST (16:00) when after-hours trading starts
     # Only run on weekdays (Monday-Friday) when markets are open
@@ -854,7 +674,8 @@ def start_scheduler():
     logger.info(
         "AsyncIO Scheduler started - price refresh every 15 minutes, "
         "position cache warmup every 20 minutes, "
-        "alerts check every 5 minutes, daily changes check every 10 minutes, "
+        f"alerts check every 5 minutes, price ticks applied every {settings.PRICE_TICK_POLL_SECONDS} seconds, "
+        f"market data refreshed every {settings.MARKET_DATA_REFRESH_SECONDS} seconds, "
         "daily reports at 4:00 PM EST (weekdays only), "
         "daily closing prices at 5:00 PM EST (weekdays only), "
         "ATH update at 5:30 PM EST (weekdays only). "
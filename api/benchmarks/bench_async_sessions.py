@@ -0,0 +1,188 @@
+"""
+Benchmark: sync vs async database sessions on GET /portfolios/{id}/positions
+
+Serves the real app in-process (httpx ASGITransport) against a file-backed
+SQLite database. Every statement sleeps --query-latency in the thread that
+runs it, standing in for the Postgres round trip:
+- sync: the previous dependencies (get_db, verify_portfolio_access and a
+  MetricsService on a plain Session); each round trip blocks the event loop
+- async: get_async_db / verify_portfolio_access_async; round trips run in the
+  driver's thread (aiosqlite standing in for asyncpg) while the loop serves
+  other requests
+
+--clients concurrent clients share --requests requests over a few portfolios
+(Redis off, prices fresh in the DB, so every request does the full read).
+Reports throughput and p50/p99 latency.
+
+Usage (from api/):
+    python -m benchmarks.bench_async_sessions [--clients 50] [--requests 500] [--assets 20] [--query-latency 0.002]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import aiosqlite
+import httpx
+from fastapi import Depends
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from benchmarks.common import print_table
+
+from app.auth import create_access_token, verify_portfolio_access, verify_portfolio_access_async
+from app.db import Base, get_async_db, get_db
+from app.dependencies import get_async_metrics_service
+from app.main import app
+from app.models import Asset, Portfolio, Price, Transaction, TransactionType, User
+from app.services.metrics import MetricsService
+
+
+def _connect(path: str, latency: float) -> sqlite3.Connection:
+    """SQLite connection whose statements each cost one simulated round trip"""
+    connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Set after the pragma: opening a connection costs no round trip here
+    connection.set_trace_callback(lambda statement: time.sleep(latency))
+    return connection
+
+
+def seed(db, n_portfolios: int, n_assets: int):
+    """Portfolios holding n_assets each, with fresh prices and previous closes"""
+    user = User(username="bench", email="bench@example.com", hashed_password="x", is_active=True, is_verified=True)
+    db.add(user)
+    db.flush()
+    assets = [Asset(symbol=f"BENCH{i:03d}", currency="USD") for i in range(n_assets)]
+    portfolios = [Portfolio(user_id=user.id, name=f"bench-{i}", base_currency="USD") for i in range(n_portfolios)]
+    db.add_all(assets + portfolios)
+    db.flush()
+
+    now = datetime.utcnow()
+    for asset in assets:
+        db.add(Price(asset_id=asset.id, asof=now, price=Decimal("101"), source="yfinance"))
+        db.add(Price(asset_id=asset.id, asof=now - timedelta(days=1), price=Decimal("100"), source="yfinance_prev_close"))
+        for portfolio in portfolios:
+            db.add(Transaction(
+                portfolio_id=portfolio.id,
+                asset_id=asset.id,
+                tx_date=date(2024, 1, 2),
+                type=TransactionType.BUY,
+                quantity=Decimal("10"),
+                price=Decimal("90"),
+                fees=Decimal("1"),
+                currency="USD",
+                meta_data={},
+            ))
+    db.commit()
+    return create_access_token({"user_id": user.id, "email": user.email}), [p.id for p in portfolios]
+
+
+async def run(token: str, portfolio_ids, n_clients: int, n_requests: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(portfolio_ids[i % len(portfolio_ids)])
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                portfolio_id = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.get(f"/portfolios/{portfolio_id}/positions", headers=headers)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(n_clients)))
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return wall, statistics.median(latencies), p99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--portfolios", type=int, default=5)
+    parser.add_argument("--assets", type=int, default=20)
+    parser.add_argument("--query-latency", type=float, default=0.002, help="Simulated seconds per statement")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    for table in Base.metadata.tables.values():
+        table.schema = None
+
+    # The sync engine never makes a request wait for a connection: with
+    # app.db's 10 + 20 pool, past 30 clients that wait blocks the event loop,
+    # so the requests holding connections cannot finish and the worker stalls
+    # until the pool timeout. The async engine keeps app.db's sizing; its
+    # waits yield to the loop.
+    engine = create_engine("sqlite://", creator=lambda: _connect(path, args.query_latency), poolclass=NullPool)
+    Base.metadata.create_all(bind=engine)
+    SyncSession = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    with SyncSession() as db:
+        token, portfolio_ids = seed(db, args.portfolios, args.assets)
+
+    async def connect():
+        return await aiosqlite.Connection(lambda: _connect(path, args.query_latency), 64)
+
+    async_engine = create_async_engine(
+        "sqlite+aiosqlite://", async_creator=connect,
+        poolclass=AsyncAdaptedQueuePool, pool_size=10, max_overflow=20,
+    )
+    AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    def sync_db():
+        with SyncSession() as db:
+            yield db
+
+    async def async_db():
+        async with AsyncSession() as db:
+            yield db
+
+    def sync_metrics_service(db=Depends(get_db)):
+        return MetricsService(db)
+
+    variants = {
+        # The dependencies the endpoint used before the async session path
+        "sync": {
+            get_db: sync_db,
+            verify_portfolio_access_async: verify_portfolio_access,
+            get_async_metrics_service: sync_metrics_service,
+        },
+        "async": {get_async_db: async_db},
+    }
+
+    table = []
+    for name, overrides in variants.items():
+        app.dependency_overrides = overrides
+        # One warm-up pass so snapshot rebuilds and imports are not timed
+        asyncio.run(run(token, portfolio_ids, 1, len(portfolio_ids)))
+        wall, p50, p99, errors = asyncio.run(run(token, portfolio_ids, args.clients, args.requests))
+        table.append((
+            name, args.clients, args.requests, f"{args.requests / wall:.0f}/s",
+            f"{p50 * 1000:.0f}ms", f"{p99 * 1000:.0f}ms", errors,
+        ))
+    app.dependency_overrides = {}
+    asyncio.run(async_engine.dispose())
+
+    print(
+        f"\nGET /portfolios/{{id}}/positions, {args.assets} assets per portfolio, "
+        f"{args.query_latency * 1000:.1f} ms per statement\n"
+    )
+    print_table(["session", "clients", "requests", "throughput", "p50", "p99", "errors"], table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: per-symbol vs batched price fetching in PricingService.get_multiple_prices
+
+Upstream requests go to the local fake Yahoo server (tests/fake_yahoo.py),
+which sleeps to simulate network latency and counts requests. Redis and the
+ATH Celery task are disabled so only the fetch path is measured.
+
+Usage (from api/):
+    python -m benchmarks.bench_bulk_price_fetch [--latency 0.05] [--sizes 10 100 500]
+"""
+import argparse
+import asyncio
+from unittest.mock import patch
+
+from benchmarks.common import make_session, print_table, timed
+
+from app.models import Asset
+from app.services import pricing, quote_provider
+from app.services.pricing import PricingService
+from tests.fake_yahoo import FakeYahoo
+
+
+async def _per_symbol(service, symbols):
+    """Baseline: one get_price() (and one upstream call) per symbol"""
+    return await asyncio.gather(*[service.get_price(s) for s in symbols])
+
+
+def run(size: int, latency: float):
+    symbols = [f"SYM{i:04d}" for i in range(size)]
+    rows = {}
+    
+    for mode in ("per_symbol", "batched"):
+        db = make_session()
+        db.add_all(Asset(symbol=s, currency="USD") for s in symbols)
+        db.commit()
+        pricing._ongoing_fetches.clear()
+        
+        fake = FakeYahoo(latency=latency)
+        for symbol in symbols:
+            fake.set_quote(symbol, 100.0, previous_close=99.0)
+        quote_provider.use_transport(fake.transport())
+        service = PricingService(db)
+        timings = {}
+        with patch.object(pricing, "get_cached_price", return_value=None), \
+             patch.object(pricing, "cache_price"), \
+             patch("app.tasks.ath_tasks.update_asset_ath"):
+            with timed(timings, mode):
+                if mode == "per_symbol":
+                    asyncio.run(_per_symbol(service, symbols))
+                else:
+                    asyncio.run(service.get_multiple_prices(symbols))
+        db.close()
+        rows[mode] = (timings[mode], len(fake.requests), fake.max_in_flight)
+    
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per upstream call")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    args = parser.parse_args()
+    
+    table = []
+    for size in args.sizes:
+        rows = run(size, args.latency)
+        (base_t, base_calls, base_peak), (batch_t, batch_calls, batch_peak) = rows["per_symbol"], rows["batched"]
+        table.append((
+            size,
+            f"{base_t:.2f}s", base_calls, base_peak,
+            f"{batch_t:.2f}s", batch_calls, batch_peak,
+            f"{base_t / batch_t:.1f}x",
+        ))
+    
+    print(f"\nget_multiple_prices, cold cache, {args.latency * 1000:.0f} ms per upstream call\n")
+    print_table(
+        ["symbols", "per-symbol", "calls", "peak", "batched", "calls", "peak", "speedup"],
+        table,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: per-row vs set-based price ingestion for ensure_historical_prices
+
+Backfills N years of business-day closes for many assets from stubbed
+upstream histories. The legacy path (iterrows + create_price per row: SELECT,
+INSERT/UPDATE, commit, refresh) is only timed on --legacy-assets assets and
+extrapolated, since it is orders of magnitude slower.
+
+Usage (from api/):
+    python -m benchmarks.bench_bulk_price_upsert [--assets 100] [--years 20]
+"""
+import argparse
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import make_session, print_table, timed
+
+from app.crud import prices as crud_prices
+from app.models import Asset, Price
+from app.schemas import PriceCreate
+from app.services.pricing import PricingService
+
+
+def _history(years: int, seed: int) -> pd.DataFrame:
+    """Synthetic daily history (tz-aware index like the quote provider returns)"""
+    end = pd.Timestamp("2025-12-01", tz="America/New_York")
+    index = pd.bdate_range(end=end, periods=years * 252)
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, len(index)))
+    return pd.DataFrame({"Close": closes, "Volume": rng.integers(1e5, 1e7, len(index))}, index=index)
+
+
+def _legacy_ingest(db, asset: Asset, hist: pd.DataFrame) -> int:
+    """The previous ensure_historical_prices() body: one create_price() per row"""
+    count = 0
+    for idx, row in hist.iterrows():
+        crud_prices.create_price(db, PriceCreate(
+            asset_id=asset.id,
+            asof=datetime(idx.year, idx.month, idx.day),
+            price=Decimal(str(float(row.get("Close")))),
+            volume=int(row.get("Volume", 0)),
+            source="yfinance_history",
+        ))
+        count += 1
+    return count
+
+
+def _setup(n_assets: int):
+    db = make_session()
+    assets = [Asset(symbol=f"SYM{i:04d}", currency="USD") for i in range(n_assets)]
+    db.add_all(assets)
+    db.commit()
+    return db, assets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--legacy-assets", type=int, default=2, help="Assets to time on the per-row path")
+    args = parser.parse_args()
+    
+    histories = [_history(args.years, seed) for seed in range(args.assets)]
+    rows_per_asset = len(histories[0])
+    timings = {}
+    
+    # Legacy per-row path on a sample, extrapolated
+    db, assets = _setup(args.legacy_assets)
+    with timed(timings, "legacy"):
+        for asset, hist in zip(assets, histories):
+            _legacy_ingest(db, asset, hist)
+    db.close()
+    legacy_total = timings["legacy"] / args.legacy_assets * args.assets
+    
+    # Set-based path through the real service
+    db, assets = _setup(args.assets)
+    service = PricingService(db)
+    inserted = 0
+    # Upstream history requests return the synthetic frames (only ingestion is timed)
+    with patch("app.services.pricing.run_sync", side_effect=histories):
+        with timed(timings, "bulk"):
+            for asset in assets:
+                inserted += service.ensure_historical_prices(asset, datetime(2000, 1, 1), datetime(2025, 12, 1))
+    # Second pass: every row already exists and is updated in place
+    with patch("app.services.pricing.run_sync", side_effect=histories):
+        with timed(timings, "bulk_rerun"):
+            for asset in assets:
+                service.ensure_historical_prices(asset, datetime(2000, 1, 1), datetime(2025, 12, 1))
+    stored = db.query(Price).count()
+    db.close()
+    
+    total_rows = rows_per_asset * args.assets
+    print(f"\nBackfill {args.assets} assets x {args.years} years ({total_rows:,} daily rows), SQLite in-memory\n")
+    print_table(
+        ["path", "wall time", "rows/s"],
+        [
+            (f"per-row (extrapolated from {args.legacy_assets})", f"{legacy_total:.1f}s", f"{total_rows / legacy_total:,.0f}"),
+            ("set-based, fresh", f"{timings['bulk']:.1f}s", f"{total_rows / timings['bulk']:,.0f}"),
+            ("set-based, all updates", f"{timings['bulk_rerun']:.1f}s", f"{total_rows / timings['bulk_rerun']:,.0f}"),
+        ],
+    )
+    print(f"\ninserted={inserted:,} stored={stored:,} speedup={legacy_total / timings['bulk']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
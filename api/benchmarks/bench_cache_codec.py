@@ -0,0 +1,129 @@
+"""
+Benchmark: cache payload encodings for a 200-position portfolio
+
+Encodes the cached positions of one portfolio (a list of Position models)
+and decodes them back into models, as metrics.get_positions does on a hit:
+- json: the previous serializer (model_dump + json.dumps, Decimals as
+  floats), decoded with json.loads and re-validated with Position(**pos)
+- msgpack: app.services.cache_codec without compression, models rebuilt
+  with model_construct
+- msgpack+zlib / msgpack+zstd: the same, compressed
+
+Reports the median encode and decode time over --repeat runs and the payload
+size. With --redis-url, each payload is also written to that Redis and
+MEMORY USAGE reports what the key actually costs there.
+
+Usage (from api/):
+    python -m benchmarks.bench_cache_codec [--positions 200] [--repeat 200] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from benchmarks.common import print_table
+
+from app.schemas import Position
+from app.services import cache_codec
+
+
+def make_positions(n: int) -> list:
+    base = datetime(2024, 6, 3, 21, 0)
+    positions = []
+    for i in range(n):
+        quantity = Decimal(f"{10 + i}.{i:04d}")
+        avg_cost = Decimal(f"{50 + i % 300}.{i % 100:02d}")
+        price = avg_cost * Decimal("1.0734")
+        positions.append(Position(
+            asset_id=i, symbol=f"SYM{i:03d}", name=f"Company {i} Holdings", quantity=quantity,
+            avg_cost=avg_cost, current_price=price, market_value=quantity * price,
+            cost_basis=quantity * avg_cost, unrealized_pnl=quantity * (price - avg_cost),
+            unrealized_pnl_pct=Decimal("7.34"), daily_change_pct=Decimal(f"-0.{i % 97:02d}"),
+            breakeven_gain_pct=None, distance_to_ath_pct=Decimal("-12.5"), local_ath_price=price * 2,
+            local_ath_date=base - timedelta(days=i), ath_price=price * 3, ath_price_native=price * 3,
+            ath_currency="USD", ath_date=base - timedelta(days=2 * i), sector="Technology",
+            industry="Software", sector_etf="XLK", currency="USD", last_updated=base, asset_type="EQUITY",
+        ))
+    return positions
+
+
+def _json_encode(positions):
+    def default(obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(type(obj))
+    return json.dumps([pos.model_dump() for pos in positions], default=default).encode()
+
+
+def _json_decode(data):
+    return [Position(**pos) for pos in json.loads(data)]
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def _codec(compression: str, min_bytes: int):
+    """encode/decode of cache_codec under one compression setting"""
+    def encode(positions):
+        with patch.object(cache_codec.settings, "CACHE_CODEC", "msgpack"), \
+                patch.object(cache_codec.settings, "CACHE_COMPRESSION", compression), \
+                patch.object(cache_codec.settings, "CACHE_COMPRESSION_MIN_BYTES", min_bytes):
+            return cache_codec.encode(positions)
+    return encode, cache_codec.decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--redis-url", default=None, help="Redis to measure MEMORY USAGE on (keys are deleted)")
+    args = parser.parse_args()
+
+    positions = make_positions(args.positions)
+    variants = [("json", _json_encode, _json_decode), ("msgpack", *_codec("none", 0))]
+    variants.append(("msgpack+zlib", *_codec("zlib", 0)))
+    if cache_codec.zstandard is not None:
+        variants.append(("msgpack+zstd", *_codec("zstd", 0)))
+
+    redis_client = None
+    if args.redis_url:
+        import redis
+        redis_client = redis.Redis.from_url(args.redis_url)
+
+    rows = []
+    for name, encode, decode in variants:
+        data = encode(positions)
+        assert len(decode(data)) == len(positions)
+        row = [
+            name,
+            f"{_median_ms(lambda: encode(positions), args.repeat):.2f}",
+            f"{_median_ms(lambda: decode(data), args.repeat):.2f}",
+            f"{len(data):,}",
+        ]
+        if redis_client is not None:
+            key = f"bench_cache_codec:{name}"
+            redis_client.set(key, data)
+            row.append(f"{redis_client.memory_usage(key):,}")
+            redis_client.delete(key)
+        rows.append(row)
+
+    headers = ["encoding", "encode ms", "decode ms", "bytes"]
+    if redis_client is not None:
+        headers.append("redis bytes")
+    print(f"{args.positions} positions, median of {args.repeat} runs")
+    print_table(headers, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark: vectorized portfolio history engine vs the per-date Decimal loop
+
+Uses a synthetic 60-asset portfolio over ~5 years of daily closes. The reference
+loop is O(dates x assets x dates); pass --reference-limit to skip it for larger
+runs. At high transaction counts both sides are dominated by the O(transactions)
+Decimal ledger pass, which the engine keeps for exact holdings semantics.
+
+Usage (from api/):
+    python -m benchmarks.bench_portfolio_history [--sizes 1000 10000 100000]
+"""
+import argparse
+
+from benchmarks.common import print_table, timed
+
+from app.services.metrics import MetricsService
+from app.services.portfolio_history import build_history_points
+from tests.utils import reference_history_points, synthetic_portfolio_history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--assets", type=int, default=60)
+    parser.add_argument("--days", type=int, default=1825)
+    parser.add_argument("--reference-limit", type=int, default=100000,
+                        help="Largest transaction count to also time the reference loop on")
+    args = parser.parse_args()
+    
+    split_ratio = MetricsService(db=None)._parse_split_ratio
+    table = []
+    for size in args.sizes:
+        dates, prices, transactions = synthetic_portfolio_history(
+            n_transactions=size, n_assets=args.assets, n_days=args.days, seed=size
+        )
+        timings = {}
+        with timed(timings, "engine"):
+            build_history_points(dates, prices, transactions, split_ratio)
+        
+        if size <= args.reference_limit:
+            with timed(timings, "reference"):
+                reference_history_points(dates, prices, transactions, split_ratio)
+            reference = f"{timings['reference']:.2f}s"
+            speedup = f"{timings['reference'] / timings['engine']:.0f}x"
+        else:
+            reference, speedup = "skipped", "-"
+        
+        table.append((size, len(dates), reference, f"{timings['engine']:.3f}s", speedup))
+    
+    print(f"\nget_portfolio_history series, {args.assets} assets, {args.days} days\n")
+    print_table(["transactions", "dates", "reference", "vectorized", "speedup"], table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark: position reads from persisted snapshots vs full transaction replay
+
+Seeds one portfolio with N transactions spread over a few assets, then times:
+- replay: load every transaction (joinedload asset) and fold it, as
+  MetricsService did on every positions cache miss
+- snapshots: load the per-asset snapshot rows (what positions reads do now)
+- append: insert one new transaction (folded incrementally on flush)
+- back-dated edit: change a transaction in the middle of the history
+  (replays only that asset from the edited date)
+
+Usage (from api/):
+    python -m benchmarks.bench_position_snapshots [--sizes 1000 20000] [--assets 30]
+"""
+import argparse
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks.common import make_session, print_table, timed
+
+from sqlalchemy.orm import joinedload
+
+from app.crud import positions as crud_positions
+from app.models import Asset, Portfolio, Transaction, TransactionType, User
+from app.services.position_state import PositionState
+
+
+def seed(db, n_transactions, n_assets, rng):
+    """One portfolio with n_transactions buys/sells in date order"""
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    portfolio = Portfolio(user_id=user.id, name="bench", base_currency="USD")
+    assets = [Asset(symbol=f"BENCH{i:03d}", currency="USD") for i in range(n_assets)]
+    db.add(portfolio)
+    db.add_all(assets)
+    db.commit()
+
+    start = date(2005, 1, 3)
+    held = {asset.id: Decimal(0) for asset in assets}
+    for i in range(n_transactions):
+        asset = rng.choice(assets)
+        tx_date = start + timedelta(days=i * 7000 // n_transactions)
+        if held[asset.id] > 5 and rng.random() < 0.3:
+            tx_type, quantity = TransactionType.SELL, Decimal(rng.randint(1, 5))
+            held[asset.id] -= quantity
+        else:
+            tx_type, quantity = TransactionType.BUY, Decimal(rng.randint(1, 20))
+            held[asset.id] += quantity
+        db.add(Transaction(
+            portfolio_id=portfolio.id,
+            asset_id=asset.id,
+            tx_date=tx_date,
+            type=tx_type,
+            quantity=quantity,
+            price=Decimal(rng.randint(5000, 20000)) / 100,
+            fees=Decimal("1"),
+            currency="USD",
+            meta_data={},
+        ))
+        if i % 1000 == 999:
+            db.commit()
+    db.commit()
+    return portfolio, assets
+
+
+def full_replay(db, portfolio_id):
+    """Legacy read path: every transaction loaded and folded"""
+    transactions = (
+        db.query(Transaction)
+        .options(joinedload(Transaction.asset))
+        .filter(Transaction.portfolio_id == portfolio_id)
+        .order_by(Transaction.tx_date, Transaction.created_at)
+        .all()
+    )
+    by_asset = {}
+    for tx in transactions:
+        by_asset.setdefault(tx.asset_id, []).append(tx)
+    return {asset_id: PositionState.from_transactions(txs) for asset_id, txs in by_asset.items()}
+
+
+def snapshot_read(db, portfolio_id):
+    """Current read path"""
+    return {
+        snapshot.asset_id: PositionState.from_row(snapshot)
+        for snapshot in crud_positions.get_position_snapshots(db, portfolio_id)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--assets", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    table = []
+    for size in args.sizes:
+        db = make_session()
+        rng = random.Random(size)
+        portfolio, assets = seed(db, size, args.assets, rng)
+        timings = {}
+
+        with timed(timings, "replay"):
+            for _ in range(args.repeat):
+                replayed = full_replay(db, portfolio.id)
+        with timed(timings, "snapshots"):
+            for _ in range(args.repeat):
+                stored = snapshot_read(db, portfolio.id)
+        for asset_id, state in replayed.items():
+            assert abs(stored[asset_id].quantity - state.quantity) < Decimal("1e-6")
+
+        with timed(timings, "append"):
+            db.add(Transaction(
+                portfolio_id=portfolio.id, asset_id=assets[0].id, tx_date=date(2030, 1, 1),
+                type=TransactionType.BUY, quantity=Decimal(1), price=Decimal(100), fees=Decimal(0),
+                currency="USD", meta_data={},
+            ))
+            db.commit()
+
+        middle = (
+            db.query(Transaction)
+            .filter(Transaction.portfolio_id == portfolio.id)
+            .order_by(Transaction.tx_date)
+            .offset(size // 2)
+            .first()
+        )
+        with timed(timings, "edit"):
+            middle.quantity += 1
+            db.commit()
+
+        db.close()
+        per_read = lambda key: f"{timings[key] / args.repeat * 1000:.1f}ms"
+        table.append((
+            size,
+            per_read("replay"),
+            per_read("snapshots"),
+            f"{timings['replay'] / timings['snapshots']:.0f}x",
+            f"{timings['append'] * 1000:.1f}ms",
+            f"{timings['edit'] * 1000:.1f}ms",
+        ))
+
+    print(f"\nPosition reads, {args.assets} assets, SQLite in-memory\n")
+    print_table(["transactions", "replay read", "snapshot read", "speedup", "append", "back-dated edit"], table)
+
+
+if __name__ == "__main__":
+    main()
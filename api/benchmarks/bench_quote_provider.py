@@ -0,0 +1,112 @@
+"""
+Benchmark: shared pooled upstream client vs one connection per quote
+
+Serves the fake Yahoo server (tests/fake_yahoo.py) with uvicorn on a local
+port and fires N concurrent quote requests, as a burst of dashboard loads
+would:
+- per-call: a fresh httpx client per quote, unbounded (what per-ticker
+  yfinance calls in worker threads amounted to)
+- pooled: the shared YahooQuoteProvider, keep-alive connections, bounded by
+  UPSTREAM_MAX_CONCURRENCY (the token bucket is disabled to isolate pooling)
+
+Reports wall time, p50/p99 latency per quote and the peak number of requests
+the upstream saw in flight.
+
+Usage (from api/):
+    python -m benchmarks.bench_quote_provider [--requests 200 1000] [--latency 0.02] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from benchmarks.common import print_table
+
+from app.services.quote_provider import TokenBucket, YahooQuoteProvider
+from tests.fake_yahoo import FakeYahoo
+
+SYMBOLS = [f"SYM{i:03d}" for i in range(50)]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(fake: FakeYahoo) -> str:
+    """Run the fake on a background uvicorn server and return its base URL"""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}"
+
+
+async def _per_call(base_url: str, symbol: str) -> float:
+    started = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        response = await client.get(f"{base_url}/v8/finance/chart/{symbol}", params={"range": "5d", "interval": "1d"})
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def _pooled(provider: YahooQuoteProvider, symbol: str) -> float:
+    started = time.perf_counter()
+    await provider.get_quote(symbol)
+    return time.perf_counter() - started
+
+
+async def run(base_url: str, fake: FakeYahoo, mode: str, n_requests: int, concurrency: int):
+    fake.max_in_flight = 0
+    symbols = [SYMBOLS[i % len(SYMBOLS)] for i in range(n_requests)]
+    provider = YahooQuoteProvider(
+        base_url=base_url,
+        max_concurrency=concurrency,
+        rate_limiter=TokenBucket(rate=1e9, capacity=10**9),
+    )
+    started = time.perf_counter()
+    if mode == "per-call":
+        latencies = await asyncio.gather(*(_per_call(base_url, s) for s in symbols), return_exceptions=True)
+    else:
+        latencies = await asyncio.gather(*(_pooled(provider, s) for s in symbols), return_exceptions=True)
+    wall = time.perf_counter() - started
+    await provider.aclose()
+
+    ok = sorted(l for l in latencies if isinstance(l, float))
+    p99 = ok[min(len(ok) - 1, int(len(ok) * 0.99))] if ok else float("nan")
+    return wall, statistics.median(ok) if ok else float("nan"), p99, n_requests - len(ok), fake.max_in_flight
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, nargs="+", default=[200, 1000])
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated upstream seconds per request")
+    parser.add_argument("--concurrency", type=int, default=8, help="UPSTREAM_MAX_CONCURRENCY for the pooled client")
+    args = parser.parse_args()
+
+    fake = FakeYahoo(latency=args.latency)
+    for symbol in SYMBOLS:
+        fake.set_quote(symbol, 100.0, previous_close=99.0)
+    base_url = serve(fake)
+
+    table = []
+    for n_requests in args.requests:
+        for mode in ("per-call", "pooled"):
+            wall, p50, p99, errors, peak = asyncio.run(run(base_url, fake, mode, n_requests, args.concurrency))
+            table.append((
+                n_requests, mode, f"{wall:.2f}s", f"{p50 * 1000:.0f}ms", f"{p99 * 1000:.0f}ms", errors, peak,
+            ))
+
+    print(f"\nConcurrent quotes against a local fake Yahoo, {args.latency * 1000:.0f} ms upstream latency\n")
+    print_table(["requests", "client", "wall time", "p50", "p99", "errors", "peak upstream in-flight"], table)
+
+
+if __name__ == "__main__":
+    main()
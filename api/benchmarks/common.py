@@ -0,0 +1,55 @@
+"""
+Shared helpers for benchmarks: test environment, in-memory database and timing
+"""
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Benchmarks run against the test configuration, never a real database
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from dotenv import load_dotenv
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env.test'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
+
+from app.db import Base
+
+# Keep benchmark output readable
+logging.disable(logging.WARNING)
+
+
+def make_session() -> Session:
+    """Create an in-memory SQLite session with all tables (schemas stripped like in tests)"""
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    for table in Base.metadata.tables.values():
+        table.schema = None
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)()
+
+
+@contextmanager
+def timed(results: dict, key: str):
+    """Store the wall time of the block (seconds) in results[key]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results[key] = time.perf_counter() - start
+
+
+def print_table(headers, rows):
+    """Print rows as a fixed-width table"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    line = "  ".join(str(h).rjust(w) for h, w in zip(headers, widths))
+    print(line)
+    print("-" * len(line))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
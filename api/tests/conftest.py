@@ -1,7 +1,9 @@
 """
 Test configuration and fixtures
 """
+import asyncio
 import os
+import sqlite3
 import sys
 from typing import Generator
 from decimal import Decimal
@@ -19,7 +21,7 @@ from fastapi.testclient import TestClient
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.db import Base, get_db
+from app.db import Base, get_async_db, get_db
 from app.main import app
 from app.models import User, Portfolio, Asset, Transaction, TransactionType
 from app.auth import get_password_hash
@@ -42,24 +44,35 @@ def clear_caches():
     if hasattr(metrics, '_result_cache'):
         metrics._result_cache.clear()
     
+    # Clear the in-process cache tier and its hit counters
+    from app.services.cache import _tier_counters, local_cache
+    local_cache.clear()
+    _tier_counters.clear()
+    from app.services import cache_refresh
+    cache_refresh._local_claims.clear()
+    from app.services.single_flight import _flight_counters
+    _flight_counters.clear()
+    from app.services import price_refresh
+    price_refresh._refresh_counters.clear()
+    price_refresh._last_refresh.clear()
+    from app.services import price_alerts
+    price_alerts._alert_counters.clear()
+    price_alerts._local_index = price_alerts._LocalAlertIndex()
+    from app.services import price_ticks
+    price_ticks._publish_counters.clear()
+    price_ticks._group_counters.clear()
+    price_ticks._groups_ready.clear()
+    from app.services import price_feed
+    price_feed.price_feed = price_feed.PriceFeed()
+    
     # Clear pricing service caches
     from app.services import pricing
-    if hasattr(pricing, '_price_memory_cache'):
-        pricing._price_memory_cache.clear()
     if hasattr(pricing, '_ongoing_fetches'):
         pricing._ongoing_fetches.clear()
-    # Reset locks to avoid event loop issues
-    if hasattr(pricing, '_fetch_lock'):
-        pricing._fetch_lock = None
-        pricing._fetch_lock_loop = None
-    if hasattr(pricing, '_memory_cache_lock'):
-        pricing._memory_cache_lock = None
-        pricing._memory_cache_loop = None
-    
-    # Clear currency service cache
-    from app.services import currency
-    if hasattr(currency, '_exchange_rate_cache'):
-        currency._exchange_rate_cache.clear()
+    
+    # Clear FX history cache
+    from app.services import fx_history
+    fx_history.clear_cache()
     
     # Clear insights service cache
     from app.services import insights
@@ -73,16 +86,56 @@ def clear_caches():
         metrics._task_cache.clear()
     if hasattr(metrics, '_result_cache'):
         metrics._result_cache.clear()
-    if hasattr(pricing, '_price_memory_cache'):
-        pricing._price_memory_cache.clear()
+    local_cache.clear()
     if hasattr(pricing, '_ongoing_fetches'):
         pricing._ongoing_fetches.clear()
-    if hasattr(currency, '_exchange_rate_cache'):
-        currency._exchange_rate_cache.clear()
+    fx_history.clear_cache()
     if hasattr(insights, '_insights_cache'):
         insights._insights_cache.clear()
 
 
+@pytest.fixture(scope="function", autouse=True)
+def fake_yahoo():
+    """Route every upstream market data request to a local fake Yahoo server"""
+    from app.services import quote_provider
+    from tests.fake_yahoo import FakeYahoo
+    
+    fake = FakeYahoo()
+    quote_provider.use_transport(fake.transport())
+    yield fake
+    quote_provider.use_transport(None)
+
+
+@pytest.fixture(scope="function")
+def fake_redis():
+    """
+    In-memory Redis behind CacheService, for tests that exercise the cache itself
+    
+    CacheService talks to it over a binary connection; the client yielded to
+    the test decodes responses, for reading keys and writing legacy entries.
+    """
+    import fakeredis
+    from unittest.mock import patch
+    from app.services.cache import stop_invalidation_listener
+    from app.services.single_flight import stop_single_flight_listener
+    
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    binary_client = fakeredis.FakeRedis(server=server)
+    # fakeredis has no INFO command
+    binary_client.info = lambda *args, **kwargs: {"db0": {"keys": binary_client.dbsize()}}
+    with patch("app.services.cache.get_redis_binary", return_value=binary_client), \
+            patch("app.services.single_flight.get_redis_binary", return_value=binary_client), \
+            patch("app.services.cache_refresh.get_redis_binary", return_value=binary_client), \
+            patch("app.services.price_alerts.get_redis_binary", return_value=binary_client), \
+            patch("app.services.price_ticks.get_redis_binary", return_value=binary_client), \
+            patch("app.services.price_feed.get_redis_binary", return_value=binary_client):
+        yield client
+    stop_invalidation_listener()
+    stop_single_flight_listener()
+    client.flushall()
+
+
 @pytest.fixture(scope="function")
 def test_db() -> Generator[Session, None, None]:
     """Create test database with proper schema handling"""
@@ -90,9 +143,11 @@ def test_db() -> Generator[Session, None, None]:
     # This prevents issues where different connections get different in-memory databases
     from sqlalchemy.pool import StaticPool
     
+    # One sqlite3 connection, shared with the async engine of async_test_db
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
     engine = create_engine(
         TEST_DATABASE_URL,
-        connect_args={"check_same_thread": False},
+        creator=lambda: connection,
         poolclass=StaticPool,  # Critical for :memory: databases
         echo=False  # Set to True for SQL debugging
     )
@@ -126,16 +181,56 @@ def test_db() -> Generator[Session, None, None]:
                 Base.metadata.tables[table_name].schema = schema
 
 
+class _SharedConnection:
+    """sqlite3 connection handed to aiosqlite, which must not close the shared database"""
+    
+    def __init__(self, connection: sqlite3.Connection):
+        object.__setattr__(self, "_connection", connection)
+    
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+    
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="function")
+def async_test_db(test_db: Session):
+    """AsyncSession factory (aiosqlite) over the same in-memory database as test_db"""
+    import aiosqlite
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+    
+    pooled = test_db.get_bind().raw_connection()
+    connection = _SharedConnection(pooled.driver_connection)
+    pooled.close()
+    
+    async def connect():
+        return await aiosqlite.Connection(lambda: connection, 64)
+    
+    engine = create_async_engine("sqlite+aiosqlite://", async_creator=connect, poolclass=StaticPool)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
 @pytest.fixture(scope="function")
-def client(test_db: Session) -> Generator[TestClient, None, None]:
-    """Create test client with database override"""
+def client(test_db: Session, async_test_db) -> Generator[TestClient, None, None]:
+    """Create test client with database overrides (sync and async sessions)"""
     def override_get_db():
         try:
             yield test_db
         finally:
             pass
     
+    async def override_get_async_db():
+        async with async_test_db() as session:
+            yield session
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     
     with TestClient(app) as test_client:
         yield test_client
@@ -143,6 +238,28 @@ def client(test_db: Session) -> Generator[TestClient, None, None]:
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def stream_db(test_db: Session, async_test_db):
+    """Point the sessions streaming endpoints open for their response body at the test database"""
+    from contextlib import asynccontextmanager, contextmanager
+    from unittest.mock import patch
+    
+    @contextmanager
+    def db_context():
+        yield test_db
+    
+    @asynccontextmanager
+    async def async_db_context():
+        async with async_test_db() as session:
+            yield session
+    
+    with patch("app.routers.batch.get_db_context", db_context), \
+            patch("app.routers.batch.get_async_db_context", async_db_context), \
+            patch("app.routers.portfolios.get_async_db_context", async_db_context), \
+            patch("app.routers.watchlist.get_db_context", db_context):
+        yield
+
+
 @pytest.fixture
 def test_user(test_db: Session) -> User:
     """Create a test user for authentication tests"""
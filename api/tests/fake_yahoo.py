@@ -0,0 +1,163 @@
+"""
+Local fake of the Yahoo Finance chart/spark endpoints
+
+Serves deterministic quotes and daily histories so tests and benchmarks never
+hit the network. Install it with quote_provider.use_transport(fake.transport())
+or serve fake.app with uvicorn for load tests.
+"""
+import asyncio
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class FakeYahoo:
+    """In-process Yahoo Finance stand-in with request recording and latency injection"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.quotes: Dict[str, dict] = {}
+        self.histories: Dict[str, Tuple[Dict[date, float], str]] = {}
+        self.errors: Dict[str, int] = {}
+        self.requests: List[Tuple[str, dict]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = self._build_app()
+
+    def set_quote(
+        self,
+        symbol: str,
+        price: Optional[float],
+        previous_close: Optional[float] = None,
+        volume: Optional[int] = None,
+        closes: Optional[List[Optional[float]]] = None,
+    ):
+        """
+        Quote served by chart (range requests) and spark
+
+        price=None leaves regularMarketPrice out of the meta so consumers fall
+        back to the closes. closes defaults to [previous_close, price].
+        """
+        if closes is None:
+            closes = [c for c in (previous_close, price) if c is not None]
+        self.quotes[symbol] = {
+            "price": price,
+            "previous_close": previous_close,
+            "volume": volume,
+            "closes": closes,
+        }
+
+    def set_history(self, symbol: str, closes: Mapping[date, float], tz: str = "America/New_York"):
+        """Daily closes served by chart period1/period2 requests"""
+        self.histories[symbol] = (dict(closes), tz)
+
+    def fail(self, symbol: str, status: int = 500):
+        """Answer every request for a symbol with an HTTP error"""
+        self.errors[symbol] = status
+
+    def transport(self) -> httpx.ASGITransport:
+        """httpx transport routing requests to this fake"""
+        return httpx.ASGITransport(app=self.app)
+
+    def requests_for(self, path: str) -> List[dict]:
+        """Query params of recorded requests whose path starts with path"""
+        return [params for request_path, params in self.requests if request_path.startswith(path)]
+
+    async def _enter(self, request: Request):
+        self.requests.append((request.url.path, dict(request.query_params)))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/v8/finance/chart/{symbol}")
+        async def chart(symbol: str, request: Request):
+            await self._enter(request)
+            try:
+                if symbol in self.errors:
+                    return JSONResponse({"chart": {"result": None, "error": {"code": "Error"}}}, self.errors[symbol])
+                if "period1" in request.query_params:
+                    result = self._history_result(
+                        symbol, int(request.query_params["period1"]), int(request.query_params["period2"])
+                    )
+                else:
+                    result = self._quote_result(symbol)
+                if result is None:
+                    return JSONResponse(
+                        {"chart": {"result": None, "error": {"code": "Not Found", "description": "No data found"}}},
+                        404,
+                    )
+                return {"chart": {"result": [result], "error": None}}
+            finally:
+                self.in_flight -= 1
+
+        @app.get("/v8/finance/spark")
+        async def spark(request: Request):
+            await self._enter(request)
+            try:
+                body = {}
+                for symbol in request.query_params.get("symbols", "").split(","):
+                    quote = self.quotes.get(symbol)
+                    if quote is None or symbol in self.errors:
+                        continue
+                    body[symbol] = {
+                        "symbol": symbol,
+                        "timestamp": self._recent_timestamps(len(quote["closes"])),
+                        "close": quote["closes"],
+                        "chartPreviousClose": quote["previous_close"],
+                        "dataGranularity": 300,
+                    }
+                    if quote["volume"] is not None:
+                        body[symbol]["volume"] = [quote["volume"]] * len(quote["closes"])
+                return body
+            finally:
+                self.in_flight -= 1
+
+        return app
+
+    @staticmethod
+    def _recent_timestamps(count: int) -> List[int]:
+        today = datetime.now(timezone.utc).replace(hour=14, minute=30, second=0, microsecond=0)
+        return [int((today - timedelta(days=count - 1 - i)).timestamp()) for i in range(count)]
+
+    def _quote_result(self, symbol: str) -> Optional[dict]:
+        quote = self.quotes.get(symbol)
+        if quote is None:
+            return None
+        meta = {"symbol": symbol, "exchangeTimezoneName": "America/New_York"}
+        if quote["price"] is not None:
+            meta["regularMarketPrice"] = quote["price"]
+        if quote["previous_close"] is not None:
+            meta["previousClose"] = quote["previous_close"]
+        if quote["volume"] is not None:
+            meta["regularMarketVolume"] = quote["volume"]
+        return {
+            "meta": meta,
+            "timestamp": self._recent_timestamps(len(quote["closes"])),
+            "indicators": {"quote": [{"close": quote["closes"], "volume": [quote["volume"]] * len(quote["closes"])}]},
+        }
+
+    def _history_result(self, symbol: str, period1: int, period2: int) -> Optional[dict]:
+        if symbol not in self.histories:
+            return None
+        closes, tz = self.histories[symbol]
+        zone = ZoneInfo(tz)
+        timestamps, values = [], []
+        for day in sorted(closes):
+            # Daily bars are stamped at the market open, exchange-local
+            ts = int(datetime.combine(day, dt_time(9, 30), zone).timestamp())
+            if period1 <= ts < period2:
+                timestamps.append(ts)
+                values.append(closes[day])
+        return {
+            "meta": {"symbol": symbol, "exchangeTimezoneName": tz},
+            "timestamp": timestamps,
+            "indicators": {"quote": [{"close": values, "volume": [1000] * len(values)}]},
+        }
@@ -53,3 +53,25 @@ def test_api_docs_available(client):
     """Test that API documentation is available"""
     response = client.get("/docs")
     assert response.status_code == 200
+
+
+def test_refresh_watchlist_prices_is_one_batch(client, auth_headers, test_db, test_user, fake_yahoo):
+    """Test a watchlist refresh force-fetches every symbol with one batched request"""
+    from unittest.mock import patch
+
+    from app.models import Watchlist
+    from tests.factories import AssetFactory
+
+    for symbol in ("AAPL", "MSFT"):
+        asset = AssetFactory.create(symbol=symbol)
+        test_db.add(Watchlist(user_id=test_user.id, asset_id=asset.id))
+        fake_yahoo.set_quote(symbol, 110.0, previous_close=100.0)
+    test_db.commit()
+
+    with patch('app.tasks.ath_tasks.update_asset_ath'):
+        response = client.post("/watchlist/refresh-prices", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"refreshed_count": 2}
+    assert len(fake_yahoo.requests_for("/v8/finance/spark")) == 1
+    assert fake_yahoo.requests_for("/v8/finance/chart") == []
@@ -0,0 +1,109 @@
+"""
+Tests for the async session path - run_db bridging and the async read endpoints
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from unittest.mock import patch
+
+from sqlalchemy.exc import MissingGreenlet
+
+from app.crud import portfolios as crud_portfolios
+from app.db import run_db
+from app.models import Portfolio
+from tests.factories import UserFactory, PortfolioFactory, AssetFactory, TransactionFactory
+
+
+@pytest.mark.unit
+class TestRunDb:
+    """Test sync ORM code runs inline on sync sessions and over the driver on async ones"""
+
+    @pytest.mark.asyncio
+    async def test_sync_session_runs_inline(self, test_db):
+        """Test a plain session is used directly, as Celery and the scheduler do"""
+        user = UserFactory.create()
+        PortfolioFactory.create(user_id=user.id)
+
+        portfolios = await run_db(test_db, crud_portfolios.get_portfolios_by_user, test_db, user.id)
+
+        assert len(portfolios) == 1
+
+    @pytest.mark.asyncio
+    async def test_async_session_goes_through_the_driver(self, test_db, async_test_db):
+        """Test sync crud works on an AsyncSession only through run_db"""
+        user = UserFactory.create()
+        PortfolioFactory.create(user_id=user.id, name="Async")
+
+        async with async_test_db() as session:
+            db = session.sync_session
+            portfolios = await run_db(db, crud_portfolios.get_portfolios_by_user, db, user.id)
+
+            assert [p.name for p in portfolios] == ["Async"]
+            with pytest.raises(MissingGreenlet):
+                db.query(Portfolio).all()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_session(self, test_db, async_test_db):
+        """Test tasks of one request can use the same session concurrently"""
+        user = UserFactory.create()
+        portfolio = PortfolioFactory.create(user_id=user.id)
+
+        async with async_test_db() as session:
+            db = session.sync_session
+            results = await asyncio.gather(*(
+                run_db(db, crud_portfolios.get_portfolio, db, portfolio.id) for _ in range(10)
+            ))
+
+        assert {p.id for p in results} == {portfolio.id}
+
+
+@pytest.mark.api
+class TestAsyncReadEndpoints:
+    """Test the hot read endpoints end to end on the async session"""
+
+    @pytest.fixture
+    def holding(self, test_db, test_user, fake_yahoo):
+        portfolio = PortfolioFactory.create(user_id=test_user.id, base_currency="USD")
+        asset = AssetFactory.create(symbol="AAPL", currency="USD")
+        TransactionFactory.create(
+            portfolio_id=portfolio.id,
+            asset_id=asset.id,
+            tx_date=date(2024, 1, 2),
+            quantity=Decimal("10"),
+            price=Decimal("100"),
+            fees=Decimal("0"),
+            currency="USD",
+        )
+        fake_yahoo.set_quote("AAPL", 150.0, previous_close=148.0)
+        # Saving the fetched price queues an ATH update; there is no broker here
+        with patch("app.tasks.ath_tasks.update_asset_ath.delay"):
+            yield portfolio
+
+    def test_positions(self, client, auth_headers, holding):
+        """Test positions are computed and priced over the async session"""
+        response = client.get(f"/portfolios/{holding.id}/positions", headers=auth_headers)
+
+        assert response.status_code == 200
+        [position] = response.json()
+        assert position["symbol"] == "AAPL"
+        assert Decimal(str(position["quantity"])) == Decimal("10")
+        assert Decimal(str(position["current_price"])) == Decimal("150")
+
+    def test_metrics_and_history(self, client, auth_headers, holding):
+        """Test metrics and history resolve without touching the sync session"""
+        metrics = client.get(f"/portfolios/{holding.id}/metrics", headers=auth_headers)
+        history = client.get(f"/portfolios/{holding.id}/history?period=1M", headers=auth_headers)
+
+        assert metrics.status_code == 200
+        assert Decimal(str(metrics.json()["total_value"])) == Decimal("1500")
+        assert history.status_code == 200
+        assert isinstance(history.json(), list)
+
+    def test_other_users_portfolio_is_rejected(self, client, auth_headers):
+        """Test access checks still apply on the async dependency"""
+        other = PortfolioFactory.create(user_id=UserFactory.create().id)
+
+        response = client.get(f"/portfolios/{other.id}/positions", headers=auth_headers)
+
+        assert response.status_code == 403
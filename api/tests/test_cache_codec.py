@@ -0,0 +1,111 @@
+"""
+Tests for the cache codec - exact round trips, model reconstruction, compression and rollouts
+"""
+import json
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+from app.schemas import Position
+from app.services import cache_codec
+from app.services.cache import CacheService, cache_positions, get_cached_positions, local_cache
+
+
+def _position(i: int) -> Position:
+    return Position(
+        asset_id=i, symbol=f"SYM{i}", name=f"Asset {i}", quantity=Decimal("12.345678"),
+        avg_cost=Decimal("101.10"), current_price=Decimal("0.1"), market_value=Decimal("1.2345678"),
+        cost_basis=Decimal("1248.11"), unrealized_pnl=Decimal("-1246.8754322"), unrealized_pnl_pct=None,
+        daily_change_pct=Decimal("0.30"), currency="USD", last_updated=datetime(2024, 5, 6, 7, 8, 9, 123456),
+    )
+
+
+@pytest.mark.unit
+class TestCodec:
+    """Test encode/decode on their own"""
+
+    def test_decimals_and_dates_round_trip_exactly(self):
+        """Test values the JSON encoding turned into floats and strings come back unchanged"""
+        value = {"price": Decimal("0.1"), "zero": Decimal("0E-8"), "at": datetime(2024, 1, 2, 3, 4, 5, 6),
+                 "day": date(2024, 1, 2), "ids": [1, 2], "none": None}
+
+        decoded = cache_codec.decode(cache_codec.encode(value))
+
+        assert decoded == value
+        assert str(decoded["zero"]) == "0E-8"
+        assert type(decoded["day"]) is date
+
+    def test_models_are_rebuilt_without_validation(self):
+        """Test a cached model comes back as the same model, through model_construct"""
+        positions = [_position(1), _position(2)]
+        data = cache_codec.encode(positions)
+
+        with patch.object(Position, "__init__", side_effect=AssertionError("validated again")):
+            decoded = cache_codec.decode(data)
+
+        assert decoded == positions
+        assert all(type(position) is Position for position in decoded)
+        assert decoded[0].model_fields_set == positions[0].model_fields_set
+
+    def test_only_schema_models_are_rebuilt(self):
+        """Test a model name outside app.schemas reads as an unreadable entry"""
+        data = cache_codec.encode(_position(1)).replace(b"Position", b"Settings")
+
+        with pytest.raises(cache_codec.UnreadableEntry):
+            cache_codec.decode(data)
+
+    def test_large_entries_are_compressed(self):
+        """Test entries above the threshold are compressed and small ones left alone"""
+        large = cache_codec.encode([_position(i) for i in range(50)])
+        small = cache_codec.encode({"price": Decimal("1")})
+
+        assert large[3] != cache_codec.COMPRESSION_NONE
+        assert small[3] == cache_codec.COMPRESSION_NONE
+        assert len(cache_codec.decode(large)) == 50
+
+    def test_other_schema_version_is_unreadable(self):
+        """Test an entry written under another schema version is not decoded"""
+        data = bytearray(cache_codec.encode({"price": 1}))
+        data[1] = cache_codec.CACHE_SCHEMA_VERSION + 1
+
+        with pytest.raises(cache_codec.UnreadableEntry):
+            cache_codec.decode(bytes(data))
+
+    def test_json_codec_writes_legacy_entries(self):
+        """Test CACHE_CODEC=json writes what workers without the codec read"""
+        with patch("app.services.cache_codec.settings.CACHE_CODEC", "json"):
+            data = cache_codec.encode({"price": Decimal("1.5"), "position": _position(1)})
+
+        decoded = json.loads(data)
+        assert decoded["price"] == 1.5
+        assert decoded["position"]["symbol"] == "SYM1"
+        assert cache_codec.decode(data) == decoded
+
+
+@pytest.mark.unit
+class TestCodecThroughCache:
+    """Test CacheService reads and writes through the codec"""
+
+    def test_positions_round_trip_through_redis(self, fake_redis):
+        """Test cached positions come back from Redis as equal Position models"""
+        positions = [_position(i) for i in range(3)]
+        cache_positions(7, positions)
+        local_cache.clear()
+
+        assert get_cached_positions(7) == positions
+
+    def test_legacy_json_entries_are_read(self, fake_redis):
+        """Test entries written by the JSON serializer still read after an upgrade"""
+        fake_redis.set("price:AAPL", json.dumps({"symbol": "AAPL", "price": 1.5}))
+
+        assert CacheService.get("price:AAPL") == {"symbol": "AAPL", "price": 1.5}
+
+    def test_unreadable_entry_is_a_miss(self, fake_redis):
+        """Test an entry of a newer schema version reads as a miss during a rollout"""
+        CacheService.set("price:AAPL", {"price": 1.5}, ttl=60)
+        local_cache.clear()
+
+        with patch("app.services.cache_codec.CACHE_SCHEMA_VERSION", cache_codec.CACHE_SCHEMA_VERSION + 1):
+            assert CacheService.get("price:AAPL", "miss") == "miss"
+            assert CacheService.mget(["price:AAPL"]) == [None]
@@ -0,0 +1,166 @@
+"""
+Tests for stale-while-revalidate cache entries and their background refresh
+"""
+import time
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from app.schemas import PriceQuote
+from app.services import cache as cache_module
+from app.services.cache import CacheService, cache_price, cache_prices, local_cache, stale_reads_disallowed
+from app.services.cache_refresh import claim_refresh, wait_for_refreshes
+from tests.factories import PortfolioFactory, AssetFactory, TransactionFactory
+from tests.utils import CalculationCounters
+
+
+def _make_stale(key: str) -> None:
+    """Move an SWR entry past its fresh period, keeping its value"""
+    envelope = CacheService.get(key)
+    envelope[cache_module._SWR_FRESH_UNTIL] = time.time() - 1
+    CacheService.set(key, envelope, ttl=600)
+    local_cache.clear()
+
+
+@pytest.mark.unit
+class TestSwrEntries:
+    """Test soft and hard expiry of SWR entries"""
+
+    def test_fresh_then_stale(self, fake_redis):
+        """Test an entry reads fresh, then stale past its TTL, until its hard expiry"""
+        CacheService.set_swr("insights:1:1y:SPY", {"total": 1}, ttl=300, stale_ttl=1800)
+
+        assert CacheService.get_swr("insights:1:1y:SPY") == ({"total": 1}, False)
+        assert 2000 < fake_redis.ttl("insights:1:1y:SPY") <= 2100
+
+        _make_stale("insights:1:1y:SPY")
+        assert CacheService.get_swr("insights:1:1y:SPY") == ({"total": 1}, True)
+
+    def test_refresh_never_reads_stale_entries(self, fake_redis):
+        """Test stale entries are misses inside a refresh"""
+        CacheService.set_swr("positions:1", [1], ttl=300, stale_ttl=300)
+        _make_stale("positions:1")
+
+        with stale_reads_disallowed():
+            assert CacheService.get_swr("positions:1") == (None, False)
+
+    def test_plain_entries_read_fresh(self, fake_redis):
+        """Test entries written by set() have no soft expiry"""
+        CacheService.set("positions:1", [1], ttl=300)
+
+        assert CacheService.get_swr("positions:1") == ([1], False)
+
+    def test_one_refresh_claim_per_window(self, fake_redis):
+        """Test only the first caller claims an entry's refresh"""
+        assert claim_refresh("positions:1") is True
+        assert claim_refresh("positions:1") is False
+        assert claim_refresh("positions:2") is True
+        assert 0 < fake_redis.ttl("swr_lock:positions:1") <= 60
+
+    def test_one_refresh_claim_without_redis(self):
+        """Test claims are kept in process when Redis is unavailable"""
+        assert claim_refresh("positions:3") is True
+        assert claim_refresh("positions:3") is False
+
+
+@pytest.mark.unit
+class TestStalePrices:
+    """Test stale quotes are served and refreshed in one batch"""
+
+    @pytest.mark.asyncio
+    async def test_stale_quotes_refreshed_together(self, fake_redis):
+        """Test a batch read serves stale quotes and schedules one refresh for all of them"""
+        from app.services.pricing import PricingService
+
+        for symbol in ("AAPL", "MSFT"):
+            cache_price(symbol, PriceQuote(symbol=symbol, price=Decimal("1.5"), asof=datetime(2024, 6, 3), currency="USD"))
+            _make_stale(f"price:{symbol}")
+
+        with patch("app.services.pricing.schedule_refresh") as schedule:
+            quotes = await PricingService(MagicMock()).get_multiple_prices(["AAPL", "MSFT"])
+            again = await PricingService(MagicMock()).get_multiple_prices(["AAPL", "MSFT"])
+
+        assert quotes["AAPL"].price == Decimal("1.5") and set(again) == {"AAPL", "MSFT"}
+        schedule.assert_called_once()
+        assert schedule.call_args.args[1] == "2 stale prices"
+
+    @pytest.mark.asyncio
+    async def test_cached_quotes_read_with_one_mget(self, fake_redis):
+        """Test a batch of cached symbols costs one MGET round trip and no per-symbol GET"""
+        from app.services.pricing import PricingService
+
+        cache_prices({
+            symbol: PriceQuote(symbol=symbol, price=Decimal("1.5"), asof=datetime(2024, 6, 3), currency="USD")
+            for symbol in ("AAPL", "MSFT", "NVDA")
+        })
+        local_cache.clear()
+        redis_client = cache_module.get_redis_binary()
+
+        with patch.object(redis_client, "pipeline", wraps=redis_client.pipeline) as pipeline, \
+                patch.object(redis_client, "get", wraps=redis_client.get) as get:
+            quotes = await PricingService(MagicMock()).get_multiple_prices(["AAPL", "MSFT", "NVDA", "AAPL"])
+
+        assert set(quotes) == {"AAPL", "MSFT", "NVDA"}
+        pipeline.assert_called_once()  # MGET plus the PTTLs of the local tier
+        get.assert_not_called()
+
+    def test_quotes_written_in_one_pipeline_with_their_ttls(self, fake_redis):
+        """Test set_many() keeps each entry's TTL and tags, in one pipeline"""
+        redis_client = cache_module.get_redis_binary()
+
+        with patch.object(redis_client, "pipeline", wraps=redis_client.pipeline) as pipeline:
+            CacheService.set_many([
+                ("price:AAPL", 1, 60, ["symbol:AAPL"]),
+                ("positions:1", 2, 600, ["portfolio:1"]),
+            ])
+
+        pipeline.assert_called_once()
+        assert 50 < fake_redis.ttl("price:AAPL") <= 60
+        assert 590 < fake_redis.ttl("positions:1") <= 600
+        assert CacheService.invalidate_tags("portfolio:1") == 1
+        assert CacheService.get("price:AAPL") == 1
+
+
+@pytest.fixture
+def held_portfolio(test_db, test_user):
+    """Verified user holding two assets"""
+    test_user.is_verified = True
+    test_db.commit()
+    portfolio = PortfolioFactory.create(user_id=test_user.id, base_currency="USD")
+    for symbol in ("AAA", "BBB"):
+        asset = AssetFactory.create(symbol=symbol)
+        TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+    return portfolio
+
+
+@pytest.mark.api
+class TestStalePositions:
+    """Test GET /portfolios/{id}/positions serves stale positions while they are refreshed"""
+
+    def test_stale_positions_served_and_refreshed_once(
+        self, client, auth_headers, test_db, held_portfolio, fake_redis
+    ):
+        """Test stale reads return at once, one background refresh runs, then reads are fresh"""
+        @contextmanager
+        def db_context():
+            yield test_db
+
+        url = f"/portfolios/{held_portfolio.id}/positions"
+        with CalculationCounters() as counters, patch("app.services.metrics.get_db_context", db_context):
+            first = client.get(url, headers=auth_headers)
+            _make_stale(f"positions:{held_portfolio.id}")
+            counters.positions.reset_mock()
+
+            stale = [client.get(url, headers=auth_headers) for _ in range(2)]
+            assert wait_for_refreshes(timeout=10)
+            refreshed = client.get(url, headers=auth_headers)
+
+        assert first.headers["X-Cache-Freshness"] == "fresh"
+        assert stale[0].headers["X-Cache-Freshness"] == "stale"
+        assert all(response.json() == first.json() for response in stale)
+        assert counters.positions.call_count == 2  # one refresh, one call per asset
+        assert refreshed.headers["X-Cache-Freshness"] == "fresh"
+        assert CacheService.get_swr(f"positions:{held_portfolio.id}")[1] is False
+        assert 5000 < fake_redis.ttl(f"positions:{held_portfolio.id}") <= 5400
@@ -0,0 +1,109 @@
+"""
+Tests for tag-indexed cache invalidation and index-backed cache statistics
+"""
+import pytest
+from unittest.mock import patch
+
+from app.services.cache import (
+    CacheService,
+    cache_positions,
+    cache_price,
+    dashboard_widget_key,
+    dashboard_widget_tags,
+    invalidate_dashboard_widgets,
+    portfolio_tag,
+    user_tag,
+)
+
+
+@pytest.fixture
+def no_keys_command(fake_redis):
+    """Fail the test if anything runs the blocking KEYS command"""
+    with patch.object(fake_redis, "keys", side_effect=AssertionError("KEYS must not be used")):
+        yield fake_redis
+
+
+@pytest.mark.unit
+class TestTagInvalidation:
+    """Test invalidation deletes exactly the keys registered under a tag"""
+
+    def test_invalidate_portfolio_deletes_only_its_entries(self, no_keys_command):
+        """Test every portfolio-tagged entry goes, other portfolios and prices stay"""
+        redis = no_keys_command
+        cache_positions(1, [{"asset_id": 1}])
+        cache_positions(2, [{"asset_id": 2}])
+        cache_price("AAPL", {"price": 1.0})
+        CacheService.set("insights:1:1y:SPY", {"x": 1}, 300, tags=[portfolio_tag(1)])
+        CacheService.mset({"analytics:risk_1_abc": 1, "analytics:bench_1_abc": 2}, ttl=600, tags=[portfolio_tag(1)])
+
+        deleted = CacheService.invalidate_portfolio(1)
+
+        assert deleted == 4
+        assert not redis.exists("positions:1", "insights:1:1y:SPY", "analytics:risk_1_abc")
+        assert redis.exists("positions:2", "price:AAPL") == 2
+        assert not redis.exists(f"{CacheService.PREFIX_TAG}{portfolio_tag(1)}")
+
+    def test_already_expired_members_are_not_counted(self, fake_redis):
+        """Test keys gone by TTL are skipped without error"""
+        CacheService.set("positions:5", [], 60, tags=[portfolio_tag(5)])
+        fake_redis.delete("positions:5")
+
+        assert CacheService.invalidate_portfolio(5) == 0
+
+    def test_tag_set_lives_as_long_as_its_longest_member(self, fake_redis):
+        """Test the tag set TTL is raised to the longest member, never lowered"""
+        tag_key = f"{CacheService.PREFIX_TAG}{user_tag(3, 'assets')}"
+        CacheService.set("assets_held:3:all", "[]", 3600, tags=[user_tag(3, "assets")])
+        CacheService.set("assets_sold:3:all", "[]", 60, tags=[user_tag(3, "assets")])
+
+        assert 3500 < fake_redis.ttl(tag_key) <= 3600
+        assert CacheService.invalidate_tags(user_tag(3, "assets")) == 2
+
+    def test_dashboard_widgets_by_owner_and_widget(self, fake_redis):
+        """Test a user widget can be dropped alone and portfolio widgets go with the portfolio"""
+        for owner, widget in (("u3", "watchlist"), ("u3", "notifications"), ("p7", "metrics")):
+            CacheService.set(dashboard_widget_key(owner, widget), {}, 300, tags=dashboard_widget_tags(owner, widget))
+
+        assert invalidate_dashboard_widgets("u3", "watchlist") == 1
+        assert fake_redis.exists(dashboard_widget_key("u3", "notifications"))
+        assert CacheService.invalidate_portfolio(7) == 1
+        assert not fake_redis.exists(dashboard_widget_key("p7", "metrics"))
+
+
+@pytest.mark.unit
+class TestCacheStats:
+    """Test key counts come from the write-maintained indexes"""
+
+    def test_counts_from_index(self, no_keys_command):
+        """Test counts follow writes and deletes without scanning"""
+        cache_price("AAPL", {"price": 1.0})
+        cache_price("MSFT", {"price": 2.0})
+        cache_positions(1, [])
+        CacheService.delete("price:MSFT")
+
+        with patch.object(no_keys_command, "scan_iter", side_effect=AssertionError("no scan expected")):
+            stats = CacheService.get_stats()
+
+        assert stats["keys_by_prefix_source"] == "index"
+        assert stats["keys_by_prefix"]["price"] == 1
+        assert stats["keys_by_prefix"]["positions"] == 1
+
+    def test_expired_entries_leave_the_count(self, fake_redis):
+        """Test index members past their expiry are pruned before counting"""
+        cache_price("AAPL", {"price": 1.0})
+        with patch("app.services.cache.time.time", return_value=4_000_000_000):
+            cache_price("MSFT", {"price": 2.0})
+            stats = CacheService.get_stats()
+
+        assert stats["keys_by_prefix"]["price"] == 1
+
+    def test_scan_fallback_for_legacy_keys(self, no_keys_command):
+        """Test keys written before the index existed are counted with SCAN"""
+        no_keys_command.set("price:OLD", "{}")
+        no_keys_command.set("positions:9", "[]")
+
+        stats = CacheService.get_stats()
+
+        assert stats["keys_by_prefix_source"] == "scan"
+        assert stats["keys_by_prefix"]["price"] == 1
+        assert stats["keys_by_prefix"]["positions"] == 1
@@ -0,0 +1,131 @@
+"""
+Tests for the in-process cache tier in front of Redis and its pub/sub invalidation
+"""
+import json
+import time
+import pytest
+from unittest.mock import patch
+
+from app.services.cache import (
+    INVALIDATION_CHANNEL,
+    CacheService,
+    LocalCache,
+    cache_positions,
+    get_cached_positions,
+    local_cache,
+    portfolio_tag,
+)
+
+
+def _wait_until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.mark.unit
+class TestLocalCache:
+    """Test the bounded LRU itself"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry goes when the bound is reached"""
+        cache = LocalCache(max_entries=2, max_ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") == (False, None)
+        assert cache.get("a") == (True, 1)
+        assert len(cache) == 2
+
+    def test_ttl_is_capped(self):
+        """Test an entry never outlives max_ttl, whatever its own TTL"""
+        cache = LocalCache(max_entries=10, max_ttl=5)
+        cache.set("a", 1, ttl=3600)
+
+        with patch("app.services.cache.time.monotonic", return_value=time.monotonic() + 6):
+            assert cache.get("a") == (False, None)
+
+    def test_tags_without_redis(self):
+        """Test tag invalidation reaches local entries when Redis is unavailable"""
+        cache_positions(1, [{"asset_id": 1}])
+        cache_positions(2, [{"asset_id": 2}])
+
+        CacheService.invalidate_tags(portfolio_tag(1))
+
+        assert get_cached_positions(1) is None
+        assert get_cached_positions(2) == [{"asset_id": 2}]
+
+    def test_reads_are_private_copies(self):
+        """Test a caller mutating what it read does not change the cached entry"""
+        cache_positions(1, [{"asset_id": 1}])
+
+        get_cached_positions(1)[0]["annotated"] = True
+
+        assert get_cached_positions(1) == [{"asset_id": 1}]
+
+
+@pytest.mark.unit
+class TestTwoTierCache:
+    """Test reads are served locally and kept coherent across processes"""
+
+    def test_hot_key_skips_redis(self, fake_redis):
+        """Test a second read is answered by the local tier"""
+        CacheService.set("price:AAPL", {"price": 1.5}, ttl=60)
+        local_cache.clear()
+
+        assert CacheService.get("price:AAPL") == {"price": 1.5}
+        with patch("app.services.cache.get_redis_binary", side_effect=AssertionError("Redis was queried")):
+            assert CacheService.get("price:AAPL") == {"price": 1.5}
+            assert CacheService.mget(["price:AAPL"]) == [{"price": 1.5}]
+
+        tiers = CacheService.get_tier_stats()
+        assert tiers["redis"]["by_prefix"]["price"] == {"hits": 1, "misses": 0}
+        assert tiers["local"]["by_prefix"]["price"]["hits"] == 2
+
+    def test_redis_hits_keep_their_tags_locally(self, fake_redis):
+        """Test an entry filled from Redis is still evicted by its tag when Redis goes away"""
+        CacheService.set("positions:1", [{"asset_id": 1}], ttl=60, tags=[portfolio_tag(1)])
+        CacheService.mset({"positions:2": [{"asset_id": 2}]}, ttl=60, tags=[portfolio_tag(2)])
+        local_cache.clear()
+        assert CacheService.get("positions:1") == [{"asset_id": 1}]
+        assert CacheService.mget(["positions:2"]) == [[{"asset_id": 2}]]
+
+        with patch("app.services.cache.get_redis_binary", return_value=None):
+            CacheService.invalidate_tags(portfolio_tag(1), portfolio_tag(2))
+
+            assert local_cache.get("positions:1") == (False, None)
+            assert local_cache.get("positions:2") == (False, None)
+
+    def test_write_in_another_process_drops_local_copy(self, fake_redis):
+        """Test a published invalidation from another process evicts the entry"""
+        fake_redis.set("price:AAPL", json.dumps({"price": 1.5}))
+        assert CacheService.get("price:AAPL") == {"price": 1.5}
+
+        fake_redis.set("price:AAPL", json.dumps({"price": 2.0}))
+        fake_redis.publish(INVALIDATION_CHANNEL, json.dumps({"origin": "other", "keys": ["price:AAPL"]}))
+
+        assert _wait_until(lambda: local_cache.get("price:AAPL") == (False, None))
+        assert CacheService.get("price:AAPL") == {"price": 2.0}
+
+    def test_writes_are_published(self, fake_redis):
+        """Test set, mset and deletes announce the keys they change"""
+        pubsub = fake_redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(INVALIDATION_CHANNEL)
+
+        CacheService.set("price:AAPL", {"price": 1.5}, ttl=60)
+        CacheService.mset({"price:MSFT": {}, "price:GOOG": {}}, ttl=60)
+        CacheService.delete("price:AAPL")
+
+        published = []
+        deadline = time.monotonic() + 1.0
+        while len(published) < 3 and time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=0.1)
+            if message is not None:
+                published.append(sorted(json.loads(message["data"])["keys"]))
+        pubsub.close()
+        assert published == [["price:AAPL"], ["price:GOOG", "price:MSFT"], ["price:AAPL"]]
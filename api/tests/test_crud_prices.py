@@ -0,0 +1,255 @@
+"""
+Tests for price CRUD operations - daily close materialization and batched loading
+"""
+import pytest
+from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from app.crud import prices as crud_prices
+from app.models import DailyClose
+from app.schemas import PriceCreate
+from tests.factories import AssetFactory, PriceFactory
+
+
+@pytest.mark.unit
+@pytest.mark.crud
+class TestGetDailyCloses:
+    """Test get_daily_closes() per-day selection and batching"""
+    
+    def test_prefers_official_close_then_latest(self, test_db):
+        """Test yfinance_history wins over later intraday prices; otherwise the latest wins"""
+        asset = AssetFactory.create()
+        day1 = datetime(2024, 3, 4)
+        day2 = datetime(2024, 3, 5)
+        PriceFactory.create(asset_id=asset.id, asof=day1 + timedelta(hours=21), price=Decimal("10"), source="yfinance_history")
+        PriceFactory.create(asset_id=asset.id, asof=day1 + timedelta(hours=22), price=Decimal("11"), source="yfinance")
+        PriceFactory.create(asset_id=asset.id, asof=day2 + timedelta(hours=15), price=Decimal("12"), source="yfinance")
+        PriceFactory.create(asset_id=asset.id, asof=day2 + timedelta(hours=18), price=Decimal("13"), source="yfinance")
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+        
+        closes = crud_prices.get_daily_closes(test_db, [asset.id])[asset.id]
+        
+        assert [(c.asof.date(), c.price, c.source) for c in closes] == [
+            (day1.date(), Decimal("10"), "yfinance_history"),
+            (day2.date(), Decimal("13"), "yfinance"),
+        ]
+    
+    def test_many_assets_single_query(self, test_db):
+        """Test all assets are loaded with one SELECT and missing assets get empty lists"""
+        assets = [AssetFactory.create() for _ in range(5)]
+        for asset in assets:
+            for offset in range(3):
+                PriceFactory.create(asset_id=asset.id, asof=datetime(2024, 1, 1 + offset, 21))
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+        
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engine = test_db.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            closes = crud_prices.get_daily_closes(test_db, [a.id for a in assets] + [9999])
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        
+        assert len(statements) == 1
+        assert all(len(closes[a.id]) == 3 for a in assets)
+        assert closes[9999] == []
+    
+    def test_date_bounds_are_inclusive(self, test_db):
+        """Test date_from/date_to filter on asof"""
+        asset = AssetFactory.create()
+        for day in range(1, 6):
+            PriceFactory.create(asset_id=asset.id, asof=datetime(2024, 1, day, 12))
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+        
+        closes = crud_prices.get_daily_closes(
+            test_db, [asset.id],
+            date_from=datetime(2024, 1, 2, 12),
+            date_to=datetime(2024, 1, 4, 12)
+        )[asset.id]
+        
+        assert [c.asof.day for c in closes] == [2, 3, 4]
+    
+    def test_empty_asset_list(self, test_db):
+        """Test no asset ids returns an empty dict without querying"""
+        assert crud_prices.get_daily_closes(test_db, []) == {}
+
+
+def _write(db, asset_id, asof, price, source):
+    return crud_prices.create_price(db, PriceCreate(
+        asset_id=asset_id, asof=asof, price=Decimal(price), volume=None, source=source
+    ))
+
+
+@pytest.mark.unit
+@pytest.mark.crud
+class TestDailyCloseMaintenance:
+    """Test daily_closes is kept in sync on price writes"""
+    
+    def test_create_price_maintains_daily_close(self, test_db):
+        """Test later intraday quotes replace earlier ones but never the official close"""
+        asset = AssetFactory.create()
+        day = datetime(2024, 6, 3)
+        
+        _write(test_db, asset.id, day + timedelta(hours=14), "100", "yfinance")
+        _write(test_db, asset.id, day + timedelta(hours=15), "101", "yfinance")
+        row = test_db.get(DailyClose, (asset.id, day.date()))
+        assert (row.close, row.source) == (Decimal("101"), "yfinance")
+        
+        _write(test_db, asset.id, day + timedelta(hours=20), "102", "yfinance_history")
+        _write(test_db, asset.id, day + timedelta(hours=22), "103", "yfinance")
+        test_db.expire_all()
+        row = test_db.get(DailyClose, (asset.id, day.date()))
+        assert (row.close, row.source) == (Decimal("102"), "yfinance_history")
+        
+        # An out-of-order older quote doesn't win either
+        _write(test_db, asset.id, day + timedelta(hours=10), "90", "yfinance")
+        test_db.expire_all()
+        assert test_db.query(DailyClose).count() == 1
+        assert test_db.get(DailyClose, (asset.id, day.date())).close == Decimal("102")
+    
+    def test_incremental_matches_rebuild(self, test_db):
+        """Test incremental maintenance and a full rebuild agree"""
+        asset = AssetFactory.create()
+        writes = [
+            (datetime(2024, 6, 3, 15), "10", "yfinance"),
+            (datetime(2024, 6, 3, 21), "11", "yfinance_history"),
+            (datetime(2024, 6, 4, 9), "12", "yfinance_prev_close"),
+            (datetime(2024, 6, 4, 16), "13", "yfinance"),
+            (datetime(2024, 6, 5, 16), "14", "yfinance"),
+        ]
+        for asof, price, source in writes:
+            _write(test_db, asset.id, asof, price, source)
+        
+        incremental = [(c.asof, c.price, c.source) for c in crud_prices.get_daily_closes(test_db, [asset.id])[asset.id]]
+        
+        test_db.query(DailyClose).delete()
+        test_db.commit()
+        assert crud_prices.rebuild_daily_closes(test_db) == 3
+        rebuilt = [(c.asof, c.price, c.source) for c in crud_prices.get_daily_closes(test_db, [asset.id])[asset.id]]
+        
+        assert incremental == rebuilt
+        assert [p for _, p, _ in rebuilt] == [Decimal("11"), Decimal("13"), Decimal("14")]
+
+
+@pytest.mark.unit
+@pytest.mark.crud
+class TestBulkUpsertPrices:
+    """Test set-based bulk price upserts"""
+    
+    def test_counts_inserted_and_updated(self, test_db):
+        """Test new keys are inserted, existing keys updated in place"""
+        asset = AssetFactory.create()
+        _write(test_db, asset.id, datetime(2024, 1, 1), "1", "yfinance_history")
+        
+        rows = [
+            {"asset_id": asset.id, "asof": datetime(2024, 1, d), "price": Decimal(d * 10), "volume": d, "source": "yfinance_history"}
+            for d in range(1, 6)
+        ]
+        counts = crud_prices.bulk_upsert_prices(test_db, rows, chunk_size=2)
+        
+        assert counts == {"inserted": 4, "updated": 1}
+        prices = crud_prices.get_prices(test_db, asset.id)
+        assert len(prices) == 5
+        assert prices[-1].price == Decimal("10")
+    
+    def test_duplicate_keys_last_wins(self, test_db):
+        """Test duplicate (asset_id, asof) keys in one batch collapse to the last row"""
+        asset = AssetFactory.create()
+        asof = datetime(2024, 1, 2)
+        counts = crud_prices.bulk_upsert_prices(test_db, [
+            {"asset_id": asset.id, "asof": asof, "price": Decimal("1"), "source": "yfinance"},
+            {"asset_id": asset.id, "asof": asof, "price": Decimal("2"), "source": "yfinance"},
+        ])
+        
+        assert counts == {"inserted": 1, "updated": 0}
+        assert crud_prices.get_latest_price(test_db, asset.id).price == Decimal("2")
+    
+    def test_maintains_daily_closes(self, test_db):
+        """Test bulk writes are folded into daily_closes"""
+        asset = AssetFactory.create()
+        _write(test_db, asset.id, datetime(2024, 1, 1, 15), "9", "yfinance")
+        
+        crud_prices.bulk_upsert_prices(test_db, [
+            {"asset_id": asset.id, "asof": datetime(2024, 1, d), "price": Decimal(d), "source": "yfinance_history"}
+            for d in range(1, 4)
+        ])
+        
+        closes = crud_prices.get_daily_closes(test_db, [asset.id])[asset.id]
+        assert [(c.price, c.source) for c in closes] == [
+            (Decimal("1"), "yfinance_history"),
+            (Decimal("2"), "yfinance_history"),
+            (Decimal("3"), "yfinance_history"),
+        ]
+    
+    def test_bulk_create_prices_returns_rows_written(self, test_db):
+        """Test the PriceCreate wrapper"""
+        asset = AssetFactory.create()
+        prices = [
+            PriceCreate(asset_id=asset.id, asof=datetime(2024, 1, d), price=Decimal("5"), volume=None, source="yfinance")
+            for d in range(1, 4)
+        ]
+        assert crud_prices.bulk_create_prices(test_db, prices) == 3
+        assert crud_prices.bulk_create_prices(test_db, prices) == 3
+        assert len(crud_prices.get_prices(test_db, asset.id)) == 3
+
+
+@pytest.mark.unit
+@pytest.mark.crud
+class TestBatchedPriceReads:
+    """Test get_latest_prices()/get_recent_prices() load many assets in one query"""
+    
+    def test_latest_price_of_each_asset(self, test_db):
+        """Test each asset gets its newest price and assets without prices are absent"""
+        assets = [AssetFactory.create() for _ in range(3)]
+        for i, asset in enumerate(assets[:2]):
+            for day in range(1, 4):
+                _write(test_db, asset.id, datetime(2024, 1, day), f"{10 * i + day}", "yfinance")
+        
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engine = test_db.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            latest = crud_prices.get_latest_prices(test_db, [a.id for a in assets])
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        
+        assert len(statements) == 1
+        assert {asset_id: price.price for asset_id, price in latest.items()} == {
+            assets[0].id: Decimal("3"),
+            assets[1].id: Decimal("13"),
+        }
+    
+    def test_recent_prices_newest_first_per_asset_limit(self, test_db):
+        """Test the window and limit apply to each asset separately, like get_prices()"""
+        first, second = AssetFactory.create(), AssetFactory.create()
+        for day in range(1, 6):
+            _write(test_db, first.id, datetime(2024, 1, day), "1", "yfinance")
+            _write(test_db, second.id, datetime(2024, 1, day), "2", "yfinance")
+        
+        recent = crud_prices.get_recent_prices(
+            test_db, [first.id, second.id], date_from=datetime(2024, 1, 2), date_to=datetime(2024, 1, 5), limit=2
+        )
+        
+        for asset in (first, second):
+            expected = [p.asof for p in crud_prices.get_prices(
+                test_db, asset.id, date_from=datetime(2024, 1, 2), date_to=datetime(2024, 1, 5), limit=2
+            )]
+            assert [p.asof.day for p in recent[asset.id]] == [5, 4]
+            assert [p.asof for p in recent[asset.id]] == expected
+    
+    def test_no_assets(self, test_db):
+        """Test no asset ids returns an empty dict without querying"""
+        assert crud_prices.get_latest_prices(test_db, []) == {}
+        assert crud_prices.get_recent_prices(test_db, [], date_from=datetime(2024, 1, 1)) == {}
@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 import pandas as pd
 
-from app.services.currency import CurrencyService
+from app.services.currency import CurrencyService, FxMatrix
 
 
 @pytest.mark.unit
@@ -272,3 +272,84 @@ class TestCurrencyEdgeCases:
             )
             # 0.01 * 149.5 = 1.495
             assert abs(result - Decimal("1.495")) < Decimal("0.001")
+
+
+def _fx_quotes(fake_yahoo, rates):
+    """Serve forex quotes from the fake Yahoo server and return its spark request log"""
+    for symbol, rate in rates.items():
+        fake_yahoo.set_quote(symbol, rate, previous_close=rate * 0.99)
+    return lambda: [params["symbols"].split(",") for params in fake_yahoo.requests_for("/v8/finance/spark")]
+
+
+@pytest.fixture
+def shared_fx_cache():
+    """Dict standing in for Redis behind CacheService.mget / mset"""
+    store = {}
+    with patch('app.services.currency.CacheService.mget', side_effect=lambda keys: [store.get(k) for k in keys]), \
+            patch('app.services.currency.CacheService.mset', side_effect=lambda mapping, ttl=None: store.update(mapping)):
+        yield store
+
+
+@pytest.mark.unit
+@pytest.mark.service
+class TestRateMatrix:
+    """Test pre-resolved FX rate matrices"""
+    
+    def test_missing_legs_fetched_in_one_batch(self, shared_fx_cache, fake_yahoo):
+        """Test every pair is triangulated from one batched request of USD legs"""
+        calls = _fx_quotes(fake_yahoo, {"USDEUR=X": 0.8, "USDGBP=X": 0.5, "USDJPY=X": 150.0})
+        
+        with patch('app.services.currency.yf.Ticker') as ticker:
+            fx = CurrencyService.get_rate_matrix([
+                ("EUR", "USD"), ("GBP", "EUR"), ("JPY", "EUR"), ("EUR", "USD"), ("USD", "USD"),
+            ])
+        
+        assert calls() == [["USDEUR=X", "USDGBP=X", "USDJPY=X"]]
+        ticker.assert_not_called()
+        assert fx.rate("EUR", "USD") == Decimal("1.25")
+        assert fx.rate("GBP", "EUR") == Decimal("1.6")
+        assert fx.convert(Decimal("1500"), "JPY", "EUR") == Decimal("8")
+        assert fx.rate("USD", "USD") == Decimal(1)
+        assert shared_fx_cache["fx:USD:EUR"] == "0.8"
+    
+    def test_legs_reused_from_shared_cache(self, shared_fx_cache, fake_yahoo):
+        """Test another worker's legs are read from Redis instead of Yahoo"""
+        shared_fx_cache.update({"fx:USD:EUR": "0.8", "fx:USD:CHF": "0.9"})
+        calls = _fx_quotes(fake_yahoo, {"USDGBP=X": 0.5})
+        
+        fx = CurrencyService.get_rate_matrix([("CHF", "EUR"), ("GBP", "CHF")])
+        again = CurrencyService.get_rate_matrix([("EUR", "GBP")])
+        
+        assert calls() == [["USDGBP=X"]]  # second matrix served from the in-process cache
+        assert fx.rate("CHF", "EUR") == Decimal("0.8") / Decimal("0.9")
+        assert fx.rate("GBP", "CHF") == Decimal("1.8")
+        assert again.rate("EUR", "GBP") == Decimal("0.625")
+    
+    def test_fallback_pivot_and_unresolved_pairs(self, shared_fx_cache, fake_yahoo):
+        """Test legs missing against USD go through EUR and unknown currencies stay None"""
+        calls = _fx_quotes(fake_yahoo, {"USDEUR=X": 0.8, "EURXYZ=X": 10.0})
+        
+        fx = CurrencyService.get_rate_matrix([("XYZ", "USD"), ("ABC", "USD"), ("EUR", "USD")])
+        
+        assert calls() == [["USDABC=X", "USDEUR=X", "USDXYZ=X"], ["EURABC=X", "EURXYZ=X"]]
+        assert fx.rate("XYZ", "USD") == Decimal("0.125")
+        assert fx.rate("ABC", "USD") is None
+        assert fx.convert(Decimal("10"), "ABC", "USD") is None
+        assert ("ABC", "USD") not in fx
+    
+    def test_matrix_is_immutable_and_converts_columns(self):
+        """Test the snapshot cannot be modified and converts whole columns"""
+        fx = FxMatrix({("EUR", "USD"): Decimal("1.1"), ("GBP", "USD"): Decimal("1.3")})
+        
+        with pytest.raises(AttributeError):
+            fx.resolved_at = datetime.utcnow()
+        with pytest.raises(TypeError):
+            fx.rates[("CHF", "USD")] = Decimal("1.2")
+        
+        assert fx.convert_many([Decimal("10"), Decimal("20")], "EUR", "USD") == [Decimal("11.0"), Decimal("22.0")]
+        assert fx.convert_many([Decimal("10")], "CHF", "USD") is None
+        assert fx.convert_column(
+            [Decimal("10"), Decimal("10"), Decimal("10"), Decimal("10")],
+            ["EUR", "GBP", "USD", "CHF"],
+            "USD",
+        ) == [Decimal("11.0"), Decimal("13.0"), Decimal("10"), None]
@@ -0,0 +1,216 @@
+"""
+Tests for the dashboard batch endpoint - per-widget caching shared with the Celery warmup
+and the streaming variant
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import pytest
+from contextlib import contextmanager
+from datetime import date
+from unittest.mock import patch
+
+from app.routers.batch import _widget_cache_key
+from app.services.cache import CacheService, invalidate_dashboard_widgets
+from tests.factories import PortfolioFactory, AssetFactory, TransactionFactory
+from tests.utils import CalculationCounters
+
+
+@pytest.fixture
+def widget_store(fake_redis):
+    """Names of the dashboard widget entries currently cached"""
+    class WidgetStore:
+        def __contains__(self, key):
+            return bool(fake_redis.exists(key))
+
+        def __iter__(self):
+            return fake_redis.scan_iter(match=f"{CacheService.PREFIX_DASHBOARD}*")
+
+    return WidgetStore()
+
+
+@pytest.fixture
+def dashboard_portfolio(test_db, test_user):
+    """Verified user holding two assets"""
+    test_user.is_verified = True
+    test_db.commit()
+    portfolio = PortfolioFactory.create(user_id=test_user.id, base_currency="USD")
+    for symbol in ("AAA", "BBB"):
+        asset = AssetFactory.create(symbol=symbol)
+        TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+    return portfolio
+
+
+def _stream(client, headers, portfolio_id, widgets, accept="application/x-ndjson"):
+    response = client.post(
+        "/batch/dashboard/stream",
+        json={"portfolio_id": portfolio_id, "visible_widgets": widgets},
+        headers={**headers, "Accept": accept},
+    )
+    assert response.status_code == 200
+    return response
+
+
+def _frames(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def _post(client, headers, portfolio_id, widgets):
+    response = client.post(
+        "/batch/dashboard",
+        json={"portfolio_id": portfolio_id, "visible_widgets": widgets},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.unit
+class TestWidgetCacheKeys:
+    """Test widget keys are content-addressed"""
+
+    def test_key_is_stable_across_processes(self):
+        """Test the key does not depend on the per-process str hash seed"""
+        code = "from app.routers.batch import _widget_cache_key; print(_widget_cache_key('performance_history', 7, 3))"
+        keys = set()
+        for seed in ("1", "2"):
+            env = {**os.environ, "PYTHONHASHSEED": seed}
+            result = subprocess.run(
+                [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True,
+                cwd=os.path.join(os.path.dirname(__file__), ".."),
+            )
+            keys.add(result.stdout.strip().splitlines()[-1])
+
+        assert keys == {_widget_cache_key('performance_history', 7, 3)}
+
+    def test_keys_are_scoped_by_owner(self):
+        """Test portfolio, user and market sections key on their own owner"""
+        assert _widget_cache_key('metrics', 7, 3).startswith("dashboard_widget:p7:metrics:")
+        assert _widget_cache_key('watchlist', 7, 3).startswith("dashboard_widget:u3:watchlist:")
+        assert _widget_cache_key('market_vix', 7, 3) == _widget_cache_key('market_vix', 8, 4)
+
+
+@pytest.mark.api
+class TestDashboardWidgetCache:
+    """Test requests assemble cached widgets and compute only the missing ones"""
+
+    def test_only_missing_widgets_are_computed(self, client, auth_headers, dashboard_portfolio, widget_store):
+        """Test a new widget set reuses the sections another set already cached"""
+        with CalculationCounters():
+            first = _post(client, auth_headers, dashboard_portfolio.id, ["total-value"])
+
+        with CalculationCounters() as counters:
+            second = _post(client, auth_headers, dashboard_portfolio.id, ["total-value", "recent-transactions"])
+
+        assert first["cached"] is False
+        assert sorted(second["cached_widgets"]) == ["metrics", "positions"]
+        assert second["cached"] is False
+        assert set(second["data"]) == {"metrics", "positions", "transactions"}
+        assert second["data"]["metrics"] == first["data"]["metrics"]
+        assert counters.positions.call_count == 0
+        assert counters.snapshots.call_count == 0
+
+    def test_invalidation_drops_portfolio_widgets(self, client, auth_headers, dashboard_portfolio, widget_store):
+        """Test a portfolio invalidation makes the next request recompute"""
+        with CalculationCounters():
+            _post(client, auth_headers, dashboard_portfolio.id, ["total-value"])
+        assert _widget_cache_key('metrics', dashboard_portfolio.id, dashboard_portfolio.user_id) in widget_store
+
+        invalidate_dashboard_widgets(f"p{dashboard_portfolio.id}")
+        with CalculationCounters() as counters:
+            again = _post(client, auth_headers, dashboard_portfolio.id, ["total-value"])
+
+        assert again["cached_widgets"] == []
+        assert counters.positions.call_count == 2
+
+    def test_warmup_writes_the_keys_the_api_reads(
+        self, client, auth_headers, test_db, dashboard_portfolio, widget_store
+    ):
+        """Test the Celery warmup fills the cache a later request is served from"""
+        from app.tasks.dashboard_tasks import warmup_user_dashboard
+
+        @contextmanager
+        def db_context():
+            yield test_db
+
+        widgets = ["total-value", "positions-table", "recent-transactions"]
+        with CalculationCounters(), patch("app.tasks.dashboard_tasks.get_db_context", db_context):
+            result = warmup_user_dashboard(dashboard_portfolio.user_id, dashboard_portfolio.id, widgets)
+
+        with CalculationCounters() as counters:
+            response = _post(client, auth_headers, dashboard_portfolio.id, widgets)
+
+        assert result["success"] is True
+        assert set(result["cache_keys"]) <= set(widget_store)
+        assert response["cached"] is True
+        assert counters.positions.call_count == 0
+
+
+@pytest.mark.api
+@pytest.mark.usefixtures("stream_db")
+class TestDashboardBatchStream:
+    """Test POST /batch/dashboard/stream emits each widget when it resolves"""
+
+    def test_fast_widgets_arrive_before_slow_ones(self, client, auth_headers, dashboard_portfolio, widget_store):
+        """Test a slow market widget does not hold back the portfolio widgets"""
+        async def slow_vix():
+            await asyncio.sleep(0.3)
+            return {"symbol": "^VIX", "price": 15.0}
+
+        with CalculationCounters(), patch("app.routers.batch._fetch_market_vix", slow_vix):
+            response = _stream(client, auth_headers, dashboard_portfolio.id, ["total-value", "vix-index"])
+
+        frames = _frames(response)
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert frames[0]["type"] == "start"
+        assert frames[-1] == {**frames[-1], "type": "complete", "pending": [], "failed": []}
+        widgets = [frame["widget"] for frame in frames if frame["type"] == "widget"]
+        assert widgets[-1] == "market_vix"
+        assert set(widgets) == {"metrics", "positions", "market_vix"}
+        assert all(frame["status"] == "ok" for frame in frames if frame["type"] == "widget")
+
+    def test_deadline_and_failure_frames(self, client, auth_headers, dashboard_portfolio, widget_store):
+        """Test a widget past the deadline is reported pending and an empty one failed"""
+        async def hanging():
+            await asyncio.sleep(5)
+
+        async def empty():
+            return None
+
+        with CalculationCounters(), \
+                patch("app.routers.batch.settings.DASHBOARD_WIDGET_DEADLINE_SECONDS", 0.2), \
+                patch("app.routers.batch._fetch_market_vix", hanging), \
+                patch("app.routers.batch._fetch_market_dxy", empty):
+            response = _stream(client, auth_headers, dashboard_portfolio.id, ["vix-index", "dxy-index"])
+
+        by_widget = {frame["widget"]: frame for frame in _frames(response) if frame["type"] == "widget"}
+        assert by_widget["market_vix"]["status"] == "pending"
+        assert by_widget["market_dxy"] == {**by_widget["market_dxy"], "status": "failed", "error": "No data returned"}
+        assert _frames(response)[-1]["pending"] == ["market_vix"]
+        assert not any(key.startswith("dashboard_widget:global:market_") for key in widget_store)
+
+    def test_shares_cache_entries_with_blocking_endpoint(
+        self, client, auth_headers, dashboard_portfolio, widget_store
+    ):
+        """Test streamed widgets are served from cache by the blocking endpoint and back"""
+        with CalculationCounters():
+            _stream(client, auth_headers, dashboard_portfolio.id, ["total-value"])
+
+        with CalculationCounters() as counters:
+            blocking = _post(client, auth_headers, dashboard_portfolio.id, ["total-value", "recent-transactions"])
+            response = _stream(
+                client, auth_headers, dashboard_portfolio.id, ["total-value", "recent-transactions"],
+                accept="text/event-stream",
+            )
+
+        assert blocking["cached_widgets"] == ["metrics", "positions"]
+        assert counters.positions.call_count == 0
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [chunk for chunk in response.text.split("\n\n") if chunk]
+        frames = [json.loads(event.split("data: ", 1)[1]) for event in events]
+        assert all(event.startswith(f"event: {frame['type']}") for event, frame in zip(events, frames))
+        assert {f["widget"]: f["cached"] for f in frames if f["type"] == "widget"} == {
+            "metrics": True, "positions": True, "transactions": True,
+        }
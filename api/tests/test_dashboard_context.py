@@ -0,0 +1,154 @@
+"""
+Tests for the request-scoped dashboard graph - every shared input computed once per request
+"""
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+from app.crud import prices as crud_prices
+from app.models import TransactionType
+from app.services.dashboard_context import DashboardContext
+from app.services.metrics import MetricsService
+from tests.factories import UserFactory, PortfolioFactory, AssetFactory, TransactionFactory, PriceFactory
+from tests.utils import CalculationCounters
+
+
+HISTORY_PERIODS = ['1W', '1M', 'YTD', '1Y']
+
+
+@pytest.fixture
+def mixed_portfolio(test_db):
+    """Two held assets and one fully sold asset"""
+    user = UserFactory.create()
+    portfolio = PortfolioFactory.create(user_id=user.id, base_currency="USD")
+    for _ in range(2):
+        asset = AssetFactory.create()
+        TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+    sold = AssetFactory.create()
+    TransactionFactory.create(portfolio_id=portfolio.id, asset_id=sold.id, tx_date=date(2024, 1, 2))
+    TransactionFactory.create(
+        portfolio_id=portfolio.id, asset_id=sold.id, tx_date=date(2024, 3, 1),
+        type=TransactionType.SELL, price=Decimal("120"),
+    )
+    return portfolio
+
+
+@pytest.mark.unit
+@pytest.mark.service
+class TestDashboardContext:
+    """Test the graph shares each node between concurrent widget fetchers"""
+
+    @pytest.mark.asyncio
+    async def test_each_input_computed_once(self, test_db, mixed_portfolio):
+        """Test snapshots, quotes, FX, positions and history run once for all widgets"""
+        context = DashboardContext(MetricsService(test_db), mixed_portfolio.id)
+
+        with CalculationCounters() as counters:
+            await asyncio.gather(
+                context.get_metrics(mixed_portfolio.id),
+                context.get_positions(mixed_portfolio.id),
+                context.get_sold_positions_only(mixed_portfolio.id),
+                context.get_positions(mixed_portfolio.id, include_sold=True),
+                context.histories(HISTORY_PERIODS),
+                context.histories(HISTORY_PERIODS),
+            )
+
+        assert counters.snapshots.call_count == 1
+        assert counters.quotes.await_count == 1
+        assert counters.fx.call_count == 1
+        assert counters.positions.call_count == 3  # one per asset
+        assert counters.history.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_matches_metrics_service(self, test_db, mixed_portfolio):
+        """Test the graph returns what separate MetricsService calls return"""
+        context = DashboardContext(MetricsService(test_db), mixed_portfolio.id)
+
+        with CalculationCounters():
+            held = await context.get_positions(mixed_portfolio.id)
+            sold = await context.get_sold_positions_only(mixed_portfolio.id)
+            metrics = await context.get_metrics(mixed_portfolio.id)
+
+            service = MetricsService(test_db)
+            expected_held = await service._calculate_positions_internal(mixed_portfolio.id)
+            expected_metrics = await service.get_metrics(mixed_portfolio.id)
+
+        assert held == expected_held
+        assert [p.quantity for p in sold] == [Decimal(0)]
+        assert sold[0].unrealized_pnl == Decimal("200")
+        exclude = {"last_updated"}
+        assert metrics.model_dump(exclude=exclude) == expected_metrics.model_dump(exclude=exclude)
+        assert metrics.total_realized_pnl == Decimal("200")
+        assert metrics.positions_count == 2
+
+
+@pytest.mark.integration
+@pytest.mark.service
+class TestPortfolioHistories:
+    """Test several history intervals cut from one calculation"""
+
+    def test_intervals_match_separate_calls(self, test_db):
+        """Test each interval equals its own get_portfolio_history() when every day has a close"""
+        user = UserFactory.create()
+        portfolio = PortfolioFactory.create(user_id=user.id, base_currency="USD")
+        asset = AssetFactory.create(symbol="HIST", currency="USD")
+
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=20)
+        TransactionFactory.create(
+            portfolio_id=portfolio.id, asset_id=asset.id, tx_date=start,
+            quantity=Decimal("2"), price=Decimal("100"), fees=Decimal("0"),
+        )
+        for offset in range(21):
+            day = datetime.combine(start + timedelta(days=offset), datetime.min.time())
+            PriceFactory.create(
+                asset_id=asset.id, asof=day + timedelta(hours=21),
+                price=Decimal(100 + offset), source="yfinance_history",
+            )
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+
+        service = MetricsService(test_db)
+        histories = service.get_portfolio_histories(portfolio.id, ["1W", "ALL", "1M"])
+
+        for interval in ("1W", "ALL", "1M"):
+            assert histories[interval] == service.get_portfolio_history(portfolio.id, interval)
+        assert histories["ALL"][0].value == 0.0
+        assert len(histories["1M"]) == 21
+
+
+@pytest.mark.api
+class TestDashboardBatchEndpoint:
+    """Test POST /batch/dashboard computes positions once for every widget"""
+
+    def test_positions_computed_once(self, client, auth_headers, test_user, test_db):
+        """Test metrics, positions, allocations and history share one calculation"""
+        test_user.is_verified = True
+        test_db.commit()
+        portfolio = PortfolioFactory.create(user_id=test_user.id, base_currency="USD")
+        for symbol in ("AAA", "BBB"):
+            asset = AssetFactory.create(symbol=symbol)
+            TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+
+        with CalculationCounters() as counters:
+            response = client.post(
+                "/batch/dashboard",
+                json={
+                    "portfolio_id": portfolio.id,
+                    "visible_widgets": [
+                        "total-value", "positions-table", "sold-positions",
+                        "asset-allocation", "top-performers", "performance-metrics",
+                    ],
+                },
+                headers=auth_headers,
+            )
+
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert {"metrics", "positions", "asset_allocation", "sector_allocation", "performance_history"} <= set(data)
+        assert data["metrics"]["positions_count"] == 2
+        assert counters.snapshots.call_count == 1
+        assert counters.quotes.await_count == 1
+        assert counters.positions.call_count == 2
+        assert counters.history.call_count == 1
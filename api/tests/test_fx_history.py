@@ -0,0 +1,124 @@
+"""
+Tests for the historical FX series store - as-of lookups and incremental backfill
+"""
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+
+from app.crud import fx_rates as crud_fx_rates
+from app.models import FxRate
+from app.services import fx_history
+from app.services.fx_history import FxHistoryStore, FxSeries
+
+
+TODAY = datetime.utcnow().date()
+
+# Deterministic leg per currency and day so backfilled values can be asserted
+LEG_BASE = {"EUR": 0.8, "GBP": 0.5}
+
+
+def _leg(currency, day):
+    return LEG_BASE[currency] + (day - TODAY).days / 1000
+
+
+def _serve_legs(fake_yahoo, currencies=("EUR", "GBP")):
+    """Serve one close per calendar day of the last 400 days for each USD leg"""
+    days = [TODAY - timedelta(days=n) for n in range(400)]
+    for currency in currencies:
+        fake_yahoo.set_history(f"USD{currency}=X", {day: _leg(currency, day) for day in days}, tz="Europe/London")
+
+
+def _backfill_calls(fake_yahoo):
+    """History requests grouped per window, as (symbols, start, end) in request order"""
+    windows = {}
+    for path, params in fake_yahoo.requests:
+        if "period1" not in params:
+            continue
+        window = tuple(datetime.utcfromtimestamp(int(params[key])).date() for key in ("period1", "period2"))
+        windows.setdefault(window, []).append(path.rsplit("/", 1)[-1])
+    return [(sorted(symbols), start, end) for (start, end), symbols in windows.items()]
+
+
+@pytest.mark.unit
+class TestFxSeries:
+    """Test as-of lookups on one sorted series"""
+
+    def test_rate_asof_uses_last_close_on_or_before(self):
+        """Test weekend dates resolve to Friday and dates before the series to None"""
+        friday, monday = date(2024, 6, 7), date(2024, 6, 10)
+        series = FxSeries("EUR", [(monday, Decimal("0.93")), (friday, Decimal("0.92"))], friday, monday)
+
+        assert series.rate_asof(date(2024, 6, 6)) is None
+        assert series.rate_asof(friday) == Decimal("0.92")
+        assert series.rate_asof(datetime(2024, 6, 9, 15)) == Decimal("0.92")
+        assert series.rate_asof(date(2024, 7, 1)) == Decimal("0.93")
+        assert series.rates_asof([date(2024, 7, 1), date(2024, 6, 6), date(2024, 6, 8)]) == [
+            Decimal("0.93"), None, Decimal("0.92")
+        ]
+
+
+@pytest.mark.unit
+@pytest.mark.service
+class TestFxHistoryStore:
+    """Test backfill, persistence and cross rates of the FX store"""
+
+    def test_backfill_is_batched_and_incremental(self, test_db, fake_yahoo):
+        """Test one request batch per missing window for all currencies, then only head/tail"""
+        _serve_legs(fake_yahoo)
+        start = TODAY - timedelta(days=30)
+
+        series = FxHistoryStore(test_db).load({"EUR", "GBP", "USD"}, start)
+        assert _backfill_calls(fake_yahoo) == [
+            (["USDEUR=X", "USDGBP=X"], start - timedelta(days=7), TODAY + timedelta(days=1))
+        ]
+        assert len(series["EUR"]) == 38
+        assert series["GBP"].rate_asof(TODAY) == pytest.approx(Decimal("0.5"))
+        assert test_db.query(FxRate).count() == 76
+
+        # Already covered in this process: no I/O at all
+        FxHistoryStore(test_db).load({"EUR"}, start + timedelta(days=3))
+        assert len(fake_yahoo.requests) == 2
+
+        # New process: stored rows are reused, only the last stored day is refreshed
+        fx_history.clear_cache()
+        FxHistoryStore(test_db).load({"EUR", "GBP"}, start)
+        assert _backfill_calls(fake_yahoo)[1] == (["USDEUR=X", "USDGBP=X"], TODAY, TODAY + timedelta(days=1))
+
+        # Earlier start: only the head window is fetched
+        FxHistoryStore(test_db).load({"EUR"}, start - timedelta(days=20))
+        assert _backfill_calls(fake_yahoo)[2] == (["USDEUR=X"], start - timedelta(days=27), start - timedelta(days=6))
+        assert len(fake_yahoo.requests) == 5
+
+    def test_cross_rates_and_series_conversion(self, test_db):
+        """Test pairs are triangulated per day and whole columns convert at their own dates"""
+        crud_fx_rates.upsert_fx_rates(test_db, [
+            {"base_currency": "USD", "quote_currency": "EUR", "date": TODAY - timedelta(days=2), "rate": Decimal("0.8")},
+            {"base_currency": "USD", "quote_currency": "EUR", "date": TODAY - timedelta(days=1), "rate": Decimal("0.9")},
+            {"base_currency": "USD", "quote_currency": "GBP", "date": TODAY - timedelta(days=2), "rate": Decimal("0.5")},
+        ])
+        store = FxHistoryStore(test_db)
+        days = [TODAY - timedelta(days=1), TODAY - timedelta(days=2), TODAY - timedelta(days=3)]
+
+        assert store.pair_rates("EUR", "USD", days) == [Decimal("1") / Decimal("0.9"), Decimal("1.25"), None]
+        assert store.rate("EUR", "GBP", TODAY) == Decimal("0.5") / Decimal("0.9")
+        assert store.convert_series([Decimal("10"), Decimal("10")], days[:2], "USD", "EUR") == [
+            Decimal("9.0"), Decimal("8.0")
+        ]
+        assert store.resolve([("EUR", "USD", datetime.combine(days[1], datetime.min.time()))]) == {
+            ("EUR", "USD", datetime.combine(days[1], datetime.min.time())): Decimal("1.25")
+        }
+
+    def test_failed_download_is_retried(self, test_db, fake_yahoo):
+        """Test a failed backfill is not cached as covered, while unknown pairs are"""
+        _serve_legs(fake_yahoo)
+        fake_yahoo.fail("USDEUR=X", 503)
+
+        assert FxHistoryStore(test_db).rate("EUR", "USD", TODAY) is None
+        fake_yahoo.errors.clear()
+        assert FxHistoryStore(test_db).rate("USD", "EUR", TODAY) == pytest.approx(Decimal("0.8"))
+        assert len(fake_yahoo.requests_for("/v8/finance/chart/USDEUR=X")) == 2
+
+        # No data upstream (404) is remembered for the day
+        assert FxHistoryStore(test_db).rate("USD", "XYZ", TODAY) is None
+        assert FxHistoryStore(test_db).rate("USD", "XYZ", TODAY) is None
+        assert len(fake_yahoo.requests_for("/v8/finance/chart/USDXYZ=X")) == 1
@@ -0,0 +1,85 @@
+"""
+Tests for exchange trading calendars
+"""
+import pytest
+from datetime import date, datetime, timezone
+
+from app.models.enums import AssetClass
+from app.services.market_calendar import (
+    CRYPTO, FX, NYSE, EXCHANGES, _easter, _lse_holidays, _nyse_holidays, exchange_for_symbol, is_market_open,
+)
+
+
+@pytest.mark.unit
+class TestExchangeForSymbol:
+    """Test symbols are mapped to their exchange by their Yahoo Finance ticker"""
+
+    @pytest.mark.parametrize("symbol, code", [
+        ("AAPL", "NYSE"),
+        ("BRK.B", "NYSE"),
+        ("BRK-B", "NYSE"),
+        ("^GSPC", "NYSE"),
+        ("AIR.PA", "EURONEXT"),
+        ("SAP.DE", "XETRA"),
+        ("VOD.L", "LSE"),
+        ("7203.T", "TSE"),
+        ("SHOP.TO", "TSX"),
+        ("BTC-USD", "CRYPTO"),
+        ("ETH-EUR", "CRYPTO"),
+        ("EURUSD=X", "FX"),
+        ("GC=F", "FX"),
+        ("XYZ.QQ", "FX"),  # unknown exchange: weekdays around the clock
+    ])
+    def test_suffixes(self, symbol, code):
+        """Test each ticker form"""
+        assert exchange_for_symbol(symbol).code == code
+
+    def test_asset_class_wins(self):
+        """Test an asset known to be crypto trades around the clock whatever its ticker"""
+        assert exchange_for_symbol("BTC", AssetClass.CRYPTO) is CRYPTO
+
+
+@pytest.mark.unit
+class TestSessions:
+    """Test regular sessions, weekends and holidays"""
+
+    def test_us_session_in_new_york_time(self):
+        """Test the session follows New York time across daylight saving changes"""
+        # 2024-07-01 (EDT): 09:30 ET is 13:30 UTC; 2024-12-02 (EST): 09:30 ET is 14:30 UTC
+        assert NYSE.is_open(datetime(2024, 7, 1, 13, 30)) is True
+        assert NYSE.is_open(datetime(2024, 7, 1, 13, 29)) is False
+        assert NYSE.is_open(datetime(2024, 12, 2, 14, 0)) is False
+        assert NYSE.is_open(datetime(2024, 12, 2, 20, 59)) is True
+        assert NYSE.is_open(datetime(2024, 12, 2, 21, 0)) is False
+        assert NYSE.is_open(datetime(2024, 12, 2, 8, 0, tzinfo=timezone.utc)) is False  # 3 a.m. in New York
+
+    def test_weekends_and_holidays(self):
+        """Test US equities are closed on weekends and NYSE holidays, crypto never"""
+        saturday = datetime(2024, 6, 1, 16)
+        thanksgiving = datetime(2024, 11, 28, 16)
+        assert is_market_open("AAPL", at=saturday) is False
+        assert is_market_open("AAPL", at=thanksgiving) is False
+        assert is_market_open("BTC-USD", at=saturday) is True
+        assert is_market_open("EURUSD=X", at=saturday) is False
+        assert FX.is_open(thanksgiving) is True
+
+    def test_other_exchanges_in_their_time_zone(self):
+        """Test a European listing is open at 10:00 in Paris, closed when New York opens its afternoon"""
+        euronext = EXCHANGES["EURONEXT"]
+        assert euronext.is_open(datetime(2024, 6, 3, 8, 0)) is True  # 10:00 CEST
+        assert euronext.is_open(datetime(2024, 6, 3, 16, 0)) is False  # 18:00 CEST
+        assert is_market_open("AIR.PA", at=datetime(2024, 5, 1, 8, 0)) is False  # Labour Day
+
+    def test_holiday_rules(self):
+        """Test computed holidays against published calendars"""
+        assert _easter(2024) == date(2024, 3, 31)
+        assert _easter(2025) == date(2025, 4, 20)
+        assert _nyse_holidays(2024) == {
+            date(2024, 1, 1), date(2024, 1, 15), date(2024, 2, 19), date(2024, 3, 29), date(2024, 5, 27),
+            date(2024, 6, 19), date(2024, 7, 4), date(2024, 9, 2), date(2024, 11, 28), date(2024, 12, 25),
+        }
+        # Saturday New Year's Day is not observed; Sunday Independence Day moves to Monday
+        assert date(2021, 12, 31) not in _nyse_holidays(2021) and date(2022, 1, 1) not in _nyse_holidays(2022)
+        assert date(2027, 7, 5) in _nyse_holidays(2027)
+        # Christmas on Saturday: substitute days on Monday and Tuesday
+        assert {date(2021, 12, 27), date(2021, 12, 28)} <= _lse_holidays(2021)
@@ -0,0 +1,71 @@
+"""
+Tests for the shared market data cache and its background refresh
+"""
+import pytest
+
+from app.services import market_data
+from app.services.cache import CacheService
+from app.services.cache_refresh import wait_for_refreshes
+from app.services.market_data import MARKET_INDICES, get_market_data, refresh_market_data
+
+
+@pytest.mark.unit
+class TestMarketDataRefresh:
+    """Test the scheduled refresh keeps market data cached for every worker"""
+
+    async def test_refresh_caches_items_once_per_cycle(self, fake_redis, fake_yahoo):
+        """Test a refresh fetches each item, a concurrent one in another process skips them"""
+        fake_yahoo.set_quote("^VIX", 16.5, previous_close=15.0)
+        fake_yahoo.set_quote("^GSPC", 5500.0, previous_close=5400.0)
+        fake_yahoo.set_quote("^FTSE", 8200.0, previous_close=8300.0)
+
+        assert await refresh_market_data(["index_vix", "indices"]) == ["index_vix", "indices"]
+        assert await refresh_market_data(["index_vix", "indices"]) == []  # claimed by the first refresh
+        assert len(fake_yahoo.requests_for("/v8/finance/spark")) == 1  # every index in one request
+
+        vix = await get_market_data("index_vix")
+        indices = await get_market_data("indices")
+        assert (vix["price"], vix["change"], vix["change_pct"]) == (16.5, 1.5, 10.0)
+        assert set(indices) == {"^GSPC", "^FTSE"}
+        assert indices["^FTSE"]["daily_change_pct"] == -1.2
+        assert len(fake_yahoo.requests) == 2  # reads never went upstream
+
+    async def test_failed_refresh_keeps_the_cached_value(self, fake_redis, fake_yahoo):
+        """Test an upstream failure leaves the last known value in the cache"""
+        fake_yahoo.set_quote("^VIX", 16.5, previous_close=15.0)
+        await refresh_market_data(["index_vix"])
+        fake_yahoo.fail("^VIX")
+        CacheService.delete("swr_lock:market:index_vix")
+
+        assert await refresh_market_data(["index_vix"]) == []
+        assert (await get_market_data("index_vix"))["price"] == 16.5
+
+    def test_all_market_widgets_are_refreshed(self):
+        """Test the refresh covers the sentiment and index endpoints and the indices widget"""
+        assert set(market_data.MARKET_DATA) == {
+            "sentiment_stock", "sentiment_crypto", "index_vix", "index_tnx", "index_dxy", "indices",
+        }
+        assert "^GSPC" in MARKET_INDICES
+
+
+@pytest.mark.api
+class TestMarketEndpoints:
+    """Test market endpoints read the cache"""
+
+    def test_stale_entry_served_then_refreshed_in_background(self, client, fake_redis, fake_yahoo):
+        """Test a stale read answers from the cache at once and one refresh runs"""
+        fake_yahoo.set_quote("^TNX", 4.2, previous_close=4.0)
+        first = client.get("/market/tnx")  # cold cache: fetched here
+        assert first.status_code == 200
+        assert first.json()["price"] == 4.2
+
+        fake_yahoo.set_quote("^TNX", 4.4, previous_close=4.0)
+        fake_yahoo.latency = 0.5  # the refresh is still running while both stale reads are served
+        CacheService.expire_swr(["market:index_tnx"])
+        stale = [client.get("/market/tnx") for _ in range(2)]
+        assert wait_for_refreshes(timeout=10)
+        refreshed = client.get("/market/tnx")
+
+        assert [response.json()["price"] for response in stale] == [4.2, 4.2]
+        assert refreshed.json()["price"] == 4.4
+        assert len(fake_yahoo.requests_for("/v8/finance/chart/^TNX")) == 2
@@ -4,10 +4,13 @@ Tests for metrics calculation service
 import pytest
 from decimal import Decimal
 from datetime import date, datetime
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock
 
 from app.services.metrics import MetricsService
+from app.services.position_calculator import FxRates, calculate_position
+from app.services.position_state import PositionState
 from app.models import Asset, Transaction, TransactionType, Portfolio
+from app.schemas import PriceQuote
 
 
 @pytest.fixture
@@ -22,8 +25,11 @@ def metrics_service(mock_db):
     return MetricsService(mock_db)
 
 
-@pytest.mark.asyncio
-async def test_calculate_position_simple_buy(metrics_service, mock_db):
+def _quote(price: str) -> PriceQuote:
+    return PriceQuote(symbol="AAPL", price=Decimal(price), asof=datetime.utcnow(), currency="USD")
+
+
+def test_calculate_position_simple_buy():
     """Test position calculation for simple BUY transaction"""
     asset = Asset(id=1, symbol="AAPL", name="Apple Inc.", currency="USD")
     
@@ -41,30 +47,20 @@ async def test_calculate_position_simple_buy(metrics_service, mock_db):
         )
     ]
     
-    mock_db.query().filter().first.return_value = asset
+    quote = _quote("160.00")
     
-    with patch('app.services.metrics.crud_prices') as mock_crud:
-        from app.models import Price
-        mock_crud.get_latest_price.return_value = Price(
-            id=1,
-            asset_id=1,
-            price=Decimal("160.00"),
-            asof=datetime.utcnow()
-        )
-        
-        position = await metrics_service._calculate_position(1, transactions)
-        
-        assert position is not None
-        assert position.quantity == Decimal("10")
-        assert position.cost_basis == Decimal("1510.00")  # (10 * 150) + 10 fees
-        assert position.avg_cost == Decimal("151.00")  # 1510 / 10
-        assert position.current_price == Decimal("160.00")
-        assert position.market_value == Decimal("1600.00")  # 10 * 160
-        assert position.unrealized_pnl == Decimal("90.00")  # 1600 - 1510
+    position = calculate_position(asset, PositionState.from_transactions(transactions), quote, FxRates())
+    
+    assert position is not None
+    assert position.quantity == Decimal("10")
+    assert position.cost_basis == Decimal("1510.00")  # (10 * 150) + 10 fees
+    assert position.avg_cost == Decimal("151.00")  # 1510 / 10
+    assert position.current_price == Decimal("160.00")
+    assert position.market_value == Decimal("1600.00")  # 10 * 160
+    assert position.unrealized_pnl == Decimal("90.00")  # 1600 - 1510
 
 
-@pytest.mark.asyncio
-async def test_calculate_position_buy_and_sell(metrics_service, mock_db):
+def test_calculate_position_buy_and_sell():
     """Test position calculation with BUY and SELL"""
     asset = Asset(id=1, symbol="AAPL", name="Apple Inc.", currency="USD")
     
@@ -91,28 +87,18 @@ async def test_calculate_position_buy_and_sell(metrics_service, mock_db):
         )
     ]
     
-    mock_db.query().filter().first.return_value = asset
+    quote = _quote("160.00")
     
-    with patch('app.services.metrics.crud_prices') as mock_crud:
-        from app.models import Price
-        mock_crud.get_latest_price.return_value = Price(
-            id=1,
-            asset_id=1,
-            price=Decimal("160.00"),
-            asof=datetime.utcnow()
-        )
-        
-        position = await metrics_service._calculate_position(1, transactions)
-        
-        assert position is not None
-        assert position.quantity == Decimal("5")  # 10 - 5
-        # Cost basis: (10*150 + 10) - (5*151) = 1510 - 755 = 755
-        assert position.cost_basis == Decimal("755.00")
-        assert position.avg_cost == Decimal("151.00")
+    position = calculate_position(asset, PositionState.from_transactions(transactions), quote, FxRates())
+    
+    assert position is not None
+    assert position.quantity == Decimal("5")  # 10 - 5
+    # Cost basis: (10*150 + 10) - (5*151) = 1510 - 755 = 755
+    assert position.cost_basis == Decimal("755.00")
+    assert position.avg_cost == Decimal("151.00")
 
 
-@pytest.mark.asyncio
-async def test_calculate_position_with_split(metrics_service, mock_db):
+def test_calculate_position_with_split():
     """Test position calculation with stock split"""
     asset = Asset(id=1, symbol="AAPL", name="Apple Inc.", currency="USD")
     
@@ -141,23 +127,14 @@ async def test_calculate_position_with_split(metrics_service, mock_db):
         )
     ]
     
-    mock_db.query().filter().first.return_value = asset
+    quote = _quote("80.00")  # After split, price halves
     
-    with patch('app.services.metrics.crud_prices') as mock_crud:
-        from app.models import Price
-        mock_crud.get_latest_price.return_value = Price(
-            id=1,
-            asset_id=1,
-            price=Decimal("80.00"),  # After split, price halves
-            asof=datetime.utcnow()
-        )
-        
-        position = await metrics_service._calculate_position(1, transactions)
-        
-        assert position is not None
-        assert position.quantity == Decimal("20")  # 10 * 2 (2:1 split)
-        assert position.cost_basis == Decimal("1510.00")  # Cost basis unchanged
-        assert position.avg_cost == Decimal("75.50")  # 1510 / 20
+    position = calculate_position(asset, PositionState.from_transactions(transactions), quote, FxRates())
+    
+    assert position is not None
+    assert position.quantity == Decimal("20")  # 10 * 2 (2:1 split)
+    assert position.cost_basis == Decimal("1510.00")  # Cost basis unchanged
+    assert position.avg_cost == Decimal("75.50")  # 1510 / 20
 
 
 def test_parse_split_ratio(metrics_service):
@@ -0,0 +1,185 @@
+"""
+Tests for the vectorized portfolio history engine - parity with the per-date Decimal loop
+"""
+import math
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from app.crud import prices as crud_prices
+from app.models import FxRate, TransactionType
+from app.services.metrics import MetricsService
+from app.services.portfolio_history import HISTORY_RTOL, build_history_points, compute_history_series
+from tests.factories import AssetFactory, PortfolioFactory, PriceFactory, TransactionFactory, UserFactory
+from tests.utils import reference_history_points, synthetic_portfolio_history
+
+
+split_ratio = MetricsService(db=None)._parse_split_ratio
+
+
+def _tx(asset_id, tx_date, tx_type, quantity="0", price="0", fees="0", split=None):
+    return SimpleNamespace(
+        asset_id=asset_id,
+        tx_date=tx_date,
+        type=tx_type,
+        quantity=Decimal(quantity),
+        price=Decimal(price),
+        fees=Decimal(fees),
+        meta_data={"split": split} if split else None,
+    )
+
+
+def _close(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=HISTORY_RTOL, abs_tol=1e-9)
+
+
+def assert_history_parity(actual, expected):
+    """Assert two PortfolioHistoryPoint lists match within the documented tolerance"""
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got.date == want.date
+        for field in ("value", "invested", "cost_basis", "gain_pct", "unrealized_pnl_pct"):
+            assert _close(getattr(got, field), getattr(want, field)), \
+                f"{field} on {got.date}: {getattr(got, field)} != {getattr(want, field)}"
+
+
+@pytest.mark.unit
+@pytest.mark.service
+class TestHistoryEngineParity:
+    """Engine output matches the reference Decimal loop"""
+    
+    @pytest.mark.parametrize("seed", [0, 1, 2, 3, 4])
+    def test_random_portfolios_match_reference(self, seed):
+        """Test randomized buys/sells/transfers/conversions/splits with price gaps"""
+        dates, prices, transactions = synthetic_portfolio_history(
+            n_transactions=400, n_assets=8, n_days=120, seed=seed
+        )
+        
+        expected = reference_history_points(dates, prices, transactions, split_ratio)
+        actual = build_history_points(dates, prices, transactions, split_ratio)
+        
+        assert_history_parity(actual, expected)
+    
+    def test_forward_fill_uses_last_known_price(self):
+        """Test an asset without a price on a date keeps its previous close"""
+        d0, d1, d2 = date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)
+        prices = {1: {d0: Decimal("10"), d2: Decimal("12")}, 2: {d1: Decimal("5")}}
+        transactions = [
+            _tx(1, d0, TransactionType.BUY, "2", "10"),
+            _tx(2, d0, TransactionType.BUY, "4", "5"),
+        ]
+        
+        history = build_history_points([d0, d1, d2], prices, transactions, split_ratio)
+        
+        # d0: asset 2 has no price yet, d1: asset 1 forward-filled at 10
+        assert [p.value for p in history] == [20.0, 40.0, 44.0]
+        assert history[0].invested == 40.0
+    
+    def test_future_split_compensates_adjusted_prices(self):
+        """Test prices before a split are scaled by the splits still ahead"""
+        d0, d1, d2 = date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)
+        # Yahoo prices are already split-adjusted (2:1 on d2)
+        prices = {1: {d0: Decimal("50"), d1: Decimal("50"), d2: Decimal("50")}}
+        transactions = [
+            _tx(1, d0, TransactionType.BUY, "10", "100"),
+            _tx(1, d2, TransactionType.SPLIT, split="2:1"),
+        ]
+        
+        history = build_history_points([d0, d1, d2], prices, transactions, split_ratio)
+        
+        assert [p.value for p in history] == [1000.0, 1000.0, 1000.0]
+        assert all(p.cost_basis == 1000.0 for p in history)
+    
+    def test_oversell_is_capped_and_position_closed(self):
+        """Test selling more than held closes the position without negative holdings"""
+        d0, d1 = date(2024, 1, 1), date(2024, 1, 2)
+        prices = {1: {d0: Decimal("10"), d1: Decimal("20")}}
+        transactions = [
+            _tx(1, d0, TransactionType.BUY, "5", "10"),
+            _tx(1, d1, TransactionType.SELL, "8", "20"),
+        ]
+        
+        history = build_history_points([d0, d1], prices, transactions, split_ratio)
+        
+        assert history[1].value == 0.0
+        assert history[1].cost_basis == 0.0
+        assert history[1].invested == 0.0
+        assert history[1].gain_pct is None
+        assert history[1].unrealized_pnl_pct is None
+    
+    def test_transactions_before_first_price_date_are_applied(self):
+        """Test holdings bought before any price exist on the first chart date"""
+        d0 = date(2024, 1, 5)
+        prices = {1: {d0: Decimal("10")}}
+        transactions = [_tx(1, date(2024, 1, 1), TransactionType.BUY, "3", "9")]
+        
+        series = compute_history_series([d0], prices, transactions, split_ratio)
+        
+        assert series["value"].tolist() == [30.0]
+        assert series["invested"].tolist() == [27.0]
+    
+    def test_empty_inputs(self):
+        """Test no dates or no transactions yields an empty history"""
+        assert build_history_points([], {}, [_tx(1, date(2024, 1, 1), TransactionType.BUY, "1", "1")], split_ratio) == []
+        assert build_history_points([date(2024, 1, 1)], {}, [], split_ratio) == []
+
+
+@pytest.mark.integration
+@pytest.mark.service
+class TestPortfolioHistoryService:
+    """MetricsService.get_portfolio_history end-to-end on the engine"""
+    
+    def test_history_from_db_prices(self, test_db):
+        """Test history uses yfinance_history closes and the engine series"""
+        user = UserFactory.create()
+        portfolio = PortfolioFactory.create(user_id=user.id, base_currency="USD")
+        asset = AssetFactory.create(symbol="HIST", currency="USD")
+        
+        start = datetime.utcnow().date() - timedelta(days=5)
+        TransactionFactory.create(
+            portfolio_id=portfolio.id, asset_id=asset.id, tx_date=start,
+            quantity=Decimal("2"), price=Decimal("100"), fees=Decimal("0")
+        )
+        for offset, close in enumerate(["100", "110", "120"]):
+            day = datetime.combine(start + timedelta(days=offset), datetime.min.time())
+            PriceFactory.create(asset_id=asset.id, asof=day + timedelta(hours=21), price=Decimal(close), source="yfinance_history")
+            # Intraday price on the same day must lose against the official close
+            PriceFactory.create(asset_id=asset.id, asof=day + timedelta(hours=22), price=Decimal("1"), source="yfinance")
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+        
+        history = MetricsService(test_db).get_portfolio_history(portfolio.id, interval="ALL")
+        
+        # Zero point + 3 price dates
+        assert [p.value for p in history] == [0.0, 200.0, 220.0, 240.0]
+        assert history[-1].invested == 200.0
+        assert history[-1].gain_pct == pytest.approx(20.0)
+    
+    def test_history_converts_at_historical_rates(self, test_db):
+        """Test foreign closes are converted at the rate of their own day"""
+        user = UserFactory.create()
+        portfolio = PortfolioFactory.create(user_id=user.id, base_currency="USD")
+        asset = AssetFactory.create(symbol="HIST.DE", currency="EUR")
+        
+        start = datetime.utcnow().date() - timedelta(days=5)
+        TransactionFactory.create(
+            portfolio_id=portfolio.id, asset_id=asset.id, tx_date=start,
+            quantity=Decimal("2"), price=Decimal("100"), fees=Decimal("0"), currency="EUR"
+        )
+        for offset, leg in enumerate(["0.8", "0.5"]):
+            day = start + timedelta(days=offset)
+            PriceFactory.create(
+                asset_id=asset.id, asof=datetime.combine(day, datetime.min.time()) + timedelta(hours=21),
+                price=Decimal("100"), source="yfinance_history"
+            )
+            test_db.add(FxRate(base_currency="USD", quote_currency="EUR", date=day, rate=Decimal(leg)))
+        test_db.commit()
+        crud_prices.rebuild_daily_closes(test_db)
+        
+        history = MetricsService(test_db).get_portfolio_history(portfolio.id, interval="ALL")
+        
+        # 2 x 100 EUR at 1.25 then 2.0 USD per EUR
+        assert [p.value for p in history[1:]] == [250.0, 400.0]
@@ -0,0 +1,144 @@
+"""
+Tests for the pure position calculator and the batched positions pipeline
+"""
+import pytest
+from decimal import Decimal
+from datetime import date, datetime
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import event
+
+from app.models import Asset, Transaction, TransactionType
+from app.schemas import PriceQuote
+from app.services.metrics import MetricsService
+from app.services.position_calculator import FxRates, calculate_position, fx_requirements
+from app.services.position_state import PositionState
+from tests.factories import UserFactory, PortfolioFactory, AssetFactory, TransactionFactory
+
+
+def _quote(symbol, price, currency="USD", daily_change_pct=None):
+    return PriceQuote(
+        symbol=symbol,
+        price=Decimal(price),
+        asof=datetime(2024, 6, 3, 20),
+        currency=currency,
+        daily_change_pct=daily_change_pct,
+    )
+
+
+@pytest.mark.unit
+class TestCalculatePosition:
+    """Test calculate_position() on preloaded inputs (no database)"""
+
+    def test_held_position(self):
+        """Test cost basis, market value and P&L of a simple holding"""
+        asset = Asset(id=1, symbol="AAPL", name="Apple Inc.", currency="USD")
+        state = PositionState(quantity=10, total_cost=Decimal("1510"), position_currency="USD")
+
+        position = calculate_position(asset, state, _quote("AAPL", "160", daily_change_pct=Decimal("1.5")), FxRates())
+
+        assert position.quantity == Decimal("10")
+        assert position.avg_cost == Decimal("151")
+        assert position.market_value == Decimal("1600")
+        assert position.unrealized_pnl == Decimal("90")
+        assert position.daily_change_pct == Decimal("1.5")
+        assert position.currency == "USD"
+
+    def test_converts_price_and_cost_to_base_currency(self):
+        """Test the FX table converts cost basis, price and ATH"""
+        asset = Asset(
+            id=1, symbol="SAP.DE", currency="EUR",
+            ath_price=Decimal("200"), ath_date=datetime(2024, 3, 1),
+        )
+        state = PositionState(quantity=2, total_cost=Decimal("300"), position_currency="EUR")
+        fx = FxRates(
+            rates={("EUR", "USD"): Decimal("1.1")},
+            historical={("EUR", "USD", datetime(2024, 3, 1)): Decimal("1.2")},
+        )
+
+        position = calculate_position(asset, state, _quote("SAP.DE", "180", "EUR"), fx, "USD")
+
+        assert position.cost_basis == Decimal("330.0")
+        assert position.current_price == Decimal("198.0")
+        assert position.market_value == Decimal("396.0")
+        assert position.ath_price == Decimal("240")
+        assert position.ath_price_native == Decimal("200")
+        assert position.currency == "USD"
+
+    def test_missing_price_rate_skips_position(self):
+        """Test an unconvertible price drops the position instead of mixing currencies"""
+        asset = Asset(id=1, symbol="SAP.DE", currency="EUR")
+        state = PositionState(quantity=2, total_cost=Decimal("300"), position_currency="USD")
+
+        assert calculate_position(asset, state, _quote("SAP.DE", "180", "EUR"), FxRates(), "USD") is None
+
+    def test_sold_position(self):
+        """Test a fully sold position reports realized P&L and average prices"""
+        asset = Asset(id=1, symbol="AAPL", currency="USD")
+        state = PositionState.from_transactions([
+            Transaction(type=TransactionType.BUY, quantity=Decimal(10), price=Decimal(100),
+                        fees=Decimal(0), currency="USD", meta_data={}),
+            Transaction(type=TransactionType.SELL, quantity=Decimal(10), price=Decimal(120),
+                        fees=Decimal(0), currency="USD", meta_data={}),
+        ])
+
+        assert calculate_position(asset, state, None, FxRates()) is None
+        position = calculate_position(asset, state, None, FxRates(), include_sold=True)
+        assert position.quantity == Decimal(0)
+        assert position.avg_cost == Decimal(100)
+        assert position.current_price == Decimal(120)
+        assert position.unrealized_pnl == Decimal(200)
+
+    def test_fx_requirements(self):
+        """Test only the pairs a position can use are requested"""
+        asset = Asset(id=1, symbol="SAP.DE", currency="EUR", ath_price=Decimal("200"), ath_date=datetime(2024, 3, 1))
+        held = PositionState(quantity=1, position_currency="USD")
+        sold = PositionState(quantity=0, position_currency="EUR")
+
+        assert fx_requirements(asset, held, "USD") == (
+            {("EUR", "USD")}, {("EUR", "USD", datetime(2024, 3, 1))}
+        )
+        assert fx_requirements(asset, sold, "CHF") == ({("EUR", "CHF")}, set())
+
+
+@pytest.mark.integration
+class TestPositionsPipelineQueries:
+    """Test the portfolio positions read issues O(1) queries"""
+
+    async def _count_queries(self, db, portfolio_id):
+        service = MetricsService(db)
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        async def quotes(symbols):
+            return {symbol: _quote(symbol, "50") for symbol in symbols}
+
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            with patch("app.services.pricing.PricingService.get_multiple_prices", AsyncMock(side_effect=quotes)):
+                positions = await service._calculate_positions_internal(portfolio_id)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        return positions, statements
+
+    @pytest.mark.asyncio
+    async def test_query_count_independent_of_asset_count(self, test_db):
+        """Test 2 and 12 asset portfolios read with the same number of queries"""
+        user = UserFactory.create()
+        counts = {}
+        for n_assets in (2, 12):
+            portfolio = PortfolioFactory.create(user_id=user.id)
+            for _ in range(n_assets):
+                asset = AssetFactory.create()
+                TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+                TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 2, 1))
+
+            positions, statements = await self._count_queries(test_db, portfolio.id)
+
+            assert len(positions) == n_assets
+            assert all(p.market_value == Decimal("1000") for p in positions)
+            counts[n_assets] = len(statements)
+
+        assert counts[2] == counts[12] == 2  # portfolio + snapshots joined with assets
@@ -0,0 +1,193 @@
+"""
+Tests for persisted position snapshots - incremental folding and partial replay
+"""
+import pytest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy import event
+
+from app.crud import positions as crud_positions
+from app.crud import transactions as crud_transactions
+from app.models import Portfolio, PositionCheckpoint, Transaction, TransactionType
+from app.schemas import TransactionCreate
+from app.services.position_state import STATE_FIELDS, PositionState, fold_key
+from tests.factories import UserFactory, PortfolioFactory, AssetFactory, TransactionFactory
+
+
+def _tx(portfolio, asset, tx_date, tx_type=TransactionType.BUY, quantity="10", price="100", fees="0", **kwargs):
+    return TransactionFactory.create(
+        portfolio_id=portfolio.id,
+        asset_id=asset.id,
+        tx_date=tx_date,
+        type=tx_type,
+        quantity=Decimal(quantity),
+        price=Decimal(price),
+        fees=Decimal(fees),
+        **kwargs
+    )
+
+
+def _replayed(db, portfolio_id, asset_id):
+    """Reference state: full replay of the asset's transactions"""
+    txs = (
+        db.query(Transaction)
+        .filter(Transaction.portfolio_id == portfolio_id, Transaction.asset_id == asset_id)
+        .all()
+    )
+    txs.sort(key=lambda tx: fold_key(tx.tx_date, tx.created_at, tx.id))
+    return PositionState.from_transactions(txs)
+
+
+def _assert_matches_replay(db, portfolio_id, asset_id):
+    snapshot = crud_positions.get_position_snapshot(db, portfolio_id, asset_id)
+    expected = _replayed(db, portfolio_id, asset_id)
+    assert snapshot is not None
+    for field in STATE_FIELDS:
+        # SQLite hands NUMERIC back through float; Postgres is exact
+        assert getattr(snapshot, field) == pytest.approx(getattr(expected, field), abs=Decimal("1e-6")), field
+    assert snapshot.position_currency == expected.position_currency
+
+
+@pytest.fixture
+def portfolio(test_db):
+    user = UserFactory.create()
+    return PortfolioFactory.create(user_id=user.id)
+
+
+@pytest.mark.unit
+@pytest.mark.crud
+class TestPositionSnapshotSync:
+    """Test snapshots follow transaction inserts, edits and deletes"""
+
+    def test_append_folds_new_transaction(self, test_db, portfolio):
+        """Test appended transactions update the snapshot and add one checkpoint each"""
+        asset = AssetFactory.create()
+        _tx(portfolio, asset, date(2024, 1, 2), quantity="10", price="100", fees="5")
+        _tx(portfolio, asset, date(2024, 2, 1), TransactionType.SELL, quantity="4", price="120", fees="1")
+        _tx(portfolio, asset, date(2024, 3, 1), TransactionType.SPLIT, quantity="0", price="0", meta_data={"split": "3:1"})
+        _tx(portfolio, asset, date(2024, 4, 1), TransactionType.DIVIDEND, quantity="18", price="0.5")
+
+        snapshot = crud_positions.get_position_snapshot(test_db, portfolio.id, asset.id)
+
+        assert snapshot.quantity == Decimal("18")
+        assert snapshot.total_cost == Decimal("603")  # 1005 - 4 * 100.5
+        assert snapshot.realized_pnl == Decimal("77")  # (480 - 1) - 402
+        assert snapshot.total_dividends == Decimal("9")
+        assert snapshot.total_fees == Decimal("6")
+        assert snapshot.last_tx_date == date(2024, 4, 1)
+        assert test_db.query(PositionCheckpoint).count() == 4
+        _assert_matches_replay(test_db, portfolio.id, asset.id)
+
+    def test_backdated_insert_replays_from_its_date(self, test_db, portfolio):
+        """Test a back-dated buy changes later sells and keeps earlier checkpoints"""
+        asset = AssetFactory.create()
+        first = _tx(portfolio, asset, date(2024, 1, 2), quantity="10", price="100")
+        _tx(portfolio, asset, date(2024, 3, 1), TransactionType.SELL, quantity="5", price="150")
+        first_checkpoint = test_db.get(PositionCheckpoint, first.id)
+        first_state = PositionState.from_row(first_checkpoint).as_dict()
+
+        _tx(portfolio, asset, date(2024, 2, 1), quantity="10", price="200")
+
+        assert PositionState.from_row(test_db.get(PositionCheckpoint, first.id)).as_dict() == first_state
+        snapshot = crud_positions.get_position_snapshot(test_db, portfolio.id, asset.id)
+        assert snapshot.quantity == Decimal("15")
+        assert snapshot.total_cost == Decimal("2250")  # 3000 - 5 * 150
+        assert snapshot.last_tx_date == date(2024, 3, 1)
+        _assert_matches_replay(test_db, portfolio.id, asset.id)
+
+    def test_update_moving_asset_replays_both(self, test_db, portfolio):
+        """Test editing the asset of a transaction moves it between snapshots"""
+        asset_a = AssetFactory.create()
+        asset_b = AssetFactory.create()
+        _tx(portfolio, asset_a, date(2024, 1, 2), quantity="10")
+        moved = _tx(portfolio, asset_a, date(2024, 2, 1), quantity="5", price="110")
+        _tx(portfolio, asset_b, date(2024, 3, 1), quantity="1", price="50")
+
+        crud_transactions.update_transaction(test_db, moved.id, TransactionCreate(
+            asset_id=asset_b.id,
+            tx_date=date(2024, 1, 15),
+            type=TransactionType.BUY,
+            quantity=Decimal("5"),
+            price=Decimal("110"),
+            fees=Decimal("0"),
+            currency="USD",
+        ))
+
+        assert crud_positions.get_position_snapshot(test_db, portfolio.id, asset_a.id).quantity == Decimal("10")
+        assert crud_positions.get_position_snapshot(test_db, portfolio.id, asset_b.id).quantity == Decimal("6")
+        assert test_db.get(PositionCheckpoint, moved.id).asset_id == asset_b.id
+        _assert_matches_replay(test_db, portfolio.id, asset_a.id)
+        _assert_matches_replay(test_db, portfolio.id, asset_b.id)
+
+    def test_notes_edit_does_not_replay(self, test_db, portfolio):
+        """Test edits outside the folded attributes leave checkpoints alone"""
+        asset = AssetFactory.create()
+        tx = _tx(portfolio, asset, date(2024, 1, 2))
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = test_db.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            tx.notes = "edited"
+            test_db.commit()
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert not any("position_" in statement for statement in statements)
+
+    def test_delete_replays_and_drops_empty_position(self, test_db, portfolio):
+        """Test deleting transactions replays the asset and removes emptied snapshots"""
+        asset = AssetFactory.create()
+        buy = _tx(portfolio, asset, date(2024, 1, 2), quantity="10")
+        second = _tx(portfolio, asset, date(2024, 2, 1), quantity="5", price="120")
+
+        crud_transactions.delete_transaction(test_db, buy.id)
+        snapshot = crud_positions.get_position_snapshot(test_db, portfolio.id, asset.id)
+        assert snapshot.quantity == Decimal("5")
+        assert snapshot.total_cost == Decimal("600")
+        _assert_matches_replay(test_db, portfolio.id, asset.id)
+
+        crud_transactions.delete_transaction(test_db, second.id)
+        assert crud_positions.get_position_snapshot(test_db, portfolio.id, asset.id) is None
+        assert test_db.query(PositionCheckpoint).count() == 0
+
+    def test_unsynced_portfolio_is_skipped_then_rebuilt(self, test_db, portfolio):
+        """Test portfolios without snapshots are left to a one-off full rebuild"""
+        portfolio.positions_synced_at = None
+        test_db.commit()
+        asset = AssetFactory.create()
+        _tx(portfolio, asset, date(2024, 1, 2), quantity="10")
+        _tx(portfolio, asset, date(2024, 2, 1), TransactionType.SELL, quantity="3", price="130")
+        assert crud_positions.get_position_snapshots(test_db, portfolio.id) == []
+
+        assert crud_positions.rebuild_portfolio_positions(test_db, portfolio.id) == 1
+
+        assert test_db.get(Portfolio, portfolio.id).positions_synced_at is not None
+        assert test_db.query(PositionCheckpoint).count() == 2
+        _assert_matches_replay(test_db, portfolio.id, asset.id)
+
+    def test_read_cost_independent_of_history(self, test_db, portfolio):
+        """Test loading snapshots is one query however many transactions exist"""
+        short_asset = AssetFactory.create()
+        long_asset = AssetFactory.create()
+        _tx(portfolio, short_asset, date(2024, 1, 2))
+        for day in range(1, 200):
+            _tx(portfolio, long_asset, date.fromordinal(date(2023, 1, 1).toordinal() + day), quantity="1")
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        engine = test_db.get_bind()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            snapshots = crud_positions.get_position_snapshots(test_db, portfolio.id)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert len(statements) == 1
+        assert [s.asset.symbol for s in snapshots] == [short_asset.symbol, long_asset.symbol]
+        assert snapshots[1].quantity == Decimal("199")
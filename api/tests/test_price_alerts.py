@@ -0,0 +1,151 @@
+"""
+Tests for price alerts evaluated against quote ticks
+"""
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import update
+from unittest.mock import patch
+
+from app.crud import watchlist as crud_watchlist
+from app.models import Notification, NotificationType, Watchlist
+from app.schemas import WatchlistItemCreate, WatchlistItemUpdate
+from app.services.price_alerts import (
+    PREFIX_ALERT_INDEX, evaluate_price_alerts, get_price_alert_stats, rebuild_alert_index,
+)
+from tests.factories import AssetFactory
+
+
+@pytest.fixture
+def asset(test_db):
+    asset = AssetFactory.create(symbol="AAPL")
+    test_db.commit()
+    return asset
+
+
+def _alert(test_db, user, asset, target: str) -> Watchlist:
+    return crud_watchlist.create_watchlist_item(
+        test_db,
+        WatchlistItemCreate(asset_id=asset.id, alert_target_price=Decimal(target), alert_enabled=True),
+        user.id,
+    )
+
+
+def _alerts_sent(test_db) -> int:
+    return test_db.query(Notification).filter(Notification.type == NotificationType.PRICE_ALERT).count()
+
+
+@pytest.mark.unit
+class TestCrossingDetection:
+    """Test alerts fire when a move passes through their target"""
+
+    def test_fast_move_through_target(self, test_db, test_user, asset, fake_redis):
+        """Test a jump from well below to well above the target fires (never within 1% of it)"""
+        item = _alert(test_db, test_user, asset, "110")
+
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("100")}) == 0  # first tick: no move yet
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("120")}) == 1
+
+        test_db.refresh(item)
+        assert item.alert_enabled is False
+        assert _alerts_sent(test_db) == 1
+        assert fake_redis.zcard(f"{PREFIX_ALERT_INDEX}{asset.id}") == 0
+
+    def test_only_targets_on_the_move(self, test_db, test_user, asset, fake_redis):
+        """Test falling moves fire targets in [current, previous), other targets stay armed"""
+        above = _alert(test_db, test_user, asset, "130")
+        crossed = _alert(test_db, test_user, asset, "95")
+        below = _alert(test_db, test_user, asset, "80")
+
+        evaluate_price_alerts(test_db, {asset.id: Decimal("100")})
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("95")}) == 1
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("95")}) == 0  # no move
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("96")}) == 0  # moving off the target
+
+        for item in (above, crossed, below):
+            test_db.refresh(item)
+        assert (above.alert_enabled, crossed.alert_enabled, below.alert_enabled) == (True, False, True)
+        assert get_price_alert_stats() == {"ticks": 4, "moves": 2, "triggered": 1, "lagging": 0}
+
+    def test_without_redis(self, test_db, test_user, asset):
+        """Test the index and previous prices are kept in process when Redis is unavailable"""
+        item = _alert(test_db, test_user, asset, "50")
+
+        evaluate_price_alerts(test_db, {asset.id: Decimal("60")})
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("40")}) == 1
+
+        test_db.refresh(item)
+        assert item.alert_enabled is False
+
+
+@pytest.mark.unit
+class TestIndexMaintenance:
+    """Test the index follows alert edits"""
+
+    def test_edits_and_deletes_are_indexed_on_commit(self, test_db, test_user, asset, fake_redis):
+        """Test committed edits move or drop index entries"""
+        item = _alert(test_db, test_user, asset, "110")
+        key = f"{PREFIX_ALERT_INDEX}{asset.id}"
+        assert fake_redis.zscore(key, item.id) == 110.0
+
+        crud_watchlist.update_watchlist_item(test_db, item.id, WatchlistItemUpdate(alert_target_price=Decimal("90")))
+        assert fake_redis.zscore(key, item.id) == 90.0
+
+        crud_watchlist.update_watchlist_item(test_db, item.id, WatchlistItemUpdate(alert_enabled=False))
+        assert fake_redis.zscore(key, item.id) is None
+
+        crud_watchlist.update_watchlist_item(test_db, item.id, WatchlistItemUpdate(alert_enabled=True))
+        crud_watchlist.delete_watchlist_item(test_db, item.id)
+        assert fake_redis.zcard(key) == 0
+
+    def test_lagging_entry_is_checked_and_reindexed(self, test_db, test_user, asset, fake_redis):
+        """Test an entry at an outdated target does not fire and moves to the current target"""
+        item = _alert(test_db, test_user, asset, "110")
+        # Edited behind the session's back: the index still says 110
+        test_db.execute(update(Watchlist).where(Watchlist.id == item.id).values(alert_target_price=Decimal("150")))
+        test_db.commit()
+
+        evaluate_price_alerts(test_db, {asset.id: Decimal("100")})
+        assert evaluate_price_alerts(test_db, {asset.id: Decimal("120")}) == 0
+
+        assert _alerts_sent(test_db) == 0
+        assert fake_redis.zscore(f"{PREFIX_ALERT_INDEX}{asset.id}", item.id) == 150.0
+
+    def test_rebuild(self, test_db, test_user, asset, fake_redis):
+        """Test a rebuild restores a flushed index and drops assets without alerts"""
+        item = _alert(test_db, test_user, asset, "110")
+        fake_redis.flushall()
+        fake_redis.zadd(f"{PREFIX_ALERT_INDEX}9999", {"1": 1.0})
+
+        assert rebuild_alert_index(test_db) == 1
+        assert fake_redis.zscore(f"{PREFIX_ALERT_INDEX}{asset.id}", item.id) == 110.0
+        assert fake_redis.exists(f"{PREFIX_ALERT_INDEX}9999") == 0
+
+
+@pytest.mark.unit
+class TestPricingTicks:
+    """Test fetched quotes are evaluated as their ticks are consumed"""
+
+    def test_saved_prices_fire_alerts(self, test_db, test_user, asset, fake_redis):
+        """Test two fetched prices on either side of a target fire its alert"""
+        from contextlib import contextmanager
+        from app.services.price_ticks import consume_price_ticks
+        from app.services.pricing import PricingService
+
+        _alert(test_db, test_user, asset, "110")
+        service = PricingService(test_db)
+
+        for hour, price in ((14, "100"), (15, "125")):
+            service._save_fetched_prices([
+                (asset, {"price": Decimal(price), "asof": datetime(2024, 6, 4, hour), "previous_close": Decimal("99")})
+            ])
+        assert _alerts_sent(test_db) == 0  # published, not applied yet
+
+        @contextmanager
+        def db_context():
+            yield test_db
+
+        with patch("app.services.price_ticks.get_db_context", db_context):
+            assert consume_price_ticks("alerts") == 2
+
+        assert _alerts_sent(test_db) == 1
@@ -0,0 +1,167 @@
+"""
+Tests for the live price feed and its streaming endpoints
+"""
+import asyncio
+import json
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock, patch
+
+from app.models import Watchlist
+from app.services import price_feed as feed_module
+from app.services.currency import FxMatrix
+from app.services.price_ticks import PriceTick, publish_price_ticks
+from tests.factories import AssetFactory, PortfolioFactory, TransactionFactory, UserFactory
+
+
+def _tick(asset_id: int, symbol: str, price: str, change: str = None) -> PriceTick:
+    return PriceTick(
+        asset_id=asset_id,
+        symbol=symbol,
+        price=Decimal(price),
+        asof=datetime(2024, 6, 4, 15),
+        daily_change_pct=Decimal(change) if change else None,
+    )
+
+
+async def _connected() -> bool:
+    return False
+
+
+@pytest.mark.unit
+class TestPriceFeed:
+    """Test ticks fan out to the connections following their asset"""
+
+    async def test_fan_out_shares_one_subscription_per_asset(self):
+        """Test each connection gets the ticks of its assets, the latest per asset"""
+        feed = feed_module.price_feed
+        both = feed.subscribe([1, 2])
+        first = feed.subscribe([1])
+        assert feed.get_stats()["symbols"] == 2
+
+        feed.publish_local([_tick(1, "AAPL", "100"), _tick(2, "MSFT", "400"), _tick(1, "AAPL", "101")])
+        await asyncio.sleep(0)
+
+        assert sorted((tick.symbol, tick.price) for tick in await both.next(timeout=1)) == [
+            ("AAPL", Decimal("101")), ("MSFT", Decimal("400"))
+        ]
+        assert [tick.price for tick in await first.next(timeout=1)] == [Decimal("101")]
+        assert await first.next(timeout=0.01) == []
+
+        feed.unsubscribe(both)
+        feed.unsubscribe(first)
+        assert feed.get_stats() == {
+            "connections": 0, "symbols": 0, "read": 0, "delivered": 5, "reading_stream": False,
+        }
+
+    async def test_reads_ticks_published_on_the_stream(self, test_db, fake_redis):
+        """Test a worker's reader delivers ticks any process publishes, from its subscription on"""
+        asset = AssetFactory.create(symbol="AAPL")
+        test_db.commit()
+        publish_price_ticks([_tick(asset.id, "AAPL", "99")])  # before anyone subscribed
+
+        feed = feed_module.price_feed
+        subscription = feed.subscribe([asset.id])
+        await asyncio.sleep(0.1)  # the reader positions itself at the newest entry
+        publish_price_ticks([_tick(asset.id, "AAPL", "100", change="1.5")])
+
+        ticks = await subscription.next(timeout=5)
+        assert [(tick.price, tick.daily_change_pct) for tick in ticks] == [(Decimal("100"), Decimal("1.5"))]
+        assert feed.get_stats()["reading_stream"]
+        feed.unsubscribe(subscription)
+        assert not feed.get_stats()["reading_stream"]
+
+
+@pytest.mark.unit
+class TestPriceDeltas:
+    """Test the frames of a live price connection"""
+
+    async def test_deltas_converted_to_base_currency(self):
+        """Test prices frames hold the converted price and daily change of the assets that moved"""
+        fx = FxMatrix({("USD", "EUR"): Decimal("0.5")})
+        frames = feed_module.stream_price_deltas({1: ("AAPL", "USD"), 2: ("MC.PA", "EUR")}, "EUR", _connected)
+
+        with patch("app.services.price_feed.CurrencyService.get_rate_matrix", return_value=fx) as get_rate_matrix:
+            assert await frames.__anext__() == {"type": "start", "symbols": ["AAPL", "MC.PA"], "base_currency": "EUR"}
+            feed_module.price_feed.publish_local([_tick(1, "AAPL", "200", change="-2.5")])
+            frame = await frames.__anext__()
+            feed_module.price_feed.publish_local([_tick(2, "MC.PA", "700")])
+            second = await frames.__anext__()
+        await frames.aclose()
+
+        assert frame == {"type": "prices", "prices": [{
+            "symbol": "AAPL", "asset_id": 1, "current_price": 100.0, "currency": "EUR",
+            "last_updated": "2024-06-04T15:00:00", "daily_change_pct": -2.5,
+        }]}
+        assert second["prices"][0]["current_price"] == 700.0
+        assert get_rate_matrix.call_count == 1  # rates resolved once per connection
+        assert feed_module.price_feed.get_stats()["connections"] == 0
+
+    async def test_price_without_rate_keeps_its_currency(self):
+        """Test a price whose rate is unavailable is sent in its own currency, not labelled as base"""
+        fx = FxMatrix({})
+        frames = feed_module.stream_price_deltas({1: ("7203.T", "JPY")}, "EUR", _connected)
+
+        with patch("app.services.price_feed.CurrencyService.get_rate_matrix", return_value=fx):
+            await frames.__anext__()
+            feed_module.price_feed.publish_local([_tick(1, "7203.T", "3000")])
+            frame = await frames.__anext__()
+        await frames.aclose()
+
+        assert [(p["current_price"], p["currency"]) for p in frame["prices"]] == [(3000.0, "JPY")]
+
+    async def test_heartbeat_when_idle(self):
+        """Test an idle connection gets heartbeats"""
+        frames = feed_module.stream_price_deltas({1: ("AAPL", "USD")}, None, _connected)
+        with patch("app.services.price_feed.settings.PRICE_FEED_HEARTBEAT_SECONDS", 0.01):
+            await frames.__anext__()
+            assert (await frames.__anext__())["type"] == "heartbeat"
+        await frames.aclose()
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("stream_db")
+class TestStreamEndpoints:
+    """Test the live price endpoints subscribe to the right assets"""
+
+    def _frames(self, client, auth_headers, url, accept="application/x-ndjson"):
+        # The client "disconnects" once the start frame is sent
+        with patch("starlette.requests.Request.is_disconnected", AsyncMock(return_value=True)):
+            response = client.get(url, headers={**auth_headers, "Accept": accept})
+        assert response.status_code == 200
+        return response
+
+    def test_portfolio_stream(self, client, auth_headers, test_db, test_user):
+        """Test a portfolio stream follows its traded assets in its base currency"""
+        portfolio = PortfolioFactory.create(user_id=test_user.id, base_currency="EUR")
+        for symbol in ("AAPL", "MC.PA"):
+            asset = AssetFactory.create(symbol=symbol)
+            TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+        AssetFactory.create(symbol="MSFT")
+        test_db.commit()
+
+        response = self._frames(client, auth_headers, f"/portfolios/{portfolio.id}/prices/stream")
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        frames = [json.loads(line) for line in response.text.splitlines() if line]
+        assert frames == [{"type": "start", "symbols": ["AAPL", "MC.PA"], "base_currency": "EUR"}]
+
+    def test_portfolio_stream_of_another_user(self, client, auth_headers, test_db):
+        """Test another user's portfolio cannot be streamed"""
+        other = PortfolioFactory.create(user_id=UserFactory.create().id)
+        test_db.commit()
+
+        response = client.get(f"/portfolios/{other.id}/prices/stream", headers=auth_headers)
+        assert response.status_code in (403, 404)
+
+    def test_watchlist_stream_as_sse(self, client, auth_headers, test_db, test_user):
+        """Test a watchlist stream follows the watched assets in their own currency"""
+        asset = AssetFactory.create(symbol="NVDA")
+        test_db.add(Watchlist(user_id=test_user.id, asset_id=asset.id))
+        test_db.commit()
+
+        response = self._frames(client, auth_headers, "/watchlist/prices/stream", accept="text/event-stream")
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text == 'event: start\ndata: {"type": "start", "symbols": ["NVDA"], "base_currency": null}\n\n'
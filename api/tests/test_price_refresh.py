@@ -0,0 +1,150 @@
+"""
+Tests for the scheduled refresh of held quotes
+"""
+import asyncio
+import pytest
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from app.models.enums import AssetClass, TransactionType
+from app.schemas import PriceQuote
+from app.services.price_refresh import (
+    RefreshRun, get_price_refresh_stats, plan_price_refresh, record_refresh, run_price_refresh,
+)
+from tests.factories import AssetFactory, PortfolioFactory, PriceFactory, TransactionFactory
+
+# Tuesday 2024-06-04 15:00 UTC: New York and Europe open, Tokyo closed
+US_AND_EUROPE_OPEN = datetime(2024, 6, 4, 15, 0)
+# Saturday: only crypto trades
+WEEKEND = datetime(2024, 6, 8, 15, 0)
+
+
+def _quote(symbol: str) -> PriceQuote:
+    return PriceQuote(symbol=symbol, price=Decimal("1"), asof=datetime(2024, 6, 4), currency="USD")
+
+
+@pytest.fixture
+def holdings(test_db, test_user):
+    """Held US, Paris, Tokyo and crypto listings, plus a sold out and a never held asset"""
+    portfolio = PortfolioFactory.create(user_id=test_user.id)
+    assets = {}
+    for symbol, asset_class in [
+        ("AAPL", AssetClass.STOCK), ("AIR.PA", AssetClass.STOCK), ("7203.T", AssetClass.STOCK),
+        ("BTC-USD", AssetClass.CRYPTO), ("GONE", AssetClass.STOCK),
+    ]:
+        assets[symbol] = AssetFactory.create(symbol=symbol, class_=asset_class)
+        TransactionFactory.create(portfolio_id=portfolio.id, asset_id=assets[symbol].id, tx_date=date(2024, 1, 2))
+    TransactionFactory.create(
+        portfolio_id=portfolio.id, asset_id=assets["GONE"].id, tx_date=date(2024, 2, 1), type=TransactionType.SELL
+    )
+    AssetFactory.create(symbol="NEVER")
+    test_db.commit()
+    return assets
+
+
+@pytest.mark.unit
+class TestPlan:
+    """Test the planner keeps held symbols whose exchange is open"""
+
+    def test_held_and_open_only(self, test_db, holdings):
+        """Test sold out assets and closed exchanges are left out"""
+        plan = plan_price_refresh(test_db, at=US_AND_EUROPE_OPEN)
+
+        assert sorted(plan.symbols) == ["AAPL", "AIR.PA", "BTC-USD"]
+        assert plan.held == 4
+        assert plan.closed == {"TSE": 1}
+
+    def test_weekend_refreshes_crypto_only(self, test_db, holdings):
+        """Test nothing but crypto is refreshed on a Saturday"""
+        plan = plan_price_refresh(test_db, at=WEEKEND)
+
+        assert plan.symbols == ["BTC-USD"]
+        assert plan.closed == {"NYSE": 1, "EURONEXT": 1, "TSE": 1}
+
+    def test_least_recently_priced_first_within_cap(self, test_db, holdings):
+        """Test never priced symbols come first and the cap defers the most recently priced"""
+        PriceFactory.create(asset_id=holdings["AAPL"].id, asof=datetime.utcnow() - timedelta(hours=1))
+        PriceFactory.create(asset_id=holdings["BTC-USD"].id, asof=datetime.utcnow())
+        test_db.commit()
+
+        plan = plan_price_refresh(test_db, at=US_AND_EUROPE_OPEN, max_symbols=2)
+
+        assert plan.symbols == ["AIR.PA", "AAPL"]
+        assert plan.deferred == 1
+
+
+@pytest.mark.unit
+class TestRun:
+    """Test batched, bounded-concurrency rounds within a budget"""
+
+    @pytest.fixture(autouse=True)
+    def db_context(self, test_db):
+        @contextmanager
+        def context():
+            yield test_db
+
+        with patch("app.services.price_refresh.get_db_context", context):
+            yield
+
+    @pytest.mark.asyncio
+    async def test_rounds_are_batched_and_bounded(self):
+        """Test symbols are resolved in rounds of round_size, at most concurrency at a time"""
+        in_flight = []
+        peak = []
+
+        async def get_multiple_prices(self, symbols):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.pop()
+            return {symbol: _quote(symbol) for symbol in symbols if symbol != "BAD"}
+
+        symbols = [f"SYM{i}" for i in range(9)] + ["BAD"]
+        with patch("app.services.pricing.PricingService.get_multiple_prices", get_multiple_prices):
+            run = await run_price_refresh(symbols, round_size=2, concurrency=2, budget_seconds=60)
+
+        assert run.rounds == 5
+        assert max(peak) == 2
+        assert (run.refreshed, run.failed, run.not_started) == (9, 1, 0)
+        assert run.symbols_per_second > 0
+
+    @pytest.mark.asyncio
+    async def test_budget_stops_new_rounds(self):
+        """Test rounds not started before the budget ran out are counted, not run"""
+        async def get_multiple_prices(self, symbols):
+            await asyncio.sleep(0.1)
+            return {symbol: _quote(symbol) for symbol in symbols}
+
+        with patch("app.services.pricing.PricingService.get_multiple_prices", get_multiple_prices):
+            run = await run_price_refresh([f"SYM{i}" for i in range(6)], round_size=2, concurrency=1, budget_seconds=0.05)
+
+        assert (run.rounds, run.refreshed, run.not_started) == (1, 2, 4)
+
+    @pytest.mark.asyncio
+    async def test_stale_quotes_are_fetched(self):
+        """Test a run reads stale cached quotes as misses instead of serving them back"""
+        from app.services.cache import _stale_allowed
+
+        seen = []
+
+        async def get_multiple_prices(self, symbols):
+            seen.append(_stale_allowed.get())
+            return {}
+
+        with patch("app.services.pricing.PricingService.get_multiple_prices", get_multiple_prices):
+            await run_price_refresh(["AAPL"], budget_seconds=60)
+
+        assert seen == [False]
+
+    def test_stats(self, test_db, holdings):
+        """Test run figures are kept for the health endpoint"""
+        plan = plan_price_refresh(test_db, at=US_AND_EUROPE_OPEN)
+        record_refresh(plan, RefreshRun(planned=3, refreshed=3, rounds=1, duration_seconds=1.5))
+
+        stats = get_price_refresh_stats()
+        assert stats["totals"]["refreshed"] == 3
+        assert stats["totals"]["skipped_closed"] == 1
+        assert stats["last_run"]["symbols_per_second"] == 2.0
+        assert stats["last_run"]["closed"] == {"TSE": 1}
@@ -0,0 +1,170 @@
+"""
+Tests for the price tick stream and its consumer groups
+"""
+import pytest
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from app.models import Notification, NotificationType
+from app.models.enums import AssetClass
+from app.services.cache import CacheService, cache_positions
+from app.services.price_ticks import (
+    STREAM_KEY, PriceTick, consume_price_ticks, get_price_tick_stats, publish_price_ticks,
+)
+from tests.factories import AssetFactory, PortfolioFactory, TransactionFactory
+
+
+def _tick(asset, price: str, hour: int = 15, change: str = None) -> PriceTick:
+    return PriceTick(
+        asset_id=asset.id,
+        symbol=asset.symbol,
+        price=Decimal(price),
+        asof=datetime(2024, 6, 4, hour),
+        daily_change_pct=Decimal(change) if change else None,
+    )
+
+
+@pytest.fixture
+def db_context(test_db):
+    @contextmanager
+    def context():
+        yield test_db
+
+    with patch("app.services.price_ticks.get_db_context", context):
+        yield
+
+
+@pytest.fixture
+def holding(test_db, test_user):
+    """A crypto asset (its exchange never closes) held in one portfolio"""
+    portfolio = PortfolioFactory.create(user_id=test_user.id)
+    asset = AssetFactory.create(symbol="BTC-USD", class_=AssetClass.CRYPTO)
+    TransactionFactory.create(portfolio_id=portfolio.id, asset_id=asset.id, tx_date=date(2024, 1, 2))
+    test_db.commit()
+    return portfolio, asset
+
+
+def _daily_change_notifications(test_db) -> int:
+    return test_db.query(Notification).filter(
+        Notification.type.in_([NotificationType.DAILY_CHANGE_UP, NotificationType.DAILY_CHANGE_DOWN])
+    ).count()
+
+
+@pytest.mark.unit
+class TestAllTimeHighs:
+    """Test ATH tracking coalesces ticks into one set-based UPDATE"""
+
+    def test_one_update_raises_only_beaten_highs(self, test_db, db_context):
+        """Test assets without an ATH or below the batch high are raised, others untouched"""
+        fresh = AssetFactory.create(symbol="NEW")
+        beaten = AssetFactory.create(symbol="UP", ath_price=Decimal("100"), ath_date=datetime(2020, 1, 1))
+        held = AssetFactory.create(symbol="FLAT", ath_price=Decimal("500"), ath_date=datetime(2020, 1, 1))
+        test_db.commit()
+
+        updates = []
+
+        def count_updates(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith("UPDATE"):
+                updates.append(statement)
+
+        event.listen(test_db.get_bind(), "before_cursor_execute", count_updates)
+        try:
+            publish_price_ticks([
+                _tick(fresh, "10", 14), _tick(fresh, "12", 15), _tick(fresh, "11", 16),
+                _tick(beaten, "120", 14), _tick(beaten, "110", 15),
+                _tick(held, "450", 15),
+            ])
+        finally:
+            event.remove(test_db.get_bind(), "before_cursor_execute", count_updates)
+
+        assert len([statement for statement in updates if "assets" in statement]) == 1
+        for asset in (fresh, beaten, held):
+            test_db.refresh(asset)
+        assert (fresh.ath_price, fresh.ath_date) == (Decimal("12"), datetime(2024, 6, 4, 15))
+        assert (beaten.ath_price, beaten.ath_date) == (Decimal("120"), datetime(2024, 6, 4, 14))
+        assert (held.ath_price, held.ath_date) == (Decimal("500"), datetime(2020, 1, 1))
+
+
+@pytest.mark.unit
+class TestStream:
+    """Test ticks are published once and applied by each consumer group"""
+
+    def test_published_then_consumed_per_group(self, test_db, fake_redis, db_context):
+        """Test a group applies and acknowledges the stream, the other groups keep their lag"""
+        asset = AssetFactory.create(symbol="AAPL")
+        test_db.commit()
+
+        publish_price_ticks([_tick(asset, "100", 14), _tick(asset, "130", 15)])
+        assert fake_redis.xlen(STREAM_KEY) == 2
+        test_db.refresh(asset)
+        assert asset.ath_price is None  # nothing applied by the publisher
+
+        assert consume_price_ticks("ath") == 2
+        assert consume_price_ticks("ath") == 0
+        test_db.refresh(asset)
+        assert asset.ath_price == Decimal("130")
+
+        consume_price_ticks("positions")
+        stats = get_price_tick_stats()
+        assert stats["published"] == 2 and stats["stream_length"] == 2
+        assert stats["groups"]["ath"]["handled"] == 2 and stats["groups"]["ath"]["pending"] == 0
+        assert stats["groups"]["ath"]["lag"] == 0
+        assert stats["groups"]["positions"]["lag"] == 0
+
+    def test_failed_batches_are_retried_then_dropped(self, test_db, fake_redis, db_context):
+        """Test an unacknowledged batch is claimed again, and dropped after its last attempt"""
+        asset = AssetFactory.create(symbol="AAPL")
+        test_db.commit()
+        publish_price_ticks([_tick(asset, "100")])
+
+        with patch("app.crud.assets.raise_all_time_highs", side_effect=RuntimeError("db down")), \
+                patch("app.services.price_ticks.settings.PRICE_TICK_CLAIM_IDLE_SECONDS", 0), \
+                patch("app.services.price_ticks.settings.PRICE_TICK_MAX_DELIVERIES", 2):
+            assert consume_price_ticks("ath", max_batches=1) == 0  # delivered once, failed
+            assert fake_redis.xpending(STREAM_KEY, "ath")["pending"] == 1
+            time.sleep(0.01)
+            assert consume_price_ticks("ath", max_batches=1) == 0  # claimed again, failed
+            time.sleep(0.01)
+            consume_price_ticks("ath", max_batches=1)  # out of attempts
+
+        assert fake_redis.xpending(STREAM_KEY, "ath")["pending"] == 0
+        stats = get_price_tick_stats()["groups"]["ath"]
+        assert (stats["failed"], stats["dropped"]) == (2, 1)
+
+
+@pytest.mark.unit
+class TestConsumers:
+    """Test the positions and daily change consumers"""
+
+    def test_cached_positions_marked_stale(self, test_db, fake_redis, db_context, holding):
+        """Test positions of a portfolio holding a ticked asset are served stale, not dropped"""
+        portfolio, asset = holding
+        other = PortfolioFactory.create(user_id=portfolio.user_id)
+        test_db.commit()
+        cache_positions(portfolio.id, ["held"])
+        cache_positions(other.id, ["other"])
+
+        publish_price_ticks([_tick(asset, "65000")])
+        consume_price_ticks("positions")
+
+        assert CacheService.get_swr(f"{CacheService.PREFIX_POSITION}{portfolio.id}") == (["held"], True)
+        assert CacheService.get_swr(f"{CacheService.PREFIX_POSITION}{other.id}") == (["other"], False)
+
+    def test_daily_change_notified_once_per_day(self, test_db, db_context, holding):
+        """Test a change past the holder's threshold notifies once, a smaller one never"""
+        _, asset = holding
+
+        publish_price_ticks([_tick(asset, "65000", change="3.2")])
+        assert _daily_change_notifications(test_db) == 0
+
+        publish_price_ticks([_tick(asset, "68000", change="7.5")])
+        publish_price_ticks([_tick(asset, "69000", change="9.1")])
+        assert _daily_change_notifications(test_db) == 1
+        notification = test_db.query(Notification).one()
+        assert notification.type == NotificationType.DAILY_CHANGE_UP
+        assert notification.meta_data["session_id"] == datetime.utcnow().date().isoformat()  # crypto trades on UTC days
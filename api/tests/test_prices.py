@@ -4,7 +4,7 @@ Tests for pricing service
 import pytest
 from decimal import Decimal
 from datetime import datetime, timedelta
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from app.services.pricing import PricingService
 from app.models import Asset, Price
@@ -64,7 +64,7 @@ async def test_get_price_fetches_when_stale(pricing_service, mock_db):
     )
     
     with patch('app.services.pricing.crud_prices') as mock_crud, \
-         patch.object(pricing_service, '_fetch_from_yfinance') as mock_fetch:
+         patch.object(pricing_service, '_fetch_quote') as mock_fetch:
         
         mock_crud.get_latest_price.return_value = stale_price
         mock_fetch.return_value = {
@@ -94,7 +94,7 @@ async def test_get_price_fallback_on_fetch_failure(pricing_service, mock_db):
     )
     
     with patch('app.services.pricing.crud_prices') as mock_crud, \
-         patch.object(pricing_service, '_fetch_from_yfinance') as mock_fetch:
+         patch.object(pricing_service, '_fetch_quote') as mock_fetch:
         
         mock_crud.get_latest_price.return_value = stale_price
         mock_fetch.return_value = None  # Simulate fetch failure
@@ -118,17 +118,20 @@ async def test_get_price_returns_none_for_unknown_symbol(pricing_service, mock_d
 @pytest.mark.asyncio
 async def test_get_multiple_prices(pricing_service):
     """Test getting multiple prices at once"""
-    with patch.object(pricing_service, 'get_price') as mock_get_price:
+    with patch.object(pricing_service, '_get_prices_batch_internal', new_callable=AsyncMock) as mock_batch, \
+         patch('app.services.pricing.get_cached_prices', return_value={}), \
+         patch('app.services.pricing.cache_prices'):
         from app.schemas import PriceQuote
         
-        mock_get_price.side_effect = [
-            PriceQuote(symbol="AAPL", price=Decimal("150.25"), asof=datetime.utcnow(), currency="USD"),
-            PriceQuote(symbol="MSFT", price=Decimal("380.50"), asof=datetime.utcnow(), currency="USD"),
-            None  # Failed to get price
-        ]
+        # INVALID failed to resolve and is missing from the batch result
+        mock_batch.return_value = {
+            "AAPL": PriceQuote(symbol="AAPL", price=Decimal("150.25"), asof=datetime.utcnow(), currency="USD"),
+            "MSFT": PriceQuote(symbol="MSFT", price=Decimal("380.50"), asof=datetime.utcnow(), currency="USD"),
+        }
         
         result = await pricing_service.get_multiple_prices(["AAPL", "MSFT", "INVALID"])
         
+        mock_batch.assert_awaited_once_with(["AAPL", "MSFT", "INVALID"], force_refresh=False)
         assert len(result) == 2
         assert "AAPL" in result
         assert "MSFT" in result
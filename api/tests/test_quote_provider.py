@@ -0,0 +1,167 @@
+"""
+Tests for the shared upstream quote provider - concurrency, timeouts, rate limiting and parsing
+"""
+import asyncio
+import socket
+import time
+import pytest
+from decimal import Decimal
+from datetime import date
+
+from app.services import quote_provider
+from app.services.quote_provider import TokenBucket, YahooQuoteProvider, get_quote_provider, run_sync
+from tests.fake_yahoo import FakeYahoo
+
+
+def _provider(fake: FakeYahoo, **kwargs) -> YahooQuoteProvider:
+    kwargs.setdefault("rate_limiter", TokenBucket(rate=1000, capacity=1000))
+    return YahooQuoteProvider(transport=fake.transport(), **kwargs)
+
+
+@pytest.mark.unit
+class TestTokenBucket:
+    """Test the process-wide rate limiter"""
+
+    def test_burst_then_paced(self):
+        """Test the burst is free and later tokens are spaced by 1/rate"""
+        bucket = TokenBucket(rate=10, capacity=2)
+
+        waits = [bucket.reserve() for _ in range(4)]
+
+        assert waits[:2] == [0.0, 0.0]
+        assert waits[2] == pytest.approx(0.1, abs=0.01)
+        assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+    @pytest.mark.asyncio
+    async def test_requests_are_rate_limited(self):
+        """Test requests beyond the burst wait for tokens"""
+        fake = FakeYahoo()
+        fake.set_quote("AAPL", 100.0, previous_close=99.0)
+        provider = _provider(fake, rate_limiter=TokenBucket(rate=20, capacity=1))
+
+        started = time.monotonic()
+        await asyncio.gather(*(provider.get_quote("AAPL") for _ in range(4)))
+
+        assert time.monotonic() - started >= 0.14
+        await provider.aclose()
+
+
+@pytest.mark.unit
+class TestUpstreamLimits:
+    """Test concurrency bounds and per-call timeouts"""
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        """Test no more than max_concurrency requests are in flight"""
+        fake = FakeYahoo(latency=0.02)
+        fake.set_quote("AAPL", 100.0, previous_close=99.0)
+        provider = _provider(fake, max_concurrency=3)
+
+        quotes = await asyncio.gather(*(provider.get_quote("AAPL") for _ in range(12)))
+
+        assert all(q["price"] == Decimal("100.0") for q in quotes)
+        assert fake.max_in_flight == 3
+        await provider.aclose()
+
+    @pytest.mark.asyncio
+    async def test_timeout_is_per_call(self):
+        """Test a slow upstream times out without touching global socket state"""
+        fake = FakeYahoo(latency=0.5)
+        fake.set_quote("AAPL", 100.0)
+        provider = _provider(fake, timeout=0.05)
+        default_timeout = socket.getdefaulttimeout()
+
+        started = time.monotonic()
+        assert await provider.get_quote("AAPL") is None
+
+        assert time.monotonic() - started < 0.4
+        assert socket.getdefaulttimeout() == default_timeout
+        await provider.aclose()
+
+
+@pytest.mark.unit
+class TestYahooParsing:
+    """Test chart and spark responses are parsed into quotes and frames"""
+
+    @pytest.mark.asyncio
+    async def test_history_is_indexed_by_exchange_date(self):
+        """Test daily bars land on their exchange-local date"""
+        fake = FakeYahoo()
+        fake.set_history("SAP.DE", {date(2024, 3, 1): 10.0, date(2024, 3, 4): None, date(2024, 3, 5): 12.5}, tz="Europe/Berlin")
+        provider = _provider(fake)
+
+        hist = await provider.get_history("SAP.DE", date(2024, 3, 1), date(2024, 3, 6))
+
+        assert [d.date() for d in hist.index] == [date(2024, 3, 1), date(2024, 3, 4), date(2024, 3, 5)]
+        assert str(hist.index.tz) == "Europe/Berlin"
+        assert hist["Close"].tolist()[::2] == [10.0, 12.5]
+        assert (await provider.get_history("NOPE", date(2024, 3, 1), date(2024, 3, 6))).empty
+        await provider.aclose()
+
+    @pytest.mark.asyncio
+    async def test_quotes_are_batched(self, fake_yahoo):
+        """Test many symbols share one spark request and failures are omitted"""
+        fake_yahoo.set_quote("AAPL", 150.0, previous_close=148.0)
+        fake_yahoo.set_quote("MSFT", 380.0)
+
+        quotes = await get_quote_provider().get_quotes(["AAPL", "MSFT", "NOPE"])
+
+        assert set(quotes) == {"AAPL", "MSFT"}
+        assert quotes["AAPL"]["previous_close"] == Decimal("148.0")
+        assert "previous_close" not in quotes["MSFT"]
+        assert len(fake_yahoo.requests_for("/v8/finance/spark")) == 1
+        # No previous close in the spark meta, so MSFT is quoted by the chart endpoint
+        assert len(fake_yahoo.requests_for("/v8/finance/chart/MSFT")) == 1
+        assert len(fake_yahoo.requests) == 2
+
+    @pytest.mark.asyncio
+    async def test_batched_previous_close_comes_from_the_meta(self, fake_yahoo):
+        """Test a missing daily bar does not shift the previous close of a batch quote"""
+        # The bar of the previous session is missing from the closes
+        fake_yahoo.set_quote("AAPL", 150.0, previous_close=148.0, volume=52000000, closes=[140.0, 150.0])
+
+        quotes = await get_quote_provider().get_quotes(["AAPL"])
+
+        assert quotes["AAPL"]["price"] == Decimal("150.0")
+        assert quotes["AAPL"]["previous_close"] == Decimal("148.0")
+        assert quotes["AAPL"]["volume"] == 52000000
+        assert fake_yahoo.requests_for("/v8/finance/chart") == []
+
+
+@pytest.mark.unit
+class TestSyncBridge:
+    """Test sync callers share the background loop's provider"""
+
+    def test_run_sync_reuses_one_provider(self, fake_yahoo):
+        """Test repeated sync calls go through the same pooled provider"""
+        fake_yahoo.set_quote("AAPL", 150.0)
+
+        providers = [run_sync(lambda provider: asyncio.sleep(0, provider)) for _ in range(2)]
+        quote = run_sync(lambda provider: provider.get_quote("AAPL"))
+
+        assert providers[0] is providers[1]
+        assert quote["price"] == Decimal("150.0")
+
+    @pytest.mark.asyncio
+    async def test_providers_are_per_event_loop(self):
+        """Test the async provider is not the background loop's"""
+        background = await asyncio.to_thread(run_sync, lambda provider: asyncio.sleep(0, provider))
+
+        assert get_quote_provider() is get_quote_provider()
+        assert get_quote_provider() is not background
+        await quote_provider.close_quote_provider()
+
+
+@pytest.mark.api
+class TestMarketIndices:
+    """Test market index endpoints read through the shared provider"""
+
+    def test_vix_endpoint(self, client, fake_yahoo):
+        """Test the VIX quote and its change against the previous close"""
+        fake_yahoo.set_quote("^VIX", 16.5, previous_close=15.0)
+
+        response = client.get("/market/vix")
+
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["price"], body["change"], body["change_pct"]) == (16.5, 1.5, 10.0)
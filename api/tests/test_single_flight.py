@@ -0,0 +1,146 @@
+"""
+Tests for single-flight computations across processes
+"""
+import asyncio
+import time
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.schemas import PriceQuote
+from app.services import cache_codec
+from app.services import single_flight as single_flight_module
+from app.services.single_flight import (
+    PREFIX_LOCK, PREFIX_RESULT, get_single_flight_stats, single_flight, try_acquire, wait_for,
+)
+
+
+def _quote(symbol: str) -> PriceQuote:
+    return PriceQuote(symbol=symbol, price=Decimal("1.5"), asof=datetime(2024, 6, 3), currency="USD")
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """Test leases, completion messages and fencing"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_computation(self, fake_redis):
+        """Test one caller computes and the others get its result, woken by its completion message"""
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return [Decimal("1.10"), "positions"]
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(single_flight("positions:1", compute) for _ in range(5)))
+
+        assert len(calls) == 1
+        assert all(result == [Decimal("1.10"), "positions"] for result in results)
+        assert time.monotonic() - started < 2  # not woken by the 30s lease expiry
+        assert get_single_flight_stats()["positions"]["led"] == 1
+        assert get_single_flight_stats()["positions"]["coalesced_remote"] == 4
+        assert fake_redis.get(f"{PREFIX_LOCK}positions:1") is None
+
+    @pytest.mark.asyncio
+    async def test_store_runs_once_under_the_lease(self, fake_redis):
+        """Test the holder alone stores the value"""
+        stored = []
+
+        async def compute():
+            await asyncio.sleep(0.1)
+            return 42
+
+        await asyncio.gather(*(single_flight("insights:1:1y:SPY", compute, store=stored.append) for _ in range(3)))
+
+        assert stored == [42]
+
+    @pytest.mark.asyncio
+    async def test_waiter_takes_over_when_holder_fails(self, fake_redis):
+        """Test a failed computation releases its lease and a waiter computes instead"""
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            if len(calls) == 1:
+                raise ValueError("upstream down")
+            return "recomputed"
+
+        first, second = await asyncio.gather(
+            single_flight("history:1:1M", compute), single_flight("history:1:1M", compute),
+            return_exceptions=True,
+        )
+
+        assert isinstance(first, ValueError)
+        assert second == "recomputed"
+        assert len(calls) == 2
+
+    def test_expired_lease_is_fenced_off(self, fake_redis):
+        """Test a holder whose lease expired neither publishes its result nor releases the new lease"""
+        stalled = try_acquire("price:AAPL")
+        fake_redis.delete(f"{PREFIX_LOCK}price:AAPL")  # lease expiry
+        current = try_acquire("price:AAPL")
+
+        assert current.token > stalled.token
+        assert stalled.holds() is False
+        assert stalled.complete("old") is False
+        assert fake_redis.get(f"{PREFIX_LOCK}price:AAPL") == str(current.token)
+        assert try_acquire("price:AAPL") is None
+
+        assert current.complete("new") is True
+        token, value = cache_codec.decode(single_flight_module.get_redis_binary().get(f"{PREFIX_RESULT}price:AAPL"))
+        assert (token, value) == (current.token, "new")
+        assert get_single_flight_stats()["price"]["lease_lost"] == 1
+
+    @pytest.mark.asyncio
+    async def test_result_of_an_earlier_lease_is_not_taken(self, fake_redis):
+        """Test a waiter only takes results of the lease it joined, or a later one"""
+        earlier = try_acquire("positions:1")
+        earlier.complete("before invalidation")
+
+        # No lease held when joining: the leftover result may be stale
+        assert await wait_for("positions:1", 1.0) == (False, None)
+
+        current = try_acquire("positions:1")
+
+        async def complete_later():
+            await asyncio.sleep(0.1)
+            current.complete("after invalidation")
+
+        waited, _ = await asyncio.gather(wait_for("positions:1", 1.0), complete_later())
+        assert waited == (True, "after invalidation")
+
+    @pytest.mark.asyncio
+    async def test_computes_without_redis(self):
+        """Test callers just compute when Redis is unavailable"""
+        with patch("app.services.single_flight.get_redis_binary", return_value=None):
+            results = await asyncio.gather(*(single_flight("positions:2", AsyncMock(return_value=7)) for _ in range(2)))
+
+        assert results == [7, 7]
+
+
+@pytest.mark.unit
+class TestSharedPriceBatch:
+    """Test batch quote fetches skip the symbols another process is fetching"""
+
+    @pytest.mark.asyncio
+    async def test_symbols_leased_elsewhere_are_awaited(self, fake_redis):
+        """Test only unleased symbols are fetched, the others come from their holder"""
+        from app.services.pricing import PricingService
+
+        holder = try_acquire("price:MSFT")
+
+        async def other_process():
+            await asyncio.sleep(0.1)
+            holder.complete(_quote("MSFT"))
+
+        service = PricingService(MagicMock())
+        with patch.object(service, "_get_prices_batch_internal", AsyncMock(return_value={"AAPL": _quote("AAPL")})) as batch:
+            quotes, _ = await asyncio.gather(service._get_prices_batch_shared(["AAPL", "MSFT"]), other_process())
+
+        batch.assert_awaited_once_with(["AAPL"], force_refresh=False)
+        assert quotes == {"AAPL": _quote("AAPL"), "MSFT": _quote("MSFT")}
+        assert get_single_flight_stats()["price"]["coalesced_remote"] == 1
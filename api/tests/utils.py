@@ -1,9 +1,11 @@
 """
 Test utilities and helper functions
 """
+from contextlib import ExitStack
 from typing import Optional
 from decimal import Decimal
 from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
 import random
 import string
 
@@ -96,3 +98,187 @@ class MockYFinanceData:
             })
         
         return history
+
+
+def synthetic_portfolio_history(
+    n_transactions: int,
+    n_assets: int = 20,
+    n_days: int = 365,
+    seed: int = 0,
+    end_date: Optional[date] = None,
+):
+    """
+    Build a synthetic portfolio for history calculations (no database needed)
+    
+    Returns (dates, prices, transactions) in the shape expected by
+    app.services.portfolio_history: sorted dates, asset_id -> {date: Decimal}
+    and SimpleNamespace transactions ordered by tx_date. Mixes buys, sells
+    (including oversells), transfers, conversions, splits and missing price days.
+    """
+    from types import SimpleNamespace
+    from app.models import TransactionType
+    
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=n_days - 1)
+    
+    prices = {}
+    for asset_id in range(1, n_assets + 1):
+        price = rng.uniform(5, 500)
+        by_date = {}
+        for offset in range(n_days):
+            price *= 1 + rng.uniform(-0.03, 0.03)
+            # Gaps (weekends/holidays/late listings) exercise the forward-fill
+            if rng.random() < 0.2:
+                continue
+            by_date[start_date + timedelta(days=offset)] = Decimal(str(round(price, 4)))
+        prices[asset_id] = by_date
+    
+    weighted_types = (
+        [TransactionType.BUY] * 10
+        + [TransactionType.SELL] * 5
+        + [TransactionType.TRANSFER_IN, TransactionType.TRANSFER_OUT]
+        + [TransactionType.CONVERSION_IN, TransactionType.CONVERSION_OUT]
+        + [TransactionType.DIVIDEND]
+    )
+    transactions = []
+    for _ in range(n_transactions):
+        tx_type = rng.choice(weighted_types)
+        meta_data = None
+        if rng.random() < 0.002:
+            tx_type = TransactionType.SPLIT
+            meta_data = {"split": rng.choice(["2:1", "3:1", "1:4", "10:1"])}
+        transactions.append(SimpleNamespace(
+            asset_id=rng.randint(1, n_assets),
+            tx_date=start_date + timedelta(days=rng.randrange(n_days + 10) - 10),
+            type=tx_type,
+            quantity=Decimal(str(round(rng.uniform(0.01, 50), 6))),
+            price=Decimal(str(round(rng.uniform(5, 500), 2))),
+            fees=Decimal(str(round(rng.uniform(0, 5), 2))),
+            meta_data=meta_data,
+        ))
+    transactions.sort(key=lambda tx: tx.tx_date)
+    
+    dates = sorted({d for by_date in prices.values() for d in by_date})
+    return dates, prices, transactions
+
+
+def reference_history_points(dates, prices, transactions, split_ratio) -> list:
+    """
+    Reference per-date Decimal implementation of the portfolio history series
+    
+    This is the original MetricsService.get_portfolio_history() loop, kept as
+    the parity oracle for app.services.portfolio_history.
+    """
+    from collections import defaultdict
+    from app.models import TransactionType
+    from app.schemas import PortfolioHistoryPoint
+    
+    asset_splits = defaultdict(list)
+    for tx in transactions:
+        if tx.type == TransactionType.SPLIT:
+            asset_splits[tx.asset_id].append((tx.tx_date, split_ratio((tx.meta_data or {}).get("split", "1:1"))))
+    
+    holdings = defaultdict(lambda: Decimal(0))
+    cost_basis = defaultdict(lambda: Decimal(0))
+    total_invested = Decimal(0)
+    history = []
+    tx_idx = 0
+    
+    for current_date in dates:
+        while tx_idx < len(transactions) and transactions[tx_idx].tx_date <= current_date:
+            tx = transactions[tx_idx]
+            if tx.type in [TransactionType.BUY, TransactionType.TRANSFER_IN, TransactionType.CONVERSION_IN]:
+                holdings[tx.asset_id] += tx.quantity
+                cost_basis[tx.asset_id] += (tx.quantity * tx.price) + tx.fees
+                if tx.type != TransactionType.CONVERSION_IN:
+                    total_invested += (tx.quantity * tx.price) + tx.fees
+            elif tx.type in [TransactionType.SELL, TransactionType.TRANSFER_OUT, TransactionType.CONVERSION_OUT]:
+                if holdings[tx.asset_id] > 0:
+                    actual_quantity_sold = min(tx.quantity, holdings[tx.asset_id])
+                    sell_proportion = actual_quantity_sold / holdings[tx.asset_id]
+                    cost_removed = cost_basis[tx.asset_id] * sell_proportion
+                    cost_basis[tx.asset_id] -= cost_removed
+                    if tx.type != TransactionType.CONVERSION_OUT:
+                        total_invested -= cost_removed
+                    holdings[tx.asset_id] -= actual_quantity_sold
+            elif tx.type == TransactionType.SPLIT:
+                holdings[tx.asset_id] *= split_ratio((tx.meta_data or {}).get("split", "1:1"))
+            tx_idx += 1
+        
+        total_value = Decimal(0)
+        for asset_id, quantity in holdings.items():
+            if quantity <= 0:
+                continue
+            asset_prices = prices.get(asset_id, {})
+            price = asset_prices.get(current_date)
+            if price is None:
+                available_dates = sorted([d for d in asset_prices.keys() if d <= current_date])
+                if available_dates:
+                    price = asset_prices[available_dates[-1]]
+            if price is not None:
+                adjustment_factor = Decimal(1)
+                for split_date, ratio in asset_splits.get(asset_id, []):
+                    if split_date > current_date:
+                        adjustment_factor *= ratio
+                total_value += quantity * adjustment_factor * price
+        
+        total_cost_basis = sum(cost_basis[a] for a in holdings.keys() if holdings[a] > 0)
+        
+        gain_pct = None
+        if total_invested > 0:
+            gain_pct = float(((total_value - total_invested) / total_invested) * 100)
+        unrealized_pnl_pct = None
+        if total_cost_basis > 0:
+            unrealized_pnl_pct = float(((total_value - total_cost_basis) / total_cost_basis) * 100)
+        
+        history.append(PortfolioHistoryPoint(
+            date=current_date.isoformat(),
+            value=float(total_value),
+            invested=float(total_invested),
+            gain_pct=gain_pct,
+            cost_basis=float(total_cost_basis),
+            unrealized_pnl_pct=unrealized_pnl_pct
+        ))
+    
+    return history
+
+
+class CalculationCounters:
+    """
+    Counting wrappers around the calculators behind the dashboard widgets
+    
+    Snapshots, FX, positions and history run for real; quotes are a flat 50 USD.
+    """
+    
+    def __enter__(self):
+        from app.schemas import PriceQuote
+        from app.services.metrics import MetricsService
+        from app.services.position_calculator import FxRates, calculate_position
+        
+        async def quotes(symbols):
+            return {
+                symbol: PriceQuote(symbol=symbol, price=Decimal("50"), asof=datetime(2024, 6, 3, 20), currency="USD")
+                for symbol in symbols
+            }
+        
+        self._stack = ExitStack()
+        self.snapshots = self._stack.enter_context(patch.object(
+            MetricsService, "_load_position_snapshots", autospec=True,
+            side_effect=MetricsService._load_position_snapshots,
+        ))
+        self.quotes = self._stack.enter_context(patch(
+            "app.services.pricing.PricingService.get_multiple_prices", AsyncMock(side_effect=quotes)
+        ))
+        self.fx = self._stack.enter_context(patch.object(FxRates, "resolve", wraps=FxRates.resolve))
+        self.positions = self._stack.enter_context(patch(
+            "app.services.metrics.calculate_position", wraps=calculate_position
+        ))
+        self.history = self._stack.enter_context(patch.object(
+            MetricsService, "get_portfolio_history", autospec=True,
+            side_effect=MetricsService.get_portfolio_history,
+        ))
+        return self
+    
+    def __exit__(self, *exc):
+        return self._stack.__exit__(*exc)